@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+POLICIES = ("drop_newest", "drop_oldest", "block")
+
+Sender = Callable[[List[Dict[str, Any]]], bool]
+
+
+class BatchEmitter:
+    """Bounded in-memory queue flushed by a daemon thread.
+
+    Records are handed to ``sender`` in batches of up to ``batch_size`` either
+    when the batch fills or ``flush_interval`` seconds elapse. ``submit`` never
+    performs network I/O; when the queue is full the overflow ``policy`` decides:
+
+    - drop_newest: reject the incoming record
+    - drop_oldest: evict the oldest queued record to make room
+    - block: wait up to ``block_timeout`` seconds for space, then drop
+    """
+
+    def __init__(
+        self,
+        sender: Sender,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        policy: str = "drop_newest",
+        block_timeout: float = 0.05,
+        tick: Optional[Callable[[], None]] = None,
+    ) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.sender = sender
+        self.max_queue = max(1, max_queue)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.tick = tick
+
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    # -- producer side -------------------------------------------------
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """Enqueue a record; returns False when it was dropped."""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                if self.policy == "drop_oldest":
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif self.policy == "block":
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._queue) >= self.max_queue:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.notify_all()
+                        self._cond.wait(remaining)
+                    if len(self._queue) >= self.max_queue:
+                        self.dropped += 1
+                        return False
+                else:
+                    self.dropped += 1
+                    return False
+            self._queue.append(record)
+            self.queued += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+        self._ensure_started()
+        return True
+
+    # -- consumer side -------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._stopped or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name="analytics-batcher", daemon=True)
+            self._thread.start()
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        batch: List[Dict[str, Any]] = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        if batch:
+            # Wake producers waiting under the "block" policy
+            self._cond.notify_all()
+        return batch
+
+    def _send(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            ok = self.sender(batch)
+        except Exception as e:  # pragma: no cover - sender should never raise
+            logger.warning("analytics_batch_send_failed", error=str(e), rows=len(batch))
+            ok = False
+        self.batches += 1
+        if ok:
+            self.flushed += len(batch)
+        else:
+            self.failed += len(batch)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._stopped and len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._stopped and not self._queue:
+                    return
+            self.flush()
+            if self.tick is not None:
+                try:
+                    self.tick()
+                except Exception as e:  # pragma: no cover
+                    logger.warning("analytics_batch_tick_failed", error=str(e))
+
+    def flush(self) -> int:
+        """Drain everything currently queued; returns the number of records sent."""
+        sent = 0
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = self._take_batch()
+                if not batch:
+                    return sent
+                self._send(batch)
+                sent += len(batch)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the worker thread after draining the queue."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = len(self._queue)
+        return {
+            "policy": self.policy,
+            "depth": depth,
+            "capacity": self.max_queue,
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
+
+
+_emitter: Optional[BatchEmitter] = None
+_emitter_pid: Optional[int] = None
+_emitter_lock = threading.Lock()
+
+
+def get_emitter(sender: Optional[Sender] = None) -> BatchEmitter:
+    """Return the per-process emitter, creating it on first use (and after fork)."""
+    global _emitter, _emitter_pid
+    pid = os.getpid()
+    if _emitter is None or _emitter_pid != pid:
+        with _emitter_lock:
+            if _emitter is None or _emitter_pid != pid:
+                tick = None
+                if sender is None:
+                    from .sink import send_batch, tick as sink_tick
+                    sender, tick = send_batch, sink_tick
+                _emitter = BatchEmitter(
+                    sender,
+                    max_queue=int(os.getenv("ANALYTICS_QUEUE_MAX", "10000")),
+                    batch_size=int(os.getenv("ANALYTICS_BATCH_SIZE", "500")),
+                    flush_interval=int(os.getenv("ANALYTICS_FLUSH_INTERVAL_MS", "1000")) / 1000.0,
+                    policy=os.getenv("ANALYTICS_QUEUE_POLICY", "drop_newest"),
+                    tick=tick,
+                )
+                _emitter_pid = pid
+    return _emitter
+
+
+def emitter_stats() -> Optional[Dict[str, Any]]:
+    """Counters for the current process emitter, or None if nothing was emitted yet."""
+    if _emitter is None or _emitter_pid != os.getpid():
+        return None
+    return _emitter.stats()
+
+
+@atexit.register
+def _flush_on_exit() -> None:  # pragma: no cover - interpreter shutdown
+    if _emitter is not None and _emitter_pid == os.getpid():
+        try:
+            _emitter.stop(timeout=2.0)
+            from .sink import rotate_files
+            from .spool import close_spools
+            rotate_files(final=True)
+            close_spools()
+        except Exception:
+            pass
@@ -0,0 +1,385 @@
+"""
+Optional columnar in-memory analytics engine (requires NumPy).
+
+Keeps a per-org snapshot of the last ``window_days`` of ``recovery_attempts``
+(joined to the transaction amount) and ``failure_events`` as NumPy columns:
+created_at as int64 epoch microseconds, status/channel/reason as dictionary
+codes, amount as int64. Snapshots refresh incrementally by id watermark. Ids
+are allocated before commit, so a row committed after a higher id was read
+would fall below the watermark: each refresh also re-scans rows created
+within ``overlap_s`` of the previous scan and skips ids already held. Rows
+whose status can still change (not completed/expired/cancelled) are re-read
+by id on every refresh so status transitions are picked up.
+
+Snapshots are held in an LRU bounded by total bytes. When NumPy is missing,
+the feature flag is off, or a query reaches outside the window, callers get
+``None`` and fall back to SQL.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    np = None  # type: ignore
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from app.config.flags import flag
+from app.models import FailureEvent, RecoveryAttempt, Transaction
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+TERMINAL_STATUSES = ("completed", "expired", "cancelled")
+_ID_CHUNK = 1000
+
+
+def available() -> bool:
+    return np is not None
+
+
+def to_us(dt: datetime) -> int:
+    """Epoch microseconds; naive datetimes are treated as UTC."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1_000_000)
+
+
+class _Dictionary:
+    """String -> small int code mapping; None is stored as the literal value."""
+
+    def __init__(self) -> None:
+        self.values: List[Optional[str]] = []
+        self._index: Dict[Optional[str], int] = {}
+
+    def code(self, value: Optional[str]) -> int:
+        c = self._index.get(value)
+        if c is None:
+            c = self._index[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+    def lookup(self, value: Optional[str]) -> int:
+        return self._index.get(value, -1)
+
+    def encode(self, values: Iterable[Optional[str]]):
+        return np.fromiter((self.code(v) for v in values), dtype=np.int32)
+
+
+class _Attempts(NamedTuple):
+    id: Any
+    created: Any
+    status: Any
+    channel: Any
+    amount: Any
+
+
+class _Failures(NamedTuple):
+    id: Any
+    created: Any
+    reason: Any
+
+
+class OrgSnapshot:
+    """Columnar copy of one org's recent attempts and failures.
+
+    Column sets are immutable tuples swapped in one assignment, so queries
+    running alongside a refresh always see equal-length columns.
+    """
+
+    def __init__(self, org_id: int, cutoff_us: int = 0) -> None:
+        self.org_id = org_id
+        self.cutoff_us = cutoff_us
+        self.statuses = _Dictionary()
+        self.channels = _Dictionary()
+        self.reasons = _Dictionary()
+        self.attempts = _Attempts(*(np.empty(0, dtype=t) for t in (np.int64, np.int64, np.int32, np.int32, np.int64)))
+        self.failures = _Failures(*(np.empty(0, dtype=t) for t in (np.int64, np.int64, np.int32)))
+        self.attempt_watermark = 0
+        self.failure_watermark = 0
+        self.scanned_us = 0  # wall clock at the start of the last refresh
+        self.refreshed_at = 0.0
+
+    # -- maintenance ---------------------------------------------------
+
+    @staticmethod
+    def _merged(cols, new):
+        """``cols`` plus the rows of ``new`` whose id is not held yet, sorted by id."""
+        fresh = ~np.isin(new.id, cols.id)
+        merged = type(cols)(*(np.concatenate([c, n[fresh]]) for c, n in zip(cols, new)))
+        if len(cols.id) and fresh.any() and new.id[fresh].min() < cols.id[-1]:
+            order = np.argsort(merged.id, kind="stable")
+            merged = type(cols)(*(c[order] for c in merged))
+        return merged
+
+    def append_attempts(self, rows: Sequence[Tuple[int, datetime, Optional[str], Optional[str], Optional[int]]]) -> None:
+        """Merge (id, created_at, status, channel, amount) rows; held ids are skipped."""
+        if not rows:
+            return
+        ids, created, status, channel, amount = zip(*rows)
+        self.attempts = self._merged(self.attempts, _Attempts(
+            np.asarray(ids, dtype=np.int64),
+            np.fromiter((to_us(d) for d in created), dtype=np.int64),
+            self.statuses.encode(status),
+            self.channels.encode(channel),
+            np.fromiter((x or 0 for x in amount), dtype=np.int64),
+        ))
+        self.attempt_watermark = max(self.attempt_watermark, int(max(ids)))
+
+    def append_failures(self, rows: Sequence[Tuple[int, datetime, Optional[str]]]) -> None:
+        """Merge (id, created_at, reason) rows; held ids are skipped."""
+        if not rows:
+            return
+        ids, created, reason = zip(*rows)
+        self.failures = self._merged(self.failures, _Failures(
+            np.asarray(ids, dtype=np.int64),
+            np.fromiter((to_us(d) for d in created), dtype=np.int64),
+            self.reasons.encode(reason),
+        ))
+        self.failure_watermark = max(self.failure_watermark, int(max(ids)))
+
+    def open_attempt_ids(self) -> List[int]:
+        """Ids of attempts whose status may still change."""
+        a = self.attempts
+        terminal = [c for c in (self.statuses.lookup(s) for s in TERMINAL_STATUSES) if c >= 0]
+        mask = ~np.isin(a.status, terminal) if terminal else np.ones(len(a.status), dtype=bool)
+        return a.id[mask].tolist()
+
+    def update_statuses(self, changes: Sequence[Tuple[int, Optional[str]]]) -> None:
+        a = self.attempts
+        if not changes or not len(a.id):
+            return
+        ids = np.asarray([c[0] for c in changes], dtype=np.int64)
+        pos = np.searchsorted(a.id, ids)
+        found = (pos < len(a.id)) & (a.id[np.minimum(pos, len(a.id) - 1)] == ids)
+        codes = self.statuses.encode(c[1] for c in changes)
+        status = a.status.copy()
+        status[pos[found]] = codes[found]
+        self.attempts = a._replace(status=status)
+
+    def trim(self, cutoff_us: int) -> None:
+        """Drop rows that fell out of the window."""
+        self.cutoff_us = cutoff_us
+        a, f = self.attempts, self.failures
+        keep = a.created >= cutoff_us
+        if not keep.all():
+            self.attempts = _Attempts(*(col[keep] for col in a))
+        keep = f.created >= cutoff_us
+        if not keep.all():
+            self.failures = _Failures(*(col[keep] for col in f))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(col.nbytes for col in (*self.attempts, *self.failures))
+
+    def covers(self, start: datetime) -> bool:
+        return to_us(start) >= self.cutoff_us
+
+    # -- queries -------------------------------------------------------
+
+    def _attempt_mask(self, a: _Attempts, start: datetime, end: datetime, statuses: Optional[Sequence[str]] = None):
+        mask = (a.created >= to_us(start)) & (a.created <= to_us(end))
+        if statuses is not None:
+            codes = [c for c in (self.statuses.lookup(s) for s in statuses) if c >= 0]
+            mask &= np.isin(a.status, codes)
+        return mask
+
+    def count_attempts(self, start: datetime, end: datetime, statuses: Optional[Sequence[str]] = None) -> int:
+        a = self.attempts
+        return int(np.count_nonzero(self._attempt_mask(a, start, end, statuses)))
+
+    def sum_amount(self, start: datetime, end: datetime, statuses: Optional[Sequence[str]] = None) -> int:
+        a = self.attempts
+        return int(a.amount[self._attempt_mask(a, start, end, statuses)].sum())
+
+    def attempts_by(self, column: str, start: datetime, end: datetime) -> Dict[Optional[str], int]:
+        a = self.attempts
+        codes, dictionary = (a.status, self.statuses) if column == "status" else (a.channel, self.channels)
+        counts = np.bincount(codes[self._attempt_mask(a, start, end)], minlength=len(dictionary.values))
+        return {dictionary.values[i]: int(n) for i, n in enumerate(counts) if n}
+
+    def failures_by_reason(self, start: datetime, end: datetime) -> Dict[Optional[str], int]:
+        f = self.failures
+        mask = (f.created >= to_us(start)) & (f.created <= to_us(end))
+        counts = np.bincount(f.reason[mask], minlength=len(self.reasons.values))
+        return {self.reasons.values[i]: int(n) for i, n in enumerate(counts) if n}
+
+    def funnel(self, start: datetime, end: datetime) -> Dict[str, int]:
+        by_status = self.attempts_by("status", start, end)
+        return {
+            "failed": sum(by_status.values()),
+            "notified": sum(by_status.get(s, 0) for s in ("sent", "opened", "completed")),
+            "clicked": sum(by_status.get(s, 0) for s in ("opened", "completed")),
+            "paid": by_status.get("completed", 0),
+        }
+
+
+class ColumnarCache:
+    """LRU of OrgSnapshots bounded by total column bytes."""
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024 * 1024,
+        window_days: int = 90,
+        refresh_interval: float = 30.0,
+        overlap_s: float = 300.0,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.window_days = window_days
+        self.refresh_interval = refresh_interval
+        self.overlap_s = overlap_s
+        self._snapshots: "OrderedDict[int, OrgSnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._org_locks: Dict[int, threading.Lock] = {}
+        self.hits = 0
+        self.loads = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def _cutoff_us(self) -> int:
+        return to_us(datetime.now(timezone.utc) - timedelta(days=self.window_days))
+
+    def get(self, db: Session, org_id: int) -> OrgSnapshot:
+        with self._lock:
+            snap = self._snapshots.get(org_id)
+            if snap is not None:
+                self._snapshots.move_to_end(org_id)
+            org_lock = self._org_locks.setdefault(org_id, threading.Lock())
+        with org_lock:
+            if snap is None:
+                snap = OrgSnapshot(org_id, cutoff_us=self._cutoff_us())
+                self._refresh(db, snap)
+                self.loads += 1
+            elif time.monotonic() - snap.refreshed_at >= self.refresh_interval:
+                self._refresh(db, snap)
+                self.refreshes += 1
+            else:
+                self.hits += 1
+        with self._lock:
+            self._snapshots[org_id] = snap
+            self._snapshots.move_to_end(org_id)
+            self._evict()
+        return snap
+
+    def _evict(self) -> None:
+        total = sum(s.nbytes for s in self._snapshots.values())
+        while total > self.max_bytes and len(self._snapshots) > 1:
+            org_id, snap = self._snapshots.popitem(last=False)
+            self._org_locks.pop(org_id, None)
+            total -= snap.nbytes
+            self.evictions += 1
+
+    def _refresh(self, db: Session, snap: OrgSnapshot) -> None:
+        scanned_us = to_us(datetime.now(timezone.utc))
+        cutoff_us = self._cutoff_us()
+        cutoff = datetime.fromtimestamp(cutoff_us / 1_000_000, tz=timezone.utc)
+        # Rows this recent may have committed after a higher id we already read
+        overlap = datetime.fromtimestamp(
+            max(cutoff_us, snap.scanned_us - int(self.overlap_s * 1_000_000)) / 1_000_000, tz=timezone.utc
+        )
+
+        # Status transitions on rows we already hold
+        open_ids = snap.open_attempt_ids()
+        for i in range(0, len(open_ids), _ID_CHUNK):
+            chunk = open_ids[i:i + _ID_CHUNK]
+            rows = db.execute(
+                select(RecoveryAttempt.id, RecoveryAttempt.status).where(RecoveryAttempt.id.in_(chunk))
+            ).all()
+            snap.update_statuses([(r[0], r[1]) for r in rows])
+
+        rows = db.execute(
+            select(RecoveryAttempt.id, RecoveryAttempt.created_at, RecoveryAttempt.status,
+                   RecoveryAttempt.channel, Transaction.amount)
+            .join(Transaction, RecoveryAttempt.transaction_id == Transaction.id)
+            .where(
+                Transaction.org_id == snap.org_id,
+                or_(RecoveryAttempt.id > snap.attempt_watermark, RecoveryAttempt.created_at >= overlap),
+                RecoveryAttempt.created_at >= cutoff,
+            )
+            .order_by(RecoveryAttempt.id)
+        ).all()
+        snap.append_attempts([tuple(r) for r in rows])
+
+        rows = db.execute(
+            select(FailureEvent.id, FailureEvent.created_at, FailureEvent.reason)
+            .join(Transaction, FailureEvent.transaction_id == Transaction.id)
+            .where(
+                Transaction.org_id == snap.org_id,
+                or_(FailureEvent.id > snap.failure_watermark, FailureEvent.created_at >= overlap),
+                FailureEvent.created_at >= cutoff,
+            )
+            .order_by(FailureEvent.id)
+        ).all()
+        snap.append_failures([tuple(r) for r in rows])
+
+        snap.trim(cutoff_us)
+        snap.scanned_us = scanned_us
+        snap.refreshed_at = time.monotonic()
+
+    def invalidate(self, org_id: Optional[int] = None) -> None:
+        with self._lock:
+            if org_id is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(org_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_org = {org_id: s.nbytes for org_id, s in self._snapshots.items()}
+        return {
+            "orgs": len(per_org),
+            "bytes": sum(per_org.values()),
+            "max_bytes": self.max_bytes,
+            "per_org_bytes": per_org,
+            "hits": self.hits,
+            "loads": self.loads,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+        }
+
+
+_cache: Optional[ColumnarCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ColumnarCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ColumnarCache(
+                    max_bytes=int(os.getenv("ANALYTICS_COLUMNAR_MAX_BYTES", str(256 * 1024 * 1024))),
+                    window_days=int(os.getenv("ANALYTICS_COLUMNAR_WINDOW_DAYS", "90")),
+                    refresh_interval=float(os.getenv("ANALYTICS_COLUMNAR_REFRESH_S", "30")),
+                    overlap_s=float(os.getenv("ANALYTICS_COLUMNAR_OVERLAP_S", "300")),
+                )
+    return _cache
+
+
+def snapshot_for(db: Session, org_id: Optional[int], start: datetime) -> Optional[OrgSnapshot]:
+    """Columnar snapshot able to answer queries from ``start``, else None (use SQL)."""
+    if org_id is None or np is None or not flag("FEATURE_ANALYTICS_COLUMNAR"):
+        return None
+    try:
+        snap = get_cache().get(db, org_id)
+    except Exception as e:
+        logger.warning("analytics_columnar_refresh_failed", org_id=org_id, error=str(e))
+        return None
+    return snap if snap.covers(start) else None
+
+
+def cache_stats() -> Optional[Dict[str, Any]]:
+    return None if _cache is None else _cache.stats()
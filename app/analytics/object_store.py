@@ -0,0 +1,408 @@
+"""
+Time-partitioned, compressed object-store layout for the analytics sink.
+
+Records are rolled into files under
+``{prefix}/dt=YYYY-MM-DD/hour=HH/part-NNNNN-<writer>.ndjson.gz`` (or ``.parquet``)
+with size- and age-based rotation. Each writer owns one manifest per day at
+``{prefix}/_manifests/dt=YYYY-MM-DD/<writer>.json`` listing the files it wrote,
+so a date-range scan only needs one LIST per day plus GETs of matching files.
+
+Records sit in memory until their part rolls. With a ``wal`` spool they are
+appended to it first, and the spool's cursor only moves past a record once
+its part was written (or handed to ``on_failed``). A writer created on a
+restarted worker rolls whatever its predecessor's log still holds, so a crash
+loses nothing the sink acknowledged (delivery is at-least-once).
+
+Backends: LocalObjectStore (tests, local dev) and S3ObjectStore (AWS or a
+MinIO stand-in via S3_ENDPOINT_URL).
+"""
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------
+# Stores
+# ---------------------------------------------------------------------------
+
+class LocalObjectStore:
+    """Filesystem-backed store using keys as relative paths under ``root``."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key: str, body: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+    def get(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def list(self, prefix: str) -> List[str]:
+        base = self._path(prefix.rstrip("/"))
+        if not os.path.isdir(base):
+            return []
+        keys: List[str] = []
+        for dirpath, _, files in os.walk(base):
+            for name in files:
+                if ".tmp-" in name:
+                    continue
+                rel = os.path.relpath(os.path.join(dirpath, name), self.root)
+                keys.append(rel.replace(os.sep, "/"))
+        return sorted(keys)
+
+
+class S3ObjectStore:
+    """boto3-backed store; set ``endpoint_url`` to target MinIO."""
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None) -> None:
+        import boto3  # type: ignore
+        kwargs: Dict[str, Any] = {}
+        if endpoint_url:
+            kwargs["endpoint_url"] = endpoint_url
+        if region:
+            kwargs["region_name"] = region
+        self.bucket = bucket
+        self.client = boto3.client("s3", **kwargs)
+
+    def put(self, key: str, body: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body)
+
+    def get(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def list(self, prefix: str) -> List[str]:
+        keys: List[str] = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(obj["Key"] for obj in page.get("Contents", []))
+        return sorted(keys)
+
+
+def store_from_env():
+    """Build the configured store: ANALYTICS_STORE_URL=file:///path, else S3_BUCKET_NAME."""
+    url = os.getenv("ANALYTICS_STORE_URL", "")
+    if url.startswith("file://"):
+        return LocalObjectStore(url[len("file://"):])
+    bucket = os.getenv("S3_BUCKET_NAME")
+    if not bucket:
+        return None
+    return S3ObjectStore(
+        bucket,
+        endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+        region=os.getenv("S3_REGION") or os.getenv("AWS_DEFAULT_REGION"),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Encoding
+# ---------------------------------------------------------------------------
+
+def _encode_ndjson(records: List[Dict[str, Any]]) -> bytes:
+    raw = "\n".join(json.dumps(r, separators=(",", ":")) for r in records).encode("utf-8")
+    return gzip.compress(raw, compresslevel=6)
+
+
+def _decode_ndjson(body: bytes) -> Iterator[Dict[str, Any]]:
+    for line in gzip.decompress(body).splitlines():
+        if line:
+            yield json.loads(line)
+
+
+def _encode_parquet(records: List[Dict[str, Any]]) -> bytes:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+    table = pa.table({
+        "ts": [int(r.get("ts", 0)) for r in records],
+        "event_type": [r.get("event_type") for r in records],
+        "payload": [json.dumps(r.get("payload"), separators=(",", ":")) for r in records],
+    })
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression="zstd")
+    return buf.getvalue()
+
+
+def _decode_parquet(body: bytes) -> Iterator[Dict[str, Any]]:
+    import pyarrow.parquet as pq  # type: ignore
+    table = pq.read_table(io.BytesIO(body))
+    for row in table.to_pylist():
+        yield {"ts": row["ts"], "event_type": row["event_type"], "payload": json.loads(row["payload"])}
+
+
+FORMATS = {
+    "ndjson": (".ndjson.gz", _encode_ndjson, _decode_ndjson),
+    "parquet": (".parquet", _encode_parquet, _decode_parquet),
+}
+
+
+def _partition_of(ts: int) -> Tuple[str, int]:
+    dt = datetime.fromtimestamp(ts, tz=timezone.utc)
+    return dt.strftime("%Y-%m-%d"), dt.hour
+
+
+# ---------------------------------------------------------------------------
+# Writer
+# ---------------------------------------------------------------------------
+
+class _OpenPart:
+    __slots__ = ("records", "approx_bytes", "opened_at", "wal_start")
+
+    def __init__(self, wal_start: Optional[Tuple[int, int]] = None) -> None:
+        self.records: List[Dict[str, Any]] = []
+        self.approx_bytes = 0
+        self.opened_at = time.monotonic()
+        self.wal_start = wal_start  # write-ahead log cursor before this part's first record
+
+
+class PartitionedWriter:
+    """Buffers records per (day, hour) and rolls them into compressed part files.
+
+    A part is written when its buffered size reaches ``max_bytes`` (uncompressed
+    estimate) or it has been open for ``max_age`` seconds. If the store rejects
+    a part, its records are handed to ``on_failed`` (the sink spools them).
+    ``wal`` (an analytics Spool) makes buffered records durable; see the module
+    docstring. Only the current UTC day's manifests are kept in memory.
+    """
+
+    def __init__(
+        self,
+        store,
+        prefix: str = "analytics",
+        fmt: str = "ndjson",
+        max_bytes: int = 8 * 1024 * 1024,
+        max_age: float = 300.0,
+        writer_id: Optional[str] = None,
+        on_failed: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+        wal=None,
+    ) -> None:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported analytics file format: {fmt}")
+        if fmt == "parquet":
+            import pyarrow  # type: ignore  # noqa: F401  (fail fast if missing)
+        self.store = store
+        self.prefix = prefix.rstrip("/")
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.writer_id = writer_id or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._parts: Dict[Tuple[str, int], _OpenPart] = {}
+        self._seq = 0
+        self._manifests: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.on_failed = on_failed
+        self.wal = wal
+        self.files_written = 0
+        self.bytes_written = 0
+        self.files_failed = 0
+        self.recovered = 0
+        if wal is not None:
+            self._recover()
+
+    def write_many(self, records: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            wal_start = None
+            if self.wal is not None:
+                wal_start = self.wal.tail()
+                self.wal.append_many(records)
+            self._buffer(records, wal_start)
+            self._checkpoint()
+
+    def _buffer(self, records: List[Dict[str, Any]], wal_start: Optional[Tuple[int, int]]) -> None:
+        for rec in records:
+            key = _partition_of(int(rec.get("ts") or time.time()))
+            part = self._parts.get(key)
+            if part is None:
+                part = self._parts[key] = _OpenPart(wal_start)
+            part.records.append(rec)
+            part.approx_bytes += len(json.dumps(rec, separators=(",", ":"))) + 1
+            if part.approx_bytes >= self.max_bytes:
+                self._roll(key)
+
+    def _checkpoint(self) -> None:
+        """Move the log's cursor up to the oldest record still only in memory."""
+        if self.wal is None:
+            return
+        open_starts = [p.wal_start for p in self._parts.values() if p.wal_start is not None]
+        cursor = min(open_starts) if open_starts else self.wal.tail()
+        if cursor > self.wal.cursor:
+            self.wal.commit(cursor)
+
+    def _recover(self) -> None:
+        """Roll the records a previous writer logged but never wrote out."""
+        with self._lock:
+            while True:
+                records, cursor = self.wal.read_batch(10000)
+                if not records:
+                    break
+                self._buffer(records, None)
+                for key in list(self._parts):
+                    self._roll(key)
+                self.wal.commit(cursor)
+                self.recovered += len(records)
+        if self.recovered:
+            logger.info("analytics_parts_recovered", records=self.recovered)
+
+    def maybe_rotate(self) -> None:
+        """Roll parts that have exceeded ``max_age``; call periodically."""
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, p in self._parts.items() if now - p.opened_at >= self.max_age]:
+                self._roll(key)
+            self._checkpoint()
+
+    def close(self) -> None:
+        with self._lock:
+            for key in list(self._parts):
+                self._roll(key)
+            self._checkpoint()
+
+    def _manifest_files(self, day: str) -> List[Dict[str, Any]]:
+        files = self._manifests.get(day)
+        if files is None:
+            # Evicted (or from before a restart): late records for a past day
+            # must extend its manifest, not replace it
+            files = []
+            key = f"{self.prefix}/_manifests/dt={day}/{self.writer_id}.json"
+            if key in self.store.list(f"{self.prefix}/_manifests/dt={day}/"):
+                files = json.loads(self.store.get(key)).get("files", [])
+            self._manifests[day] = files
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        for old in [d for d in self._manifests if d < today and d != day]:
+            del self._manifests[old]
+        return files
+
+    def _roll(self, key: Tuple[str, int]) -> None:
+        part = self._parts.pop(key, None)
+        if part is None or not part.records:
+            return
+        day, hour = key
+        ext, encode, _ = FORMATS[self.fmt]
+        self._seq += 1
+        obj_key = f"{self.prefix}/dt={day}/hour={hour:02d}/part-{self._seq:05d}-{self.writer_id}{ext}"
+        body = encode(part.records)
+        entry = {
+            "key": obj_key,
+            "hour": hour,
+            "records": len(part.records),
+            "bytes": len(body),
+            "min_ts": min(int(r.get("ts") or 0) for r in part.records),
+            "max_ts": max(int(r.get("ts") or 0) for r in part.records),
+            "format": self.fmt,
+        }
+        files: List[Dict[str, Any]] = []
+        try:
+            files = self._manifest_files(day)
+            files.append(entry)
+            self.store.put(obj_key, body)
+            manifest = {"writer": self.writer_id, "dt": day, "files": files}
+            self.store.put(f"{self.prefix}/_manifests/dt={day}/{self.writer_id}.json", json.dumps(manifest).encode("utf-8"))
+        except Exception as e:
+            # Unlisted in the manifest, a stray part is invisible to readers
+            if entry in files:
+                files.remove(entry)
+            self.files_failed += 1
+            logger.warning("analytics_part_write_failed", key=obj_key, error=str(e), rows=len(part.records))
+            if self.on_failed is not None:
+                self.on_failed(part.records)
+            return
+        self.files_written += 1
+        self.bytes_written += len(body)
+
+
+# ---------------------------------------------------------------------------
+# Reader
+# ---------------------------------------------------------------------------
+
+def list_files(store, start: datetime, end: datetime, prefix: str = "analytics") -> List[Dict[str, Any]]:
+    """Return manifest entries whose [min_ts, max_ts] overlaps [start, end]."""
+    prefix = prefix.rstrip("/")
+    start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+    day = start.astimezone(timezone.utc).date()
+    last = end.astimezone(timezone.utc).date()
+    out: List[Dict[str, Any]] = []
+    while day <= last:
+        for mkey in store.list(f"{prefix}/_manifests/dt={day.isoformat()}/"):
+            manifest = json.loads(store.get(mkey))
+            for entry in manifest.get("files", []):
+                if entry["max_ts"] >= start_ts and entry["min_ts"] <= end_ts:
+                    out.append(entry)
+        day += timedelta(days=1)
+    return sorted(out, key=lambda e: (e["min_ts"], e["key"]))
+
+
+def scan(
+    store,
+    start: datetime,
+    end: datetime,
+    event_type: Optional[str] = None,
+    prefix: str = "analytics",
+) -> Iterator[Dict[str, Any]]:
+    """Yield records with start <= ts <= end, reading only files the manifests point at."""
+    start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+    for entry in list_files(store, start, end, prefix=prefix):
+        _, _, decode = FORMATS[entry.get("format", "ndjson")]
+        for rec in decode(store.get(entry["key"])):
+            ts = int(rec.get("ts") or 0)
+            if ts < start_ts or ts > end_ts:
+                continue
+            if event_type and rec.get("event_type") != event_type:
+                continue
+            yield rec
+
+
+_writer: Optional[PartitionedWriter] = None
+_writer_pid: Optional[int] = None
+_writer_lock = threading.Lock()
+
+
+def get_partition_writer(
+    on_failed: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    wal: Optional[Callable[[], Any]] = None,
+) -> Optional[PartitionedWriter]:
+    """Per-process writer for the configured store, or None when unconfigured.
+
+    ``on_failed`` and ``wal`` (a factory for the write-ahead spool) are only
+    used when the writer is first created.
+    """
+    global _writer, _writer_pid
+    pid = os.getpid()
+    if _writer is None or _writer_pid != pid:
+        with _writer_lock:
+            if _writer is None or _writer_pid != pid:
+                store = store_from_env()
+                if store is None:
+                    return None
+                _writer = PartitionedWriter(
+                    store,
+                    prefix=os.getenv("ANALYTICS_STORE_PREFIX", "analytics"),
+                    fmt=os.getenv("ANALYTICS_FILE_FORMAT", "ndjson"),
+                    max_bytes=int(os.getenv("ANALYTICS_PART_MAX_BYTES", str(8 * 1024 * 1024))),
+                    max_age=float(os.getenv("ANALYTICS_PART_MAX_AGE_S", "300")),
+                    on_failed=on_failed,
+                    wal=wal() if wal is not None else None,
+                )
+                _writer_pid = pid
+    return _writer
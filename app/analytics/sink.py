@@ -3,10 +3,12 @@ from __future__ import annotations
 import json
 import os
 import time
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 from app.config.flags import flag
-from .util import safe_http_post, safe_s3_put
+from .object_store import get_partition_writer
+from .spool import get_spool
+from .util import safe_http_post, safe_http_post_rows, safe_s3_put
 
 try:
     import structlog  # type: ignore
@@ -20,6 +22,8 @@ def emit(event_type: str, payload: Dict[str, Any]) -> None:
     """Emit an analytics record to configured sinks if enabled.
 
     Never raises; controlled by FEATURE_ANALYTICS_SINK and per-sink flags.
+    With FEATURE_ANALYTICS_BATCH (default on) the record is only enqueued and
+    delivered by the background batch emitter, so callers never wait on I/O.
     """
     if not flag("FEATURE_ANALYTICS_SINK"):
         return
@@ -29,15 +33,156 @@ def emit(event_type: str, payload: Dict[str, Any]) -> None:
         "payload": payload,
     }
     try:
+        if flag("FEATURE_ANALYTICS_BATCH", "on"):
+            from .batcher import get_emitter
+            get_emitter().submit(record)
+            return
         if flag("FEATURE_CLICKHOUSE_SINK"):
-            safe_http_post(
+            if not safe_http_post(
                 os.getenv("CLICKHOUSE_URL"),
                 os.getenv("CLICKHOUSE_DATABASE"),
                 os.getenv("CLICKHOUSE_TABLE", "tinko_events"),
                 record,
-            )
+            ):
+                _spool_failed("clickhouse", [record])
         if flag("FEATURE_S3_SINK"):
-            safe_s3_put(os.getenv("S3_BUCKET_NAME"), f"analytics/{record['ts']}-{event_type}.json", json.dumps(record).encode("utf-8"))
+            if not safe_s3_put(os.getenv("S3_BUCKET_NAME"), f"analytics/{record['ts']}-{event_type}.json", json.dumps(record).encode("utf-8")):
+                _spool_failed("s3", [record])
     except Exception as e:  # pragma: no cover
         # Guard rail: never throw
         logger.warning("analytics_emit_failed", error=str(e))
+
+
+def send_batch(records: List[Dict[str, Any]]) -> bool:
+    """Deliver a batch of records to every enabled sink; never raises.
+
+    ClickHouse receives a single multi-row JSONEachRow insert; S3 receives
+    partitioned part files. Rows a configured sink rejects go to the on-disk
+    spool and are replayed later by ``tick``.
+    """
+    ok = True
+    if flag("FEATURE_CLICKHOUSE_SINK"):
+        if not _send_clickhouse(records):
+            _spool_failed("clickhouse", records)
+            ok = False
+    if flag("FEATURE_S3_SINK"):
+        if not _write_partitioned(records):
+            _spool_failed("s3", records)
+            ok = False
+    return ok
+
+
+def _send_clickhouse(records: List[Dict[str, Any]]) -> bool:
+    return safe_http_post_rows(
+        os.getenv("CLICKHOUSE_URL"),
+        os.getenv("CLICKHOUSE_DATABASE"),
+        os.getenv("CLICKHOUSE_TABLE", "tinko_events"),
+        records,
+    )
+
+
+def _write_partitioned(records: List[Dict[str, Any]]) -> bool:
+    """Roll records into the time-partitioned object-store layout."""
+    try:
+        writer = get_partition_writer(on_failed=_spool_s3_parts, wal=_open_parts_wal)
+        if writer is None:
+            logger.warning("analytics_s3_disabled", reason="missing_bucket")
+            return False
+        writer.write_many(records)
+        writer.maybe_rotate()
+        return True
+    except Exception as e:  # pragma: no cover
+        logger.warning("analytics_s3_write_failed", error=str(e), rows=len(records))
+        return False
+
+
+def rotate_files(final: bool = False) -> None:
+    """Age-based rotation for open part files; ``final`` writes everything out."""
+    if not flag("FEATURE_S3_SINK"):
+        return
+    try:
+        writer = get_partition_writer(on_failed=_spool_s3_parts, wal=_open_parts_wal)
+        if writer is None:
+            return
+        if final:
+            writer.close()
+        else:
+            writer.maybe_rotate()
+    except Exception as e:  # pragma: no cover
+        logger.warning("analytics_s3_rotate_failed", error=str(e))
+
+
+# ---------------------------------------------------------------------------
+# Spool / replay
+# ---------------------------------------------------------------------------
+
+_SENDERS = {"clickhouse": _send_clickhouse, "s3": _write_partitioned}
+_replay_state: Dict[str, Dict[str, float]] = {}
+
+
+def _sink_configured(sink: str) -> bool:
+    """Spool only for sinks that are set up; a missing URL is not an outage."""
+    if sink == "clickhouse":
+        return bool(os.getenv("CLICKHOUSE_URL") and os.getenv("CLICKHOUSE_DATABASE"))
+    if sink == "s3":
+        return bool(os.getenv("ANALYTICS_STORE_URL", "").startswith("file://") or os.getenv("S3_BUCKET_NAME"))
+    return False
+
+
+def _spool_failed(sink: str, records: List[Dict[str, Any]]) -> None:
+    if not flag("FEATURE_ANALYTICS_SPOOL", "on") or not _sink_configured(sink):
+        return
+    try:
+        get_spool(sink).append_many(records)
+    except Exception as e:  # pragma: no cover
+        logger.warning("analytics_spool_failed", sink=sink, error=str(e), rows=len(records))
+
+
+def _open_parts_wal():
+    # Records buffered in open part files are logged here until their part is
+    # written, so the sink can acknowledge them without risking a crash
+    if not flag("FEATURE_ANALYTICS_SPOOL", "on"):
+        return None
+    return get_spool("s3-open")
+
+
+def _spool_s3_parts(records: List[Dict[str, Any]]) -> None:
+    # Part files are rolled asynchronously, so S3 failures surface here rather
+    # than in send_batch's return value.
+    _spool_failed("s3", records)
+
+
+def replay_spools(force: bool = False) -> int:
+    """Drain spooled records for every enabled sink, backing off after failures."""
+    if not flag("FEATURE_ANALYTICS_SPOOL", "on"):
+        return 0
+    now = time.monotonic()
+    base_backoff = float(os.getenv("ANALYTICS_SPOOL_RETRY_S", "5"))
+    batch_size = int(os.getenv("ANALYTICS_SPOOL_REPLAY_BATCH", "5000"))
+    delivered = 0
+    for sink, enabled in (("clickhouse", "FEATURE_CLICKHOUSE_SINK"), ("s3", "FEATURE_S3_SINK")):
+        if not flag(enabled) or not _sink_configured(sink):
+            continue
+        state = _replay_state.setdefault(sink, {"next_at": 0.0, "backoff": base_backoff})
+        if not force and now < state["next_at"]:
+            continue
+        try:
+            spool = get_spool(sink)
+            if spool.pending_bytes() == 0:
+                continue
+            failures = spool.replay_failures
+            delivered += spool.replay(_SENDERS[sink], batch_size=batch_size)
+            if spool.replay_failures > failures:
+                state["next_at"] = now + state["backoff"]
+                state["backoff"] = min(state["backoff"] * 2, 60.0)
+            else:
+                state["backoff"] = base_backoff
+        except Exception as e:  # pragma: no cover
+            logger.warning("analytics_spool_replay_error", sink=sink, error=str(e))
+    return delivered
+
+
+def tick() -> None:
+    """Periodic housekeeping run by the batch emitter thread."""
+    rotate_files()
+    replay_spools()
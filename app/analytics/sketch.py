@@ -0,0 +1,128 @@
+"""
+Pure-Python DDSketch for mergeable quantile estimates.
+
+Values are bucketed on a logarithmic scale so every quantile is returned with
+at most ``relative_accuracy`` relative error, and two sketches merge by
+adding bucket counts. Sketches serialise to small JSON dicts so they can be
+stored per (org, day, channel) row and merged at query time.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterable, Optional
+
+
+class DDSketch:
+    """Positive-value DDSketch with a collapsing lowest-bucket bound."""
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048) -> None:
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        # Midpoint of the bucket in the relative-error sense
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value: float, weight: int = 1) -> None:
+        if value < 0:
+            raise ValueError("DDSketch only accepts non-negative values")
+        if value <= 1e-9:
+            self.zero_count += weight
+        else:
+            idx = self._index(value)
+            self.bins[idx] = self.bins.get(idx, 0) + weight
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += weight
+        self.sum += value * weight
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def _collapse(self) -> None:
+        # Fold the lowest buckets together; accuracy is kept for higher quantiles
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        target = keys[excess]
+        for k in keys[:excess]:
+            self.bins[target] += self.bins.pop(k)
+
+    def merge(self, other: "DDSketch") -> None:
+        if abs(other.gamma - self.gamma) > 1e-12:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for k, c in other.bins.items():
+            self.bins[k] = self.bins.get(k, 0) + c
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not 0 <= q <= 1:
+            raise ValueError("quantile must be in [0, 1]")
+        if self.count == 0:
+            return None
+        if q == 0:
+            return self.min
+        if q == 1:
+            return self.max
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for k in sorted(self.bins):
+            seen += self.bins[k]
+            if seen > rank:
+                # Clamp to the observed range
+                return min(max(self._value(k), self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "a": self.relative_accuracy,
+            "bins": {str(k): c for k, c in self.bins.items()},
+            "zero": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], max_bins: int = 2048) -> "DDSketch":
+        sk = cls(relative_accuracy=float(data.get("a", 0.01)), max_bins=max_bins)
+        sk.bins = {int(k): int(c) for k, c in (data.get("bins") or {}).items()}
+        sk.zero_count = int(data.get("zero", 0))
+        sk.count = int(data.get("count", 0))
+        sk.sum = float(data.get("sum", 0.0))
+        sk.min = data.get("min")
+        sk.max = data.get("max")
+        return sk
+
+    @classmethod
+    def merged(cls, sketches: Iterable["DDSketch"], relative_accuracy: float = 0.01) -> "DDSketch":
+        out = cls(relative_accuracy=relative_accuracy)
+        for sk in sketches:
+            out.merge(sk)
+        return out
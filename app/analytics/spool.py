@@ -0,0 +1,383 @@
+"""
+Append-only on-disk spool for analytics records the sinks failed to deliver.
+
+Layout: one directory per sink and process slot containing
+``seg-NNNNNNNNNNNN.log`` segment files and a ``cursor.json`` with the (segment, offset) of the next unreplayed
+record. Each record is framed as ``<u32 length><u32 crc32><json bytes>``; a
+short or corrupt tail (torn write after a crash) ends the readable region.
+
+Appends go through a buffered file handle and are fsync'd in batches (every
+``fsync_every`` records or ``fsync_interval`` seconds). Replay reads segments
+through ``mmap`` and advances the cursor only after the sender accepted the
+batch, so delivery is at-least-once.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+_HEADER = struct.Struct("<II")
+_SEGMENT_PREFIX = "seg-"
+_SEGMENT_SUFFIX = ".log"
+
+Sender = Callable[[List[Dict[str, Any]]], bool]
+
+
+def _segment_name(seq: int) -> str:
+    return f"{_SEGMENT_PREFIX}{seq:012d}{_SEGMENT_SUFFIX}"
+
+
+def _segment_seq(name: str) -> Optional[int]:
+    if not (name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX)):
+        return None
+    try:
+        return int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)])
+    except ValueError:
+        return None
+
+
+class Spool:
+    """Durable FIFO of JSON records backed by segment files in ``directory``."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        fsync_every: int = 1000,
+        fsync_interval: float = 1.0,
+    ) -> None:
+        self.directory = directory
+        self.segment_bytes = max(1024, segment_bytes)
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._fh = None
+        self._active_seq = 0
+        self._active_size = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._cursor: Tuple[int, int] = self._load_cursor()
+
+        self.appended = 0
+        self.replayed = 0
+        self.replay_batches = 0
+        self.replay_failures = 0
+        self.corrupt = 0
+        self.last_replay_rate = 0.0
+
+        # Never append to a segment left by a previous process: its tail may be torn
+        segs = self._segments()
+        self._active_seq = (segs[-1] + 1) if segs else max(1, self._cursor[0])
+
+    # -- bookkeeping ---------------------------------------------------
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, _segment_name(seq))
+
+    def _segments(self) -> List[int]:
+        seqs = [s for s in (_segment_seq(n) for n in os.listdir(self.directory)) if s is not None]
+        return sorted(seqs)
+
+    def _load_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, "cursor.json"), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return int(data["segment"]), int(data["offset"])
+        except Exception:
+            segs = self._segments()
+            return (segs[0] if segs else 1), 0
+
+    def _store_cursor(self, seq: int, offset: int) -> None:
+        path = os.path.join(self.directory, "cursor.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segment": seq, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._cursor = (seq, offset)
+
+    # -- append side ---------------------------------------------------
+
+    def _open_active(self) -> None:
+        if self._fh is not None:
+            return
+        path = self._path(self._active_seq)
+        self._fh = open(path, "ab")
+        self._active_size = self._fh.tell()
+
+    def _rotate(self) -> None:
+        self._sync()
+        self._fh.close()
+        self._fh = None
+        self._active_seq += 1
+        self._open_active()
+
+    def _sync(self) -> None:
+        if self._fh is None or self._unsynced == 0:
+            return
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def append_many(self, records: List[Dict[str, Any]]) -> int:
+        """Persist records; returns how many were written. Never raises."""
+        if not records:
+            return 0
+        written = 0
+        try:
+            with self._lock:
+                self._open_active()
+                for rec in records:
+                    payload = json.dumps(rec, separators=(",", ":")).encode("utf-8")
+                    frame = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+                    if self._active_size and self._active_size + len(frame) > self.segment_bytes:
+                        self._rotate()
+                    self._fh.write(frame)
+                    self._active_size += len(frame)
+                    self._unsynced += 1
+                    written += 1
+                self.appended += written
+                if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                    self._sync()
+        except Exception as e:  # pragma: no cover - disk full / permissions
+            logger.warning("analytics_spool_append_failed", error=str(e), rows=len(records) - written)
+        return written
+
+    def tail(self) -> Tuple[int, int]:
+        """Cursor just past the last appended record."""
+        with self._lock:
+            return self._active_seq, self._active_size
+
+    @property
+    def cursor(self) -> Tuple[int, int]:
+        """Cursor of the next unconsumed record."""
+        return self._cursor
+
+    def sync(self) -> None:
+        """Force buffered appends to disk."""
+        with self._lock:
+            self._sync()
+
+    # -- read / replay side --------------------------------------------
+
+    def _read_from(self, seq: int, offset: int, limit: int) -> Tuple[List[Dict[str, Any]], int, bool]:
+        """Read up to ``limit`` records from one segment.
+
+        Returns (records, next_offset, at_end) where at_end means no further
+        complete record exists in this segment right now.
+        """
+        path = self._path(seq)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return [], offset, True
+        if size <= offset:
+            return [], offset, True
+        out: List[Dict[str, Any]] = []
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                pos = offset
+                while len(out) < limit:
+                    if pos + _HEADER.size > size:
+                        return out, pos, True
+                    length, crc = _HEADER.unpack_from(mm, pos)
+                    start = pos + _HEADER.size
+                    if start + length > size:
+                        return out, pos, True
+                    payload = mm[start:start + length]
+                    if zlib.crc32(payload) != crc:
+                        # Corrupt frame: framing can't be trusted past this point
+                        self.corrupt += 1
+                        logger.warning("analytics_spool_corrupt_record", segment=seq, offset=pos)
+                        return out, size, True
+                    out.append(json.loads(payload))
+                    pos = start + length
+                return out, pos, pos >= size
+
+    def read_batch(self, limit: int) -> Tuple[List[Dict[str, Any]], Tuple[int, int]]:
+        """Return up to ``limit`` pending records and the cursor just past them."""
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+            seq, offset = self._cursor
+            active = self._active_seq
+            out: List[Dict[str, Any]] = []
+            while len(out) < limit:
+                recs, offset, at_end = self._read_from(seq, offset, limit - len(out))
+                out.extend(recs)
+                if not at_end:
+                    break
+                if seq >= active:
+                    break
+                seq, offset = seq + 1, 0
+            return out, (seq, offset)
+
+    def commit(self, cursor: Tuple[int, int]) -> None:
+        """Advance the cursor and delete fully consumed segments."""
+        with self._lock:
+            self._store_cursor(*cursor)
+            for s in self._segments():
+                if s < cursor[0] and s != self._active_seq:
+                    try:
+                        os.remove(self._path(s))
+                    except OSError:
+                        pass
+            if cursor[0] == self._active_seq and cursor[1] >= self._active_size and self._active_size:
+                # Everything replayed: start a fresh segment so disk is reclaimed
+                self._rotate()
+                self._store_cursor(self._active_seq, 0)
+                try:
+                    os.remove(self._path(cursor[0]))
+                except OSError:
+                    pass
+
+    def replay(self, sender: Sender, batch_size: int = 5000, max_seconds: float = 1.0) -> int:
+        """Drain pending records through ``sender`` in large batches.
+
+        Stops at the first failed batch (the cursor stays put) or once
+        ``max_seconds`` elapsed. Returns the number of records delivered.
+        """
+        started = time.monotonic()
+        delivered = 0
+        with self._lock:
+            # Records re-spooled by the sender during this call wait for the next one
+            stop_at = (self._active_seq, self._active_size)
+        while time.monotonic() - started < max_seconds and self._cursor < stop_at:
+            batch, cursor = self.read_batch(batch_size)
+            if not batch:
+                break
+            try:
+                ok = sender(batch)
+            except Exception as e:  # pragma: no cover - sender should never raise
+                logger.warning("analytics_spool_replay_failed", error=str(e), rows=len(batch))
+                ok = False
+            if not ok:
+                self.replay_failures += 1
+                break
+            self.commit(cursor)
+            delivered += len(batch)
+            self.replay_batches += 1
+        self.replayed += delivered
+        if delivered:
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.last_replay_rate = delivered / elapsed
+            logger.info("analytics_spool_replayed", records=delivered, rate=round(self.last_replay_rate, 1))
+        return delivered
+
+    def pending_bytes(self) -> int:
+        """Bytes on disk not yet replayed (includes framing overhead)."""
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+            seq, offset = self._cursor
+            total = 0
+            for s in self._segments():
+                if s < seq:
+                    continue
+                try:
+                    total += os.path.getsize(self._path(s))
+                except OSError:
+                    continue
+            return max(0, total - offset)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._sync()
+                self._fh.close()
+                self._fh = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "segments": len(self._segments()),
+            "pending_bytes": self.pending_bytes(),
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "replay_batches": self.replay_batches,
+            "replay_failures": self.replay_failures,
+            "last_replay_rate": round(self.last_replay_rate, 1),
+            "corrupt": self.corrupt,
+        }
+
+
+_spools: Dict[str, Spool] = {}
+_spools_pid: Optional[int] = None
+_spools_lock = threading.Lock()
+_slot_locks: List[Any] = []
+
+
+def _claim_slot(base: str, sink: str) -> str:
+    """Pick a spool directory no other live process holds.
+
+    Slots are ``<sink>/0``, ``<sink>/1``, ... guarded by an flock, so a
+    restarted worker reclaims (and replays) whatever its predecessor left.
+    """
+    try:
+        import fcntl  # type: ignore
+    except Exception:  # pragma: no cover - non-POSIX
+        return os.path.join(base, sink, str(os.getpid()))
+    for slot in range(256):
+        directory = os.path.join(base, sink, str(slot))
+        os.makedirs(directory, exist_ok=True)
+        fh = open(os.path.join(directory, ".lock"), "a+")
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            continue
+        _slot_locks.append(fh)  # held for the life of the process
+        return directory
+    return os.path.join(base, sink, f"pid-{os.getpid()}")
+
+
+def get_spool(sink: str) -> Spool:
+    """Per-process spool for ``sink`` under ANALYTICS_SPOOL_DIR."""
+    global _spools, _spools_pid
+    pid = os.getpid()
+    with _spools_lock:
+        if _spools_pid != pid:
+            _spools, _spools_pid = {}, pid
+            _slot_locks.clear()
+        spool = _spools.get(sink)
+        if spool is None:
+            base = os.getenv("ANALYTICS_SPOOL_DIR", os.path.join("var", "analytics-spool"))
+            spool = _spools[sink] = Spool(
+                _claim_slot(base, sink),
+                segment_bytes=int(os.getenv("ANALYTICS_SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024))),
+                fsync_every=int(os.getenv("ANALYTICS_SPOOL_FSYNC_EVERY", "1000")),
+                fsync_interval=int(os.getenv("ANALYTICS_SPOOL_FSYNC_INTERVAL_MS", "1000")) / 1000.0,
+            )
+    return spool
+
+
+def spool_stats() -> Dict[str, Any]:
+    """Counters for every spool opened by this process."""
+    if _spools_pid != os.getpid():
+        return {}
+    return {name: s.stats() for name, s in _spools.items()}
+
+
+def close_spools() -> None:
+    """Flush and fsync every spool opened by this process."""
+    if _spools_pid != os.getpid():
+        return
+    for s in _spools.values():
+        s.close()
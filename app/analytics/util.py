@@ -2,7 +2,8 @@ from __future__ import annotations
 
 import json
 import os
-from typing import Any, Optional
+import threading
+from typing import Any, List, Optional
 
 try:
     import structlog  # type: ignore
@@ -12,37 +13,70 @@ except Exception:  # pragma: no cover
     logger = logging.getLogger(__name__)
 
 
-def safe_http_post(url: Optional[str], database: Optional[str], table: Optional[str], record: dict) -> None:
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def _get_http_client():
+    """Return a process-wide pooled httpx.Client for ClickHouse inserts."""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                import httpx  # type: ignore
+                _http_client = httpx.Client(
+                    timeout=3.0,
+                    limits=httpx.Limits(max_connections=4, max_keepalive_connections=2),
+                )
+    return _http_client
+
+
+def _clickhouse_auth():
+    # Support optional basic auth via env (CLICKHOUSE_USER/PASSWORD)
+    user = os.getenv("CLICKHOUSE_USER")
+    pwd = os.getenv("CLICKHOUSE_PASSWORD")
+    if user:
+        return (user, pwd or "")
+    return None
+
+
+def safe_http_post(url: Optional[str], database: Optional[str], table: Optional[str], record: dict) -> bool:
     """Attempt to write a record to ClickHouse via HTTP; never raise.
 
     Expects the ClickHouse server URL (e.g., http://localhost:8123) and will
     perform an INSERT into database.table using JSONEachRow format.
+    Returns True when the insert was accepted.
+    """
+    return safe_http_post_rows(url, database, table, [record])
+
+
+def safe_http_post_rows(url: Optional[str], database: Optional[str], table: Optional[str], records: List[dict]) -> bool:
+    """Multi-row variant of safe_http_post: one JSONEachRow INSERT per call.
+
+    Rows are newline-delimited in a single request body over the pooled client.
     """
     if not url or not database or not table:
         logger.warning("analytics_http_disabled", reason="missing_url_or_db_or_table")
-        return
+        return False
+    if not records:
+        return True
     try:
-        import httpx  # type: ignore
         query = f"INSERT INTO {database}.{table} FORMAT JSONEachRow"
-        data = json.dumps(record).encode("utf-8")
+        data = "\n".join(json.dumps(r) for r in records).encode("utf-8")
         headers = {"Content-Type": "application/json"}
-        # Support optional basic auth via env (CLICKHOUSE_USER/PASSWORD)
-        auth = None
-        user = os.getenv("CLICKHOUSE_USER")
-        pwd = os.getenv("CLICKHOUSE_PASSWORD")
-        if user:
-            auth = (user, pwd or "")
-        with httpx.Client(timeout=3.0) as client:
-            client.post(f"{url}/?query={query}", content=data, headers=headers, auth=auth)
+        r = _get_http_client().post(f"{url}/?query={query}", content=data, headers=headers, auth=_clickhouse_auth())
+        r.raise_for_status()
+        return True
     except Exception as e:  # pragma: no cover
-        logger.warning("analytics_http_post_failed", error=str(e))
+        logger.warning("analytics_http_post_failed", error=str(e), rows=len(records))
+        return False
 
 
-def safe_s3_put(bucket: Optional[str], key: str, body: bytes) -> None:
+def safe_s3_put(bucket: Optional[str], key: str, body: bytes) -> bool:
     """Attempt to write a blob to S3; never raise. Uses boto3 if available."""
     if not bucket:
         logger.warning("analytics_s3_disabled", reason="missing_bucket")
-        return
+        return False
     try:
         import boto3  # type: ignore
         region = os.getenv("S3_REGION") or os.getenv("AWS_DEFAULT_REGION")
@@ -52,5 +86,7 @@ def safe_s3_put(bucket: Optional[str], key: str, body: bytes) -> None:
         else:
             s3 = boto3.client("s3")
         s3.put_object(**kwargs)
+        return True
     except Exception as e:  # pragma: no cover
         logger.warning("analytics_s3_put_failed", error=str(e))
+        return False
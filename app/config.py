@@ -7,6 +7,10 @@ from typing import Optional, List
 from pydantic_settings import BaseSettings
 from pydantic import field_validator
 
+# This module shadows the app/config/ directory; expose it as a package path
+# so submodules such as app.config.flags stay importable.
+__path__ = [os.path.join(os.path.dirname(__file__), "config")]
+
 
 class Settings(BaseSettings):
     """Application settings"""
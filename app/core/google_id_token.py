@@ -0,0 +1,202 @@
+"""
+Local verification of Google ID tokens.
+
+Google signs ID tokens with RS256 keys published as a JWKS whose
+Cache-Control max-age says how long they may be cached. The verifier keeps
+the key set in memory, refreshes it in the background once it is within
+``refresh_margin`` of expiring, and forces one (rate-limited) refresh when a
+token names an unknown ``kid`` (key rotation). A login therefore verifies
+signature, issuer, audience and expiry without calling Google.
+
+Pass ``jwks=`` (and ``certs_url=None``) for a fixed local key set, or an
+``httpx.AsyncClient`` with a mock transport, to test offline.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+import httpx
+from jose import JWTError, jwt
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class InvalidIdToken(Exception):
+    """The ID token failed verification (or no signing key was available)."""
+
+
+def cache_max_age(cache_control: Optional[str]) -> Optional[int]:
+    m = _MAX_AGE_RE.search(cache_control or "")
+    return int(m.group(1)) if m else None
+
+
+class GoogleIdTokenVerifier:
+    def __init__(
+        self,
+        certs_url: Optional[str] = GOOGLE_CERTS_URL,
+        client: Optional[httpx.AsyncClient] = None,
+        jwks: Optional[Dict[str, Any]] = None,
+        default_max_age: float = 3600.0,
+        refresh_margin: float = 0.1,
+        min_refresh_interval: float = 30.0,
+        leeway: int = 60,
+    ) -> None:
+        self.certs_url = certs_url
+        self.client = client
+        self.default_max_age = default_max_age
+        self.refresh_margin = refresh_margin
+        self.min_refresh_interval = min_refresh_interval
+        self.leeway = leeway
+        self._keys: Dict[str, Dict[str, Any]] = {}
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._fetched_at = float("-inf")
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.verified = 0
+        self.rejected = 0
+        if jwks is not None:
+            self._install(jwks, float("inf"))
+
+    def _install(self, jwks: Dict[str, Any], max_age: float) -> None:
+        self._keys = {k["kid"]: k for k in jwks.get("keys", []) if k.get("kid")}
+        now = time.monotonic()
+        self._fetched_at = now
+        self._expires_at = now + max_age
+        self._refresh_at = now + max_age * (1 - self.refresh_margin)
+
+    async def refresh(self) -> None:
+        """Fetch the JWKS now (no-op for a fixed key set); keeps old keys on failure."""
+        if self.certs_url is None:
+            return
+        started = time.monotonic()
+        async with self._lock:
+            if self._fetched_at >= started:
+                return  # another caller refreshed while we waited
+            from app.core.http import get_http_client
+
+            client = self.client or get_http_client()
+            try:
+                resp = await client.get(self.certs_url)
+                resp.raise_for_status()
+                jwks = resp.json()
+            except Exception as e:
+                self.refresh_failures += 1
+                # Back off so a Google outage does not turn into a fetch per login
+                self._fetched_at = time.monotonic()
+                logger.warning("google_jwks_refresh_failed", error=str(e), cached_keys=len(self._keys))
+                return
+            max_age = cache_max_age(resp.headers.get("cache-control"))
+            self._install(jwks, float(max_age) if max_age is not None else self.default_max_age)
+            self.refreshes += 1
+
+    async def _refresh_quietly(self) -> None:
+        try:
+            await self.refresh()
+        except Exception:  # pragma: no cover - refresh already logs
+            pass
+
+    def _refresh_in_background(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._refresh_quietly())
+
+    async def _key(self, kid: Optional[str]) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        if not self._keys or now >= self._expires_at:
+            await self.refresh()
+        elif now >= self._refresh_at:
+            self._refresh_in_background()
+        key = self._keys.get(kid) if kid else None
+        if key is None and kid and time.monotonic() - self._fetched_at >= self.min_refresh_interval:
+            # Probably a freshly rotated key
+            await self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+    async def verify(
+        self,
+        id_token: str,
+        audiences: Iterable[str],
+        access_token: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Verified claims of ``id_token`` issued for one of ``audiences``; raises InvalidIdToken."""
+        try:
+            claims = await self._verify(id_token, [a for a in audiences if a], access_token)
+        except InvalidIdToken:
+            self.rejected += 1
+            raise
+        self.verified += 1
+        return claims
+
+    async def _verify(self, id_token: str, audiences, access_token: Optional[str]) -> Dict[str, Any]:
+        if not audiences:
+            raise InvalidIdToken("no audience configured")
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except JWTError as e:
+            raise InvalidIdToken(f"malformed token: {e}")
+        if header.get("alg") != "RS256":
+            raise InvalidIdToken("unexpected algorithm")
+        key = await self._key(header.get("kid"))
+        if key is None:
+            raise InvalidIdToken("unknown signing key")
+        try:
+            claims = jwt.decode(
+                id_token,
+                key,
+                algorithms=["RS256"],
+                issuer=GOOGLE_ISSUERS,
+                access_token=access_token,
+                options={"verify_aud": False, "verify_at_hash": access_token is not None, "leeway": self.leeway},
+            )
+        except JWTError as e:
+            raise InvalidIdToken(str(e))
+        aud = claims.get("aud")
+        if (aud not in audiences) if isinstance(aud, str) else not set(aud or ()) & set(audiences):
+            raise InvalidIdToken("audience mismatch")
+        return claims
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        expires_in = self._expires_at - now
+        return {
+            "keys": len(self._keys),
+            "expires_in_s": None if expires_in == float("inf") else round(max(0.0, expires_in), 1),
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "verified": self.verified,
+            "rejected": self.rejected,
+        }
+
+
+_verifier: Optional[GoogleIdTokenVerifier] = None
+_verifier_pid: Optional[int] = None
+_verifier_lock = threading.Lock()
+
+
+def get_google_verifier() -> GoogleIdTokenVerifier:
+    global _verifier, _verifier_pid
+    pid = os.getpid()
+    if _verifier is None or _verifier_pid != pid:
+        with _verifier_lock:
+            if _verifier is None or _verifier_pid != pid:
+                _verifier = GoogleIdTokenVerifier(os.getenv("GOOGLE_JWKS_URL", GOOGLE_CERTS_URL))
+                _verifier_pid = pid
+    return _verifier
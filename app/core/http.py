@@ -0,0 +1,43 @@
+"""
+Process-wide pooled ``httpx.AsyncClient`` for outbound API calls.
+
+Opening an AsyncClient per request pays a TCP + TLS handshake every time.
+Handlers share one client per process (keep-alive pool sized by
+HTTP_POOL_MAX_CONNECTIONS / HTTP_POOL_MAX_KEEPALIVE); the app closes it on
+shutdown. Per-call timeouts can still be passed to ``client.post(...)``.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Optional
+
+import httpx
+
+_client: Optional[httpx.AsyncClient] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client.is_closed or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client.is_closed or _client_pid != pid:
+                _client = httpx.AsyncClient(
+                    timeout=float(os.getenv("HTTP_CLIENT_TIMEOUT_S", "10")),
+                    limits=httpx.Limits(
+                        max_connections=int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100")),
+                        max_keepalive_connections=int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20")),
+                    ),
+                )
+                _client_pid = pid
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    client, _client = _client, None
+    if client is not None and not client.is_closed and _client_pid == os.getpid():
+        await client.aclose()
@@ -0,0 +1,111 @@
+"""
+Verified JWT claims cache.
+
+``decode_jwt`` runs on every authenticated request. Verified claims are kept
+in a per-process LRU keyed by a SHA-256 digest of (algorithm, secret, token),
+so a repeat token costs one hash and a dict lookup instead of a base64 parse
+and HMAC check. Entries expire at the token's ``exp`` (capped at
+JWT_CLAIMS_CACHE_TTL_S for tokens without one); invalid tokens are never
+cached. Size is JWT_CLAIMS_CACHE_SIZE (0 disables the cache).
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class ClaimsCache:
+    """Thread-safe LRU of verified claims, honoring ``exp``."""
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 300.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # digest -> (claims, expires at wall-clock seconds)
+        self._entries: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(token: str, secret: str, algorithm: str) -> bytes:
+        h = hashlib.sha256()
+        h.update(algorithm.encode())
+        h.update(b"\0")
+        h.update(secret.encode())
+        h.update(b"\0")
+        h.update(token.encode())
+        return h.digest()
+
+    def get(self, key: bytes) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] <= now:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Callers may mutate the payload; never hand out the cached dict
+        return dict(entry[0])
+
+    def put(self, key: bytes, claims: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        expires = time.time() + self.ttl
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            expires = min(expires, float(exp))
+        with self._lock:
+            self._entries[key] = (dict(claims), expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
+
+
+_cache: Optional[ClaimsCache] = None
+_cache_pid: Optional[int] = None
+_cache_lock = threading.Lock()
+
+
+def get_claims_cache() -> ClaimsCache:
+    global _cache, _cache_pid
+    pid = os.getpid()
+    if _cache is None or _cache_pid != pid:
+        with _cache_lock:
+            if _cache is None or _cache_pid != pid:
+                _cache = ClaimsCache(
+                    max_entries=int(os.getenv("JWT_CLAIMS_CACHE_SIZE", "4096")),
+                    ttl=float(os.getenv("JWT_CLAIMS_CACHE_TTL_S", "300")),
+                )
+                _cache_pid = pid
+    return _cache
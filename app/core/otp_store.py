@@ -0,0 +1,193 @@
+"""
+Redis-first OTP storage.
+
+An OTP lives in a Redis hash ``otp:{kind}:{subject}`` holding a SHA-256 of
+the code and a failed-attempt counter, with the OTP's lifetime as the key
+TTL. Issuing a new OTP overwrites the hash and marks any unused EmailOTP /
+MobileOTP rows used (which invalidates the previous one wherever it lives). Verification is a single Lua script: a match deletes the key, a
+mismatch bumps the counter and deletes the key once ``max_attempts`` is
+reached. Expired OTPs simply disappear, so nothing has to be cleaned up.
+
+When ``redis_manager.is_available`` is false the EmailOTP / MobileOTP tables
+are used instead (degraded mode). Verification also consults them when Redis
+has no key, so OTPs issued during an outage keep working once Redis is back.
+The store never commits; callers commit with their own audit records.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.redis import redis_manager
+from app.models import EmailOTP, MobileOTP
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+VERIFIED = "verified"
+INVALID = "invalid"
+EXPIRED = "expired"
+LOCKED = "locked"
+
+# kind -> (model, subject column)
+_MODELS: Dict[str, Tuple[Any, str]] = {
+    "email": (EmailOTP, "email"),
+    "mobile": (MobileOTP, "mobile_number"),
+}
+
+# KEYS[1]: otp hash; ARGV: code digest, max attempts
+_VERIFY_LUA = """
+local digest = redis.call('HGET', KEYS[1], 'code')
+if not digest then return 'missing' end
+if digest == ARGV[1] then
+  redis.call('DEL', KEYS[1])
+  return 'verified'
+end
+local n = redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+if n >= tonumber(ARGV[2]) then
+  redis.call('DEL', KEYS[1])
+  return 'locked'
+end
+return 'invalid'
+"""
+
+
+class OTPStore:
+    def __init__(self, manager=redis_manager, prefix: str = "otp") -> None:
+        self.manager = manager
+        self.prefix = prefix
+        self._verify_sha: Optional[str] = None
+
+    def _client(self):
+        if self.manager.is_available and self.manager.redis_client is not None:
+            return self.manager.redis_client
+        return None
+
+    def _failed(self, e: Exception) -> None:
+        logger.warning("otp_store_redis_failed", error=str(e))
+        self.manager.is_available = False
+
+    def _key(self, kind: str, subject: str) -> str:
+        return f"{self.prefix}:{kind}:{subject.lower()}"
+
+    @staticmethod
+    def _digest(kind: str, subject: str, code: str) -> str:
+        return hashlib.sha256(f"{kind}:{subject.lower()}:{code}".encode("utf-8")).hexdigest()
+
+    # -- issue -----------------------------------------------------------
+
+    async def issue(self, db: Session, kind: str, subject: str, code: str, ttl_seconds: int, **row_fields: Any) -> str:
+        """Store a new OTP (replacing any previous one); returns "redis" or "db"."""
+        # Rows from an outage would otherwise stay valid through verify's fallback
+        self._invalidate_rows(db, kind, subject)
+        client = self._client()
+        if client is not None:
+            try:
+                key = self._key(kind, subject)
+                pipe = client.pipeline(transaction=True)
+                pipe.delete(key)
+                pipe.hset(key, mapping={"code": self._digest(kind, subject, code), "attempts": 0})
+                pipe.expire(key, ttl_seconds)
+                await pipe.execute()
+                return "redis"
+            except Exception as e:
+                self._failed(e)
+        model, column = _MODELS[kind]
+        db.add(model(**{column: subject}, otp_code=code,
+                     expires_at=datetime.utcnow() + timedelta(seconds=ttl_seconds), **row_fields))
+        db.flush()
+        return "db"
+
+    # -- lookup ----------------------------------------------------------
+
+    async def has_active(self, db: Session, kind: str, subject: str) -> bool:
+        client = self._client()
+        if client is not None:
+            try:
+                return bool(await client.exists(self._key(kind, subject)))
+            except Exception as e:
+                self._failed(e)
+        model, column = _MODELS[kind]
+        return db.query(model.id).filter(
+            getattr(model, column) == subject,
+            model.is_used == False,  # noqa: E712
+            model.expires_at > datetime.utcnow(),
+        ).first() is not None
+
+    # -- verify ----------------------------------------------------------
+
+    async def verify(self, db: Session, kind: str, subject: str, code: str, max_attempts: int = 3) -> str:
+        """Returns VERIFIED, INVALID, EXPIRED or LOCKED; a verified OTP is consumed."""
+        client = self._client()
+        if client is not None:
+            try:
+                outcome = await self._verify_redis(client, kind, subject, code, max_attempts)
+                if outcome != "missing":
+                    return outcome
+            except Exception as e:
+                self._failed(e)
+        return self._verify_db(db, kind, subject, code, max_attempts)
+
+    async def _verify_redis(self, client, kind: str, subject: str, code: str, max_attempts: int) -> str:
+        args = (self._key(kind, subject), self._digest(kind, subject, code), str(max_attempts))
+        if self._verify_sha is None:
+            self._verify_sha = await client.script_load(_VERIFY_LUA)
+        try:
+            out = await client.evalsha(self._verify_sha, 1, *args)
+        except Exception as e:
+            if "NOSCRIPT" not in str(e):
+                raise
+            out = await client.eval(_VERIFY_LUA, 1, *args)
+        return out.decode() if isinstance(out, bytes) else out
+
+    def _verify_db(self, db: Session, kind: str, subject: str, code: str, max_attempts: int) -> str:
+        model, column = _MODELS[kind]
+        row = db.query(model).filter(
+            getattr(model, column) == subject,
+            model.is_used == False,  # noqa: E712
+        ).order_by(model.id.desc()).first()
+        if row is None:
+            return INVALID
+        expires = row.expires_at
+        now = datetime.utcnow() if expires.tzinfo is None else datetime.now(timezone.utc)
+        if expires <= now:
+            row.is_used = True
+            return EXPIRED
+        if hmac.compare_digest(row.otp_code, code):
+            row.is_used = True
+            return VERIFIED
+        row.attempts += 1
+        if row.attempts >= max_attempts:
+            row.is_used = True
+            return LOCKED
+        return INVALID
+
+    # -- invalidate ------------------------------------------------------
+
+    async def invalidate(self, db: Session, kind: str, subject: str) -> None:
+        client = self._client()
+        if client is not None:
+            try:
+                await client.delete(self._key(kind, subject))
+            except Exception as e:
+                self._failed(e)
+        self._invalidate_rows(db, kind, subject)
+
+    def _invalidate_rows(self, db: Session, kind: str, subject: str) -> None:
+        model, column = _MODELS[kind]
+        db.query(model).filter(
+            getattr(model, column) == subject,
+            model.is_used == False,  # noqa: E712
+        ).update({"is_used": True}, synchronize_session=False)
+
+
+otp_store = OTPStore()
@@ -0,0 +1,178 @@
+"""
+Bounded executor for bcrypt hashing.
+
+bcrypt is deliberately slow (~250 ms at cost 12), so calling it inline from an
+``async def`` handler stalls every other request on the worker. Hashing runs
+on a small dedicated thread pool (PASSWORD_HASH_WORKERS) instead. Admission
+is capped at workers + PASSWORD_HASH_MAX_QUEUE jobs; past that, callers get
+a 503 with Retry-After instead of piling up behind a login storm. The bcrypt
+cost itself is set per environment with BCRYPT_ROUNDS (see app.security).
+
+Sync handlers (which FastAPI already runs on its threadpool, DB work
+included) use the ``*_sync`` helpers: same pool and admission, but the
+calling thread waits for the result.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException, status
+
+from app.security import hash_password, verify_password
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+class PasswordHasher:
+    """Runs hash/verify on ``workers`` threads with at most ``max_queue`` waiting jobs."""
+
+    def __init__(self, workers: int = 2, max_queue: int = 32, retry_after: int = 1) -> None:
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self._shedding = False
+        self._busy_seconds = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self._admitted - self._running
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._admitted >= self.workers + self.max_queue:
+                self.rejected += 1
+                # Log once per shedding episode, not once per rejected login
+                first, self._shedding = not self._shedding, True
+                saturated = True
+            else:
+                self._admitted += 1
+                self.max_queue_depth = max(self.max_queue_depth, self._admitted - self._running)
+                self._shedding = saturated = False
+        if saturated:
+            if first:
+                logger.warning("password_hasher_saturated", workers=self.workers, max_queue=self.max_queue)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication is busy, please retry shortly",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+    def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            self._running += 1
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            # Released when the job finishes, even if the awaiting request was cancelled
+            with self._lock:
+                self._running -= 1
+                self._admitted -= 1
+                self.completed += 1
+                self._busy_seconds += time.perf_counter() - started
+
+    async def _submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        self._admit()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._pool, self._run, fn, *args)
+        except RuntimeError:
+            # Pool already shut down (interpreter exit); undo the admission
+            with self._lock:
+                self._admitted -= 1
+            raise
+
+    def _call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        self._admit()
+        try:
+            future = self._pool.submit(self._run, fn, *args)
+        except RuntimeError:
+            with self._lock:
+                self._admitted -= 1
+            raise
+        return future.result()
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: Optional[str]) -> bool:
+        if not hashed_password:
+            return False
+        return await self._submit(verify_password, plain_password, hashed_password)
+
+    def hash_sync(self, password: str) -> str:
+        return self._call(hash_password, password)
+
+    def verify_sync(self, plain_password: str, hashed_password: Optional[str]) -> bool:
+        if not hashed_password:
+            return False
+        return self._call(verify_password, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": self._admitted - self._running,
+                "max_queue_depth": self.max_queue_depth,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_ms": round(1000 * self._busy_seconds / self.completed, 2) if self.completed else None,
+            }
+
+
+_hasher: Optional[PasswordHasher] = None
+_hasher_pid: Optional[int] = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher() -> PasswordHasher:
+    global _hasher, _hasher_pid
+    pid = os.getpid()
+    if _hasher is None or _hasher_pid != pid:
+        with _hasher_lock:
+            if _hasher is None or _hasher_pid != pid:
+                _hasher = PasswordHasher(
+                    workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+                    max_queue=int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32")),
+                )
+                _hasher_pid = pid
+    return _hasher
+
+
+async def hash_password_async(password: str) -> str:
+    return await get_password_hasher().hash(password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: Optional[str]) -> bool:
+    return await get_password_hasher().verify(plain_password, hashed_password)
+
+
+def hash_password_sync(password: str) -> str:
+    return get_password_hasher().hash_sync(password)
+
+
+def verify_password_sync(plain_password: str, hashed_password: Optional[str]) -> bool:
+    return get_password_hasher().verify_sync(plain_password, hashed_password)
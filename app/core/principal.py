@@ -0,0 +1,172 @@
+"""
+Cached authenticated principal.
+
+A Principal is a compact, immutable snapshot of the fields authorization
+needs (id, org_id, role, is_active, org slug). Snapshots are cached per user
+id for PRINCIPAL_CACHE_TTL_S seconds so warm requests skip the users /
+organizations lookups. Committing a change to a user's role, active flag or
+org (listeners in app.models) and logging out call ``invalidate(user_id)``,
+which drops the local entry and broadcasts the id on a Redis pub/sub channel
+so every worker drops it too. Without Redis, the TTL bounds how long another
+worker can serve a stale snapshot.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+CHANNEL = "auth:principal:invalidate"
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    org_id: Optional[int]
+    role: str
+    is_active: bool
+    org_slug: Optional[str] = None
+
+
+class PrincipalCache:
+    """TTL cache of Principals keyed by user id, with cross-process invalidation."""
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 50000, redis_url: Optional[str] = None) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.redis_url = redis_url
+        self._entries: Dict[int, Tuple[Principal, float]] = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        self._subscriber: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # -- cache ---------------------------------------------------------
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        self._ensure_subscribed()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+        return None
+
+    def put(self, principal: Principal) -> None:
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Drop the oldest insertion; entries are short-lived anyway
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[principal.id] = (principal, time.monotonic() + self.ttl)
+
+    def drop(self, user_id: int) -> None:
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop ``user_id`` here and in every other process."""
+        self.drop(user_id)
+        client = self._client()
+        if client is None:
+            return
+        try:
+            client.publish(CHANNEL, str(user_id))
+        except Exception as e:
+            logger.warning("principal_invalidate_publish_failed", user_id=user_id, error=str(e))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    # -- pub/sub -------------------------------------------------------
+
+    def _client(self):
+        if not self.redis_url:
+            return None
+        if self._redis is None:
+            try:
+                import redis  # type: ignore
+                self._redis = redis.Redis.from_url(self.redis_url, socket_connect_timeout=1, socket_timeout=1)
+            except Exception as e:  # pragma: no cover - redis package missing
+                logger.warning("principal_cache_redis_unavailable", error=str(e))
+                self.redis_url = None
+                return None
+        return self._redis
+
+    def _ensure_subscribed(self) -> None:
+        if self._subscriber is not None or not self.redis_url:
+            return
+        with self._lock:
+            if self._subscriber is not None:
+                return
+            self._subscriber = threading.Thread(target=self._listen, name="principal-invalidations", daemon=True)
+            self._subscriber.start()
+
+    def _listen(self) -> None:
+        backoff = 1.0
+        while True:
+            client = self._client()
+            if client is None:
+                return
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                # Anything published while we were disconnected was missed
+                self.clear()
+                backoff = 1.0
+                while True:
+                    msg = pubsub.get_message(timeout=5.0)
+                    if msg and msg.get("type") == "message":
+                        try:
+                            self.drop(int(msg["data"]))
+                        except (TypeError, ValueError):
+                            continue
+            except Exception as e:
+                logger.warning("principal_cache_subscriber_error", error=str(e))
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            size = len(self._entries)
+        return {"entries": size, "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
+
+
+_cache: Optional[PrincipalCache] = None
+_cache_pid: Optional[int] = None
+_cache_lock = threading.Lock()
+
+
+def get_principal_cache() -> PrincipalCache:
+    global _cache, _cache_pid
+    pid = os.getpid()
+    if _cache is None or _cache_pid != pid:
+        with _cache_lock:
+            if _cache is None or _cache_pid != pid:
+                _cache = PrincipalCache(
+                    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL_S", "30")),
+                    redis_url=os.getenv("REDIS_URL") or None,
+                )
+                _cache_pid = pid
+    return _cache
+
+
+def invalidate_principal(user_id: int) -> None:
+    get_principal_cache().invalidate(user_id)
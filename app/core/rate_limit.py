@@ -0,0 +1,207 @@
+"""
+Redis sliding-window rate limiter shared by the OTP flows.
+
+Each rule counts events per (scope, identifier) with the two-bucket sliding
+window approximation: the estimate is ``prev * (1 - elapsed/window) + cur``.
+All rules of one call are checked and incremented in a single Lua script,
+so a request either counts against every key or against none.
+
+Every method returns ``None`` when ``redis_manager.is_available`` is false
+(or Redis errors); callers then run their existing DB-backed checks.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from app.core.redis import redis_manager
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+KEY_PREFIX = "rl"
+RECONNECT_INTERVAL_S = 30.0
+
+# KEYS: cur_1, prev_1, cur_2, prev_2, ...
+# ARGV: cost, force, then per rule: limit, window_ms, prev_weight
+# Increments every rule's current bucket by ``cost`` when all rules have room
+# (or when ``force`` is set) and returns {applied, est_1, est_2, ...}.
+_SLIDING_WINDOW_LUA = """
+local cost = tonumber(ARGV[1])
+local force = ARGV[2] == '1'
+local n = #KEYS / 2
+local ok = 1
+local est = {}
+for i = 1, n do
+  local cur = tonumber(redis.call('GET', KEYS[2 * i - 1]) or '0')
+  local prev = tonumber(redis.call('GET', KEYS[2 * i]) or '0')
+  local base = 3 * (i - 1) + 2
+  est[i] = prev * tonumber(ARGV[base + 3]) + cur
+  if est[i] + cost > tonumber(ARGV[base + 1]) then ok = 0 end
+end
+local applied = 0
+if cost > 0 and (ok == 1 or force) then
+  applied = 1
+  for i = 1, n do
+    local base = 3 * (i - 1) + 2
+    redis.call('INCRBY', KEYS[2 * i - 1], cost)
+    redis.call('PEXPIRE', KEYS[2 * i - 1], 2 * tonumber(ARGV[base + 2]))
+    est[i] = est[i] + cost
+  end
+end
+local out = {applied}
+for i = 1, n do out[i + 1] = tostring(est[i]) end
+return out
+"""
+
+
+@dataclass(frozen=True)
+class Rule:
+    """At most ``limit`` events per ``window`` seconds for one (scope, identifier)."""
+    scope: str
+    identifier: str
+    limit: int
+    window: int
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    counts: Dict[str, float] = field(default_factory=dict)
+    denied_by: Optional[str] = None
+    retry_after: int = 0
+
+    @property
+    def exhausted(self) -> bool:
+        """True when ``denied_by`` is set, i.e. some rule reached its limit."""
+        return self.denied_by is not None
+
+
+class SlidingWindowLimiter:
+    def __init__(self, manager=redis_manager, prefix: str = KEY_PREFIX) -> None:
+        self.manager = manager
+        self.prefix = prefix
+        self._script_sha: Optional[str] = None
+        self._last_reconnect = 0.0
+
+    def _client(self):
+        if self.manager.is_available and self.manager.redis_client is not None:
+            return self.manager.redis_client
+        now = time.monotonic()
+        if now - self._last_reconnect > RECONNECT_INTERVAL_S:
+            # Reconnect in the background; this request takes the DB path
+            self._last_reconnect = now
+            try:
+                asyncio.get_running_loop().create_task(self.manager.connect())
+            except RuntimeError:
+                pass
+        return None
+
+    def _key(self, rule: Rule, bucket: int) -> str:
+        return f"{self.prefix}:{rule.scope}:{rule.identifier.lower()}:{bucket}"
+
+    def _layout(self, rules: Sequence[Rule], now: float):
+        keys: List[str] = []
+        argv: List[str] = []
+        for rule in rules:
+            window_ms = rule.window * 1000
+            now_ms = int(now * 1000)
+            bucket = now_ms // window_ms
+            weight = 1.0 - (now_ms % window_ms) / window_ms
+            keys += [self._key(rule, bucket), self._key(rule, bucket - 1)]
+            argv += [str(rule.limit), str(window_ms), f"{weight:.6f}"]
+        return keys, argv
+
+    async def _run(self, rules: Sequence[Rule], cost: int, force: bool, now: Optional[float] = None):
+        client = self._client()
+        if client is None or not rules:
+            return None
+        now = time.time() if now is None else now
+        keys, argv = self._layout(rules, now)
+        try:
+            if self._script_sha is None:
+                self._script_sha = await client.script_load(_SLIDING_WINDOW_LUA)
+            try:
+                raw = await client.evalsha(self._script_sha, len(keys), *keys, str(cost), "1" if force else "0", *argv)
+            except Exception as e:
+                if "NOSCRIPT" not in str(e):
+                    raise
+                raw = await client.eval(_SLIDING_WINDOW_LUA, len(keys), *keys, str(cost), "1" if force else "0", *argv)
+        except Exception as e:
+            logger.warning("rate_limit_redis_failed", error=str(e))
+            self.manager.is_available = False
+            return None
+        applied = int(raw[0]) == 1
+        counts = {f"{r.scope}": float(c) for r, c in zip(rules, raw[1:])}
+        return applied, counts, now
+
+    def _result(self, rules: Sequence[Rule], counts: Dict[str, float], allowed: bool, over, now: float) -> RateLimitResult:
+        denied = next((r for r in rules if over(counts[r.scope], r.limit)), None)
+        retry_after = 0
+        if denied is not None:
+            # Time until the current bucket rolls over; a conservative hint, not exact
+            retry_after = max(1, math.ceil(denied.window - (now % denied.window)))
+        return RateLimitResult(allowed=allowed, counts=counts,
+                               denied_by=denied.scope if denied else None, retry_after=retry_after)
+
+    async def hit(self, rules: Sequence[Rule], cost: int = 1) -> Optional[RateLimitResult]:
+        """Admit one event if every rule has room; the event counts only if admitted."""
+        out = await self._run(rules, cost, force=False)
+        if out is None:
+            return None
+        applied, counts, now = out
+        return self._result(rules, counts, applied, lambda c, limit: not applied and c + cost > limit, now)
+
+    async def record(self, rules: Sequence[Rule], cost: int = 1) -> Optional[RateLimitResult]:
+        """Count an event unconditionally (e.g. a failed attempt); exhausted once a limit is reached."""
+        out = await self._run(rules, cost, force=True)
+        if out is None:
+            return None
+        _, counts, now = out
+        result = self._result(rules, counts, True, lambda c, limit: c >= limit, now)
+        result.allowed = not result.exhausted
+        return result
+
+    async def peek(self, rules: Sequence[Rule]) -> Optional[RateLimitResult]:
+        """Check without counting; exhausted when a rule is already at its limit."""
+        out = await self._run(rules, 0, force=False)
+        if out is None:
+            return None
+        _, counts, now = out
+        result = self._result(rules, counts, True, lambda c, limit: c >= limit, now)
+        result.allowed = not result.exhausted
+        return result
+
+    async def block(self, scope: str, identifier: str, seconds: int) -> bool:
+        client = self._client()
+        if client is None:
+            return False
+        try:
+            await client.set(f"{self.prefix}:block:{scope}:{identifier.lower()}", "1", ex=seconds)
+            return True
+        except Exception as e:
+            logger.warning("rate_limit_redis_failed", error=str(e))
+            self.manager.is_available = False
+            return False
+
+    async def is_blocked(self, scope: str, identifier: str) -> Optional[bool]:
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            return bool(await client.exists(f"{self.prefix}:block:{scope}:{identifier.lower()}"))
+        except Exception as e:
+            logger.warning("rate_limit_redis_failed", error=str(e))
+            self.manager.is_available = False
+            return None
+
+
+rate_limiter = SlidingWindowLimiter()
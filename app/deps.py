@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from .db import SessionLocal
 from .security import decode_jwt
 from .models import User, Organization
+from .core.principal import Principal, get_principal_cache
 
 security = HTTPBearer()
 
@@ -51,6 +52,72 @@ def get_current_user(
     return user
 
 
+def _load_principal(db: Session, user_id: int, active_only: bool = True) -> Optional[Principal]:
+    query = (
+        db.query(User.id, User.org_id, User.role, User.is_active, Organization.slug)
+        .outerjoin(Organization, Organization.id == User.org_id)
+        .filter(User.id == user_id)
+    )
+    if active_only:
+        query = query.filter(User.is_active == True)
+    row = query.first()
+    if row is None:
+        return None
+    return Principal(id=row[0], org_id=row[1], role=row[2], is_active=bool(row[3]), org_slug=row[4])
+
+
+def get_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> Principal:
+    """
+    Like get_current_user, but returns a cached immutable Principal.
+
+    Warm requests cost no auth queries; the cache entry is dropped on role
+    change, deactivation and logout (see app.core.principal).
+    """
+    payload = decode_jwt(credentials.credentials)
+    if not payload:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    user_id = payload.get("user_id")
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token payload",
+        )
+
+    cache = get_principal_cache()
+    principal = cache.get(int(user_id))
+    if principal is None:
+        principal = _load_principal(db, int(user_id))
+        if principal is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found or inactive",
+            )
+        cache.put(principal)
+    return principal
+
+
+def require_principal_roles(allowed_roles: List[str]):
+    """
+    require_roles for handlers that only need a Principal.
+    """
+    def role_checker(principal: Principal = Depends(get_current_principal)) -> Principal:
+        if principal.role not in allowed_roles:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Insufficient permissions. Required roles: {allowed_roles}",
+            )
+        return principal
+    return role_checker
+
+
 def require_roles(allowed_roles: List[str]):
     """
     Dependency factory to require specific roles.
@@ -93,35 +160,51 @@ def get_current_org(current_user: User = Depends(get_current_user)) -> Organizat
 # Accept JWT claims directly when DB user is missing, as long as role matches.
 def require_roles_or_token(allowed_roles: List[str]):
     """
-    Dependency that prefers DB-backed user via get_current_user, but if that fails,
-    falls back to decoding the Bearer token and validating required role/org_id
-    directly from claims. This is useful for tests that mint ad-hoc tokens without
-    seeding a user record.
-
-    Returns either a User model (if found) or a minimal dict with role/org_id.
+    Dependency that authorizes from the token's role/org_id claims when present.
+    For a token naming a user, the user's current Principal (cached, else one
+    users lookup) overrides the claims, so a demotion or deactivation applies
+    before the token expires. Tokens without those claims fall back to the
+    DB-backed user via get_current_user. Claims of a token whose user does not
+    exist are used as-is, for tests that mint ad-hoc tokens without seeding a
+    user record.
+
+    Returns either a User model (legacy tokens) or a minimal dict with role/org_id.
     """
 
     def checker(
         credentials: HTTPAuthorizationCredentials = Depends(security),
         db: Session = Depends(get_db),
     ) -> User | dict:
-        # Try normal path first
-        try:
-            return get_current_user(credentials, db)
-        except HTTPException:
-            pass
-
-        # Fallback to token-only validation
         payload: Optional[dict] = decode_jwt(credentials.credentials)
         if not payload:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+        if "role" not in payload or "org_id" not in payload:
+            # Older tokens: resolve the user
+            try:
+                return get_current_user(credentials, db)
+            except HTTPException:
+                pass
+
         role = payload.get("role")
         org_id = payload.get("org_id")
+        user_id = payload.get("user_id")
+        if user_id is not None:
+            cache = get_principal_cache()
+            principal = cache.get(int(user_id))
+            if principal is None:
+                principal = _load_principal(db, int(user_id), active_only=False)
+                if principal is not None and principal.is_active:
+                    cache.put(principal)
+            if principal is not None:
+                if not principal.is_active:
+                    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or inactive")
+                role, org_id = principal.role, principal.org_id
         if role not in allowed_roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
         if org_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing org_id in token")
         # Minimal principal for handlers that only need authorization pass-through
-        return {"role": role, "org_id": org_id}
+        return {"user_id": user_id, "role": role, "org_id": org_id}
 
     return checker
@@ -148,6 +148,33 @@ def _create_tables():
         # Don't block app start in dev
         logger.error("database_tables_creation_failed", stage="startup", exc_info=e)
 
+@app.on_event("startup")
+async def _connect_redis():
+    # Rate limiting prefers Redis; without it the OTP flows fall back to DB counts
+    try:
+        from .core.redis import redis_manager
+        await redis_manager.connect()
+    except Exception as e:
+        logger.warning("redis_connect_failed", stage="startup", error=str(e))
+
+@app.on_event("shutdown")
+async def _close_redis():
+    try:
+        from .core.redis import redis_manager
+        await redis_manager.close()
+    except Exception:
+        pass
+
+@app.on_event("shutdown")
+async def _close_http_clients():
+    try:
+        from .core.http import close_http_client
+        await close_http_client()
+        from .services.payments.razorpay_adapter import close_shared_client
+        await close_shared_client()
+    except Exception:
+        pass
+
 @app.get("/healthz")
 def healthz():
     return {"ok": True}
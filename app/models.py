@@ -1,5 +1,13 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON, func, Boolean, UniqueConstraint
-from sqlalchemy.orm import relationship
+from datetime import datetime, timezone
+
+from sqlalchemy import (
+    DDL, Column, Integer, String, ForeignKey, DateTime, Date, JSON, func, Boolean, Identity, UniqueConstraint, Index,
+    event, text,
+)
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session, relationship
+from sqlalchemy.schema import PrimaryKeyConstraint
 from .db import Base
 
 class Organization(Base):
@@ -8,6 +16,8 @@ class Organization(Base):
     name = Column(String(128), nullable=False)
     slug = Column(String(64), unique=True, nullable=False, index=True)
     is_active = Column(Boolean, default=True, nullable=False)
+    # PSPs new links/checkouts may be created on, in preference order; None: ["stripe"]
+    allowed_psps = Column(JSON, nullable=True)  # ["stripe", "razorpay"]
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     
@@ -63,14 +73,53 @@ class User(Base):
         return f"<User(id={self.id}, email='{self.email}', mobile='{self.mobile_number}', auth_provider='{self.auth_provider}')>"
 
 
+# Authorization reads cached Principals (app.core.principal). Whatever code
+# path changes a user's role, active flag or org, or deletes the user, its
+# cached entry is dropped on every worker once the change commits.
+_PRINCIPAL_FIELDS = ("role", "is_active", "org_id")
+
+
+def _mark_principal_stale(target: "User", changed_only: bool) -> None:
+    state = sa_inspect(target)
+    if changed_only and not any(state.attrs[f].history.has_changes() for f in _PRINCIPAL_FIELDS):
+        return
+    if state.session is not None and target.id is not None:
+        state.session.info.setdefault("stale_principals", set()).add(target.id)
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target):
+    _mark_principal_stale(target, changed_only=True)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target):
+    _mark_principal_stale(target, changed_only=False)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_stale_principals(session):
+    stale = session.info.pop("stale_principals", None)
+    if stale:
+        from .core.principal import invalidate_principal
+
+        for user_id in stale:
+            invalidate_principal(user_id)
+
+
 class ApiKey(Base):
     """API keys for customer integrations"""
     __tablename__ = "api_keys"
+    __table_args__ = (
+        # Legacy (pre key_id) keys are found by display prefix until migrated
+        Index("ix_api_keys_legacy_prefix", "key_prefix", postgresql_where=text("key_id IS NULL")),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     key_name = Column(String(128), nullable=False)  # e.g., "Production API", "Staging API"
-    key_hash = Column(String(255), nullable=False, unique=True, index=True)  # Hashed API key
+    key_id = Column(String(32), nullable=True, unique=True, index=True)  # Lookup id embedded in sk_<key_id>_<secret>
+    key_hash = Column(String(255), nullable=False, unique=True, index=True)  # hmac-sha256$<hex> (legacy rows: bcrypt)
     key_prefix = Column(String(16), nullable=False)  # First few chars for display (sk_...)
     
     # Permissions and scope
@@ -91,10 +140,22 @@ class ApiKey(Base):
     
     @classmethod
     def generate_key(cls):
-        """Generate a new API key with prefix"""
+        """Generate a new API key: sk_<16 hex key id>_<secret>"""
         import secrets
-        key_id = secrets.token_urlsafe(32)
-        return f"sk_{key_id}"
+        return f"sk_{secrets.token_hex(8)}_{secrets.token_urlsafe(32)}"
+
+    @classmethod
+    def issue(cls, **fields):
+        """Build an ApiKey for a freshly generated key; returns (plain_key, api_key)."""
+        from .security import api_key_lookup_id, hash_api_key
+        plain = cls.generate_key()
+        record = cls(
+            key_id=api_key_lookup_id(plain),
+            key_hash=hash_api_key(plain),
+            key_prefix=plain[:8],
+            **fields,
+        )
+        return plain, record
     
     def mask_key(self):
         """Return masked key for display"""
@@ -120,6 +181,11 @@ class Transaction(Base):
     # Razorpay integration fields
     razorpay_order_id = Column(String(128), nullable=True, index=True)
     razorpay_payment_id = Column(String(128), nullable=True, index=True)
+    # Payment link (or link-backed checkout) created when the org routes to Razorpay
+    razorpay_payment_link_id = Column(String(128), nullable=True, index=True)
+
+    # What the stored checkout session / order was created for, by kind; see services.checkout_cache
+    checkout_cache = Column(JSON, nullable=True)  # {"checkout": {"provider", "id", "amount", "currency", ...}}
     
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
@@ -216,29 +282,151 @@ class ReconLog(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
 
+class ReconJob(Base):
+    """A reconciliation run (app.services.recon_engine), executed by a Celery worker.
+
+    status: queued -> running -> succeeded | failed. Counters are updated after
+    every chunk so the status endpoint can report progress.
+    """
+    __tablename__ = "recon_jobs"
+    __table_args__ = (
+        Index("ix_recon_jobs_org_status", "org_id", "status", "id"),
+    )
+    id = Column(Integer, primary_key=True)
+    org_id = Column(Integer, ForeignKey("organizations.id", ondelete="CASCADE"), index=True, nullable=False)
+    status = Column(String(16), nullable=False, default="queued")
+    since = Column(DateTime(timezone=True), nullable=False)
+    total = Column(Integer, nullable=True)
+    checked = Column(Integer, nullable=False, default=0)
+    ok = Column(Integer, nullable=False, default=0)
+    mismatches = Column(Integer, nullable=False, default=0)
+    fetch_errors = Column(Integer, nullable=False, default=0)
+    # incremental: only orders without a settled/expired ReconState or changed
+    # since the previous run's watermark; full: every order in the window;
+    # bulk: every order in the window, statuses from the PSP list API
+    mode = Column(String(16), nullable=False, default="incremental")
+    watermark = Column(DateTime(timezone=True), nullable=True)  # run start; next run rechecks txns updated after it
+    skipped = Column(Integer, nullable=False, default=0)  # in the window but aged out
+    error = Column(String(500), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class ReconState(Base):
+    """Latest reconciliation outcome per transaction.
+
+    state: open (unpaid and open at the PSP), settled (paid on both sides),
+    mismatch, unknown (PSP status could not be fetched) or expired (open for
+    longer than RECON_OPEN_TTL_DAYS). settled and expired transactions are
+    skipped by incremental runs until the transaction changes.
+    """
+    __tablename__ = "recon_states"
+    __table_args__ = (
+        Index("ix_recon_states_org_state", "org_id", "state"),
+    )
+    transaction_id = Column(Integer, ForeignKey("transactions.id", ondelete="CASCADE"), primary_key=True)
+    org_id = Column(Integer, ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False)
+    state = Column(String(16), nullable=False)
+    internal_status = Column(String(32), nullable=False)
+    external_status = Column(String(32), nullable=True)
+    checks = Column(Integer, nullable=False, default=1)
+    first_checked_at = Column(DateTime(timezone=True), nullable=False)
+    last_checked_at = Column(DateTime(timezone=True), nullable=False)
+
+
 class PspEvent(Base):
     """Idempotent store of PSP events to ensure single processing.
 
     psp_event_id should be a deterministic unique identifier, e.g.,
     provider + ':' + event_type + ':' + (payment_id or order_id).
+
+    Webhook routes insert rows as "pending"; app.services.webhook_pipeline
+    applies them in batches grouped by ``group_key`` (one transaction).
     """
     __tablename__ = "psp_events"
+    __table_args__ = (
+        # Worker claim scan: only the (small) pending backlog is indexed
+        Index("ix_psp_events_pending", "id", postgresql_where=text("status = 'pending'")),
+        Index("ix_psp_events_provider_type_created", "provider", "event_type", "created_at"),  # replay filters
+    )
     id = Column(Integer, primary_key=True)
     provider = Column(String(32), nullable=False)
     event_type = Column(String(64), nullable=False)
     psp_event_id = Column(String(160), nullable=False, unique=True, index=True)
     payload = Column(JSON, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    group_key = Column(String(160), nullable=True)
+    status = Column(String(16), nullable=False, default="pending")  # pending, processed, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String(500), nullable=True)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class WebhookReplayJob(Base):
+    """A replay of stored PspEvents through the webhook handlers (app.services.webhook_replay).
+
+    status: queued -> running -> succeeded | failed. Every event with
+    id <= checkpoint_id has been replayed or is listed in failed_ids; resuming
+    retries failed_ids, then continues after the checkpoint. A running job
+    refreshes heartbeat_at at each checkpoint.
+    """
+    __tablename__ = "webhook_replay_jobs"
+    id = Column(Integer, primary_key=True)
+    status = Column(String(16), nullable=False, default="queued")
+    provider = Column(String(32), nullable=True)     # None: all providers
+    event_types = Column(JSON, nullable=True)        # None: all types
+    since = Column(DateTime(timezone=True), nullable=True)
+    until = Column(DateTime(timezone=True), nullable=True)
+    dry_run = Column(Boolean, nullable=False, default=False)
+    rate_limit = Column(Integer, nullable=True)      # events per second
+    total = Column(Integer, nullable=True)
+    replayed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    checkpoint_id = Column(Integer, nullable=True)
+    failed_ids = Column(JSON, nullable=True)         # PspEvent ids not applied (failed or held back)
+    events_per_s = Column(Integer, nullable=True)
+    error = Column(String(500), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+
+# email_otps, mobile_otps, otp_security_logs and user_sessions are RANGE
+# partitioned on created_at (migration 008, app.services.partition_service).
+# Postgres requires the partition key in the primary key and in every unique
+# index, so the key is (id, created_at) and session tokens are only indexed.
+# created_at also gets a client-side default, so the ORM knows each row's
+# full key without reading it back.
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _time_partitioned() -> dict:
+    return {"postgresql_partition_by": "RANGE (created_at)", "info": {"partitioned_by": "created_at"}}
+
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _sqlite_partitioned_pk(constraint, compiler, **kw):
+    # SQLite (tests) only generates ids for a lone INTEGER PRIMARY KEY and
+    # has no partitions, so the partitioned tables keep an id-only key there
+    if constraint.table is not None and constraint.table.info.get("partitioned_by"):
+        return "PRIMARY KEY (id)"
+    return compiler.visit_primary_key_constraint(constraint, **kw)
 
 
 class EmailOTP(Base):
     """Email OTP for authentication."""
     __tablename__ = "email_otps"
+    __table_args__ = _time_partitioned()
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, Identity(), primary_key=True)
     email = Column(String(255), index=True, nullable=False)
     otp_code = Column(String(6), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(
+        DateTime(timezone=True), default=_utcnow, server_default=func.now(), nullable=False, primary_key=True
+    )
     expires_at = Column(DateTime(timezone=True), nullable=False)
     is_used = Column(Boolean, default=False, nullable=False)
     attempts = Column(Integer, default=0, nullable=False)
@@ -266,8 +454,9 @@ class EmailOTP(Base):
 class OTPSecurityLog(Base):
     """Track OTP security events and rate limiting"""
     __tablename__ = "otp_security_logs"
+    __table_args__ = _time_partitioned()
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, Identity(), primary_key=True)
     email = Column(String(255), index=True, nullable=False)
     ip_address = Column(String(45), nullable=True)  # IPv6 support
     user_agent = Column(String(500), nullable=True)
@@ -275,7 +464,9 @@ class OTPSecurityLog(Base):
     success = Column(Boolean, nullable=False)
     attempt_count = Column(Integer, default=1, nullable=False)
     blocked_until = Column(DateTime(timezone=True), nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(
+        DateTime(timezone=True), default=_utcnow, server_default=func.now(), nullable=False, primary_key=True
+    )
     
     def __repr__(self):
         return f"<OTPSecurityLog(email='{self.email}', action='{self.action}', success={self.success})>"
@@ -284,11 +475,14 @@ class OTPSecurityLog(Base):
 class MobileOTP(Base):
     """Mobile OTP for SMS authentication."""
     __tablename__ = "mobile_otps"
+    __table_args__ = _time_partitioned()
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, Identity(), primary_key=True)
     mobile_number = Column(String(20), index=True, nullable=False)
     otp_code = Column(String(6), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(
+        DateTime(timezone=True), default=_utcnow, server_default=func.now(), nullable=False, primary_key=True
+    )
     expires_at = Column(DateTime(timezone=True), nullable=False)
     is_used = Column(Boolean, default=False, nullable=False)
     attempts = Column(Integer, default=0, nullable=False)
@@ -318,19 +512,55 @@ class MobileOTP(Base):
 class UserSession(Base):
     """Track user sessions for better security"""
     __tablename__ = "user_sessions"
+    __table_args__ = _time_partitioned()
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, Identity(), primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    session_token = Column(String(255), unique=True, nullable=False, index=True)
+    session_token = Column(String(255), nullable=False, index=True)
     ip_address = Column(String(45), nullable=True)
     user_agent = Column(String(500), nullable=True)
     device_info = Column(JSON, nullable=True)  # Browser, OS, device details
     is_active = Column(Boolean, default=True, nullable=False)
     expires_at = Column(DateTime(timezone=True), nullable=False)
     last_activity = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(
+        DateTime(timezone=True), default=_utcnow, server_default=func.now(), nullable=False, primary_key=True
+    )
     
     user = relationship("User")
     
     def __repr__(self):
         return f"<UserSession(user_id={self.user_id}, ip='{self.ip_address}', active={self.is_active})>"
+
+
+# create_all gives each partitioned parent the DEFAULT partition migration 008
+# creates; partition_service.ensure_time_partitions adds the dated ones
+for _table in (EmailOTP.__table__, OTPSecurityLog.__table__, MobileOTP.__table__, UserSession.__table__):
+    event.listen(
+        _table,
+        "after_create",
+        DDL("CREATE TABLE IF NOT EXISTS %(table)s_default PARTITION OF %(table)s DEFAULT").execute_if(
+            dialect="postgresql"
+        ),
+    )
+
+
+class RecoveryLatencySketch(Base):
+    """Mergeable DDSketch of time-to-recovery (seconds) per org, day and channel.
+
+    ``basis`` is the starting point: "failure" (first FailureEvent) or
+    "notification" (first NotificationLog sent). ``day`` is the UTC completion day.
+    """
+    __tablename__ = "recovery_latency_sketches"
+    __table_args__ = (
+        UniqueConstraint("org_id", "day", "channel", "basis", name="uq_recovery_latency_sketch"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    org_id = Column(Integer, ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False, index=True)
+    day = Column(Date, nullable=False)
+    channel = Column(String(16), nullable=False, default="unknown")
+    basis = Column(String(16), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    sketch = Column(JSON, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
@@ -1,10 +1,77 @@
-"""PSP Adapter Dispatcher - Routes to correct PSP based on gateway."""
+"""PSP Adapter Dispatcher - Routes to correct PSP based on gateway.
+
+Calls made through ``call``/``route`` are timed into the rolling health
+table (``app.psp.health``):
+- ``route`` tries a merchant's allowed PSPs healthiest first. It fails over
+  to the next one only when the PSP cannot have acted on the call (connect
+  failures, 401/429, a saturated executor): routed calls are creates, and
+  retrying one elsewhere after e.g. a read timeout could leave the payer two
+  payable links.
+- ``call(..., hedge=True)`` re-issues a slow idempotent read (retrieves) once
+  it has taken longer than that operation's recent p95, and returns whichever
+  response lands first.
+
+``acall``/``aroute`` are the same for async routes: each attempt runs on
+that PSP's bounded executor (``app.psp.executor``) instead of the event loop.
+"""
 import os
-from typing import Optional
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
 from .adapter import PSPAdapter, PSPProvider
-from .stripe_adapter import StripeAdapter
+from .executor import executor_stats, get_psp_executor
+from .health import get_health_table
+from .stripe_adapter import StripeAdapter, stripe
 from .razorpay_adapter import RazorpayAdapter
 
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_hedge_pool_pid: Optional[int] = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    """Bounded per-process pool the hedged calls run on."""
+    global _hedge_pool, _hedge_pool_pid
+    pid = os.getpid()
+    if _hedge_pool is None or _hedge_pool_pid != pid:
+        with _hedge_pool_lock:
+            if _hedge_pool is None or _hedge_pool_pid != pid:
+                _hedge_pool = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("PSP_HEDGE_MAX_WORKERS", "16")), thread_name_prefix="psp-hedge"
+                )
+                _hedge_pool_pid = pid
+    return _hedge_pool
+
+
+def _not_processed(error: Exception) -> bool:
+    """True when the PSP cannot have acted on the failed call, so another PSP may be tried."""
+    if isinstance(error, HTTPException):
+        return error.status_code == 503  # PSP executor saturated; the call never ran
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in (401, 429)
+    if stripe is not None:
+        # Rejected before processing; APIConnectionError also covers read timeouts, so it is not here
+        errors = getattr(stripe, "error", stripe)  # stripe.error.* before SDK v8
+        rejected = tuple(getattr(stripe, name, None) or getattr(errors, name)
+                         for name in ("AuthenticationError", "RateLimitError"))
+        return isinstance(error, rejected)
+    return False
+
 
 class PSPDispatcher:
     """
@@ -61,6 +128,146 @@ class PSPDispatcher:
         """Clear cached adapters (useful for testing)."""
         cls._adapters = {}
 
+    @classmethod
+    def configured(cls, providers: Iterable[str]) -> List[str]:
+        """The subset of ``providers`` with credentials set, in the given order."""
+        out = []
+        for provider in providers:
+            try:
+                cls.get_adapter(provider)
+            except ValueError:
+                continue
+            out.append(provider.lower())
+        return out
+
+    @classmethod
+    def rank(cls, providers: Iterable[str]) -> List[str]:
+        """Configured ``providers`` (merchant preference order), healthiest first."""
+        return get_health_table().rank(cls.configured(providers))
+
+    @staticmethod
+    def _timed(provider: str, op: str, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            get_health_table().record(provider, op, time.perf_counter() - start, False)
+            raise
+        get_health_table().record(provider, op, time.perf_counter() - start, True)
+        return result
+
+    @classmethod
+    def call(
+        cls,
+        provider: str,
+        op: str,
+        fn: Optional[Callable[..., Any]] = None,
+        *args: Any,
+        hedge: bool = False,
+        **kwargs: Any,
+    ) -> Any:
+        """Run ``fn(*args, **kwargs)`` (default: the adapter's ``op`` method) and record its health.
+
+        ``hedge=True`` is only for idempotent reads.
+        """
+        provider = provider.lower()
+        if fn is None:
+            fn = getattr(cls.get_adapter(provider), op)
+        if not hedge:
+            return cls._timed(provider, op, fn, args, kwargs)
+
+        table = get_health_table()
+        pool = _get_hedge_pool()
+        delay = table.hedge_delay(provider, op, float(os.getenv("PSP_HEDGE_AFTER_MS", "800")) / 1000)
+        first = pool.submit(cls._timed, provider, op, fn, args, kwargs)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        table.incr("hedges")
+        second = pool.submit(cls._timed, provider, op, fn, args, kwargs)
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        table.incr("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    @classmethod
+    def route(cls, providers: Iterable[str], op: str, *args: Any, **kwargs: Any) -> Tuple[str, Any]:
+        """Call adapter method ``op`` on the healthiest of ``providers``, failing over on unprocessed errors.
+
+        Returns (provider, result). Raises ValueError when none is configured,
+        else the error that stopped routing.
+        """
+        providers = list(providers)
+        ranked = cls._ranked_or_raise(providers)
+        error: Optional[Exception] = None
+        for i, provider in enumerate(ranked):
+            if i:
+                cls._failed_over(op, ranked[i - 1], provider, error)
+            try:
+                return provider, cls.call(provider, op, None, *args, **kwargs)
+            except Exception as e:
+                if not _not_processed(e):
+                    raise
+                error = e
+        raise error
+
+    @classmethod
+    async def acall(
+        cls,
+        provider: str,
+        op: str,
+        fn: Optional[Callable[..., Any]] = None,
+        *args: Any,
+        hedge: bool = False,
+        **kwargs: Any,
+    ) -> Any:
+        """``call`` on the PSP's bounded executor, for async routes."""
+        return await get_psp_executor(provider).run(cls.call, provider, op, fn, *args, hedge=hedge, **kwargs)
+
+    @classmethod
+    async def aroute(cls, providers: Iterable[str], op: str, *args: Any, **kwargs: Any) -> Tuple[str, Any]:
+        """``route`` for async routes; a saturated PSP executor also fails over."""
+        ranked = cls._ranked_or_raise(list(providers))
+        error: Optional[Exception] = None
+        for i, provider in enumerate(ranked):
+            if i:
+                cls._failed_over(op, ranked[i - 1], provider, error)
+            try:
+                return provider, await cls.acall(provider, op, None, *args, **kwargs)
+            except Exception as e:
+                if not _not_processed(e):
+                    raise
+                error = e
+        raise error
+
+    @classmethod
+    def _ranked_or_raise(cls, providers: List[str]) -> List[str]:
+        ranked = cls.rank(providers)
+        if not ranked:
+            raise ValueError("No configured PSP among: " + ", ".join(providers))
+        return ranked
+
+    @staticmethod
+    def _failed_over(op: str, failed: str, provider: str, error: Optional[Exception]) -> None:
+        get_health_table().incr("failovers")
+        logger.warning("psp_failover", op=op, failed=failed, provider=provider, error=str(error))
+
+    @classmethod
+    def health(cls) -> Dict[str, Any]:
+        """Rolling health table, routing counters and executor load for this process."""
+        return {
+            **get_health_table().stats(),
+            "configured": cls.configured(p.value for p in PSPProvider),
+            "executors": executor_stats(),
+        }
+
 
 # Convenience functions
 def get_stripe_adapter() -> StripeAdapter:
@@ -0,0 +1,146 @@
+"""
+Bounded executors for blocking PSP SDK calls.
+
+The Stripe SDK (and the sync Razorpay wrappers) block for a full network
+round trip, so calling them inline from an ``async def`` route stalls every
+other request on the worker. Each PSP gets its own small thread pool
+(``<PROVIDER>_EXECUTOR_WORKERS``, default PSP_EXECUTOR_WORKERS), so one slow
+PSP cannot take the other's threads. Admission is capped at workers +
+max_queue calls; past that, callers get a 503 with Retry-After instead of
+queueing behind an outage. PSPDispatcher.acall/aroute run their calls here.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException, status
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+class PSPExecutor:
+    """Runs blocking calls to one PSP on ``workers`` threads with at most ``max_queue`` waiting."""
+
+    def __init__(self, name: str, workers: int = 16, max_queue: int = 64, retry_after: int = 1) -> None:
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"psp-{name}")
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self._shedding = False
+        self._busy_seconds = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self._admitted - self._running
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._admitted >= self.workers + self.max_queue:
+                self.rejected += 1
+                first, self._shedding = not self._shedding, True
+                saturated = True
+            else:
+                self._admitted += 1
+                self.max_queue_depth = max(self.max_queue_depth, self._admitted - self._running)
+                self._shedding = saturated = False
+        if saturated:
+            if first:
+                logger.warning("psp_executor_saturated", psp=self.name, workers=self.workers, max_queue=self.max_queue)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Payment provider {self.name} is busy, please retry shortly",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+    def _run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            self._running += 1
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # Released when the call finishes, even if the awaiting request was cancelled
+            with self._lock:
+                self._running -= 1
+                self._admitted -= 1
+                self.completed += 1
+                self._busy_seconds += time.perf_counter() - started
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Await ``fn(*args, **kwargs)`` on this PSP's pool (503 when saturated)."""
+        self._admit()
+        loop = asyncio.get_running_loop()
+        # Carry the request's contextvars (structlog bindings) into the thread
+        call = functools.partial(contextvars.copy_context().run, self._run, fn, *args, **kwargs)
+        try:
+            return await loop.run_in_executor(self._pool, call)
+        except RuntimeError:
+            # Pool already shut down (interpreter exit); undo the admission
+            with self._lock:
+                self._admitted -= 1
+            raise
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": self._admitted - self._running,
+                "max_queue_depth": self.max_queue_depth,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_ms": round(1000 * self._busy_seconds / self.completed, 2) if self.completed else None,
+            }
+
+
+_executors: Dict[str, PSPExecutor] = {}
+_executors_pid: Optional[int] = None
+_executors_lock = threading.Lock()
+
+
+def get_psp_executor(provider: str) -> PSPExecutor:
+    global _executors_pid
+    provider = provider.lower()
+    with _executors_lock:
+        if _executors_pid != os.getpid():
+            _executors.clear()
+            _executors_pid = os.getpid()
+        executor = _executors.get(provider)
+        if executor is None:
+            prefix = provider.upper()
+            executor = _executors[provider] = PSPExecutor(
+                provider,
+                workers=int(os.getenv(f"{prefix}_EXECUTOR_WORKERS") or os.getenv("PSP_EXECUTOR_WORKERS", "16")),
+                max_queue=int(os.getenv(f"{prefix}_EXECUTOR_MAX_QUEUE") or os.getenv("PSP_EXECUTOR_MAX_QUEUE", "64")),
+            )
+    return executor
+
+
+def executor_stats() -> Dict[str, Any]:
+    with _executors_lock:
+        executors = dict(_executors) if _executors_pid == os.getpid() else {}
+    return {name: ex.stats() for name, ex in executors.items()}
@@ -0,0 +1,175 @@
+"""
+Rolling PSP health: latency and error rate per provider and operation.
+
+Every adapter call made through PSPDispatcher is recorded here. A provider's
+health is taken over the calls of the last ``window_s`` seconds:
+- error rate
+- p50/p95 latency
+- score = p95_ms * (1 + error_penalty * error_rate); lower is better
+- unhealthy once the error rate reaches ``unhealthy_error_rate`` over at
+  least ``min_samples`` calls
+
+Old samples age out of the window, so a provider that stops failing is back
+in rotation a window later (the breaker's half-open state comes for free).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+Sample = Tuple[float, float, bool]  # monotonic ts, latency seconds, ok
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+class _Series:
+    __slots__ = ("samples", "calls", "errors")
+
+    def __init__(self, max_samples: int) -> None:
+        self.samples: Deque[Sample] = deque(maxlen=max_samples)
+        self.calls = 0    # lifetime
+        self.errors = 0   # lifetime
+
+    def add(self, sample: Sample) -> None:
+        self.samples.append(sample)
+        self.calls += 1
+        self.errors += 0 if sample[2] else 1
+
+    def trim(self, cutoff: float) -> None:
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+
+    def summary(self) -> Dict[str, Any]:
+        n = len(self.samples)
+        if not n:
+            return {"samples": 0, "error_rate": None, "p50_ms": None, "p95_ms": None}
+        latencies = sorted(s[1] for s in self.samples)
+        errors = sum(1 for s in self.samples if not s[2])
+        return {
+            "samples": n,
+            "error_rate": round(errors / n, 4),
+            "p50_ms": round(_percentile(latencies, 0.5) * 1000, 1),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1),
+        }
+
+
+class HealthTable:
+    def __init__(
+        self,
+        window_s: float = 60.0,
+        max_samples: int = 500,
+        min_samples: int = 5,
+        unhealthy_error_rate: float = 0.5,
+        error_penalty: float = 10.0,
+    ) -> None:
+        self.window_s = window_s
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self.unhealthy_error_rate = unhealthy_error_rate
+        self.error_penalty = error_penalty
+        self._lock = threading.Lock()
+        self._providers: Dict[str, _Series] = {}
+        self._ops: Dict[Tuple[str, str], _Series] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def record(self, provider: str, op: str, latency_s: float, ok: bool, now: Optional[float] = None) -> None:
+        sample = (time.monotonic() if now is None else now, latency_s, ok)
+        with self._lock:
+            for table, key in ((self._providers, provider), (self._ops, (provider, op))):
+                series = table.get(key)
+                if series is None:
+                    series = table[key] = _Series(self.max_samples)
+                series.add(sample)
+
+    def incr(self, counter: str) -> None:
+        """Bump one of the routing counters (hedges, hedge_wins, failovers)."""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _summary(self, series: Optional[_Series], now: float) -> Dict[str, Any]:
+        if series is None:
+            return _Series(1).summary()
+        series.trim(now - self.window_s)
+        return series.summary()
+
+    def provider_health(self, provider: str, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            s = self._summary(self._providers.get(provider), now)
+        known = s["samples"] >= self.min_samples
+        s["healthy"] = not (known and s["error_rate"] >= self.unhealthy_error_rate)
+        s["score"] = round(s["p95_ms"] * (1 + self.error_penalty * s["error_rate"]), 1) if known else None
+        return s
+
+    def rank(self, providers: Iterable[str], now: Optional[float] = None) -> List[str]:
+        """``providers`` (merchant preference order) healthiest first.
+
+        Unhealthy providers go last. A provider without enough recent calls
+        is scored like the best known one, so preference order decides until
+        there is evidence against it.
+        """
+        providers = list(dict.fromkeys(providers))
+        health = {p: self.provider_health(p, now) for p in providers}
+        known = [h["score"] for h in health.values() if h["score"] is not None]
+        neutral = min(known) if known else 0.0
+
+        def key(item):
+            i, p = item
+            h = health[p]
+            return (not h["healthy"], h["score"] if h["score"] is not None else neutral, i)
+
+        return [p for _, p in sorted(enumerate(providers), key=key)]
+
+    def hedge_delay(self, provider: str, op: str, default_s: float, floor_s: float = 0.05) -> float:
+        """Seconds to wait before hedging: the op's recent p95, else ``default_s``."""
+        now = time.monotonic()
+        with self._lock:
+            s = self._summary(self._ops.get((provider, op)), now)
+        if s["samples"] < self.min_samples:
+            return default_s
+        return max(floor_s, s["p95_ms"] / 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            ops: Dict[str, Dict[str, Any]] = {}
+            for (provider, op), series in self._ops.items():
+                ops.setdefault(provider, {})[op] = {
+                    **self._summary(series, now), "calls": series.calls, "errors": series.errors,
+                }
+            providers = list(self._providers)
+        return {
+            "window_s": self.window_s,
+            "providers": {p: {**self.provider_health(p, now), "ops": ops.get(p, {})} for p in providers},
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+        }
+
+
+_table: Optional[HealthTable] = None
+_table_pid: Optional[int] = None
+_table_lock = threading.Lock()
+
+
+def get_health_table() -> HealthTable:
+    global _table, _table_pid
+    pid = os.getpid()
+    if _table is None or _table_pid != pid:
+        with _table_lock:
+            if _table is None or _table_pid != pid:
+                _table = HealthTable(
+                    window_s=float(os.getenv("PSP_HEALTH_WINDOW_S", "60")),
+                    min_samples=int(os.getenv("PSP_HEALTH_MIN_SAMPLES", "5")),
+                    unhealthy_error_rate=float(os.getenv("PSP_UNHEALTHY_ERROR_RATE", "0.5")),
+                )
+                _table_pid = pid
+    return _table
@@ -1,19 +1,40 @@
-"""Razorpay PSP Adapter Implementation (Stub)."""
+"""Razorpay PSP Adapter Implementation.
+
+Payment links and hosted checkout (a payment link with a callback URL) go to
+the Razorpay API through the pooled services client; the rest is still stubbed.
+"""
 from typing import Dict, Any, Optional
 from .adapter import PSPAdapter, PSPProvider
+from ..services.payments.razorpay_adapter import RazorpayAdapter as RazorpayClient
+
+# Payment link statuses mapped onto Stripe Checkout Session fields
+_LINK_STATUS = {
+    "created": ("open", "unpaid"),
+    "partially_paid": ("open", "unpaid"),
+    "paid": ("complete", "paid"),
+    "expired": ("expired", "unpaid"),
+    "cancelled": ("expired", "unpaid"),
+}
+
+
+def _notes(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Link notes. Razorpay copies them onto the link's payments, so ``receipt``
+    carries the transaction_ref to payment.captured webhooks."""
+    notes = dict(metadata or {})
+    if notes.get("transaction_ref"):
+        notes.setdefault("receipt", notes["transaction_ref"])
+    return notes
 
 
 class RazorpayAdapter(PSPAdapter):
-    """Razorpay payment gateway adapter (stub implementation)."""
+    """Razorpay payment gateway adapter."""
     
     provider = PSPProvider.RAZORPAY
     
     def __init__(self, api_key: str, api_secret: Optional[str] = None, **kwargs):
         """Initialize Razorpay adapter."""
         super().__init__(api_key, api_secret, **kwargs)
-        # TODO: Initialize razorpay client when library is added
-        # import razorpay
-        # self.client = razorpay.Client(auth=(api_key, api_secret))
+        self.client = kwargs.get("client") or RazorpayClient(key_id=api_key, key_secret=api_secret)
     
     def create_payment_intent(
         self,
@@ -51,12 +72,55 @@ class RazorpayAdapter(PSPAdapter):
         metadata: Optional[Dict[str, Any]] = None,
         **kwargs
     ) -> Dict[str, Any]:
-        """Create Razorpay payment link."""
-        # Stub implementation
+        """Create a Razorpay payment link that redirects to success_url."""
+        link = self.client.create_payment_link(
+            amount,
+            currency,
+            description=kwargs.get("product_name", "Payment Recovery"),
+            notes=_notes(metadata),
+            callback_url=success_url,
+        )
+        return {
+            "session_id": link["payment_link_id"],
+            "url": link["url"],
+            "status": link["status"],
+            "raw": link["raw"],
+        }
+
+    def create_payment_link(
+        self,
+        amount: int,
+        currency: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Create a Razorpay payment link."""
+        link = self.client.create_payment_link(
+            amount,
+            currency,
+            description=kwargs.get("product_name", "Payment Recovery"),
+            notes=_notes(metadata),
+        )
+        return {
+            "payment_link_id": link["payment_link_id"],
+            "url": link["url"],
+            "raw": link["raw"],
+        }
+
+    def get_session_status(self, session_id: str) -> Dict[str, Any]:
+        """Retrieve the payment link behind a Razorpay checkout session."""
+        link = self.client.get_payment_link(session_id)
+        raw = link["raw"]
+        status, payment_status = _LINK_STATUS.get(link["status"], ("open", "unpaid"))
         return {
-            "session_id": f"session_{amount}",
-            "url": f"https://razorpay.com/payment/{amount}",
-            "status": "created"
+            "session_id": session_id,
+            "status": status,
+            "payment_status": payment_status,
+            "amount_total": raw.get("amount"),
+            "currency": raw.get("currency"),
+            "customer_email": (raw.get("customer") or {}).get("email"),
+            "payment_intent_id": None,
+            "raw": raw,
         }
     
     def verify_webhook(
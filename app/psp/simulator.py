@@ -0,0 +1,659 @@
+"""
+PSP simulator: a local stand-in for the Razorpay and Stripe APIs we call.
+
+An ASGI (Starlette) app for load tests, latency experiments and CI, so the
+payment paths can be exercised without touching real PSPs:
+- /razorpay: the subset RazorpayAdapter uses: orders (create, fetch, list)
+  and payment links. Point RAZORPAY_API_BASE at it.
+- /stripe: the subset StripeService and the Stripe adapters use: Checkout
+  Sessions, PaymentIntents (incl. list), Products, Prices, Payment Links,
+  Balance and Refunds. Form-encoded like the real API. Point
+  STRIPE_API_BASE at it.
+- /_sim: control endpoints: stats, live config changes, completing a
+  payment (which delivers its webhook), and signed webhook storms.
+
+Every PSP request goes through that provider's fault model:
+- a token-bucket rate limit (429)
+- an injected error rate (500, in the PSP's error format)
+- a latency distribution: "fixed:MS", "uniform:LO_MS:HI_MS",
+  "lognormal:MEDIAN_MS:SIGMA" or "exp:MEAN_MS"
+
+Webhooks are signed the way each PSP signs them: X-Razorpay-Signature, and
+Stripe-Signature (t=...,v1=...). Our webhook routes verify them unchanged
+given the same secrets.
+
+State is in memory and lost on restart. Run it with scripts/psp_simulator.py.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+PROVIDERS = ("razorpay", "stripe")
+WEBHOOK_PATHS = {"razorpay": "/v1/payments/razorpay/webhooks", "stripe": "/v1/payments/stripe/webhooks"}
+
+
+# ---------------------------------------------------------------------------
+# Fault model
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Latency:
+    kind: str = "fixed"   # fixed, uniform, lognormal, exp
+    a_ms: float = 0.0     # fixed value / uniform low / lognormal median / exp mean
+    b_ms: float = 0.0     # uniform high / lognormal sigma
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        kind, *params = spec.strip().split(":")
+        values = [float(p) for p in params] + [0.0, 0.0]
+        if kind not in ("fixed", "uniform", "lognormal", "exp"):
+            raise ValueError(f"unknown latency distribution: {spec!r}")
+        return cls(kind, values[0], values[1])
+
+    def sample(self, rng: random.Random) -> float:
+        """Seconds."""
+        if self.kind == "uniform":
+            ms = rng.uniform(self.a_ms, self.b_ms)
+        elif self.kind == "lognormal":
+            ms = self.a_ms * math.exp(rng.gauss(0.0, self.b_ms)) if self.a_ms else 0.0
+        elif self.kind == "exp":
+            ms = rng.expovariate(1.0 / self.a_ms) if self.a_ms else 0.0
+        else:
+            ms = self.a_ms
+        return max(0.0, ms) / 1000
+
+    def __str__(self) -> str:
+        if self.kind == "fixed":
+            return f"fixed:{self.a_ms:g}"
+        if self.kind == "exp":
+            return f"exp:{self.a_ms:g}"
+        return f"{self.kind}:{self.a_ms:g}:{self.b_ms:g}"
+
+
+@dataclass
+class ProviderConfig:
+    latency: Latency = field(default_factory=Latency)
+    error_rate: float = 0.0
+    rate_limit: Optional[float] = None  # requests per second; None: unlimited
+    burst: Optional[int] = None         # bucket size; default one second's worth
+
+    def update(self, changes: Dict[str, Any]) -> None:
+        if "latency" in changes:
+            self.latency = Latency.parse(changes["latency"])
+        if "error_rate" in changes:
+            self.error_rate = float(changes["error_rate"])
+        if "rate_limit" in changes:
+            self.rate_limit = float(changes["rate_limit"] or 0) or None
+        if "burst" in changes:
+            self.burst = int(changes["burst"] or 0) or None
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"latency": str(self.latency), "error_rate": self.error_rate,
+                "rate_limit": self.rate_limit, "burst": self.burst}
+
+
+@dataclass
+class SimConfig:
+    providers: Dict[str, ProviderConfig] = field(default_factory=lambda: {p: ProviderConfig() for p in PROVIDERS})
+    razorpay_webhook_secret: str = "sim_razorpay_webhook_secret"
+    stripe_webhook_secret: str = "whsec_sim"
+    webhook_url: Optional[str] = None   # app base URL that /_sim pay/complete deliver to
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "SimConfig":
+        """PSP_SIM_LATENCY / _ERROR_RATE / _RATE_LIMIT, overridable per PSP (PSP_SIM_STRIPE_LATENCY, ...)."""
+        providers = {}
+        for p in PROVIDERS:
+            def env(name: str, default: str, p: str = p) -> str:
+                return os.getenv(f"PSP_SIM_{p.upper()}_{name}") or os.getenv(f"PSP_SIM_{name}") or default
+
+            providers[p] = ProviderConfig()
+            providers[p].update({
+                "latency": env("LATENCY", "fixed:0"),
+                "error_rate": env("ERROR_RATE", "0"),
+                "rate_limit": env("RATE_LIMIT", "0"),
+                "burst": env("BURST", "0"),
+            })
+        return cls(
+            providers=providers,
+            razorpay_webhook_secret=os.getenv("RAZORPAY_WEBHOOK_SECRET") or cls.razorpay_webhook_secret,
+            stripe_webhook_secret=os.getenv("STRIPE_WEBHOOK_SECRET") or cls.stripe_webhook_secret,
+            webhook_url=os.getenv("PSP_SIM_WEBHOOK_URL") or None,
+            seed=int(os.environ["PSP_SIM_SEED"]) if os.getenv("PSP_SIM_SEED") else None,
+        )
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate, self.burst = rate, burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+# ---------------------------------------------------------------------------
+# Signing and Stripe form encoding
+# ---------------------------------------------------------------------------
+
+def razorpay_signature(body: bytes, secret: str) -> str:
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def stripe_signature(body: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    t = int(time.time()) if timestamp is None else timestamp
+    v1 = hmac.new(secret.encode(), f"{t}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={t},v1={v1}"
+
+
+def _listify(node: Any) -> Any:
+    if not isinstance(node, dict):
+        return node
+    node = {k: _listify(v) for k, v in node.items()}
+    if node and all(k.isdigit() for k in node):
+        return [node[k] for k in sorted(node, key=int)]
+    return node
+
+
+def unflatten(items: Iterable[Tuple[str, str]]) -> Dict[str, Any]:
+    """Stripe's bracket encoding (line_items[0][price_data][currency]=usd) to nested dicts/lists."""
+    out: Dict[str, Any] = {}
+    for key, value in items:
+        parts = re.findall(r"[^\[\]]+", key)
+        if not parts:
+            continue
+        node = out
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return _listify(out)
+
+
+def _int(value: Any, default: int = 0) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+# ---------------------------------------------------------------------------
+# Simulator
+# ---------------------------------------------------------------------------
+
+Handler = Callable[[Request], Awaitable[JSONResponse]]
+
+
+class PSPSimulator:
+    def __init__(self, config: Optional[SimConfig] = None) -> None:
+        self.config = config or SimConfig()
+        self.rng = random.Random(self.config.seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self.reset()
+        self.app = self._build_app()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.orders: Dict[str, Dict[str, Any]] = {}
+            self.payment_links: Dict[str, Dict[str, Any]] = {}
+            self.sessions: Dict[str, Dict[str, Any]] = {}
+            self.intents: Dict[str, Dict[str, Any]] = {}
+            self.objects: Dict[str, Dict[str, Any]] = {}  # products, prices, stripe links, refunds
+            self.requests: Counter = Counter()          # (provider, route, status)
+            self._buckets.clear()
+
+    def _id(self, prefix: str) -> str:
+        return f"{prefix}_sim{next(self._ids):06d}{self.rng.getrandbits(32):08x}"
+
+    # -- fault model -------------------------------------------------------
+
+    def _bucket(self, provider: str) -> Optional[_TokenBucket]:
+        cfg = self.config.providers[provider]
+        if not cfg.rate_limit:
+            return None
+        bucket = self._buckets.get(provider)
+        burst = cfg.burst or max(1, int(cfg.rate_limit))
+        if bucket is None or bucket.rate != cfg.rate_limit or bucket.burst != burst:
+            bucket = self._buckets[provider] = _TokenBucket(cfg.rate_limit, burst)
+        return bucket
+
+    @staticmethod
+    def _error(provider: str, status: int, message: str) -> JSONResponse:
+        if provider == "razorpay":
+            code = "SERVER_ERROR" if status >= 500 else "BAD_REQUEST_ERROR"
+            return JSONResponse({"error": {"code": code, "description": message}}, status_code=status)
+        kind = {401: "invalid_request_error", 404: "invalid_request_error", 429: "invalid_request_error"}
+        body = {"type": kind.get(status, "api_error"), "message": message}
+        if status == 429:
+            body["code"] = "rate_limit"
+        return JSONResponse({"error": body}, status_code=status)
+
+    def _psp(self, provider: str, route: str, handler: Handler) -> Handler:
+        async def endpoint(request: Request) -> JSONResponse:
+            cfg = self.config.providers[provider]
+            auth = request.headers.get("authorization", "")
+            expected = "Basic " if provider == "razorpay" else "Bearer "
+            if not auth.startswith(expected):
+                response = self._error(provider, 401, "Authentication failed")
+            elif (bucket := self._bucket(provider)) is not None and not bucket.take():
+                response = self._error(provider, 429, "Too many requests (simulated rate limit)")
+            else:
+                delay = cfg.latency.sample(self.rng)
+                if delay:
+                    await asyncio.sleep(delay)
+                if cfg.error_rate and self.rng.random() < cfg.error_rate:
+                    response = self._error(provider, 500, "Simulated PSP failure")
+                else:
+                    response = await handler(request)
+            with self._lock:
+                self.requests[(provider, route, response.status_code)] += 1
+            return response
+
+        return endpoint
+
+    # -- Razorpay ------------------------------------------------------------
+
+    async def _rzp_create_order(self, request: Request) -> JSONResponse:
+        body = await request.json()
+        amount = _int(body.get("amount"))
+        if amount <= 0 or not body.get("currency"):
+            return self._error("razorpay", 400, "amount and currency are required")
+        order = {
+            "id": self._id("order"), "entity": "order", "amount": amount, "amount_paid": 0, "amount_due": amount,
+            "currency": body["currency"], "receipt": body.get("receipt"), "status": "created", "attempts": 0,
+            "notes": body.get("notes") or {}, "created_at": int(time.time()),
+        }
+        self.orders[order["id"]] = order
+        return JSONResponse(order)
+
+    async def _rzp_get_order(self, request: Request) -> JSONResponse:
+        order = self.orders.get(request.path_params["id"])
+        if order is None:
+            return self._error("razorpay", 400, "The id provided does not exist")
+        return JSONResponse(order)
+
+    async def _rzp_list_orders(self, request: Request) -> JSONResponse:
+        q = request.query_params
+        lo, hi = _int(q.get("from"), 0), _int(q.get("to"), 2 ** 62)
+        count, skip = min(_int(q.get("count"), 10), 100), _int(q.get("skip"), 0)
+        rows = [o for o in self.orders.values() if lo <= o["created_at"] <= hi]
+        rows.sort(key=lambda o: o["created_at"], reverse=True)
+        page = rows[skip:skip + count]
+        return JSONResponse({"entity": "collection", "count": len(page), "items": page})
+
+    async def _rzp_create_link(self, request: Request) -> JSONResponse:
+        body = await request.json()
+        link_id = self._id("plink")
+        link = {
+            "id": link_id, "entity": "payment_link", "amount": _int(body.get("amount")), "amount_paid": 0,
+            "currency": body.get("currency"), "description": body.get("description"), "notes": body.get("notes") or {},
+            "callback_url": body.get("callback_url"), "status": "created", "customer": body.get("customer") or {},
+            "short_url": f"https://rzp.sim/i/{link_id}", "created_at": int(time.time()),
+        }
+        self.payment_links[link_id] = link
+        return JSONResponse(link)
+
+    async def _rzp_get_link(self, request: Request) -> JSONResponse:
+        link = self.payment_links.get(request.path_params["id"])
+        if link is None:
+            return self._error("razorpay", 400, "The id provided does not exist")
+        return JSONResponse(link)
+
+    # -- Stripe --------------------------------------------------------------
+
+    async def _form(self, request: Request) -> Dict[str, Any]:
+        return unflatten((await request.form()).multi_items())
+
+    def _new_intent(self, amount: int, currency: str, metadata: Dict[str, Any], **extra: Any) -> Dict[str, Any]:
+        intent = {
+            "id": self._id("pi"), "object": "payment_intent", "amount": amount, "currency": currency,
+            "status": "requires_payment_method", "metadata": metadata, "payment_method": None,
+            "created": int(time.time()), **extra,
+        }
+        intent["client_secret"] = f"{intent['id']}_secret_sim"
+        self.intents[intent["id"]] = intent
+        return intent
+
+    async def _stripe_create_session(self, request: Request) -> JSONResponse:
+        form = await self._form(request)
+        items = form.get("line_items") or []
+        amount = sum(_int((i.get("price_data") or {}).get("unit_amount")) * _int(i.get("quantity"), 1) for i in items)
+        currency = ((items[0].get("price_data") or {}).get("currency") if items else None) or form.get("currency")
+        if amount <= 0 or not currency:
+            return self._error("stripe", 400, "line_items with price_data are required")
+        metadata = form.get("metadata") or {}
+        session_id = self._id("cs_test")
+        intent = self._new_intent(amount, currency, metadata)
+        session = {
+            "id": session_id, "object": "checkout.session", "mode": form.get("mode", "payment"),
+            "amount_total": amount, "currency": currency, "metadata": metadata, "payment_intent": intent["id"],
+            "status": "open", "payment_status": "unpaid", "url": f"https://checkout.stripe.sim/c/pay/{session_id}",
+            "success_url": form.get("success_url"), "cancel_url": form.get("cancel_url"),
+            "customer_email": form.get("customer_email"), "customer_details": None,
+            "created": int(time.time()), "expires_at": _int(form.get("expires_at"), int(time.time()) + 86400),
+        }
+        self.sessions[session_id] = session
+        return JSONResponse(session)
+
+    async def _stripe_get(self, request: Request) -> JSONResponse:
+        store = {"checkout.session": self.sessions, "payment_intent": self.intents}[request.scope["sim_object"]]
+        obj = store.get(request.path_params["id"])
+        if obj is None:
+            return self._error("stripe", 404, f"No such object: '{request.path_params['id']}'")
+        return JSONResponse(obj)
+
+    async def _stripe_create_intent(self, request: Request) -> JSONResponse:
+        form = await self._form(request)
+        amount = _int(form.get("amount"))
+        if amount <= 0 or not form.get("currency"):
+            return self._error("stripe", 400, "amount and currency are required")
+        extra = {"description": form.get("description")} if form.get("description") else {}
+        return JSONResponse(self._new_intent(amount, form["currency"], form.get("metadata") or {}, **extra))
+
+    async def _stripe_list_intents(self, request: Request) -> JSONResponse:
+        q = unflatten(request.query_params.multi_items())
+        created = q.get("created") or {}
+        lo, hi = _int(created.get("gte"), 0), _int(created.get("lte"), 2 ** 62)
+        limit = min(_int(q.get("limit"), 10), 100)
+        rows = sorted((i for i in self.intents.values() if lo <= i["created"] <= hi),
+                      key=lambda i: i["id"], reverse=True)
+        if q.get("starting_after"):
+            rows = [i for i in rows if i["id"] < q["starting_after"]]
+        return JSONResponse({"object": "list", "url": "/v1/payment_intents", "data": rows[:limit],
+                             "has_more": len(rows) > limit})
+
+    async def _stripe_create_object(self, request: Request) -> JSONResponse:
+        kind = request.scope["sim_object"]
+        form = await self._form(request)
+        prefix = {"product": "prod", "price": "price", "payment_link": "plink", "refund": "re"}[kind]
+        obj = {**form, "id": self._id(prefix), "object": kind, "created": int(time.time())}
+        if kind == "payment_link":
+            obj["url"] = f"https://buy.stripe.sim/{obj['id']}"
+        elif kind == "refund":
+            intent = self.intents.get(form.get("payment_intent"))
+            obj.update(status="succeeded", amount=_int(form.get("amount"), intent["amount"] if intent else 0))
+        self.objects[obj["id"]] = obj
+        return JSONResponse(obj)
+
+    async def _stripe_balance(self, request: Request) -> JSONResponse:
+        return JSONResponse({"object": "balance", "livemode": False,
+                             "available": [{"amount": 0, "currency": "usd"}], "pending": []})
+
+    # -- payments and webhook events ----------------------------------------
+
+    def razorpay_paid_events(self, order: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Mark ``order`` paid; its payment.captured and order.paid events."""
+        now = int(time.time())
+        payment = {
+            "id": self._id("pay"), "entity": "payment", "amount": order["amount"], "currency": order["currency"],
+            "status": "captured", "order_id": order["id"], "method": "upi", "captured": True,
+            "notes": {"receipt": order.get("receipt")}, "created_at": now,
+        }
+        order.update(status="paid", amount_paid=order["amount"], amount_due=0, attempts=order["attempts"] + 1)
+        return [
+            {"entity": "event", "account_id": "acc_sim", "event": "payment.captured", "contains": ["payment"],
+             "payload": {"payment": {"entity": payment}}, "created_at": now},
+            {"entity": "event", "account_id": "acc_sim", "event": "order.paid", "contains": ["payment", "order"],
+             "payload": {"payment": {"entity": payment}, "order": {"entity": dict(order)}}, "created_at": now},
+        ]
+
+    def stripe_completed_events(self, session: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Complete ``session``; its checkout.session.completed and payment_intent.succeeded events."""
+        session.update(status="complete", payment_status="paid")
+        intent = self.intents.get(session["payment_intent"])
+        events = [self._stripe_event("checkout.session.completed", dict(session))]
+        if intent is not None:
+            intent.update(status="succeeded", payment_method=self._id("pm"))
+            events.append(self._stripe_event("payment_intent.succeeded", dict(intent)))
+        return events
+
+    def _stripe_event(self, etype: str, obj: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": self._id("evt"), "object": "event", "api_version": "2023-10-16", "livemode": False,
+                "created": int(time.time()), "type": etype, "data": {"object": obj}}
+
+    def signed(self, provider: str, event: Dict[str, Any]) -> Tuple[bytes, Dict[str, str]]:
+        """``event`` as the PSP would POST it: (body, headers)."""
+        body = json.dumps(event, separators=(",", ":")).encode()
+        if provider == "razorpay":
+            sig = {"X-Razorpay-Signature": razorpay_signature(body, self.config.razorpay_webhook_secret)}
+        else:
+            sig = {"Stripe-Signature": stripe_signature(body, self.config.stripe_webhook_secret)}
+        return body, {"Content-Type": "application/json", **sig}
+
+    def _storm_events(self, provider: str, count: int, transaction_refs: Sequence[str]) -> List[Dict[str, Any]]:
+        """``count`` payments' events: open orders/sessions first, then new ones (one per ref, cycling)."""
+        refs = itertools.cycle(transaction_refs or [None])
+        if provider == "razorpay":
+            pending = [o for o in self.orders.values() if o["status"] != "paid"]
+            while len(pending) < count:
+                ref = next(refs)
+                order = {"id": self._id("order"), "entity": "order", "amount": 50000, "amount_paid": 0,
+                         "amount_due": 50000, "currency": "INR", "receipt": ref or self._id("rcpt"),
+                         "status": "created", "attempts": 0, "notes": {}, "created_at": int(time.time())}
+                self.orders[order["id"]] = order
+                pending.append(order)
+            return [e for o in pending[:count] for e in self.razorpay_paid_events(o)]
+        pending = [s for s in self.sessions.values() if s["status"] == "open"]
+        while len(pending) < count:
+            ref = next(refs)
+            metadata = {"transaction_ref": ref} if ref else {}
+            intent = self._new_intent(5000, "usd", metadata)
+            session_id = self._id("cs_test")
+            session = {"id": session_id, "object": "checkout.session", "mode": "payment", "amount_total": 5000,
+                       "currency": "usd", "metadata": metadata, "payment_intent": intent["id"], "status": "open",
+                       "payment_status": "unpaid", "url": f"https://checkout.stripe.sim/c/pay/{session_id}",
+                       "created": int(time.time()), "expires_at": int(time.time()) + 86400}
+            self.sessions[session_id] = session
+            pending.append(session)
+        return [e for s in pending[:count] for e in self.stripe_completed_events(s)]
+
+    async def deliver(
+        self,
+        provider: str,
+        events: Sequence[Dict[str, Any]],
+        target: Optional[str] = None,
+        concurrency: int = 20,
+        duplicate_rate: float = 0.0,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> Dict[str, Any]:
+        """POST signed ``events`` to ``target``'s webhook route; a ``duplicate_rate`` share is sent twice.
+
+        Returns delivery counts by status and ack latency percentiles.
+        """
+        sends = []
+        for event in events:
+            sends.append(event)
+            if duplicate_rate and self.rng.random() < duplicate_rate:
+                sends.append(event)  # the same body again, like a PSP retry
+        self.rng.shuffle(sends)
+        url = (target or self.config.webhook_url or "").rstrip("/") + WEBHOOK_PATHS[provider]
+        own = client is None
+        client = client or httpx.AsyncClient(timeout=30)
+        sem = asyncio.Semaphore(max(1, concurrency))
+        statuses: Counter = Counter()
+        latencies: List[float] = []
+
+        async def send(event: Dict[str, Any]) -> None:
+            body, headers = self.signed(provider, event)
+            async with sem:
+                start = time.perf_counter()
+                try:
+                    r = await client.post(url, content=body, headers=headers)
+                    statuses[str(r.status_code)] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(send(e) for e in sends))
+        finally:
+            if own:
+                await client.aclose()
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+
+        def pct(q: float) -> Optional[float]:
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2) if latencies else None
+
+        return {
+            "provider": provider, "url": url, "events": len(events), "sent": len(sends),
+            "duplicates": len(sends) - len(events), "statuses": dict(statuses),
+            "elapsed_s": round(elapsed, 3), "events_per_s": round(len(sends) / elapsed, 1) if elapsed else None,
+            "ack_p50_ms": pct(0.5), "ack_p95_ms": pct(0.95), "ack_p99_ms": pct(0.99),
+        }
+
+    async def storm(
+        self,
+        provider: str,
+        count: int,
+        target: Optional[str] = None,
+        concurrency: int = 20,
+        duplicate_rate: float = 0.0,
+        transaction_refs: Sequence[str] = (),
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> Dict[str, Any]:
+        """Pay ``count`` orders/sessions and deliver all their signed webhooks at once."""
+        events = self._storm_events(provider, count, transaction_refs)
+        return await self.deliver(provider, events, target, concurrency, duplicate_rate, client)
+
+    # -- control endpoints ----------------------------------------------------
+
+    async def _ctl_stats(self, request: Request) -> JSONResponse:
+        with self._lock:
+            requests = [{"provider": p, "route": r, "status": s, "count": n}
+                        for (p, r, s), n in sorted(self.requests.items())]
+        return JSONResponse({
+            "config": {"providers": {p: c.to_json() for p, c in self.config.providers.items()},
+                       "webhook_url": self.config.webhook_url, "seed": self.config.seed},
+            "objects": {"orders": len(self.orders), "payment_links": len(self.payment_links),
+                        "checkout_sessions": len(self.sessions), "payment_intents": len(self.intents)},
+            "requests": requests,
+        })
+
+    async def _ctl_config(self, request: Request) -> JSONResponse:
+        """{"provider": "stripe" (omit for both), "latency": ..., "error_rate": ..., "rate_limit": ..., "burst": ...}"""
+        body = await request.json()
+        try:
+            for p in ([body["provider"]] if body.get("provider") else PROVIDERS):
+                self.config.providers[p].update(body)
+        except (KeyError, ValueError) as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        if "webhook_url" in body:
+            self.config.webhook_url = body["webhook_url"] or None
+        return await self._ctl_stats(request)
+
+    async def _ctl_reset(self, request: Request) -> JSONResponse:
+        self.reset()
+        return JSONResponse({"ok": True})
+
+    async def _ctl_pay(self, request: Request) -> JSONResponse:
+        provider, obj_id = request.path_params["provider"], request.path_params["id"]
+        store = self.orders if provider == "razorpay" else self.sessions
+        obj = store.get(obj_id)
+        if obj is None:
+            return JSONResponse({"error": f"unknown {provider} id {obj_id}"}, status_code=404)
+        events = self.razorpay_paid_events(obj) if provider == "razorpay" else self.stripe_completed_events(obj)
+        delivery = await self.deliver(provider, events) if self.config.webhook_url else None
+        return JSONResponse({"events": events, "delivery": delivery})
+
+    async def _ctl_storm(self, request: Request) -> JSONResponse:
+        """{"provider", "count", "target"?, "concurrency"?, "duplicate_rate"?, "transaction_refs"?}"""
+        body = await request.json()
+        if body.get("provider") not in PROVIDERS or not (body.get("target") or self.config.webhook_url):
+            return JSONResponse({"error": "provider and target (or a configured webhook_url) are required"},
+                                status_code=400)
+        summary = await self.storm(
+            body["provider"], int(body.get("count", 100)), body.get("target"),
+            concurrency=int(body.get("concurrency", 20)), duplicate_rate=float(body.get("duplicate_rate", 0)),
+            transaction_refs=body.get("transaction_refs") or (),
+        )
+        return JSONResponse(summary)
+
+    # -- app ------------------------------------------------------------------
+
+    def _build_app(self) -> Starlette:
+        def stripe_route(path: str, handler: Handler, methods: List[str], obj: Optional[str] = None) -> Route:
+            endpoint = self._psp("stripe", path, handler)
+            if obj is not None:
+                inner = endpoint
+
+                async def endpoint(request: Request, inner: Handler = inner) -> JSONResponse:
+                    request.scope["sim_object"] = obj
+                    return await inner(request)
+
+            return Route(path, endpoint, methods=methods)
+
+        razorpay = [
+            Route("/v1/orders", self._psp("razorpay", "/v1/orders", self._rzp_create_order), methods=["POST"]),
+            Route("/v1/orders", self._psp("razorpay", "/v1/orders", self._rzp_list_orders), methods=["GET"]),
+            Route("/v1/orders/{id}", self._psp("razorpay", "/v1/orders/{id}", self._rzp_get_order), methods=["GET"]),
+            Route("/v1/payment_links", self._psp("razorpay", "/v1/payment_links", self._rzp_create_link),
+                  methods=["POST"]),
+            Route("/v1/payment_links/{id}", self._psp("razorpay", "/v1/payment_links/{id}", self._rzp_get_link),
+                  methods=["GET"]),
+        ]
+        stripe = [
+            stripe_route("/v1/checkout/sessions", self._stripe_create_session, ["POST"]),
+            stripe_route("/v1/checkout/sessions/{id}", self._stripe_get, ["GET"], "checkout.session"),
+            stripe_route("/v1/payment_intents", self._stripe_create_intent, ["POST"]),
+            stripe_route("/v1/payment_intents", self._stripe_list_intents, ["GET"]),
+            stripe_route("/v1/payment_intents/{id}", self._stripe_get, ["GET"], "payment_intent"),
+            stripe_route("/v1/products", self._stripe_create_object, ["POST"], "product"),
+            stripe_route("/v1/prices", self._stripe_create_object, ["POST"], "price"),
+            stripe_route("/v1/payment_links", self._stripe_create_object, ["POST"], "payment_link"),
+            stripe_route("/v1/refunds", self._stripe_create_object, ["POST"], "refund"),
+            stripe_route("/v1/balance", self._stripe_balance, ["GET"]),
+        ]
+        control = [
+            Route("/stats", self._ctl_stats, methods=["GET"]),
+            Route("/config", self._ctl_config, methods=["POST"]),
+            Route("/reset", self._ctl_reset, methods=["POST"]),
+            Route("/{provider:str}/pay/{id:str}", self._ctl_pay, methods=["POST"]),
+            Route("/storm", self._ctl_storm, methods=["POST"]),
+        ]
+        return Starlette(routes=[Mount("/razorpay", routes=razorpay), Mount("/stripe", routes=stripe),
+                                 Mount("/_sim", routes=control)])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_status: Counter = Counter()
+            for (p, _, s), n in self.requests.items():
+                by_status[f"{p}:{s}"] += n
+        return {"providers": {p: c.to_json() for p, c in self.config.providers.items()}, "requests": dict(by_status)}
+
+
+def create_app(config: Optional[SimConfig] = None) -> Starlette:
+    """ASGI entry point (``uvicorn app.psp.simulator:create_app --factory``); configured from env by default."""
+    sim = PSPSimulator(config or SimConfig.from_env())
+    sim.app.state.simulator = sim
+    return sim.app
+
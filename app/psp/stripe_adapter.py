@@ -1,7 +1,11 @@
 """Stripe PSP Adapter Implementation."""
-import stripe
+import os
 from typing import Dict, Any, Optional
 from .adapter import PSPAdapter, PSPProvider
+try:
+    import stripe  # type: ignore
+except Exception:  # pragma: no cover
+    stripe = None  # type: ignore
 
 
 class StripeAdapter(PSPAdapter):
@@ -12,7 +16,11 @@ class StripeAdapter(PSPAdapter):
     def __init__(self, api_key: str, api_secret: Optional[str] = None, **kwargs):
         """Initialize Stripe adapter."""
         super().__init__(api_key, api_secret, **kwargs)
+        if stripe is None:
+            raise ValueError("stripe package not installed")
         stripe.api_key = self.api_key
+        if os.getenv("STRIPE_API_BASE"):
+            stripe.api_base = os.environ["STRIPE_API_BASE"]
         self.webhook_secret = api_secret  # Stripe webhook signing secret
     
     def create_payment_intent(
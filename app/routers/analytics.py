@@ -1,15 +1,18 @@
 """
 Analytics API endpoints (Razorpay-agnostic; org-scoped).
 """
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 from app.db import get_db
-from app.deps import get_current_user
-from app.models import User, Transaction, RecoveryAttempt, FailureEvent
+from app.core.principal import Principal
+from app.deps import get_current_principal
+from app.models import Transaction, RecoveryAttempt, FailureEvent
+from app.analytics.columnar import snapshot_for
+from app.services.recovery_latency import BASES, latency_percentiles, parse_quantiles
 
 router = APIRouter(prefix="/v1/analytics", tags=["Analytics"])
 
@@ -27,11 +30,16 @@ def _parse_dt(value: Optional[str]) -> Optional[datetime]:
 def revenue_recovered(
     from_: Optional[str] = Query(None, alias="from"),
     to_: Optional[str] = Query(None, alias="to"),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db),
 ):
     start = _parse_dt(from_) or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
     end = _parse_dt(to_) or datetime.now(timezone.utc)
+    snap = snapshot_for(db, current_user.org_id, start)
+    if snap is not None:
+        total = snap.sum_amount(start, end, ["completed"])
+        count = snap.count_attempts(start, end, ["completed"])
+        return _revenue_response(total, count, start, end)
     q = db.query(func.coalesce(func.sum(Transaction.amount), 0)).join(
         RecoveryAttempt, RecoveryAttempt.transaction_id == Transaction.id, isouter=True
     ).filter(
@@ -48,6 +56,10 @@ def revenue_recovered(
         RecoveryAttempt.created_at >= start,
         RecoveryAttempt.created_at <= end,
     ).scalar() or 0
+    return _revenue_response(total, count, start, end)
+
+
+def _revenue_response(total, count, start: datetime, end: datetime) -> dict:
     # Back-compat and console shape
     return {
         "total_recovered": int(total),
@@ -63,22 +75,27 @@ def revenue_recovered(
 def recovery_rate(
     from_: Optional[str] = Query(None, alias="from"),
     to_: Optional[str] = Query(None, alias="to"),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db),
 ):
     start = _parse_dt(from_) or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
     end = _parse_dt(to_) or datetime.now(timezone.utc)
-    total = db.query(func.count(RecoveryAttempt.id)).join(Transaction).filter(
-        Transaction.org_id == current_user.org_id,
-        RecoveryAttempt.created_at >= start,
-        RecoveryAttempt.created_at <= end,
-    ).scalar() or 0
-    completed = db.query(func.count(RecoveryAttempt.id)).join(Transaction).filter(
-        Transaction.org_id == current_user.org_id,
-        RecoveryAttempt.status == "completed",
-        RecoveryAttempt.created_at >= start,
-        RecoveryAttempt.created_at <= end,
-    ).scalar() or 0
+    snap = snapshot_for(db, current_user.org_id, start)
+    if snap is not None:
+        total = snap.count_attempts(start, end)
+        completed = snap.count_attempts(start, end, ["completed"])
+    else:
+        total = db.query(func.count(RecoveryAttempt.id)).join(Transaction).filter(
+            Transaction.org_id == current_user.org_id,
+            RecoveryAttempt.created_at >= start,
+            RecoveryAttempt.created_at <= end,
+        ).scalar() or 0
+        completed = db.query(func.count(RecoveryAttempt.id)).join(Transaction).filter(
+            Transaction.org_id == current_user.org_id,
+            RecoveryAttempt.status == "completed",
+            RecoveryAttempt.created_at >= start,
+            RecoveryAttempt.created_at <= end,
+        ).scalar() or 0
     pct = round((completed / total * 100.0), 2) if total else 0.0
     return {
         "recovery_rate": pct,
@@ -94,11 +111,20 @@ def recovery_rate(
 def attempts_summary(
     from_: Optional[str] = Query(None, alias="from"),
     to_: Optional[str] = Query(None, alias="to"),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db),
 ):
     start = _parse_dt(from_) or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
     end = _parse_dt(to_) or datetime.now(timezone.utc)
+    snap = snapshot_for(db, current_user.org_id, start)
+    if snap is not None:
+        return {
+            "by_status": {s or "unknown": c for s, c in snap.attempts_by("status", start, end).items()},
+            "by_category": {cat or "unknown": c for cat, c in snap.failures_by_reason(start, end).items()},
+            "by_channel": {ch or "unknown": c for ch, c in snap.attempts_by("channel", start, end).items()},
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+        }
     # Group by status
     by_status = db.query(RecoveryAttempt.status, func.count(RecoveryAttempt.id)).join(Transaction).filter(
         Transaction.org_id == current_user.org_id,
@@ -107,6 +133,14 @@ def attempts_summary(
     ).group_by(RecoveryAttempt.status).all()
     status_counts = {s or "unknown": int(c) for s, c in by_status}
 
+    # Group by channel
+    by_ch = db.query(RecoveryAttempt.channel, func.count(RecoveryAttempt.id)).join(Transaction).filter(
+        Transaction.org_id == current_user.org_id,
+        RecoveryAttempt.created_at >= start,
+        RecoveryAttempt.created_at <= end,
+    ).group_by(RecoveryAttempt.channel).all()
+    channel_counts = {ch or "unknown": int(c) for ch, c in by_ch}
+
     # Group by failure category (if recorded in FailureEvent.reason)
     by_cat = db.query(FailureEvent.reason, func.count(FailureEvent.id)).join(Transaction).filter(
         Transaction.org_id == current_user.org_id,
@@ -114,11 +148,10 @@ def attempts_summary(
         FailureEvent.created_at <= end,
     ).group_by(FailureEvent.reason).all()
     category_counts = {cat or "unknown": int(c) for cat, c in by_cat}
-    # Include by_channel key for console shape (not computed here)
     return {
         "by_status": status_counts,
         "by_category": category_counts,
-        "by_channel": {},
+        "by_channel": channel_counts,
         "from": start.isoformat(),
         "to": end.isoformat(),
     }
@@ -128,11 +161,15 @@ def attempts_summary(
 def summary(
     from_: Optional[str] = Query(None, alias="from"),
     to_: Optional[str] = Query(None, alias="to"),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db),
 ):
     start = _parse_dt(from_) or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
     end = _parse_dt(to_) or datetime.now(timezone.utc)
+    snap = snapshot_for(db, current_user.org_id, start)
+    if snap is not None:
+        failure = {cat or "other": c for cat, c in snap.failures_by_reason(start, end).items()}
+        return {"recovered_amount_30d": snap.sum_amount(start, end, ["completed"]), "failure_categories": failure}
     recovered_total = db.query(func.coalesce(func.sum(Transaction.amount), 0)).join(
         RecoveryAttempt, RecoveryAttempt.transaction_id == Transaction.id, isouter=True
     ).filter(
@@ -155,18 +192,51 @@ def summary(
 def funnel(
     from_: Optional[str] = Query(None, alias="from"),
     to_: Optional[str] = Query(None, alias="to"),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db),
 ):
     start = _parse_dt(from_) or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
     end = _parse_dt(to_) or datetime.now(timezone.utc)
+    snap = snapshot_for(db, current_user.org_id, start)
+    if snap is not None:
+        return snap.funnel(start, end)
     q_base = db.query(RecoveryAttempt).join(Transaction).filter(
         Transaction.org_id == current_user.org_id,
         RecoveryAttempt.created_at >= start,
         RecoveryAttempt.created_at <= end,
     )
-    failed = db.query(func.count(RecoveryAttempt.id)).select_from(q_base.subquery()).scalar() or 0
-    notified = db.query(func.count(RecoveryAttempt.id)).select_from(q_base.filter(RecoveryAttempt.status.in_(["sent", "opened", "completed"])) .subquery()).scalar() or 0
-    clicked = db.query(func.count(RecoveryAttempt.id)).select_from(q_base.filter(RecoveryAttempt.status.in_(["opened", "completed"])) .subquery()).scalar() or 0
-    paid = db.query(func.count(RecoveryAttempt.id)).select_from(q_base.filter(RecoveryAttempt.status == "completed").subquery()).scalar() or 0
+    # Count over each subquery itself; selecting RecoveryAttempt.id again would
+    # cross-join the base table with the subquery.
+    failed = db.query(func.count()).select_from(q_base.subquery()).scalar() or 0
+    notified = db.query(func.count()).select_from(q_base.filter(RecoveryAttempt.status.in_(["sent", "opened", "completed"])).subquery()).scalar() or 0
+    clicked = db.query(func.count()).select_from(q_base.filter(RecoveryAttempt.status.in_(["opened", "completed"])).subquery()).scalar() or 0
+    paid = db.query(func.count()).select_from(q_base.filter(RecoveryAttempt.status == "completed").subquery()).scalar() or 0
     return {"failed": int(failed), "notified": int(notified), "clicked": int(clicked), "paid": int(paid)}
+
+
+@router.get("/time_to_recovery")
+def time_to_recovery(
+    from_: Optional[str] = Query(None, alias="from"),
+    to_: Optional[str] = Query(None, alias="to"),
+    basis: str = Query("failure", description="failure | notification"),
+    channel: Optional[str] = Query(None),
+    q: Optional[str] = Query(None, description="Comma-separated quantiles, e.g. 0.5,0.9 or 50,90"),
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+):
+    """Time-to-recovery percentiles (seconds) merged from per-day sketches.
+
+    Days are UTC completion days; the window defaults to the last 30 days.
+    """
+    if basis not in BASES:
+        raise HTTPException(status_code=400, detail=f"basis must be one of {', '.join(BASES)}")
+    try:
+        quantiles = parse_quantiles(q)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid quantiles")
+    end = _parse_dt(to_) or datetime.now(timezone.utc)
+    start = _parse_dt(from_) or (end - timedelta(days=30))
+    result = latency_percentiles(
+        db, current_user.org_id, start.date(), end.date(), basis=basis, channel=channel, quantiles=quantiles
+    )
+    return {**result, "basis": basis, "from": start.date().isoformat(), "to": end.date().isoformat()}
@@ -8,11 +8,14 @@ import re
 import os
 import secrets
 import urllib.parse
-import httpx
 
 from ..deps import get_db, get_current_user, require_role
+from ..core.principal import invalidate_principal
 from ..models import User, Organization, ApiKey
-from ..security import hash_password, verify_password, create_jwt
+from ..security import create_jwt
+from ..core.google_id_token import InvalidIdToken, get_google_verifier
+from ..core.http import get_http_client
+from ..core.password_hasher import hash_password_sync, verify_password_sync
 from ..auth_schemas import (
     UserCreate,
     UserCreateWithPassword,
@@ -32,6 +35,8 @@ from app.schemas.auth import (
     VerifyOTPRequest, TokenResponse as NewTokenResponse, OTPResponse, MessageResponse
 )
 
+router = APIRouter(prefix="/v1/auth", tags=["auth"])
+
 # ========== ENHANCED MOBILE OTP & GOOGLE OAUTH ==========
 
 @router.post("/signup-enhanced", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
@@ -125,8 +130,6 @@ async def verify_mobile_otp_enhanced(
     """
     return await auth_service.verify_mobile_otp(verify_request, request)
 
-router = APIRouter(prefix="/v1/auth", tags=["auth"])
-
 
 def slugify(text: str) -> str:
     """Convert text to URL-safe slug."""
@@ -180,7 +183,7 @@ def register(user_data: UserCreateWithPassword, db: Session = Depends(get_db)):
         )
     
     # Create user
-    hashed_pw = hash_password(user_data.password)
+    hashed_pw = hash_password_sync(user_data.password)
     user = User(
         email=user_data.email,
         hashed_password=hashed_pw,
@@ -197,14 +200,9 @@ def register(user_data: UserCreateWithPassword, db: Session = Depends(get_db)):
     
     # Generate API key if requested (for customers)
     if user_data.api_key_name and user_data.account_type == "customer":
-        api_key_plain = ApiKey.generate_key()
-        api_key_hash = hash_password(api_key_plain)  # Reuse password hashing
-        
-        api_key = ApiKey(
+        api_key_plain, api_key = ApiKey.issue(
             user_id=user.id,
             key_name=user_data.api_key_name,
-            key_hash=api_key_hash,
-            key_prefix=api_key_plain[:8],  # Store first 8 chars for display
             scopes=user_data.api_scopes or ["read"],
             is_active=True,
         )
@@ -276,7 +274,7 @@ def login(credentials: UserLogin, db: Session = Depends(get_db)):
     # Find user by email
     user = db.query(User).filter(User.email == credentials.email).first()
 
-    if not user or not verify_password(credentials.password, user.hashed_password):
+    if not user or not verify_password_sync(credentials.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -442,20 +440,15 @@ def create_api_key(
     Create a new API key for the current user.
     """
     # Generate API key
-    api_key_plain = ApiKey.generate_key()
-    api_key_hash = hash_password(api_key_plain)
-    
     # Set expiry if specified
     expires_at = None
     if key_data.expires_in_days:
         from datetime import datetime, timedelta
         expires_at = datetime.utcnow() + timedelta(days=key_data.expires_in_days)
     
-    api_key = ApiKey(
+    api_key_plain, api_key = ApiKey.issue(
         user_id=current_user.id,
         key_name=key_data.key_name,
-        key_hash=api_key_hash,
-        key_prefix=api_key_plain[:8],
         scopes=key_data.scopes,
         expires_at=expires_at,
         is_active=True,
@@ -560,11 +553,42 @@ def assign_role(
         raise HTTPException(status_code=403, detail="Cannot assign role across organizations")
 
     target.role = role_norm
-    db.commit()
+    db.commit()  # drops the cached Principal (see app.models)
     db.refresh(target)
     return {"ok": True, "user": UserResponse.from_orm(target)}
 
 
+@router.post("/users/{user_id}/deactivate", dependencies=[Depends(require_role("admin"))])
+def deactivate_user(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Admin-only: deactivate a user in the same organization.
+    """
+    target = db.query(User).filter(User.id == user_id).first()
+    if not target:
+        raise HTTPException(status_code=404, detail="User not found")
+    if target.org_id != current_user.org_id:
+        raise HTTPException(status_code=403, detail="Cannot deactivate users across organizations")
+    if target.id == current_user.id:
+        raise HTTPException(status_code=400, detail="Cannot deactivate yourself")
+
+    target.is_active = False
+    db.commit()  # drops the cached Principal (see app.models)
+    return {"ok": True, "user_id": target.id}
+
+
+@router.post("/logout")
+def logout(current_user: User = Depends(get_current_user)):
+    """
+    Drop the caller's cached principal on every worker.
+    """
+    invalidate_principal(current_user.id)
+    return {"message": "Logged out"}
+
+
 # --- Google OAuth minimal flow ---
 
 def _google_oauth_config():
@@ -630,21 +654,19 @@ async def google_oauth_callback(request: Request, db: Session = Depends(get_db))
     google_id = None
     name = None
     
-    async with httpx.AsyncClient(timeout=10) as client:
-        tok = await client.post(token_url, data=data)
-        tok.raise_for_status()
-        tjson = tok.json()
-        id_token = tjson.get("id_token")
-        
-        # Parse ID token for user info
-        from jose import jwt as jose_jwt
-        try:
-            claims = jose_jwt.get_unverified_claims(id_token)
-            email = claims.get("email")
-            google_id = claims.get("sub")
-            name = claims.get("name")
-        except Exception:
-            pass
+    tok = await get_http_client().post(token_url, data=data, timeout=10)
+    tok.raise_for_status()
+    tjson = tok.json()
+    id_token = tjson.get("id_token")
+
+    # Verify the ID token against Google's cached signing keys (no extra round trip)
+    try:
+        claims = await get_google_verifier().verify(id_token or "", [client_id])
+        email = claims.get("email")
+        google_id = claims.get("sub")
+        name = claims.get("name")
+    except InvalidIdToken:
+        pass  # answered with the 400 below
 
     if not email or not google_id:
         raise HTTPException(status_code=400, detail="Failed to retrieve user info from Google")
@@ -714,14 +736,9 @@ async def google_oauth_callback(request: Request, db: Session = Depends(get_db))
         
         # Generate API key if requested for customers
         if signup_intent.get("api_key_name") and signup_intent.get("account_type") == "customer":
-            api_key_plain = ApiKey.generate_key()
-            api_key_hash = hash_password(api_key_plain)
-            
-            api_key = ApiKey(
+            api_key_plain, api_key = ApiKey.issue(
                 user_id=user.id,
                 key_name=signup_intent["api_key_name"],
-                key_hash=api_key_hash,
-                key_prefix=api_key_plain[:8],
                 scopes=["read"],
                 is_active=True,
             )
@@ -43,7 +43,11 @@ def payment_failed(
         if authorization and authorization.lower().startswith("bearer "):
             token = authorization.split(" ", 1)[1]
             payload_jwt = decode_jwt(token)
-            if payload_jwt and (user_id := payload_jwt.get("user_id")):
+            if payload_jwt and payload_jwt.get("org_id"):
+                # Tokens carry org_id; no user lookup on the ingest path
+                txn.org_id = payload_jwt["org_id"]
+            elif payload_jwt and (user_id := payload_jwt.get("user_id")):
+                # Older tokens without org_id
                 user = db.query(models.User).filter(models.User.id == user_id).first()
                 if user and user.org_id:
                     txn.org_id = user.org_id
@@ -1,6 +1,31 @@
-from fastapi import APIRouter, Depends, Query
-from app.deps import require_roles_or_token
-from app.services.partition_service import ensure_current_month_partitions, prune_old_partitions
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.deps import get_db, require_roles_or_token
+from app.services.partition_service import (
+    TIME_PARTITIONED,
+    drop_expired_time_partitions,
+    ensure_current_month_partitions,
+    ensure_time_partitions,
+    list_partitions,
+    prune_old_partitions,
+)
+from app.analytics.batcher import emitter_stats
+from app.analytics.columnar import cache_stats
+from app.analytics.sink import replay_spools
+from app.analytics.spool import spool_stats
+from app.core.password_hasher import get_password_hasher
+from app.core.google_id_token import get_google_verifier
+from app.core.jwt_cache import get_claims_cache
+from app.core.principal import get_principal_cache
+from app.services.security_audit import audit_stats
+from app.models import WebhookReplayJob
+from app.psp.dispatcher import PSPDispatcher
+from app.services.checkout_cache import get_checkout_cache
+from app.services.webhook_pipeline import pipeline_stats, process_pending
+from app.services.webhook_replay import claim_resume, dispatch_replay_job, job_summary as replay_summary
 
 router = APIRouter(prefix="/v1/maintenance", tags=["maintenance"])
 
@@ -15,3 +40,152 @@ def prune_partitions(months: int = Query(6, ge=1, le=60), user=Depends(require_r
     """Prune old partitions. For SQLite or non-partitioned DBs, returns ok without action."""
     pruned = prune_old_partitions(months=months)
     return {"ok": True, "pruned": pruned}
+
+
+@router.get("/partitions")
+def partitions(user=Depends(require_roles_or_token(["admin"]))):
+    """Partitions of transactions and the time-partitioned auth tables (empty on SQLite)."""
+    retention = {t: {"interval": s.interval, "keep": s.keep, "premake": s.premake} for t, s in TIME_PARTITIONED.items()}
+    return {"ok": True, "retention": retention, "partitions": list_partitions()}
+
+
+@router.post("/partitions/ensure_time")
+def ensure_time(user=Depends(require_roles_or_token(["admin"]))):
+    """Pre-create daily/weekly partitions for the OTP, security-log and session tables."""
+    return {"ok": True, "created": ensure_time_partitions()}
+
+
+@router.post("/partitions/retention")
+def apply_time_retention(
+    mode: str = Query("drop", pattern="^(drop|detach)$"),
+    user=Depends(require_roles_or_token(["admin"])),
+):
+    """Drop (or detach) auth-table partitions past retention."""
+    return {"ok": True, "mode": mode, "removed": drop_expired_time_partitions(mode=mode)}
+
+
+@router.get("/analytics-sink")
+def analytics_sink_stats(user=Depends(require_roles_or_token(["admin"]))):
+    """Counters for this process's analytics batch emitter (null until first emit) and spools."""
+    return {"ok": True, "emitter": emitter_stats(), "spool": spool_stats()}
+
+
+@router.post("/analytics-sink/replay")
+def analytics_sink_replay(user=Depends(require_roles_or_token(["admin"]))):
+    """Replay this process's spooled analytics records now (ignores retry backoff)."""
+    delivered = replay_spools(force=True)
+    return {"ok": True, "replayed": delivered, "spool": spool_stats()}
+
+
+@router.get("/analytics-columnar")
+def analytics_columnar_stats(user=Depends(require_roles_or_token(["admin"]))):
+    """Memory and hit counters for this process's columnar analytics cache (null if unused)."""
+    return {"ok": True, "cache": cache_stats()}
+
+
+@router.get("/principal-cache")
+def principal_cache_stats(user=Depends(require_roles_or_token(["admin"]))):
+    """Hit/miss/invalidation counters for this process's auth principal cache."""
+    return {"ok": True, "cache": get_principal_cache().stats()}
+
+
+@router.get("/jwt-cache")
+def jwt_cache_stats(user=Depends(require_roles_or_token(["admin"]))):
+    """Hit/miss/eviction counters for this process's verified JWT claims cache."""
+    return {"ok": True, "cache": get_claims_cache().stats()}
+
+
+@router.get("/google-jwks")
+def google_jwks_stats(user=Depends(require_roles_or_token(["admin"]))):
+    """Cached Google signing keys and ID token verification counters for this process."""
+    return {"ok": True, "verifier": get_google_verifier().stats()}
+
+
+@router.get("/webhooks")
+def webhook_pipeline_stats(db: Session = Depends(get_db), user=Depends(require_roles_or_token(["admin"]))):
+    """Pending/failed PSP events, processing lag and throughput, and this process's counters."""
+    return {"ok": True, "pipeline": pipeline_stats(db)}
+
+
+@router.post("/webhooks/drain")
+def webhook_pipeline_drain(db: Session = Depends(get_db), user=Depends(require_roles_or_token(["admin"]))):
+    """Process pending PSP events now, in this process."""
+    return {"ok": True, "drained": process_pending(db), "pipeline": pipeline_stats(db)}
+
+
+@router.post("/webhooks/replay")
+def webhook_replay(
+    background_tasks: BackgroundTasks,
+    provider: Optional[str] = Query(None, pattern="^(razorpay|stripe)$"),
+    event_type: Optional[List[str]] = Query(None, description="Repeat to replay several types"),
+    since: Optional[datetime] = Query(None, description="created_at >= since"),
+    until: Optional[datetime] = Query(None, description="created_at < until"),
+    dry_run: bool = Query(True, description="Run the handlers but roll every batch back"),
+    rate_limit: Optional[int] = Query(None, ge=1, description="Max events per second"),
+    db: Session = Depends(get_db),
+    user=Depends(require_roles_or_token(["admin"])),
+):
+    """Queue a replay of stored PSP events through the webhook handlers (dry run by default)."""
+    job = WebhookReplayJob(
+        status="queued", provider=provider, event_types=event_type or None, since=since, until=until,
+        dry_run=dry_run, rate_limit=rate_limit,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    executor = dispatch_replay_job(job.id, background_tasks)
+    return {"ok": True, **replay_summary(job), "executor": executor}
+
+
+@router.get("/webhooks/replay/{job_id}")
+def webhook_replay_status(job_id: int, db: Session = Depends(get_db), user=Depends(require_roles_or_token(["admin"]))):
+    job = db.get(WebhookReplayJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Replay job not found")
+    return {"ok": True, **replay_summary(job)}
+
+
+@router.post("/webhooks/replay/{job_id}/resume")
+def webhook_replay_resume(
+    job_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    user=Depends(require_roles_or_token(["admin"])),
+):
+    """Retry a failed or stalled replay's failed events, then continue after its checkpoint.
+
+    409 while the job is queued, succeeded, or running with a fresh heartbeat.
+    """
+    job = db.get(WebhookReplayJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Replay job not found")
+    if not claim_resume(db, job_id):
+        db.refresh(job)
+        raise HTTPException(status_code=409, detail=f"Replay job is {job.status}")
+    db.refresh(job)
+    executor = dispatch_replay_job(job.id, background_tasks)
+    return {"ok": True, **replay_summary(job), "executor": executor}
+
+
+@router.get("/psp-health")
+def psp_health(user=Depends(require_roles_or_token(["admin"]))):
+    """Rolling per-PSP latency/error health used for routing, plus hedge and failover counters (this process)."""
+    return {"ok": True, "psp": PSPDispatcher.health()}
+
+
+@router.get("/checkout-cache")
+def checkout_cache_stats(user=Depends(require_roles_or_token(["admin"]))):
+    """Checkout session / order reuse hits, misses and invalidations for this process."""
+    return {"ok": True, "cache": get_checkout_cache().stats()}
+
+
+@router.get("/password-hasher")
+def password_hasher_stats(user=Depends(require_roles_or_token(["admin"]))):
+    """Queue depth, throughput and 503 rejections for this process's bcrypt executor."""
+    return {"ok": True, "hasher": get_password_hasher().stats()}
+
+
+@router.get("/security-audit")
+def security_audit_stats(user=Depends(require_roles_or_token(["admin"]))):
+    """Queue depth and lag (seconds) of this process's batched security audit writer (null if unused)."""
+    return {"ok": True, "pipeline": audit_stats()}
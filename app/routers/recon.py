@@ -3,12 +3,13 @@ from __future__ import annotations
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
-from app.deps import get_current_user, get_db, require_roles
-from app.models import User, Transaction, ReconLog
-from app.services.payments.razorpay_adapter import RazorpayAdapter
+from app.core.principal import Principal
+from app.deps import get_current_user, get_db, require_principal_roles, require_roles
+from app.models import User, ReconJob
+from app.services.recon_engine import active_job, dispatch_recon_job, job_summary
 
 router = APIRouter(prefix="/v1/recon", tags=["Reconciliation"])
 
@@ -22,55 +23,38 @@ def _parse_int(v: Optional[str], default: int) -> int:
 
 @router.post("/run", dependencies=[Depends(require_roles(["admin"]))])
 def run_recon(
+    background_tasks: BackgroundTasks,
     days: int = Query(30, ge=1, le=365),
+    full: bool = Query(False, description="Recheck every order in the window, not just open/changed ones"),
+    bulk: bool = Query(False, description="Recheck the window using Razorpay's order list API (100 orders per call)"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    since = datetime.now(timezone.utc) - timedelta(days=days)
-    adapter = None
-    try:
-        adapter = RazorpayAdapter()
-    except Exception:
-        # If not configured, treat as zero external confirmation
-        adapter = None
-
-    txns = db.query(Transaction).filter(
-        Transaction.org_id == current_user.org_id,
-        Transaction.created_at >= since,
-        (Transaction.razorpay_order_id.isnot(None)) | (Transaction.razorpay_payment_id.isnot(None))
-    ).all()
+    """Queue a reconciliation job; poll GET /v1/recon/jobs/{job_id} for progress."""
+    running = active_job(db, current_user.org_id)
+    if running is not None:
+        raise HTTPException(status_code=409, detail=f"Recon job {running.id} is already {running.status}")
+    job = ReconJob(
+        org_id=current_user.org_id,
+        status="queued",
+        mode="bulk" if bulk else "full" if full else "incremental",
+        since=datetime.now(timezone.utc) - timedelta(days=days),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    executor = dispatch_recon_job(job.id, background_tasks)
+    return {**job_summary(job), "executor": executor}
 
-    checked = 0
-    ok = 0
-    mismatches = 0
 
-    for txn in txns:
-        checked += 1
-        internal_status = "paid" if txn.razorpay_payment_id else "unpaid"
-        external_status = None
-        if adapter and txn.razorpay_order_id:
-            try:
-                s = adapter.get_order_status(txn.razorpay_order_id)
-                external_status = "paid" if s.get("status") == "paid" else "open"
-            except Exception:
-                external_status = None
-        is_ok = (
-            (internal_status == "paid" and external_status == "paid") or
-            (internal_status == "unpaid" and external_status in ("open", None))
-        )
-        if is_ok:
-            ok += 1
-        else:
-            mismatches += 1
-        log = ReconLog(
-            transaction_id=txn.id,
-            stripe_checkout_session_id=None,
-            stripe_payment_intent_id=None,
-            internal_status=internal_status,
-            external_status=external_status or "unknown",
-            result="ok" if is_ok else "mismatch",
-            details={"transaction_ref": txn.transaction_ref, "razorpay_order_id": txn.razorpay_order_id},
-        )
-        db.add(log)
-    db.commit()
-    return {"checked": checked, "ok": ok, "mismatches": mismatches}
+@router.get("/jobs/{job_id}")
+def recon_job_status(
+    job_id: int,
+    current_user: Principal = Depends(require_principal_roles(["admin"])),
+    db: Session = Depends(get_db),
+):
+    # Polled while a job runs: the cached Principal spares a user query per poll
+    job = db.query(ReconJob).filter(ReconJob.id == job_id, ReconJob.org_id == current_user.org_id).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Recon job not found")
+    return job_summary(job)
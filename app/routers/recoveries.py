@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta, timezone
 from secrets import token_urlsafe
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 
 from ..deps import get_db
 from .. import models, schemas
+from ..services.checkout_cache import prewarm_checkout
 import os
 
 router = APIRouter(prefix="/v1/recoveries", tags=["recoveries"])
@@ -14,7 +15,7 @@ bearer_optional = HTTPBearer(auto_error=False)
 BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://127.0.0.1:8000")
 
 @router.post("/by_ref/{transaction_ref}/link", response_model=schemas.RecoveryLinkOut, status_code=status.HTTP_201_CREATED)
-def create_link_by_ref(transaction_ref: str, body: schemas.RecoveryLinkRequest = schemas.RecoveryLinkRequest(), db: Session = Depends(get_db)):
+def create_link_by_ref(transaction_ref: str, background_tasks: BackgroundTasks, body: schemas.RecoveryLinkRequest = schemas.RecoveryLinkRequest(), db: Session = Depends(get_db)):
     txn = db.query(models.Transaction).filter(models.Transaction.transaction_ref == transaction_ref).first()
     if txn is None:
         raise HTTPException(status_code=404, detail="transaction_ref not found")
@@ -39,6 +40,8 @@ def create_link_by_ref(transaction_ref: str, body: schemas.RecoveryLinkRequest =
     except Exception:
         # Non-fatal if Celery not running; link creation should still succeed
         pass
+    # Create the checkout session now so the payer's first open reuses it
+    background_tasks.add_task(prewarm_checkout, txn.transaction_ref)
 
     url = f"{BASE_URL}/pay/retry/{token}"
     return {
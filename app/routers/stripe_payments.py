@@ -2,19 +2,22 @@
 PSP-001: Stripe Payment API Routes
 Endpoints for creating checkout sessions, payment links, and handling webhooks.
 """
-from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import json
 import os
 import structlog
 
 from ..db import get_db
 from ..deps import get_current_user
-from ..models import Transaction, RecoveryAttempt, User
+from ..models import Organization, Transaction, User
 from ..services.stripe_service import StripeService
 from ..psp.dispatcher import PSPDispatcher
+from ..services.checkout_cache import CheckoutEntry, as_utc, get_checkout_cache, stripe_checkout
+from ..services.webhook_pipeline import ingest, kick
 try:
     import stripe  # type: ignore
 except Exception:
@@ -49,13 +52,15 @@ class CheckoutSessionResponse(BaseModel):
     payment_intent_id: Optional[str]
     checkout_url: str
     expires_at: datetime
+    reused: bool = False  # an earlier unexpired session for the same amount
 
 
 class PaymentLinkResponse(BaseModel):
     payment_link_id: str
     url: str
-    product_id: str
-    price_id: str
+    product_id: Optional[str] = None  # Stripe only
+    price_id: Optional[str] = None  # Stripe only
+    provider: str = "stripe"
 
 
 class SessionStatusResponse(BaseModel):
@@ -78,6 +83,12 @@ class PublicCheckoutResponse(BaseModel):
     data: Dict[str, Any]
 
 
+def _allowed_psps(db: Session, org_id: Optional[int]) -> list:
+    """The organization's PSPs in preference order (Stripe unless configured)."""
+    org = db.get(Organization, org_id) if org_id is not None else None
+    return list(getattr(org, "allowed_psps", None) or ["stripe"])
+
+
 # Endpoints
 @router.post("/checkout-sessions", response_model=CheckoutSessionResponse, status_code=status.HTTP_201_CREATED)
 async def create_checkout_session(
@@ -117,9 +128,28 @@ async def create_checkout_session(
         **request.metadata
     }
     
-    try:
+    providers = _allowed_psps(db, current_user.org_id)
+
+    async def create() -> CheckoutEntry:
+        if len(providers) > 1:
+            # Healthiest allowed PSP, failing over to the next on errors
+            base_url = os.getenv("PUBLIC_BASE_URL") or os.getenv("BASE_URL") or "http://localhost:3000"
+            provider, out = await PSPDispatcher.aroute(
+                providers,
+                "create_checkout_session",
+                amount=request.amount,
+                currency=request.currency,
+                success_url=request.success_url or f"{base_url}/pay/success?session_id={{CHECKOUT_SESSION_ID}}",
+                cancel_url=request.cancel_url or f"{base_url}/pay/cancel",
+                metadata=metadata,
+                product_name=f"Payment Recovery - {request.transaction_ref}",
+            )
+            return CheckoutEntry(
+                "checkout", provider, out["session_id"], request.amount, request.currency.lower(),
+                url=out["url"], expires_at=datetime.now(timezone.utc) + timedelta(hours=24),
+            )
         # Create checkout session via StripeService (keeps tests compatibility)
-        res = StripeService.create_checkout_session(
+        res = await StripeService.create_checkout_session_async(
             amount=request.amount,
             currency=request.currency,
             transaction_ref=request.transaction_ref,
@@ -128,10 +158,16 @@ async def create_checkout_session(
             cancel_url=request.cancel_url,
             metadata=metadata,
         )
-        # Update transaction with Stripe IDs
-        transaction.stripe_checkout_session_id = res["session_id"]
-        transaction.stripe_payment_intent_id = res.get("payment_intent_id")
-        transaction.payment_link_url = res["checkout_url"]
+        return CheckoutEntry(
+            "checkout", "stripe", res["session_id"], request.amount, request.currency.lower(),
+            url=res["checkout_url"], expires_at=as_utc(res["expires_at"]), payment_intent_id=res.get("payment_intent_id"),
+        )
+
+    try:
+        # An unexpired session for the same amount is reused (page refreshes)
+        entry, reused = await get_checkout_cache().get_or_create(
+            db, transaction, "checkout", request.amount, request.currency, create
+        )
         if request.customer_email:
             transaction.customer_email = request.customer_email
         if request.customer_phone:
@@ -142,7 +178,9 @@ async def create_checkout_session(
         logger.info(
             "checkout_session_created",
             transaction_id=transaction.id,
-            session_id=res["session_id"],
+            session_id=entry.id,
+            provider=entry.provider,
+            reused=reused,
             amount=request.amount,
             currency=request.currency,
             org_id=current_user.org_id
@@ -150,12 +188,16 @@ async def create_checkout_session(
         
         # Build response compatible with existing schema
         return CheckoutSessionResponse(
-            session_id=res["session_id"],
-            payment_intent_id=res.get("payment_intent_id"),
-            checkout_url=res["checkout_url"],
-            expires_at=res["expires_at"],
+            session_id=entry.id,
+            payment_intent_id=entry.payment_intent_id,
+            checkout_url=entry.url,
+            expires_at=entry.expires_at,
+            reused=reused,
         )
         
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         logger.error(
@@ -180,7 +222,8 @@ async def create_payment_link(
     Create a reusable Stripe Payment Link.
     
     Payment links are permanent and can be shared multiple times.
-    Unlike checkout sessions, they don't expire.
+    Unlike checkout sessions, they don't expire. Organizations that allow
+    several PSPs get the link from the healthiest one.
     """
     # Verify transaction exists and belongs to user's organization
     transaction = db.query(Transaction).filter(
@@ -198,34 +241,48 @@ async def create_payment_link(
     metadata = {
         "org_id": str(current_user.org_id),
         "user_id": str(current_user.id),
+        "transaction_ref": request.transaction_ref,
         **request.metadata
     }
     
     try:
-        # Create payment link via PSP adapter (Stripe)
-        adapter = PSPDispatcher.get_adapter("stripe")
-        result = adapter.create_payment_link(
+        # Create payment link via the healthiest allowed PSP adapter
+        provider, result = await PSPDispatcher.aroute(
+            _allowed_psps(db, current_user.org_id),
+            "create_payment_link",
             amount=request.amount,
             currency=request.currency,
             metadata=metadata,
             product_name=f"Payment Recovery - {request.transaction_ref}"
         )
         
-        # Update transaction with payment link URL
+        # Update transaction with payment link URL (and the link id webhooks match on)
         transaction.payment_link_url = result["url"]
+        if provider == "razorpay":
+            transaction.razorpay_payment_link_id = result["payment_link_id"]
         db.commit()
         
         logger.info(
             "payment_link_created",
             transaction_id=transaction.id,
             payment_link_id=result["payment_link_id"],
+            provider=provider,
             amount=request.amount,
             currency=request.currency,
             org_id=current_user.org_id
         )
         
-        return PaymentLinkResponse(**result)
+        return PaymentLinkResponse(
+            payment_link_id=result["payment_link_id"],
+            url=result["url"],
+            product_id=result.get("product_id"),
+            price_id=result.get("price_id"),
+            provider=provider,
+        )
         
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         logger.error(
@@ -256,7 +313,8 @@ async def get_session_status(
     try:
         # Directly use stripe to align with tests that patch
         # `app.services.stripe_service.stripe.checkout.Session.retrieve`.
-        sess = StripeService.retrieve_checkout_session(session_id)
+        # Hedged: a retrieve slower than its recent p95 is sent again.
+        sess = await StripeService.retrieve_checkout_session_async(session_id)
         if sess is None:
             # Preserve legacy/tested behavior: 500 when session retrieval returns None
             raise RuntimeError("Stripe session retrieval returned None")
@@ -290,13 +348,15 @@ async def get_session_status(
 @router.post("/webhooks", status_code=status.HTTP_200_OK, include_in_schema=False)
 async def stripe_webhook_handler(
     request: Request,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
     Handle Stripe webhook events.
     
     This endpoint receives real-time notifications from Stripe about payment events.
-    Signature verification is required for security.
+    Signature verification is required for security. Events are stored and
+    acknowledged here and processed by the webhook pipeline.
     """
     # Get raw body and signature
     payload = await request.body()
@@ -318,37 +378,20 @@ async def stripe_webhook_handler(
             detail="Invalid webhook signature"
         )
     
-    event_type = event["type"]
-    event_data = event["data"]["object"]
-    
     logger.info(
         "stripe_webhook_received",
-        event_type=event_type,
+        event_type=event["type"],
         event_id=event["id"]
     )
-    
-    # Handle different event types
-    try:
-        if event_type == "checkout.session.completed":
-            await _handle_checkout_session_completed(event_data, db)
-        elif event_type == "payment_intent.succeeded":
-            await _handle_payment_intent_succeeded(event_data, db)
-        elif event_type == "payment_intent.payment_failed":
-            await _handle_payment_intent_failed(event_data, db)
-        else:
-            logger.info("stripe_webhook_event_ignored", event_type=event_type)
-    
-    except Exception as e:
-        logger.error(
-            "stripe_webhook_processing_failed",
-            error=str(e),
-            event_type=event_type,
-            event_id=event["id"],
-            error_type=type(e).__name__
-        )
-        # Return 200 to acknowledge receipt even if processing failed
-        # Stripe will retry failed webhooks
-    
+
+    # Store and acknowledge; app.services.webhook_pipeline applies the event
+    # asynchronously. The verified raw body is stored rather than the
+    # StripeObject so the row is plain JSON.
+    inserted = ingest(db, "stripe", json.loads(payload))
+    if inserted is False:
+        return {"status": "received", "idempotent": True}
+    if inserted:
+        background_tasks.add_task(kick)
     return {"status": "received"}
 
 
@@ -369,21 +412,12 @@ async def create_checkout_public(
     if not txn or not txn.amount or not txn.currency:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction not found or incomplete")
     try:
-        base = os.getenv("BASE_URL", "http://localhost:3000")
-        res = StripeService.create_checkout_session(
-            amount=txn.amount,
-            currency=txn.currency,
-            transaction_ref=request.transaction_ref,
-            success_url=request.success_url or (base + "/pay/success"),
-            cancel_url=request.cancel_url or (base + "/pay/cancel"),
-            metadata={"transaction_ref": request.transaction_ref},
-        )
-        # Persist IDs/URL for later reconciliation
-        txn.stripe_checkout_session_id = res.get("session_id")
-        txn.stripe_payment_intent_id = res.get("payment_intent_id")
-        txn.payment_link_url = res.get("checkout_url")
-        db.commit()
-        return {"ok": True, "data": {"url": res.get("checkout_url")}}
+        # Refreshing the payer page reuses the session (pre-warmed with the recovery link)
+        entry, _ = await stripe_checkout(db, txn, request.success_url, request.cancel_url)
+        return {"ok": True, "data": {"url": entry.url}}
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         logger.error("public_checkout_creation_failed", error=str(e), transaction_ref=request.transaction_ref)
@@ -398,95 +432,10 @@ async def stripe_ping():
     try:
         stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
         # Simple API call to verify credentials
-        _ = stripe.Balance.retrieve()
+        _ = await StripeService.retrieve_balance_async()
         return {"ok": True}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("stripe_ping_failed", error=str(e))
         raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Stripe ping failed")
-
-
-# Webhook event handlers
-async def _handle_checkout_session_completed(session_data: Dict[str, Any], db: Session):
-    """Handle successful checkout session completion."""
-    session_id = session_data.get("id")
-    payment_intent_id = session_data.get("payment_intent")
-    metadata = session_data.get("metadata", {})
-    transaction_ref = metadata.get("transaction_ref")
-    
-    if not transaction_ref:
-        logger.warning("checkout_session_missing_transaction_ref", session_id=session_id)
-        return
-    
-    # Update transaction status
-    transaction = db.query(Transaction).filter(
-        Transaction.transaction_ref == transaction_ref
-    ).first()
-    
-    if transaction:
-        transaction.stripe_payment_intent_id = payment_intent_id
-        
-        # Mark recovery attempt as completed
-        recovery = db.query(RecoveryAttempt).filter(
-            RecoveryAttempt.transaction_ref == transaction_ref,
-            RecoveryAttempt.status.in_(["created", "sent", "opened"])
-        ).first()
-        
-        if recovery:
-            recovery.status = "completed"
-            recovery.used_at = datetime.utcnow()
-            logger.info(
-                "recovery_completed_via_checkout",
-                recovery_id=recovery.id,
-                transaction_ref=transaction_ref,
-                session_id=session_id
-            )
-        
-        db.commit()
-        logger.info(
-            "checkout_session_processed",
-            transaction_id=transaction.id,
-            session_id=session_id,
-            payment_intent_id=payment_intent_id
-        )
-
-
-async def _handle_payment_intent_succeeded(intent_data: Dict[str, Any], db: Session):
-    """Handle successful payment intent."""
-    payment_intent_id = intent_data.get("id")
-    amount = intent_data.get("amount")
-    currency = intent_data.get("currency")
-    
-    # Find transaction by payment intent ID
-    transaction = db.query(Transaction).filter(
-        Transaction.stripe_payment_intent_id == payment_intent_id
-    ).first()
-    
-    if transaction:
-        logger.info(
-            "payment_intent_succeeded",
-            transaction_id=transaction.id,
-            payment_intent_id=payment_intent_id,
-            amount=amount,
-            currency=currency
-        )
-        db.commit()
-
-
-async def _handle_payment_intent_failed(intent_data: Dict[str, Any], db: Session):
-    """Handle failed payment intent."""
-    payment_intent_id = intent_data.get("id")
-    error_message = intent_data.get("last_payment_error", {}).get("message", "Unknown error")
-    
-    # Find transaction by payment intent ID
-    transaction = db.query(Transaction).filter(
-        Transaction.stripe_payment_intent_id == payment_intent_id
-    ).first()
-    
-    if transaction:
-        logger.warning(
-            "payment_intent_failed",
-            transaction_id=transaction.id,
-            payment_intent_id=payment_intent_id,
-            error=error_message
-        )
-        db.commit()
@@ -5,7 +5,17 @@ from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 from jose import jwt, JWTError
 import bcrypt
+import hashlib
+import hmac
 import os
+import re
+
+from app.core.jwt_cache import get_claims_cache
+
+
+def bcrypt_rounds() -> int:
+    """bcrypt cost factor from BCRYPT_ROUNDS (default 12; use 4-8 in dev/test)."""
+    return min(31, max(4, int(os.getenv("BCRYPT_ROUNDS", "12"))))
 
 
 def hash_password(password: str) -> str:
@@ -18,7 +28,7 @@ def hash_password(password: str) -> str:
     if len(password_bytes) > 72:
         password_bytes = password_bytes[:72]
     
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=bcrypt_rounds())
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
@@ -40,6 +50,54 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 get_password_hash = hash_password
 
 
+# ---------------------------------------------------------------------------
+# API keys
+#
+# Keys look like ``sk_<key_id>_<secret>``: ``key_id`` (16 hex chars) is stored
+# in a unique indexed column so lookup is a single index probe, and the whole
+# key is verified with HMAC-SHA256 under a server-side pepper instead of
+# bcrypt. API keys carry 256 bits of entropy, so a slow hash adds cost without
+# adding security.
+# ---------------------------------------------------------------------------
+
+API_KEY_HASH_SCHEME = "hmac-sha256"
+_API_KEY_RE = re.compile(r"^sk_([0-9a-f]{16})_[A-Za-z0-9_-]{20,}$")
+
+
+def _api_key_pepper() -> bytes:
+    pepper = os.getenv("API_KEY_PEPPER") or os.getenv("JWT_SECRET", "dev-secret-change-in-production")
+    return pepper.encode("utf-8")
+
+
+def hash_api_key(api_key: str) -> str:
+    """Keyed hash stored in ApiKey.key_hash: ``hmac-sha256$<hex>``."""
+    digest = hmac.new(_api_key_pepper(), api_key.encode("utf-8"), hashlib.sha256).hexdigest()
+    return f"{API_KEY_HASH_SCHEME}${digest}"
+
+
+def verify_api_key_hash(api_key: str, stored_hash: str) -> bool:
+    """Constant-time check of a key against its stored HMAC hash."""
+    if not stored_hash or not stored_hash.startswith(f"{API_KEY_HASH_SCHEME}$"):
+        return False
+    return hmac.compare_digest(hash_api_key(api_key), stored_hash)
+
+
+def api_key_lookup_id(api_key: str) -> str:
+    """Indexed identifier for a presented key.
+
+    New-format keys embed it; legacy ``sk_<random>`` keys get a digest-derived
+    id assigned when they are migrated on first use.
+    """
+    m = _API_KEY_RE.match(api_key)
+    if m:
+        return m.group(1)
+    return "L" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:31]
+
+
+def is_legacy_api_key(api_key: str) -> bool:
+    return _API_KEY_RE.match(api_key) is None
+
+
 def create_jwt(
     data: Dict[str, Any],
     secret: str = None,
@@ -111,10 +169,18 @@ def decode_jwt(
     secret = secret or os.getenv('JWT_SECRET', 'dev-secret-change-in-production')
     algorithm = algorithm or os.getenv('JWT_ALGORITHM', 'HS256')
     
+    # Verified claims are cached until exp (see app.core.jwt_cache)
+    cache = get_claims_cache()
+    key = cache.key(token, secret, algorithm)
+    claims = cache.get(key)
+    if claims is not None:
+        return claims
     try:
-        return jwt.decode(token, secret, algorithms=[algorithm])
+        claims = jwt.decode(token, secret, algorithms=[algorithm])
     except JWTError:
         return None
+    cache.put(key, claims)
+    return claims
 
 
 def verify_token(token: str) -> Dict[str, Any]:
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, case, update
+from sqlalchemy.orm import Session
+
+from app.models import ApiKey
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+class ApiKeyUsageBuffer:
+    """Per-process accumulator for ApiKey.usage_count / last_used_at.
+
+    Requests only bump an in-memory counter; a daemon thread writes the
+    accumulated deltas every ``flush_interval`` seconds with one executemany
+    UPDATE (rows in id order so concurrent flushers never deadlock). A batch
+    being written stays visible to ``pending`` until its commit succeeds.
+    """
+
+    def __init__(self, session_factory: Optional[Callable[[], Session]] = None, flush_interval: float = 5.0) -> None:
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, List] = {}
+        self._inflight: Dict[int, List] = {}  # taken by flush, not committed yet
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.failures = 0
+
+    def record(self, api_key_id: int, used_at: Optional[datetime] = None) -> None:
+        used_at = used_at or datetime.utcnow()
+        with self._lock:
+            entry = self._pending.get(api_key_id)
+            if entry is None:
+                self._pending[api_key_id] = [1, used_at]
+            else:
+                entry[0] += 1
+                if used_at > entry[1]:
+                    entry[1] = used_at
+        self._ensure_started()
+
+    def pending(self, api_key_id: int) -> Tuple[int, Optional[datetime]]:
+        """Uncommitted (count, last_used_at) for one key, including a flush in progress."""
+        with self._lock:
+            count, last = 0, None
+            for entry in (self._inflight.get(api_key_id), self._pending.get(api_key_id)):
+                if entry is not None:
+                    count += entry[0]
+                    last = entry[1] if last is None else max(last, entry[1])
+            return count, last
+
+    def _ensure_started(self) -> None:
+        if self.session_factory is None or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._stopped or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name="api-key-usage", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self, db: Optional[Session] = None) -> int:
+        """Write pending deltas; returns the number of keys updated."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            if not batch:
+                return 0
+            params = [
+                {"kid": kid, "n": n, "ts": ts}
+                for kid, (n, ts) in sorted(batch.items())
+            ]
+            stmt = (
+                update(ApiKey)
+                .where(ApiKey.id == bindparam("kid"))
+                .values(
+                    usage_count=ApiKey.usage_count + bindparam("n"),
+                    last_used_at=case(
+                        (ApiKey.last_used_at.is_(None), bindparam("ts")),
+                        (ApiKey.last_used_at < bindparam("ts"), bindparam("ts")),
+                        else_=ApiKey.last_used_at,
+                    ),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            own = db is None
+            session = db if db is not None else self.session_factory()
+            try:
+                session.connection().execute(stmt, params)
+                session.commit()
+                with self._lock:
+                    self._inflight = {}
+            except Exception as e:
+                session.rollback()
+                self.failures += 1
+                logger.warning("api_key_usage_flush_failed", error=str(e), keys=len(params))
+                self._restore(batch)
+                return 0
+            finally:
+                if own:
+                    session.close()
+            self.flushes += 1
+            self.rows_flushed += len(params)
+            return len(params)
+
+    def _restore(self, batch: Dict[int, List]) -> None:
+        # Put deltas back so the next flush retries them
+        with self._lock:
+            self._inflight = {}
+            for kid, (n, ts) in batch.items():
+                entry = self._pending.get(kid)
+                if entry is None:
+                    self._pending[kid] = [n, ts]
+                else:
+                    entry[0] += n
+                    entry[1] = max(entry[1], ts)
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+        if self.session_factory is not None:
+            self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            depth = len(self._pending.keys() | self._inflight.keys())
+        return {"pending_keys": depth, "flushes": self.flushes, "rows_flushed": self.rows_flushed, "failures": self.failures}
+
+
+_buffer: Optional[ApiKeyUsageBuffer] = None
+_buffer_pid: Optional[int] = None
+_buffer_lock = threading.Lock()
+
+
+def get_usage_buffer() -> ApiKeyUsageBuffer:
+    """Per-process buffer writing through app.db.SessionLocal."""
+    global _buffer, _buffer_pid
+    pid = os.getpid()
+    if _buffer is None or _buffer_pid != pid:
+        with _buffer_lock:
+            if _buffer is None or _buffer_pid != pid:
+                from app.db import SessionLocal
+                _buffer = ApiKeyUsageBuffer(
+                    SessionLocal,
+                    flush_interval=float(os.getenv("API_KEY_USAGE_FLUSH_S", "5")),
+                )
+                _buffer_pid = pid
+    return _buffer
+
+
+@atexit.register
+def _flush_on_exit() -> None:  # pragma: no cover - interpreter shutdown
+    if _buffer is not None and _buffer_pid == os.getpid():
+        try:
+            _buffer.stop()
+        except Exception:
+            pass
@@ -2,7 +2,6 @@
 Authentication Service for STEALTH-TINKO
 Handles Gmail OAuth, Mobile OTP, and user registration
 """
-import httpx
 import secrets
 import string
 from datetime import datetime, timedelta
@@ -12,15 +11,20 @@ from sqlalchemy.orm import Session
 from sqlalchemy import or_, and_
 
 from app.db import get_db
-from app.models import User, MobileOTP, UserSession, OTPSecurityLog
+from app.models import User, MobileOTP, UserSession
 from app.schemas.auth import (
     UserCreate, UserResponse, GoogleLoginRequest, MobileLoginRequest,
     VerifyOTPRequest, TokenResponse, OTPResponse, GoogleUserInfo
 )
 from app.security import (
-    create_access_token, create_refresh_token, verify_password, 
-    get_password_hash, verify_token
+    create_access_token, create_refresh_token, verify_token
 )
+from app.core.google_id_token import InvalidIdToken, get_google_verifier
+from app.core.http import get_http_client
+from app.core.password_hasher import hash_password_async, verify_password_async
+from app.core.otp_store import EXPIRED, LOCKED, VERIFIED, otp_store
+from app.core.rate_limit import Rule, rate_limiter
+from app.services.security_audit import record_security_event
 from app.config import settings
 from app.services.sms_service import send_otp_sms, verify_otp_sms
 import logging
@@ -68,7 +72,7 @@ class AuthService:
             # Hash password if provided
             hashed_password = None
             if user_data.password:
-                hashed_password = get_password_hash(user_data.password)
+                hashed_password = await hash_password_async(user_data.password)
             
             # Create new user
             user = User(
@@ -111,7 +115,7 @@ class AuthService:
         """Handle Google OAuth login"""
         try:
             # Verify Google token and get user info
-            user_info = await self._verify_google_token(request.access_token)
+            user_info = await self._verify_google_token(request.access_token, request.id_token)
             
             # Check if user exists
             user = self.db.query(User).filter(
@@ -165,7 +169,8 @@ class AuthService:
             
             # Generate tokens
             access_token = create_access_token(
-                data={"sub": str(user.id), "email": user.email, "auth_provider": "google"}
+                data={"sub": str(user.id), "user_id": user.id, "org_id": user.org_id, "role": user.role,
+                      "email": user.email, "auth_provider": "google"}
             )
             refresh_token = create_refresh_token(data={"sub": str(user.id)})
             
@@ -204,37 +209,25 @@ class AuthService:
             # For basic SMS or development mode, we may get an OTP code back
             otp_code = sms_result.get("otp_code", "******")  # Mask for logging
             
-            # Set expiration time (5 minutes)
-            expires_at = datetime.utcnow() + timedelta(minutes=5)
-            
-            # Invalidate previous OTPs for this mobile number
-            self.db.query(MobileOTP).filter(
-                and_(
-                    MobileOTP.mobile_number == mobile_number,
-                    MobileOTP.is_used == False
-                )
-            ).update({"is_used": True})
-            
-            # Create new OTP record (for tracking purposes)
-            mobile_otp = MobileOTP(
-                mobile_number=mobile_number,
-                otp_code="VERIFY" if sms_result.get("provider") == "twilio_verify" else otp_code,
-                expires_at=expires_at,
+            # Store the OTP (5 minutes) in Redis, or in mobile_otps when degraded.
+            # Twilio Verify keeps its own codes; the placeholder only blocks local checks.
+            await otp_store.issue(
+                self.db, "mobile", mobile_number,
+                "VERIFY" if sms_result.get("provider") == "twilio_verify" else otp_code,
+                300,
                 ip_address=ip_address,
-                user_agent=request.headers.get("user-agent", "")
+                user_agent=request.headers.get("user-agent", "")[:500],
             )
             
-            self.db.add(mobile_otp)
-            
             # Log security event
-            security_log = OTPSecurityLog(
+            record_security_event(
+                self.db,
                 email=mobile_number,  # Using email field for mobile too
                 ip_address=ip_address,
                 user_agent=request.headers.get("user-agent", ""),
                 action="request_otp",
                 success=sms_result["success"]
             )
-            self.db.add(security_log)
             
             self.db.commit()
             
@@ -269,28 +262,35 @@ class AuthService:
                 logger.info(f"OTP verified via {verify_result.get('provider')} for {request.mobile_number}")
                 verification_method = verify_result.get('provider', 'twilio_verify')
             else:
-                # Fallback to database verification for development/legacy
-                logger.info(f"Twilio Verify result: {verify_result}, checking database fallback")
+                # Fallback to locally issued OTPs (Redis, or mobile_otps when degraded)
+                logger.info(f"Twilio Verify result: {verify_result}, checking local OTP store")
+                
+                outcome = await otp_store.verify(self.db, "mobile", request.mobile_number, request.otp, max_attempts=3)
                 
-                # Find valid OTP in database
-                otp_record = self.db.query(MobileOTP).filter(
-                    and_(
-                        MobileOTP.mobile_number == request.mobile_number,
-                        MobileOTP.otp_code == request.otp,
-                        MobileOTP.is_used == False
+                if outcome == LOCKED:
+                    self.db.commit()
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Too many invalid attempts"
+                    )
+                
+                if outcome == EXPIRED:
+                    self.db.commit()
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="OTP has expired"
                     )
-                ).first()
                 
-                if not otp_record:
+                if outcome != VERIFIED:
                     # Log failed attempt
-                    security_log = OTPSecurityLog(
+                    record_security_event(
+                        self.db,
                         email=request.mobile_number,
                         ip_address=ip_address,
                         user_agent=req.headers.get("user-agent", ""),
                         action="verify_otp",
                         success=False
                     )
-                    self.db.add(security_log)
                     self.db.commit()
                     
                     error_detail = "Invalid or expired OTP"
@@ -302,30 +302,7 @@ class AuthService:
                         detail=error_detail
                     )
                 
-                # Check if OTP is expired
-                if otp_record.is_expired():
-                    otp_record.is_used = True
-                    self.db.commit()
-                    
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="OTP has expired"
-                    )
-                
-                # Check attempt count
-                otp_record.attempts += 1
-                if otp_record.attempts > 3:
-                    otp_record.is_used = True
-                    self.db.commit()
-                    
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="Too many invalid attempts"
-                    )
-                
-                # Mark OTP as used
-                otp_record.is_used = True
-                verification_method = "database_fallback"
+                verification_method = "local_otp"
             
             # Find or create user
             user = self.db.query(User).filter(
@@ -354,14 +331,14 @@ class AuthService:
                 self.db.add(user)
             
             # Log successful verification
-            security_log = OTPSecurityLog(
+            record_security_event(
+                self.db,
                 email=request.mobile_number,
                 ip_address=ip_address,
                 user_agent=req.headers.get("user-agent", ""),
                 action="verify_otp",
                 success=True
             )
-            self.db.add(security_log)
             
             self.db.commit()
             self.db.refresh(user)
@@ -370,7 +347,8 @@ class AuthService:
             
             # Generate tokens
             access_token = create_access_token(
-                data={"sub": str(user.id), "mobile": user.mobile_number, "auth_provider": "mobile_otp"}
+                data={"sub": str(user.id), "user_id": user.id, "org_id": user.org_id, "role": user.role,
+                      "mobile": user.mobile_number, "auth_provider": "mobile_otp"}
             )
             refresh_token = create_refresh_token(data={"sub": str(user.id)})
             
@@ -399,7 +377,7 @@ class AuthService:
                 and_(User.email == email, User.is_active == True)
             ).first()
             
-            if not user or not verify_password(password, user.hashed_password):
+            if not user or not await verify_password_async(password, user.hashed_password):
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Invalid email or password"
@@ -412,7 +390,8 @@ class AuthService:
             
             # Generate tokens
             access_token = create_access_token(
-                data={"sub": str(user.id), "email": user.email, "auth_provider": "email"}
+                data={"sub": str(user.id), "user_id": user.id, "org_id": user.org_id, "role": user.role,
+                      "email": user.email, "auth_provider": "email"}
             )
             refresh_token = create_refresh_token(data={"sub": str(user.id)})
             
@@ -433,22 +412,48 @@ class AuthService:
             )
     
     # Private helper methods
-    async def _verify_google_token(self, access_token: str) -> GoogleUserInfo:
-        """Verify Google OAuth token and return user info"""
-        async with httpx.AsyncClient() as client:
-            # Get user info from Google
-            response = await client.get(
-                f"https://www.googleapis.com/oauth2/v1/userinfo?access_token={access_token}"
-            )
-            
-            if response.status_code != 200:
+    async def _verify_google_token(self, access_token: str, id_token: Optional[str] = None) -> GoogleUserInfo:
+        """Verify Google OAuth token and return user info.
+
+        An ID token is verified locally against Google's cached signing keys;
+        only access-token-only logins call the userinfo endpoint.
+        """
+        if id_token and settings.GOOGLE_CLIENT_ID:
+            try:
+                claims = await get_google_verifier().verify(
+                    id_token, [settings.GOOGLE_CLIENT_ID], access_token=access_token
+                )
+            except InvalidIdToken as e:
+                logger.warning(f"Google ID token rejected: {e}")
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Invalid Google token"
                 )
-            
-            user_data = response.json()
-            return GoogleUserInfo(**user_data)
+            return GoogleUserInfo(
+                sub=claims["sub"],
+                name=claims.get("name") or claims.get("email", ""),
+                email=claims.get("email", ""),
+                email_verified=bool(claims.get("email_verified")),
+                picture=claims.get("picture"),
+                given_name=claims.get("given_name"),
+                family_name=claims.get("family_name"),
+                locale=claims.get("locale"),
+            )
+
+        # Get user info from Google
+        response = await get_http_client().get(
+            "https://www.googleapis.com/oauth2/v1/userinfo",
+            params={"access_token": access_token},
+        )
+        
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid Google token"
+            )
+        
+        user_data = response.json()
+        return GoogleUserInfo(**user_data)
     
     async def _send_sms(self, phone: str, message: str) -> Dict[str, Any]:
         """Send SMS via Twilio"""
@@ -483,6 +488,26 @@ class AuthService:
     
     async def _check_otp_rate_limit(self, mobile_number: str, ip_address: str) -> None:
         """Check OTP rate limiting"""
+        limited = await rate_limiter.hit([
+            Rule("otp_send:mobile", mobile_number, settings.OTP_RATE_LIMIT_PER_MOBILE, 3600),
+            Rule("otp_send:ip", ip_address, settings.OTP_RATE_LIMIT_PER_IP, 3600),
+        ])
+        if limited is not None:
+            if limited.denied_by == "otp_send:mobile":
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many OTP requests. Please try again later.",
+                    headers={"Retry-After": str(limited.retry_after)},
+                )
+            if limited.denied_by == "otp_send:ip":
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Rate limit exceeded. Please try again later.",
+                    headers={"Retry-After": str(limited.retry_after)},
+                )
+            return
+        
+        # Redis unavailable: fall back to counting mobile_otps rows
         now = datetime.utcnow()
         
         # Check mobile number rate limit (max 3 OTPs per hour)
@@ -493,7 +518,7 @@ class AuthService:
             )
         ).count()
         
-        if recent_otps >= 3:
+        if recent_otps >= settings.OTP_RATE_LIMIT_PER_MOBILE:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail="Too many OTP requests. Please try again later."
@@ -507,7 +532,7 @@ class AuthService:
             )
         ).count()
         
-        if recent_ip_otps >= 10:
+        if recent_ip_otps >= settings.OTP_RATE_LIMIT_PER_IP:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail="Rate limit exceeded. Please try again later."
@@ -534,7 +559,8 @@ class AuthService:
             
             # Generate new tokens
             access_token = create_access_token(
-                data={"sub": str(user.id), "email": user.email}
+                data={"sub": str(user.id), "user_id": user.id, "org_id": user.org_id, "role": user.role,
+                      "email": user.email}
             )
             new_refresh_token = create_refresh_token(data={"sub": str(user.id)})
             
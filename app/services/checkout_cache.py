@@ -0,0 +1,296 @@
+"""
+Reuse cache for payer-facing checkout sessions and Razorpay orders.
+
+Opening or refreshing a recovery page used to create a new PSP checkout
+session (or order) each time. Entries are keyed by (transaction_ref, kind,
+amount, currency), where kind is "checkout" (hosted checkout session or link)
+or "order" (Razorpay order).
+
+The store is the Transaction row every caller has already loaded:
+- the PSP ids stay in their usual columns (stripe_checkout_session_id,
+  razorpay_order_id, razorpay_payment_link_id, payment_link_url), which
+  webhooks and recon match on
+- ``Transaction.checkout_cache`` records what each was created for: amount,
+  currency, provider and expiry
+
+So it survives restarts and is shared by every worker. An entry is reused
+while:
+- it still matches those columns (another flow may have replaced the URL)
+- more than CHECKOUT_REUSE_MIN_REMAINING_S of its life is left
+
+Concurrent misses for one key in a process wait for a single PSP call.
+Expiry webhooks call ``invalidate``, which drops the record but keeps the
+ids. Completion webhooks call ``mark_paid``: a paid transaction keeps its
+order and never gets a new session or order (409), so a payer cannot pay
+twice and webhooks/recon keep matching the paid ids.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.models import Transaction
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CheckoutEntry:
+    kind: str                      # checkout, order
+    provider: str                  # stripe, razorpay
+    id: str                        # checkout session / payment link / order id
+    amount: int
+    currency: str
+    url: Optional[str] = None
+    expires_at: Optional[datetime] = None  # None: does not expire
+    payment_intent_id: Optional[str] = None
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "id": self.id,
+            "amount": self.amount,
+            "currency": self.currency,
+            "url": self.url,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+            "payment_intent_id": self.payment_intent_id,
+        }
+
+    @classmethod
+    def from_json(cls, kind: str, data: Dict[str, Any]) -> "CheckoutEntry":
+        expires_at = data.get("expires_at")
+        return cls(
+            kind=kind,
+            provider=data["provider"],
+            id=data["id"],
+            amount=int(data["amount"]),
+            currency=data["currency"],
+            url=data.get("url"),
+            expires_at=datetime.fromisoformat(expires_at) if expires_at else None,
+            payment_intent_id=data.get("payment_intent_id"),
+        )
+
+
+def as_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    # naive values are local time (datetime.fromtimestamp)
+    return dt.astimezone(timezone.utc) if dt is not None else None
+
+
+class CheckoutCache:
+    def __init__(self, min_remaining_s: float = 600.0) -> None:
+        self.min_remaining = timedelta(seconds=min_remaining_s)
+        self._mutex = threading.Lock()
+        self._flights: Dict[Tuple[str, str, int, str], Tuple[asyncio.Lock, int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # -- durable tier (the Transaction row) ------------------------------
+
+    @staticmethod
+    def _matches_row(txn: Transaction, entry: CheckoutEntry) -> bool:
+        if entry.kind == "order":
+            return txn.razorpay_order_id == entry.id
+        if entry.provider == "stripe" and txn.stripe_checkout_session_id != entry.id:
+            return False
+        if entry.provider == "razorpay" and txn.razorpay_payment_link_id != entry.id:
+            return False
+        return txn.payment_link_url == entry.url
+
+    def lookup(self, txn: Transaction, kind: str, amount: int, currency: str) -> Optional[CheckoutEntry]:
+        """The reusable entry for this key on ``txn``, if any."""
+        currency = currency.lower()
+        raw = (txn.checkout_cache or {}).get(kind)
+        if raw is None:
+            # Orders created before this cache existed: they were always reused
+            if (kind == "order" and txn.razorpay_order_id and not txn.razorpay_payment_id
+                    and (txn.amount, (txn.currency or "").lower()) == (amount, currency)):
+                return CheckoutEntry("order", "razorpay", txn.razorpay_order_id, amount, currency)
+            return None
+        entry = CheckoutEntry.from_json(kind, raw)
+        if (entry.amount, entry.currency) != (int(amount), currency) or not self._matches_row(txn, entry):
+            return None
+        if entry.expires_at is not None and entry.expires_at - datetime.now(timezone.utc) < self.min_remaining:
+            return None
+        return entry
+
+    @staticmethod
+    def store(txn: Transaction, entry: CheckoutEntry) -> None:
+        """Write ``entry`` onto ``txn`` (the caller commits)."""
+        if entry.kind == "order":
+            txn.razorpay_order_id = entry.id
+        else:
+            if entry.provider == "stripe":
+                txn.stripe_checkout_session_id = entry.id
+                txn.stripe_payment_intent_id = entry.payment_intent_id or txn.stripe_payment_intent_id
+            elif entry.provider == "razorpay":
+                txn.razorpay_payment_link_id = entry.id
+            txn.payment_link_url = entry.url
+        # reassigned, not mutated: plain JSON columns do not track in-place changes
+        txn.checkout_cache = {**(txn.checkout_cache or {}), entry.kind: entry.to_json()}
+
+    def invalidate(self, txn: Transaction, kind: Optional[str] = None, entry_id: Optional[str] = None) -> bool:
+        """Stop reusing ``txn``'s entries (``kind`` only; only if its id is ``entry_id``)."""
+        cache = dict(txn.checkout_cache or {})
+        dropped = [k for k, v in cache.items() if k != "paid"
+                   and (kind is None or k == kind) and (entry_id is None or v.get("id") == entry_id)]
+        if not dropped:
+            return False
+        for k in dropped:
+            del cache[k]
+        txn.checkout_cache = cache or None
+        with self._mutex:
+            self.invalidations += len(dropped)
+        return True
+
+    def mark_paid(self, txn: Transaction, provider: str, entry_id: Optional[str]) -> None:
+        """Record that ``txn`` was paid through ``entry_id``; nothing is reused or created for it again."""
+        self.invalidate(txn)
+        txn.checkout_cache = {**(txn.checkout_cache or {}), "paid": {"provider": provider, "id": entry_id}}
+
+    @staticmethod
+    def _paid_entry(txn: Transaction, kind: str, amount: int, currency: str) -> Optional[CheckoutEntry]:
+        """For a paid ``txn``: its order (kind "order"); raises 409 where a new session/order would be created."""
+        if not txn.razorpay_payment_id and not (txn.checkout_cache or {}).get("paid"):
+            return None
+        if kind == "order" and txn.razorpay_order_id:
+            return CheckoutEntry("order", "razorpay", txn.razorpay_order_id, int(amount), currency.lower())
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Transaction already paid")
+
+    # -- single flight ----------------------------------------------------
+
+    @contextlib.asynccontextmanager
+    async def _single_flight(self, key: Tuple[str, str, int, str]) -> AsyncIterator[None]:
+        with self._mutex:
+            lock, users = self._flights.get(key) or (asyncio.Lock(), 0)
+            self._flights[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            with self._mutex:
+                lock, users = self._flights[key]
+                if users == 1:
+                    del self._flights[key]
+                else:
+                    self._flights[key] = (lock, users - 1)
+
+    async def get_or_create(
+        self,
+        db: Session,
+        txn: Transaction,
+        kind: str,
+        amount: int,
+        currency: str,
+        create: Callable[[], Awaitable[CheckoutEntry]],
+    ) -> Tuple[CheckoutEntry, bool]:
+        """Reuse the entry for (txn, kind, amount, currency) or ``create()`` and commit one.
+
+        Returns (entry, reused). A paid transaction gets its existing order
+        back and a 409 for anything that would need a new session or order.
+        """
+        entry = self._paid_entry(txn, kind, amount, currency) or self.lookup(txn, kind, amount, currency)
+        if entry is None:
+            async with self._single_flight((txn.transaction_ref, kind, int(amount), currency.lower())):
+                db.refresh(txn)  # a request we waited on may have just stored one
+                entry = self._paid_entry(txn, kind, amount, currency) or self.lookup(txn, kind, amount, currency)
+                if entry is None:
+                    with self._mutex:
+                        self.misses += 1
+                    entry = await create()
+                    self.store(txn, entry)
+                    db.commit()
+                    return entry, False
+        with self._mutex:
+            self.hits += 1
+        return entry, True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._mutex:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "invalidations": self.invalidations,
+                "in_flight": len(self._flights),
+            }
+
+
+_cache: Optional[CheckoutCache] = None
+_cache_pid: Optional[int] = None
+_cache_lock = threading.Lock()
+
+
+def get_checkout_cache() -> CheckoutCache:
+    global _cache, _cache_pid
+    pid = os.getpid()
+    if _cache is None or _cache_pid != pid:
+        with _cache_lock:
+            if _cache is None or _cache_pid != pid:
+                _cache = CheckoutCache(min_remaining_s=float(os.getenv("CHECKOUT_REUSE_MIN_REMAINING_S", "600")))
+                _cache_pid = pid
+    return _cache
+
+
+async def stripe_checkout(
+    db: Session,
+    txn: Transaction,
+    success_url: Optional[str] = None,
+    cancel_url: Optional[str] = None,
+) -> Tuple[CheckoutEntry, bool]:
+    """The payer checkout session for ``txn``'s full amount (public page, pre-warm)."""
+    from app.services.stripe_service import StripeService
+
+    base = os.getenv("BASE_URL", "http://localhost:3000")
+
+    async def create() -> CheckoutEntry:
+        res = await StripeService.create_checkout_session_async(
+            amount=txn.amount,
+            currency=txn.currency,
+            transaction_ref=txn.transaction_ref,
+            success_url=success_url or (base + "/pay/success"),
+            cancel_url=cancel_url or (base + "/pay/cancel"),
+            metadata={"transaction_ref": txn.transaction_ref},
+        )
+        return CheckoutEntry(
+            "checkout", "stripe", res["session_id"], int(txn.amount), txn.currency.lower(),
+            url=res["checkout_url"], expires_at=as_utc(res["expires_at"]), payment_intent_id=res.get("payment_intent_id"),
+        )
+
+    return await get_checkout_cache().get_or_create(db, txn, "checkout", txn.amount, txn.currency, create)
+
+
+async def prewarm_checkout(transaction_ref: str) -> None:
+    """Create ``transaction_ref``'s checkout session ahead of the payer opening the link."""
+    if os.getenv("CHECKOUT_PREWARM", "1") == "0" or not os.getenv("STRIPE_SECRET_KEY"):
+        return
+    from app.db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        txn = db.query(Transaction).filter(Transaction.transaction_ref == transaction_ref).first()
+        if txn is None or not txn.amount or not txn.currency:
+            return
+        if txn.razorpay_payment_id or (txn.checkout_cache or {}).get("paid"):
+            return
+        _, reused = await stripe_checkout(db, txn)
+        logger.info("checkout_prewarmed", transaction_ref=transaction_ref, reused=reused)
+    except Exception as e:
+        db.rollback()
+        logger.warning("checkout_prewarm_failed", transaction_ref=transaction_ref, error=str(e))
+    finally:
+        db.close()
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import os
+import re
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 from sqlalchemy import text
 
 from app.db import engine
@@ -99,3 +102,209 @@ def prune_old_partitions(months: int) -> List[str]:
                 pass
 
     return dropped
+
+
+# ---------------------------------------------------------------------------
+# Time-partitioned auth tables
+#
+# email_otps / mobile_otps (daily) and otp_security_logs / user_sessions
+# (weekly) are RANGE partitioned on created_at by migration 008. Partitions
+# are named <table>_dYYYYMMDD / <table>_wYYYYMMDD (the bucket's first day) and
+# each parent has a <table>_default catch-all. Retention drops (or detaches)
+# whole partitions instead of deleting rows.
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class TimePartitionSpec:
+    table: str
+    interval: str  # "day" or "week"
+    retention: int  # buckets kept, counting the current one
+    premake: int  # future buckets created ahead of time
+    column: str = "created_at"
+
+    @property
+    def prefix(self) -> str:
+        return f"{self.table}_{self.interval[0]}"
+
+    @property
+    def keep(self) -> int:
+        env = os.getenv(f"PARTITION_RETENTION_{self.table.upper()}")
+        return max(1, int(env)) if env else self.retention
+
+
+TIME_PARTITIONED: Dict[str, TimePartitionSpec] = {
+    s.table: s
+    for s in (
+        TimePartitionSpec("email_otps", "day", retention=3, premake=7),
+        TimePartitionSpec("mobile_otps", "day", retention=3, premake=7),
+        TimePartitionSpec("otp_security_logs", "week", retention=5, premake=4),
+        TimePartitionSpec("user_sessions", "week", retention=8, premake=4),
+    )
+}
+
+_BUCKET_RE = re.compile(r"^(?P<table>.+)_(?P<kind>[dw])(?P<date>\d{8})$")
+
+
+def bucket_bounds(spec: TimePartitionSpec, dt: datetime) -> Tuple[datetime, datetime]:
+    """[start, end) of the day/week (Monday-based) bucket containing ``dt``, in UTC."""
+    dt = dt.astimezone(timezone.utc) if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    start = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if spec.interval == "week":
+        start -= timedelta(days=start.weekday())
+        return start, start + timedelta(days=7)
+    return start, start + timedelta(days=1)
+
+
+def partition_name(spec: TimePartitionSpec, start: datetime) -> str:
+    return f"{spec.prefix}{start:%Y%m%d}"
+
+
+def planned_partitions(spec: TimePartitionSpec, now: Optional[datetime] = None) -> List[Tuple[str, datetime, datetime]]:
+    """Partitions that should exist: the retained window plus ``premake`` ahead."""
+    now = now or datetime.now(timezone.utc)
+    start, end = bucket_bounds(spec, now)
+    step = end - start
+    out = []
+    for i in range(-(spec.keep - 1), spec.premake + 1):
+        s = start + step * i
+        out.append((partition_name(spec, s), s, s + step))
+    return out
+
+
+def retention_cutoff(spec: TimePartitionSpec, now: Optional[datetime] = None) -> datetime:
+    """Start of the oldest retained bucket; rows created before it are expired."""
+    start, end = bucket_bounds(spec, now or datetime.now(timezone.utc))
+    return start - (end - start) * (spec.keep - 1)
+
+
+def expired_partitions(spec: TimePartitionSpec, names: List[str], now: Optional[datetime] = None) -> List[str]:
+    """Names of ``spec``'s partitions whose whole range is older than the retention window."""
+    now = now or datetime.now(timezone.utc)
+    start, end = bucket_bounds(spec, now)
+    cutoff = retention_cutoff(spec, now)
+    out = []
+    for name in names:
+        m = _BUCKET_RE.match(name)
+        if not m or m.group("table") != spec.table or m.group("kind") != spec.interval[0]:
+            continue
+        b_start = datetime.strptime(m.group("date"), "%Y%m%d").replace(tzinfo=timezone.utc)
+        if b_start + (end - start) <= cutoff:
+            out.append(name)
+    return sorted(out)
+
+
+def _is_partitioned(conn, table: str) -> bool:
+    return conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = :t
+    """), {"t": table}).first() is not None
+
+
+def _children(conn, table: str) -> List[str]:
+    res = conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = 'public' AND p.relname = :t
+    """), {"t": table})
+    return [r[0] for r in res.fetchall()]
+
+
+def is_time_partitioned(table: str) -> bool:
+    if engine.dialect.name != "postgresql":
+        return False
+    with engine.connect() as conn:
+        return _is_partitioned(conn, table)
+
+
+def ensure_time_partitions(now: Optional[datetime] = None, tables: Optional[List[str]] = None) -> List[str]:
+    """Create missing day/week partitions for the auth tables (Postgres, partitioned parents only).
+
+    Returns only the partitions that exist afterwards; ones whose CREATE failed
+    (e.g. a default partition already holds rows in their range) are left out.
+    """
+    created: List[str] = []
+    if engine.dialect.name != "postgresql":
+        return created
+    specs = [TIME_PARTITIONED[t] for t in (tables or TIME_PARTITIONED)]
+    with engine.begin() as conn:
+        for spec in specs:
+            if not _is_partitioned(conn, spec.table):
+                continue
+            existing = set(_children(conn, spec.table))
+            attempted = []
+            for name, start, end in planned_partitions(spec, now):
+                if name in existing:
+                    continue
+                # A default partition holding rows in this range makes CREATE fail; skip and report
+                conn.execute(text(f"""
+                DO $$
+                BEGIN
+                    EXECUTE 'CREATE TABLE IF NOT EXISTS public.{name} PARTITION OF public.{spec.table} FOR VALUES FROM (''{start.isoformat()}'') TO (''{end.isoformat()}'')';
+                EXCEPTION WHEN others THEN
+                    RAISE NOTICE 'Partition {name} not created: %', SQLERRM;
+                END $$;
+                """))
+                attempted.append(name)
+            if attempted:
+                now_existing = set(_children(conn, spec.table))
+                created.extend(name for name in attempted if name in now_existing)
+    return created
+
+
+def drop_expired_time_partitions(
+    now: Optional[datetime] = None,
+    tables: Optional[List[str]] = None,
+    mode: Optional[str] = None,
+) -> List[str]:
+    """Drop (or, with mode="detach", detach) partitions past each table's retention.
+
+    Expired rows in the DEFAULT partition (e.g. history copied in by migration
+    008) are deleted; only dropped/detached partition names are returned.
+    """
+    removed: List[str] = []
+    if engine.dialect.name != "postgresql":
+        return removed
+    mode = mode or os.getenv("PARTITION_RETENTION_MODE", "drop")
+    specs = [TIME_PARTITIONED[t] for t in (tables or TIME_PARTITIONED)]
+    with engine.begin() as conn:
+        for spec in specs:
+            if not _is_partitioned(conn, spec.table):
+                continue
+            children = _children(conn, spec.table)
+            for name in expired_partitions(spec, children, now):
+                conn.execute(text(f"ALTER TABLE public.{spec.table} DETACH PARTITION public.{name}"))
+                if mode != "detach":
+                    conn.execute(text(f"DROP TABLE IF EXISTS public.{name}"))
+                removed.append(name)
+            if f"{spec.table}_default" in children:
+                conn.execute(
+                    text(f"DELETE FROM public.{spec.table}_default WHERE {spec.column} < :cutoff"),
+                    {"cutoff": retention_cutoff(spec, now)},
+                )
+    return removed
+
+
+def list_partitions() -> List[Dict[str, Any]]:
+    """Partitions of transactions and the time-partitioned auth tables, with bounds and size."""
+    if engine.dialect.name != "postgresql":
+        return []
+    parents = ["transactions", *TIME_PARTITIONED]
+    with engine.connect() as conn:
+        res = conn.execute(text("""
+            SELECT p.relname, c.relname, pg_get_expr(c.relpartbound, c.oid),
+                   GREATEST(c.reltuples, 0)::bigint, pg_total_relation_size(c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            JOIN pg_namespace n ON n.oid = p.relnamespace
+            WHERE n.nspname = 'public' AND p.relname = ANY(:parents)
+            ORDER BY p.relname, c.relname
+        """), {"parents": parents})
+        return [
+            {"table": parent, "partition": child, "bounds": bounds, "approx_rows": rows, "bytes": size}
+            for parent, child, bounds, rows, size in res.fetchall()
+        ]
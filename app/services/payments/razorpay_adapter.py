@@ -1,17 +1,120 @@
 from __future__ import annotations
 
+import asyncio
 import base64
 import hashlib
 import hmac
+import importlib.util
 import os
-from typing import Dict, Any, Optional
+import threading
+import weakref
+from typing import Any, AsyncIterator, Coroutine, Dict, Optional, TypeVar
 
 import httpx
 from .base import PaymentAdapter
 
+# httpx speaks HTTP/2 only with the optional ``h2`` package installed
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+T = TypeVar("T")
+
+
+# ---------------------------------------------------------------------------
+# Shared HTTP client
+#
+# One keep-alive (HTTP/2 when ``h2`` is installed) AsyncClient per event loop
+# per process, so PSP calls reuse warm connections instead of a TCP + TLS
+# handshake each. An AsyncClient's connections belong to the loop that opened
+# them, hence one per loop: the app's loop and the background loop below.
+# ---------------------------------------------------------------------------
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_clients_pid: Optional[int] = None
+_clients_lock = threading.Lock()
+
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=_HTTP2 and os.getenv("RAZORPAY_HTTP2", "1") != "0",
+        timeout=httpx.Timeout(
+            float(os.getenv("RAZORPAY_TIMEOUT_S", "15")),
+            connect=float(os.getenv("RAZORPAY_CONNECT_TIMEOUT_S", "5")),
+        ),
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("RAZORPAY_MAX_CONNECTIONS", "50")),
+            max_keepalive_connections=int(os.getenv("RAZORPAY_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("RAZORPAY_KEEPALIVE_S", "60")),
+        ),
+    )
+
+
+def shared_client() -> httpx.AsyncClient:
+    """The running loop's pooled Razorpay client (call from a coroutine)."""
+    global _clients_pid
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _clients_pid = os.getpid()
+        client = _clients.get(loop)
+        if client is None or client.is_closed:
+            client = _new_client()
+            _clients[loop] = client
+    return client
+
+
+async def close_shared_client() -> None:
+    """Close the running loop's client (app shutdown)."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:  # pragma: no cover
+        return
+    with _clients_lock:
+        client = _clients.pop(loop, None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+class _BackgroundLoop:
+    """Daemon thread running an event loop that sync callers submit coroutines to.
+
+    Replaces ``anyio.run`` per call, which built a new loop (and client) every
+    time and failed outright when called from inside a running loop.
+    """
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _ensure(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="razorpay-loop", daemon=True).start()
+                    self._loop, self._pid = loop, os.getpid()
+        return self._loop
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure()).result(timeout)
+
+
+_background = _BackgroundLoop()
+
+
+def run_sync(coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+    """Run ``coro`` to completion from sync code, including code called inside a running loop."""
+    return _background.run(coro, timeout)
+
 
 class RazorpayAdapter(PaymentAdapter):
-    def __init__(self, key_id: Optional[str] = None, key_secret: Optional[str] = None):
+    def __init__(
+        self,
+        key_id: Optional[str] = None,
+        key_secret: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None,
+    ):
         self.key_id = key_id or os.getenv("RAZORPAY_KEY_ID")
         self.key_secret = key_secret or os.getenv("RAZORPAY_KEY_SECRET")
         if not self.key_id or not self.key_secret:
@@ -19,29 +122,101 @@ class RazorpayAdapter(PaymentAdapter):
         token = base64.b64encode(f"{self.key_id}:{self.key_secret}".encode()).decode()
         self._auth_header = {"Authorization": f"Basic {token}"}
         self._base = os.getenv("RAZORPAY_API_BASE", "https://api.razorpay.com")
+        # Injected client (tests, benchmarks); otherwise the per-loop shared one
+        self._client = client
+
+    def _http(self) -> httpx.AsyncClient:
+        return self._client or shared_client()
 
     async def _post(self, path: str, json: Dict[str, Any]) -> Dict[str, Any]:
-        async with httpx.AsyncClient(timeout=15) as client:
-            r = await client.post(f"{self._base}{path}", json=json, headers=self._auth_header)
-            r.raise_for_status()
-            return r.json()
+        r = await self._http().post(f"{self._base}{path}", json=json, headers=self._auth_header)
+        r.raise_for_status()
+        return r.json()
 
-    async def _get(self, path: str) -> Dict[str, Any]:
-        async with httpx.AsyncClient(timeout=15) as client:
-            r = await client.get(f"{self._base}{path}", headers=self._auth_header)
-            r.raise_for_status()
-            return r.json()
+    async def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        r = await self._http().get(f"{self._base}{path}", params=params, headers=self._auth_header)
+        r.raise_for_status()
+        return r.json()
 
-    def create_order(self, amount: int, currency: str, receipt: str) -> Dict[str, Any]:
-        # Synchronous wrapper for convenience in routes/tests using anyio
-        import anyio
-        return anyio.run(self._create_order_async, amount, currency, receipt)
+    # -- async API (await these from routes) ---------------------------
 
-    async def _create_order_async(self, amount: int, currency: str, receipt: str) -> Dict[str, Any]:
+    async def create_order_async(self, amount: int, currency: str, receipt: str) -> Dict[str, Any]:
         payload = {"amount": int(amount), "currency": currency.upper(), "receipt": receipt, "payment_capture": 1}
         data = await self._post("/v1/orders", payload)
         return {"order_id": data.get("id"), "amount": data.get("amount"), "currency": data.get("currency")}
 
+    async def get_order_status_async(self, order_id: str) -> Dict[str, Any]:
+        data = await self._get(f"/v1/orders/{order_id}")
+        status = data.get("status")  # created, paid, attempted
+        return {"status": status, "amount": data.get("amount"), "currency": data.get("currency"), "raw": data}
+
+    async def list_orders_async(
+        self,
+        created_from: int,
+        created_to: int,
+        page_size: int = 100,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every order created in [created_from, created_to] (unix seconds).
+
+        Pages through ``GET /v1/orders?from=&to=&count=&skip=``; 100 is the
+        largest page Razorpay serves.
+        """
+        skip = 0
+        while True:
+            data = await self._get("/v1/orders", params={
+                "from": int(created_from), "to": int(created_to), "count": page_size, "skip": skip,
+            })
+            items = data.get("items") or []
+            for item in items:
+                yield item
+            if len(items) < page_size:
+                return
+            skip += len(items)
+
+    async def create_payment_link_async(
+        self,
+        amount: int,
+        currency: str,
+        description: Optional[str] = None,
+        notes: Optional[Dict[str, Any]] = None,
+        callback_url: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"amount": int(amount), "currency": currency.upper(), "notes": notes or {}}
+        if description:
+            payload["description"] = description
+        if callback_url:
+            payload["callback_url"] = callback_url
+            payload["callback_method"] = "get"
+        data = await self._post("/v1/payment_links", payload)
+        return {"payment_link_id": data.get("id"), "url": data.get("short_url"), "status": data.get("status"), "raw": data}
+
+    async def get_payment_link_async(self, payment_link_id: str) -> Dict[str, Any]:
+        data = await self._get(f"/v1/payment_links/{payment_link_id}")
+        # created, partially_paid, paid, expired, cancelled
+        return {"status": data.get("status"), "amount_paid": data.get("amount_paid"), "raw": data}
+
+    async def ping_async(self) -> bool:
+        """Cheap credentials check: list one order."""
+        try:
+            await self._get("/v1/orders", params={"count": 1})
+        except httpx.HTTPError:
+            return False
+        return True
+
+    # -- sync API (runs on the background loop) ------------------------
+
+    def create_order(self, amount: int, currency: str, receipt: str) -> Dict[str, Any]:
+        return run_sync(self.create_order_async(amount, currency, receipt))
+
+    def get_order_status(self, order_id: str) -> Dict[str, Any]:
+        return run_sync(self.get_order_status_async(order_id))
+
+    def create_payment_link(self, amount: int, currency: str, **kwargs: Any) -> Dict[str, Any]:
+        return run_sync(self.create_payment_link_async(amount, currency, **kwargs))
+
+    def get_payment_link(self, payment_link_id: str) -> Dict[str, Any]:
+        return run_sync(self.get_payment_link_async(payment_link_id))
+
     def validate_webhook(self, payload: bytes, signature: str) -> Dict[str, Any]:
         secret = os.getenv("RAZORPAY_WEBHOOK_SECRET")
         if not secret:
@@ -52,12 +227,3 @@ class RazorpayAdapter(PaymentAdapter):
         # The payload is JSON; parse and return
         import json
         return json.loads(payload.decode())
-
-    def get_order_status(self, order_id: str) -> Dict[str, Any]:
-        import anyio
-        return anyio.run(self._get_order_status_async, order_id)
-
-    async def _get_order_status_async(self, order_id: str) -> Dict[str, Any]:
-        data = await self._get(f"/v1/orders/{order_id}")
-        status = data.get("status")  # created, paid, attempted
-        return {"status": status, "amount": data.get("amount"), "currency": data.get("currency"), "raw": data}
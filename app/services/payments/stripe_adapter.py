@@ -16,6 +16,8 @@ class StripeAdapter(PSPAdapter):
         self.api_key = api_key or os.getenv("STRIPE_SECRET_KEY")
         if stripe is not None:
             stripe.api_key = self.api_key
+            if os.getenv("STRIPE_API_BASE"):
+                stripe.api_base = os.environ["STRIPE_API_BASE"]
 
     def create_intent(self, *, amount: int, currency: str, description: Optional[str] = None) -> PaymentIntent:
         if stripe is None:
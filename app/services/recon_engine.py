@@ -0,0 +1,397 @@
+"""
+Reconciliation engine: internal Razorpay state vs the PSP's order status.
+
+A run streams the org's transactions in ``chunk_size`` partitions
+(``yield_per``; a server-side cursor on Postgres), fetches order statuses
+concurrently under a ``concurrency``-bounded semaphore through the pooled
+async adapter, and bulk-inserts one ReconLog row per transaction per chunk.
+Progress counters on the ReconJob row are committed after every chunk.
+Reads and writes use separate sessions so commits do not close the cursor.
+
+Runs are incremental by default. Each transaction's latest outcome is kept
+in ReconState, and every job records a watermark (its start time). The next
+run re-queries only transactions that were never checked, are still open,
+mismatched or unknown, or were updated after the previous watermark. Settled
+(paid on both sides) and expired (open longer than RECON_OPEN_TTL_DAYS)
+transactions age out, so PSP calls track churn rather than history.
+mode="full" rechecks the whole window.
+
+One job per org is queued or running at a time (``active_job``). Should two
+runs still overlap, new ReconState rows are upserted on ``transaction_id``,
+so the later write wins instead of failing the job.
+
+mode="bulk" rechecks the whole window too, but first pages through
+Razorpay's list API (100 orders per call) for the window and builds an
+in-memory index of status by order id. Transactions are joined against it in
+the same streaming pass, and only orders missing from the index are fetched
+one by one. N status calls become about N/100 list calls. Bulk mode is
+Razorpay-only, like recon itself: transactions carry Razorpay order ids, and
+there is nothing to join a Stripe list against.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models import ReconJob, ReconLog, ReconState, Transaction
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+# (id, transaction_ref, razorpay_order_id, razorpay_payment_id, state, first_checked_at, checks)
+Row = Tuple[int, Optional[str], Optional[str], Optional[str], Optional[str], Optional[datetime], Optional[int]]
+
+# States an incremental run re-queries regardless of the watermark
+RECHECK_STATES = ("open", "mismatch", "unknown")
+
+# A queued/running job older than the task time limit has lost its worker
+ACTIVE_JOB_STALE_S = int(os.getenv("RECON_TIME_LIMIT_S", "7200"))
+
+
+def classify(internal_status: str, external_status: Optional[str]) -> bool:
+    """True when internal and PSP state agree (unknown PSP state counts as open)."""
+    return (
+        (internal_status == "paid" and external_status == "paid") or
+        (internal_status == "unpaid" and external_status in ("open", None))
+    )
+
+
+def next_state(
+    internal_status: str,
+    is_ok: bool,
+    fetch_failed: bool,
+    first_checked_at: Optional[datetime],
+    now: datetime,
+    open_ttl: timedelta,
+) -> str:
+    if fetch_failed:
+        return "unknown"
+    if not is_ok:
+        return "mismatch"
+    if internal_status == "paid":
+        return "settled"
+    if first_checked_at is not None:
+        if first_checked_at.tzinfo is None:
+            first_checked_at = first_checked_at.replace(tzinfo=timezone.utc)
+        if now - first_checked_at >= open_ttl:
+            return "expired"
+    return "open"
+
+
+def previous_watermark(db: Session, org_id: int) -> Optional[datetime]:
+    """Watermark of the org's last successful run."""
+    return db.execute(
+        select(ReconJob.watermark)
+        .where(ReconJob.org_id == org_id, ReconJob.status == "succeeded", ReconJob.watermark.isnot(None))
+        .order_by(ReconJob.id.desc())
+        .limit(1)
+    ).scalar()
+
+
+class ReconEngine:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        adapter: Any = None,
+        concurrency: int = 16,
+        chunk_size: int = 500,
+        open_ttl: timedelta = timedelta(days=7),
+    ) -> None:
+        self.session_factory = session_factory
+        self.adapter = adapter
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.open_ttl = open_ttl
+
+    def _window(self, job: ReconJob):
+        return (
+            Transaction.org_id == job.org_id,
+            Transaction.created_at >= job.since,
+            or_(Transaction.razorpay_order_id.isnot(None), Transaction.razorpay_payment_id.isnot(None)),
+        )
+
+    def _query(self, job: ReconJob, watermark: Optional[datetime]):
+        q = (
+            select(Transaction.id, Transaction.transaction_ref,
+                   Transaction.razorpay_order_id, Transaction.razorpay_payment_id,
+                   ReconState.state, ReconState.first_checked_at, ReconState.checks)
+            .outerjoin(ReconState, ReconState.transaction_id == Transaction.id)
+            .where(*self._window(job))
+        )
+        if job.mode == "incremental":
+            due = [ReconState.transaction_id.is_(None), ReconState.state.in_(RECHECK_STATES)]
+            if watermark is not None:
+                due.append(Transaction.updated_at > watermark)
+            q = q.where(or_(*due))
+        return q.order_by(Transaction.id)
+
+    async def _build_index(self, job: ReconJob, until: datetime) -> Dict[str, str]:
+        """Order id -> PSP status for every order created in the job's window (list API)."""
+        since = job.since if job.since.tzinfo else job.since.replace(tzinfo=timezone.utc)
+        index: Dict[str, str] = {}
+        # Orders are created just after their transaction; the margin covers clock skew
+        created_from = int((since - timedelta(hours=1)).timestamp())
+        try:
+            async for order in self.adapter.list_orders_async(created_from, int(until.timestamp()) + 60):
+                if order.get("id"):
+                    index[order["id"]] = order.get("status")
+        except Exception as e:
+            # Keep what was listed; the rest falls back to per-order fetches
+            logger.warning("recon_bulk_list_failed", job_id=job.id, listed=len(index), error=str(e))
+        return index
+
+    async def _external_status(
+        self,
+        sem: asyncio.Semaphore,
+        order_id: Optional[str],
+        index: Optional[Dict[str, str]] = None,
+    ) -> Tuple[Optional[str], bool]:
+        """(external status, fetch failed)."""
+        if self.adapter is None or not order_id:
+            return None, False
+        if index is not None and order_id in index:
+            return ("paid" if index[order_id] == "paid" else "open"), False
+        async with sem:
+            try:
+                s = await self.adapter.get_order_status_async(order_id)
+            except Exception:
+                return None, True
+        return ("paid" if s.get("status") == "paid" else "open"), False
+
+    async def _reconcile(self, rows: List[Row], sem: asyncio.Semaphore, now: datetime,
+                         index: Optional[Dict[str, str]] = None):
+        """(ReconLog rows, new ReconState rows, ReconState updates, fetch failures)."""
+        results = await asyncio.gather(*(self._external_status(sem, r[2], index) for r in rows))
+        logs, new_states, updates = [], [], []
+        for (txn_id, ref, order_id, payment_id, state, first_checked, checks), (external_status, failed) in zip(rows, results):
+            internal_status = "paid" if payment_id else "unpaid"
+            is_ok = classify(internal_status, external_status)
+            logs.append({
+                "transaction_id": txn_id,
+                "internal_status": internal_status,
+                "external_status": external_status or "unknown",
+                "result": "ok" if is_ok else "mismatch",
+                "details": {"transaction_ref": ref, "razorpay_order_id": order_id},
+            })
+            new_state = next_state(internal_status, is_ok, failed, first_checked, now, self.open_ttl)
+            if state is None:
+                new_states.append({
+                    "transaction_id": txn_id, "org_id": None, "state": new_state,
+                    "internal_status": internal_status, "external_status": external_status,
+                    "checks": 1, "first_checked_at": now, "last_checked_at": now,
+                })
+            else:
+                updates.append({
+                    "b_tid": txn_id, "b_state": new_state, "b_internal": internal_status,
+                    "b_external": external_status, "b_checks": (checks or 0) + 1, "b_now": now,
+                })
+        return logs, new_states, updates, sum(1 for _, failed in results if failed)
+
+    def _save_states(self, db: Session, org_id: int, new_states, updates) -> None:
+        if new_states:
+            for row in new_states:
+                row["org_id"] = org_id
+            db.execute(_upsert_states(db), new_states)
+        if updates:
+            t = ReconState.__table__
+            db.execute(
+                update(t)
+                .where(t.c.transaction_id == bindparam("b_tid"))
+                .values(
+                    state=bindparam("b_state"),
+                    internal_status=bindparam("b_internal"),
+                    external_status=bindparam("b_external"),
+                    checks=bindparam("b_checks"),
+                    last_checked_at=bindparam("b_now"),
+                ),
+                updates,
+            )
+
+    async def run_async(self, job_id: int) -> Dict[str, Any]:
+        read = self.session_factory()
+        write = self.session_factory()
+        job = write.get(ReconJob, job_id)
+        if job is None:
+            read.close()
+            write.close()
+            raise LookupError(f"recon job {job_id} not found")
+        try:
+            now = datetime.now(timezone.utc)
+            watermark = previous_watermark(write, job.org_id)
+            query = self._query(job, watermark)
+            job.status = "running"
+            job.started_at = now
+            job.watermark = now
+            job.total = read.execute(select(func.count()).select_from(query.subquery())).scalar()
+            in_window = read.execute(select(func.count()).select_from(Transaction).where(*self._window(job))).scalar()
+            job.skipped = max(0, in_window - job.total)
+            write.commit()
+
+            index = None
+            if job.mode == "bulk" and self.adapter is not None:
+                index = await self._build_index(job, now)
+                logger.info("recon_bulk_index_built", job_id=job_id, orders=len(index))
+
+            sem = asyncio.Semaphore(self.concurrency)
+            stream = read.execute(query.execution_options(yield_per=self.chunk_size))
+            for partition in stream.partitions():
+                rows = [tuple(r) for r in partition]
+                logs, new_states, updates, failed = await self._reconcile(rows, sem, now, index)
+                write.execute(insert(ReconLog), logs)
+                self._save_states(write, job.org_id, new_states, updates)
+                ok = sum(1 for log in logs if log["result"] == "ok")
+                job.checked += len(logs)
+                job.ok += ok
+                job.mismatches += len(logs) - ok
+                job.fetch_errors += failed
+                write.commit()
+
+            job.status = "succeeded"
+            job.finished_at = datetime.now(timezone.utc)
+            write.commit()
+            logger.info(
+                "recon_job_finished", job_id=job_id, mode=job.mode, checked=job.checked,
+                skipped=job.skipped, mismatches=job.mismatches,
+            )
+            return job_summary(job)
+        except Exception as e:
+            write.rollback()
+            job = write.get(ReconJob, job_id)
+            job.status = "failed"
+            job.error = str(e)[:500]
+            job.finished_at = datetime.now(timezone.utc)
+            write.commit()
+            logger.error("recon_job_failed", job_id=job_id, error=str(e))
+            raise
+        finally:
+            read.close()
+            write.close()
+
+    def run(self, job_id: int) -> Dict[str, Any]:
+        """Run a job from sync code (Celery worker, FastAPI background task)."""
+        async def _run() -> Dict[str, Any]:
+            from app.services.payments.razorpay_adapter import close_shared_client
+
+            try:
+                return await self.run_async(job_id)
+            finally:
+                # The loop ends with the job; release its pooled connections
+                await close_shared_client()
+
+        return asyncio.run(_run())
+
+
+def _upsert_states(db: Session):
+    # A run that overlapped this one may have inserted the row since we read it
+    name = db.get_bind().dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:  # pragma: no cover
+        raise RuntimeError(f"unsupported dialect for recon state: {name}")
+    stmt = dialect_insert(ReconState)
+    return stmt.on_conflict_do_update(
+        index_elements=["transaction_id"],
+        set_={
+            "state": stmt.excluded.state,
+            "internal_status": stmt.excluded.internal_status,
+            "external_status": stmt.excluded.external_status,
+            "checks": ReconState.checks + 1,
+            "last_checked_at": stmt.excluded.last_checked_at,
+        },
+    )
+
+
+def active_job(db: Session, org_id: int) -> Optional[ReconJob]:
+    """The org's queued or running job, unless it outlived the task time limit."""
+    stale = datetime.now(timezone.utc) - timedelta(seconds=ACTIVE_JOB_STALE_S)
+    return (
+        db.query(ReconJob)
+        .filter(ReconJob.org_id == org_id, ReconJob.status.in_(("queued", "running")), ReconJob.created_at >= stale)
+        .order_by(ReconJob.id.desc())
+        .first()
+    )
+
+
+def job_summary(job: ReconJob) -> Dict[str, Any]:
+    progress = None
+    if job.total:
+        progress = round(job.checked / job.total, 4)
+    elif job.status == "succeeded":
+        progress = 1.0
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "mode": job.mode,
+        "total": job.total,
+        "skipped": job.skipped or 0,
+        "checked": job.checked or 0,
+        "ok": job.ok or 0,
+        "mismatches": job.mismatches or 0,
+        "fetch_errors": job.fetch_errors or 0,
+        "progress": progress,
+        "error": job.error,
+        "watermark": job.watermark.isoformat() if job.watermark else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def default_engine() -> ReconEngine:
+    from app.db import SessionLocal
+    from app.services.payments.razorpay_adapter import RazorpayAdapter
+
+    try:
+        adapter = RazorpayAdapter()
+    except Exception:
+        # If not configured, treat as zero external confirmation
+        adapter = None
+    return ReconEngine(
+        SessionLocal,
+        adapter,
+        concurrency=int(os.getenv("RECON_CONCURRENCY", "16")),
+        chunk_size=int(os.getenv("RECON_CHUNK_SIZE", "500")),
+        open_ttl=timedelta(days=float(os.getenv("RECON_OPEN_TTL_DAYS", "7"))),
+    )
+
+
+def run_recon_job_inline(job_id: int) -> None:
+    """Fallback executor when no Celery broker is reachable."""
+    try:
+        default_engine().run(job_id)
+    except Exception:
+        pass  # recorded on the job row
+
+
+def dispatch_recon_job(job_id: int, background_tasks=None) -> str:
+    """Queue ``job_id`` on Celery; without a reachable broker run it as a background task.
+
+    Returns "celery" or "background".
+    """
+    try:
+        from app.tasks.recon_tasks import run_recon_job
+        from app.worker import celery_app
+
+        with celery_app.connection_for_write() as conn:
+            # Fail fast instead of kombu's default reconnect loop
+            conn.ensure_connection(max_retries=1, interval_start=0, interval_step=0, timeout=1)
+            run_recon_job.apply_async(args=[job_id], connection=conn, retry=False)
+        return "celery"
+    except Exception as e:
+        if background_tasks is None:
+            raise
+        logger.warning("recon_dispatch_fallback", job_id=job_id, error=str(e))
+        background_tasks.add_task(run_recon_job_inline, job_id)
+        return "background"
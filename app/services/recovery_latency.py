@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.analytics.sketch import DDSketch
+from app.models import FailureEvent, NotificationLog, RecoveryAttempt, RecoveryLatencySketch, Transaction
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+BASES = ("failure", "notification")
+
+
+def _utc(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is None:
+        return None
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+def _starts(db: Session, attempt: RecoveryAttempt) -> Dict[str, Optional[datetime]]:
+    first_failure = None
+    if attempt.transaction_id is not None:
+        first_failure = db.query(func.min(func.coalesce(FailureEvent.occurred_at, FailureEvent.created_at))).filter(
+            FailureEvent.transaction_id == attempt.transaction_id
+        ).scalar()
+    first_notification = db.query(func.min(func.coalesce(NotificationLog.sent_at, NotificationLog.created_at))).filter(
+        NotificationLog.recovery_attempt_id == attempt.id,
+        NotificationLog.status.in_(["sent", "delivered"]),
+    ).scalar()
+    return {"failure": _utc(first_failure), "notification": _utc(first_notification)}
+
+
+def _add_sample(db: Session, org_id: int, day: date, channel: str, basis: str, seconds: float) -> None:
+    row = db.query(RecoveryLatencySketch).filter(
+        RecoveryLatencySketch.org_id == org_id,
+        RecoveryLatencySketch.day == day,
+        RecoveryLatencySketch.channel == channel,
+        RecoveryLatencySketch.basis == basis,
+    ).with_for_update().first()
+    if row is None:
+        sk = DDSketch()
+        sk.add(seconds)
+        try:
+            with db.begin_nested():
+                db.add(RecoveryLatencySketch(org_id=org_id, day=day, channel=channel, basis=basis,
+                                             count=sk.count, sketch=sk.to_dict()))
+            return
+        except IntegrityError:
+            # Another worker created the row first; fall through and merge into it
+            row = db.query(RecoveryLatencySketch).filter(
+                RecoveryLatencySketch.org_id == org_id,
+                RecoveryLatencySketch.day == day,
+                RecoveryLatencySketch.channel == channel,
+                RecoveryLatencySketch.basis == basis,
+            ).with_for_update().one()
+    sk = DDSketch.from_dict(row.sketch)
+    sk.add(seconds)
+    row.sketch = sk.to_dict()
+    row.count = sk.count
+
+
+def record_completion(db: Session, attempt: RecoveryAttempt, completed_at: Optional[datetime] = None) -> None:
+    """Add this attempt's time-to-recovery to the org/day/channel sketches.
+
+    Call in the same transaction that marks the attempt completed; the caller
+    commits. Never raises: a sketch failure must not fail the payment webhook.
+    """
+    try:
+        completed = _utc(completed_at or attempt.used_at) or datetime.now(timezone.utc)
+        org_id = attempt.transaction.org_id if attempt.transaction is not None else None
+        if org_id is None and attempt.transaction_ref:
+            org_id = db.query(Transaction.org_id).filter(Transaction.transaction_ref == attempt.transaction_ref).scalar()
+        if org_id is None:
+            return
+        channel = (attempt.channel or "unknown")[:16]
+        with db.begin_nested():
+            for basis, start in _starts(db, attempt).items():
+                if start is None:
+                    continue
+                seconds = max(0.0, (completed - start).total_seconds())
+                _add_sample(db, org_id, completed.date(), channel, basis, seconds)
+    except Exception as e:
+        logger.warning("recovery_latency_record_failed", attempt_id=attempt.id, error=str(e))
+
+
+def latency_percentiles(
+    db: Session,
+    org_id: int,
+    start: date,
+    end: date,
+    basis: str = "failure",
+    channel: Optional[str] = None,
+    quantiles: Sequence[float] = (0.5, 0.9, 0.99),
+) -> Dict[str, Any]:
+    """Merge the stored sketches for [start, end] (completion days, inclusive)."""
+    q = db.query(RecoveryLatencySketch.channel, RecoveryLatencySketch.sketch).filter(
+        RecoveryLatencySketch.org_id == org_id,
+        RecoveryLatencySketch.basis == basis,
+        RecoveryLatencySketch.day >= start,
+        RecoveryLatencySketch.day <= end,
+    )
+    if channel:
+        q = q.filter(RecoveryLatencySketch.channel == channel)
+    merged = DDSketch()
+    per_channel: Dict[str, DDSketch] = {}
+    for ch, data in q.all():
+        sk = DDSketch.from_dict(data)
+        merged.merge(sk)
+        per_channel.setdefault(ch, DDSketch()).merge(sk)
+
+    def _summary(sk: DDSketch) -> Dict[str, Any]:
+        return {
+            "count": sk.count,
+            "mean_seconds": sk.mean,
+            "percentiles": {f"p{_label(p)}": sk.quantile(p) for p in quantiles},
+        }
+
+    out = _summary(merged)
+    out["by_channel"] = {ch: _summary(sk) for ch, sk in sorted(per_channel.items())}
+    return out
+
+
+def _label(q: float) -> str:
+    return f"{q * 100:g}"
+
+
+def parse_quantiles(raw: Optional[str]) -> List[float]:
+    """'0.5,0.9' or '50,90' -> [0.5, 0.9]; raises ValueError on junk."""
+    if not raw:
+        return [0.5, 0.9, 0.99]
+    out: List[float] = []
+    for part in raw.split(","):
+        v = float(part.strip())
+        if v > 1:
+            v /= 100.0
+        if not 0 <= v <= 1:
+            raise ValueError(f"quantile out of range: {part}")
+        out.append(v)
+    return out
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models import OTPSecurityLog
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+class SecurityAuditPipeline:
+    """Per-process queue of otp_security_logs rows, bulk-inserted in batches.
+
+    Events are flushed every ``flush_interval`` seconds or as soon as
+    ``batch_size`` are pending. The queue is bounded at ``max_pending``;
+    beyond that the oldest events are dropped and counted. Failed batches
+    are put back and retried on the next flush.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Session]] = None,
+        flush_interval: float = 1.0,
+        batch_size: int = 500,
+        max_pending: int = 100000,
+    ) -> None:
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        # (enqueued at monotonic, row)
+        self._pending: Deque[Tuple[float, Dict[str, Any]]] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_lag = 0.0
+
+    def enqueue(self, **fields: Any) -> None:
+        fields.setdefault("created_at", datetime.utcnow())
+        fields.setdefault("attempt_count", 1)
+        with self._lock:
+            self._pending.append((time.monotonic(), fields))
+            self.enqueued += 1
+            while len(self._pending) > self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+        self._ensure_started()
+
+    def _ensure_started(self) -> None:
+        if self.session_factory is None or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._stopped or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name="security-audit", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            while self.flush() >= self.batch_size:
+                pass
+
+    def flush(self, db: Optional[Session] = None) -> int:
+        """Insert up to one batch of pending events; returns rows written."""
+        with self._flush_lock:
+            with self._lock:
+                n = min(len(self._pending), self.batch_size)
+                batch = [self._pending.popleft() for _ in range(n)]
+            if not batch:
+                return 0
+            own = db is None
+            session = db if db is not None else self.session_factory()
+            try:
+                session.execute(insert(OTPSecurityLog), [row for _, row in batch])
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                self.failures += 1
+                logger.warning("security_audit_flush_failed", error=str(e), rows=len(batch))
+                with self._lock:
+                    self._pending.extendleft(reversed(batch))
+                return 0
+            finally:
+                if own:
+                    session.close()
+            self.batches += 1
+            self.flushed += len(batch)
+            self.last_flush_lag = time.monotonic() - batch[0][0]
+            return len(batch)
+
+    def lag_seconds(self) -> float:
+        """Age of the oldest event not yet in the database."""
+        with self._lock:
+            return time.monotonic() - self._pending[0][0] if self._pending else 0.0
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+        if self.session_factory is not None:
+            while self.flush():
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        lag = self.lag_seconds()
+        with self._lock:
+            depth = len(self._pending)
+        return {
+            "pending": depth,
+            "lag_seconds": round(lag, 3),
+            "last_flush_lag_seconds": round(self.last_flush_lag, 3),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+
+_pipeline: Optional[SecurityAuditPipeline] = None
+_pipeline_pid: Optional[int] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_audit_pipeline() -> SecurityAuditPipeline:
+    """Per-process pipeline writing through app.db.SessionLocal."""
+    global _pipeline, _pipeline_pid
+    pid = os.getpid()
+    if _pipeline is None or _pipeline_pid != pid:
+        with _pipeline_lock:
+            if _pipeline is None or _pipeline_pid != pid:
+                from app.db import SessionLocal
+                _pipeline = SecurityAuditPipeline(
+                    SessionLocal,
+                    flush_interval=float(os.getenv("SECURITY_AUDIT_FLUSH_S", "1")),
+                    batch_size=int(os.getenv("SECURITY_AUDIT_BATCH", "500")),
+                )
+                _pipeline_pid = pid
+    return _pipeline
+
+
+def record_security_event(db: Session, **fields: Any) -> None:
+    """Queue an otp_security_logs row, or add it to ``db`` when it must be visible now.
+
+    While Redis is up, rate limits and blocks are decided from Redis
+    (app.core.rate_limit), so the audit row can land a batch later. Without
+    Redis the OTP flows count these rows to decide blocks, so the row is
+    added to the caller's session and committed with the request.
+    """
+    from app.core.redis import redis_manager
+
+    if fields.get("user_agent"):
+        fields["user_agent"] = fields["user_agent"][:500]
+    if redis_manager.is_available:
+        get_audit_pipeline().enqueue(**fields)
+    else:
+        db.add(OTPSecurityLog(**fields))
+
+
+def audit_stats() -> Optional[Dict[str, Any]]:
+    if _pipeline is None or _pipeline_pid != os.getpid():
+        return None
+    return _pipeline.stats()
+
+
+@atexit.register
+def _flush_on_exit() -> None:  # pragma: no cover - interpreter shutdown
+    if _pipeline is not None and _pipeline_pid == os.getpid():
+        try:
+            _pipeline.stop()
+        except Exception:
+            pass
@@ -8,10 +8,15 @@ from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
 import structlog
 
+from app.psp.dispatcher import PSPDispatcher
+
 logger = structlog.get_logger(__name__)
 
 # Configure Stripe API key
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# e.g. the local PSP simulator (app/psp/simulator.py) in benchmarks and CI
+if os.getenv("STRIPE_API_BASE"):
+    stripe.api_base = os.environ["STRIPE_API_BASE"]
 
 class StripeService:
     """Service for Stripe payment processing."""
@@ -274,6 +279,43 @@ class StripeService:
             )
             return None
     
+    # -- async API: the calls above on the bounded Stripe executor --------
+    # (app.psp.executor), timed into the PSP health table. Use these from
+    # ``async def`` routes so a Stripe round trip never blocks the event loop.
+
+    @staticmethod
+    async def create_checkout_session_async(**kwargs: Any) -> Dict[str, Any]:
+        return await PSPDispatcher.acall(
+            "stripe", "create_checkout_session", StripeService.create_checkout_session, **kwargs
+        )
+
+    @staticmethod
+    async def retrieve_checkout_session_async(session_id: str, hedge: bool = True) -> Optional[stripe.checkout.Session]:
+        """Hedged by default: a retrieve slower than its recent p95 is sent again.
+
+        Times the raw Stripe call, so a StripeError is recorded as a failure
+        (and cannot win a hedge) before it is turned into None here.
+        """
+        try:
+            session = await PSPDispatcher.acall(
+                "stripe", "retrieve_checkout_session", stripe.checkout.Session.retrieve, session_id, hedge=hedge
+            )
+        except stripe.error.StripeError as e:
+            logger.error(
+                "stripe_session_retrieve_failed",
+                error=str(e),
+                session_id=session_id,
+                error_type=type(e).__name__
+            )
+            return None
+        logger.info("stripe_session_retrieved", session_id=session_id, status=session.status)
+        return session
+
+    @staticmethod
+    async def retrieve_balance_async() -> Any:
+        """Cheapest authenticated call; used as a credentials check."""
+        return await PSPDispatcher.acall("stripe", "retrieve_balance", stripe.Balance.retrieve)
+    
     @staticmethod
     def verify_webhook_signature(payload: bytes, sig_header: str) -> Optional[Dict[str, Any]]:
         """
@@ -0,0 +1,496 @@
+"""
+Fast-ack PSP webhook pipeline.
+
+Webhook routes only verify the signature and call ``ingest``, which stores
+the raw event as a pending PspEvent with INSERT ... ON CONFLICT
+(psp_event_id) DO NOTHING. PSP retries and duplicate deliveries are no-ops,
+and the route returns 200 without touching transactions.
+
+State changes are applied later by ``process_pending``:
+- A worker claims a batch of pending events, oldest first, with FOR UPDATE
+  SKIP LOCKED on Postgres, so several Celery workers can drain the queue in
+  parallel without sharing events.
+- The batch is grouped by transaction (``group_key``). Each group is applied
+  in arrival order inside its own savepoint. A failing group is rolled back
+  and retried on a later pass, up to WEBHOOK_MAX_ATTEMPTS, without holding
+  back the rest of the batch.
+- A group is only applied up to its first pending event the batch did not
+  claim: one locked by another worker, or a failed one waiting for its
+  retry. Later events of that transaction stay pending until the earlier
+  ones are done, so no two workers apply one transaction at once and a
+  retry never lands after the events that followed it.
+- Analytics are emitted after the batch commits.
+
+After each new event the routes kick the ``process_webhook_events`` task, at
+most once per WEBHOOK_KICK_INTERVAL_S per process. Beat also runs it as a
+safety net. Without a reachable broker the kick drains the queue in the
+route's background task instead.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.models import PspEvent, RecoveryAttempt, Transaction
+from app.services.checkout_cache import get_checkout_cache
+from app.services.recovery_latency import record_completion
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+PAID_RAZORPAY_EVENTS = ("payment.captured", "order.paid", "payment_link.paid")
+
+
+# ---------------------------------------------------------------------------
+# Event identity
+# ---------------------------------------------------------------------------
+
+def razorpay_event_key(event: Dict[str, Any]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """(event type, deterministic psp_event_id, group key) of a Razorpay event.
+
+    The id is ``razorpay:<event>:<payment_id|order_id|payment_link_id>``. It
+    is None when the event names none of them, and such events are
+    acknowledged without being stored.
+    """
+    etype = event.get("event") or event.get("event_type")
+    payload = event.get("payload") or {}
+    payment = (payload.get("payment") or {}).get("entity") or {}
+    order = (payload.get("order") or {}).get("entity") or {}
+    link_id = ((payload.get("payment_link") or {}).get("entity") or {}).get("id")
+    payment_id = payment.get("id")
+    order_id = payment.get("order_id") or order.get("id")
+    if not etype or not (payment_id or order_id or link_id):
+        return etype, None, None
+    uid = f"razorpay:{etype}:{payment_id or order_id or link_id}"
+    return etype, uid, f"razorpay:{order_id}" if order_id else uid
+
+
+def stripe_event_key(event: Dict[str, Any]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """(event type, ``stripe:<event id>``, group key) of a Stripe event."""
+    etype = event.get("type")
+    if not etype or not event.get("id"):
+        return etype, None, None
+    obj = (event.get("data") or {}).get("object") or {}
+    ref = (obj.get("metadata") or {}).get("transaction_ref")
+    if ref:
+        group = f"txn:{ref}"
+    elif etype.startswith("payment_intent."):
+        group = f"stripe:{obj.get('id')}"
+    else:
+        group = f"stripe:{obj.get('payment_intent') or obj.get('id')}"
+    return etype, f"stripe:{event['id']}", group
+
+
+_KEYS = {"razorpay": razorpay_event_key, "stripe": stripe_event_key}
+
+
+# ---------------------------------------------------------------------------
+# Ingest (request path)
+# ---------------------------------------------------------------------------
+
+def _insert_ignore(db: Session):
+    name = db.get_bind().dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:  # pragma: no cover
+        raise RuntimeError(f"unsupported dialect for webhook ingest: {name}")
+    return insert(PspEvent).on_conflict_do_nothing(index_elements=["psp_event_id"])
+
+
+def ingest(db: Session, provider: str, event: Dict[str, Any]) -> Optional[bool]:
+    """Store a verified event for processing and commit.
+
+    Returns True for a new event, False for a duplicate, and None when the
+    event carries nothing to key it by (nothing is stored).
+    """
+    etype, uid, group = _KEYS[provider](event)
+    if uid is None:
+        return None
+    result = db.execute(_insert_ignore(db).values(
+        provider=provider,
+        event_type=(etype or "unknown")[:64],
+        psp_event_id=uid,
+        group_key=group,
+        payload=event,
+        status="pending",
+        attempts=0,
+    ))
+    db.commit()
+    inserted = result.rowcount == 1
+    _stats.ingested(inserted)
+    return inserted
+
+
+# ---------------------------------------------------------------------------
+# Handlers (worker path). Each applies one event; the caller commits.
+# ---------------------------------------------------------------------------
+
+def _apply_razorpay(db: Session, event: Dict[str, Any], emits: List[Dict[str, Any]]) -> None:
+    etype = event.get("event") or event.get("event_type")
+    payload = event.get("payload") or {}
+    payment = (payload.get("payment") or {}).get("entity") or {}
+    order = (payload.get("order") or {}).get("entity") or {}
+    link = (payload.get("payment_link") or {}).get("entity") or {}
+    payment_id = payment.get("id")
+    order_id = payment.get("order_id") or order.get("id")
+    if not order_id and not link.get("id"):
+        return
+
+    txn = None
+    if order_id:
+        txn = db.query(Transaction).filter(Transaction.razorpay_order_id == order_id).first()
+    if not txn and link.get("id"):
+        txn = db.query(Transaction).filter(Transaction.razorpay_payment_link_id == link["id"]).first()
+    if not txn:
+        # Match by receipt/transaction_ref (payment links copy their notes onto payments)
+        receipt = (order.get("receipt") or (payment.get("notes") or {}).get("receipt")
+                   or (link.get("notes") or {}).get("receipt"))
+        if receipt:
+            txn = db.query(Transaction).filter(Transaction.transaction_ref == receipt).first()
+    if not txn:
+        return
+    if payment_id and txn.razorpay_payment_id == payment_id:
+        return  # already applied (e.g. payment.captured then order.paid)
+    if etype not in PAID_RAZORPAY_EVENTS:
+        return
+
+    txn.razorpay_payment_id = payment_id or txn.razorpay_payment_id
+    get_checkout_cache().mark_paid(txn, "razorpay", link.get("id") or order_id)
+    attempt = (
+        db.query(models.RecoveryAttempt)
+        .filter(
+            (models.RecoveryAttempt.transaction_id == txn.id)
+            | (models.RecoveryAttempt.transaction_ref == txn.transaction_ref)
+        )
+        .order_by(models.RecoveryAttempt.id.desc())
+        .first()
+    )
+    if attempt and attempt.status != "completed":
+        attempt.status = "completed"
+        attempt.used_at = datetime.utcnow()
+        record_completion(db, attempt)
+    emits.append({
+        "provider": "razorpay",
+        "order_id": order_id,
+        "payment_id": payment_id,
+        "transaction_ref": txn.transaction_ref,
+        "org_id": txn.org_id,
+        "status": "success",
+    })
+
+
+def _apply_stripe(db: Session, event: Dict[str, Any], emits: List[Dict[str, Any]]) -> None:
+    etype = event.get("type")
+    obj = (event.get("data") or {}).get("object") or {}
+    if etype == "checkout.session.completed":
+        ref = (obj.get("metadata") or {}).get("transaction_ref")
+        if not ref:
+            logger.warning("checkout_session_missing_transaction_ref", session_id=obj.get("id"))
+            return
+        txn = db.query(Transaction).filter(Transaction.transaction_ref == ref).first()
+        if not txn:
+            return
+        txn.stripe_payment_intent_id = obj.get("payment_intent")
+        get_checkout_cache().mark_paid(txn, "stripe", obj.get("id"))
+        recovery = db.query(RecoveryAttempt).filter(
+            RecoveryAttempt.transaction_ref == ref,
+            RecoveryAttempt.status.in_(["created", "sent", "opened"]),
+        ).first()
+        if recovery:
+            recovery.status = "completed"
+            recovery.used_at = datetime.utcnow()
+            record_completion(db, recovery)
+            logger.info("recovery_completed_via_checkout", recovery_id=recovery.id,
+                        transaction_ref=ref, session_id=obj.get("id"))
+        logger.info("checkout_session_processed", transaction_id=txn.id, session_id=obj.get("id"),
+                    payment_intent_id=obj.get("payment_intent"))
+    elif etype == "checkout.session.expired":
+        txn = db.query(Transaction).filter(Transaction.stripe_checkout_session_id == obj.get("id")).first()
+        if txn and get_checkout_cache().invalidate(txn, "checkout", obj.get("id")):
+            logger.info("checkout_session_expired", transaction_id=txn.id, session_id=obj.get("id"))
+    elif etype in ("payment_intent.succeeded", "payment_intent.payment_failed"):
+        txn = db.query(Transaction).filter(Transaction.stripe_payment_intent_id == obj.get("id")).first()
+        if not txn:
+            return
+        if etype == "payment_intent.succeeded":
+            logger.info("payment_intent_succeeded", transaction_id=txn.id, payment_intent_id=obj.get("id"),
+                        amount=obj.get("amount"), currency=obj.get("currency"))
+        else:
+            logger.warning("payment_intent_failed", transaction_id=txn.id, payment_intent_id=obj.get("id"),
+                           error=(obj.get("last_payment_error") or {}).get("message", "Unknown error"))
+    else:
+        logger.info("stripe_webhook_event_ignored", event_type=etype)
+
+
+_HANDLERS = {"razorpay": _apply_razorpay, "stripe": _apply_stripe}
+
+
+def apply_group(db: Session, events: Iterable[Tuple[str, Optional[Dict[str, Any]]]],
+                emits: List[Dict[str, Any]]) -> None:
+    """Apply one transaction's (provider, payload) events in order inside a savepoint.
+
+    On error the savepoint is rolled back and the exception propagates.
+    """
+    with db.begin_nested():
+        for provider, payload in events:
+            _HANDLERS[provider](db, payload or {}, emits)
+
+
+# ---------------------------------------------------------------------------
+# Batch processing
+# ---------------------------------------------------------------------------
+
+def _claim(db: Session, batch_size: int, skip_ids: Set[int]) -> List[PspEvent]:
+    q = select(PspEvent).where(PspEvent.status == "pending")
+    if skip_ids:
+        q = q.where(PspEvent.id.notin_(skip_ids))
+    q = q.order_by(PspEvent.id).limit(batch_size)
+    if db.get_bind().dialect.name == "postgresql":
+        q = q.with_for_update(skip_locked=True)
+    return list(db.execute(q).scalars())
+
+
+def _hold_back(db: Session, events: List[PspEvent]) -> Tuple[List[PspEvent], List[PspEvent]]:
+    """Split claimed ``events`` into (ready, held): held events come after a pending
+    event of their group that this batch does not hold."""
+    keys = {ev.group_key for ev in events if ev.group_key}
+    if not keys:
+        return events, []
+    first_unclaimed = dict(db.execute(
+        select(PspEvent.group_key, func.min(PspEvent.id))
+        .where(PspEvent.status == "pending", PspEvent.group_key.in_(keys),
+               PspEvent.id.notin_([ev.id for ev in events]))
+        .group_by(PspEvent.group_key)
+    ).all())
+    ready: List[PspEvent] = []
+    held: List[PspEvent] = []
+    for ev in events:
+        limit = first_unclaimed.get(ev.group_key)
+        (held if limit is not None and ev.id > limit else ready).append(ev)
+    return ready, held
+
+
+def process_batch(
+    db: Session,
+    batch_size: int = 200,
+    max_attempts: int = 5,
+    skip_ids: Optional[Set[int]] = None,
+) -> Dict[str, int]:
+    """Claim and apply one batch of pending events; commits. Returns counters.
+
+    Ids of events that failed and stay pending are added to ``skip_ids``, so
+    one drain does not retry them back to back. So are events held back
+    behind an earlier event of their group; they are applied by a later drain.
+    """
+    started = time.perf_counter()
+    skip_ids = set() if skip_ids is None else skip_ids
+    claimed = _claim(db, batch_size, skip_ids)
+    if not claimed:
+        db.rollback()
+        return {"claimed": 0, "processed": 0, "failed": 0, "deferred": 0, "groups": 0}
+    events, held = _hold_back(db, claimed)
+    skip_ids.update(ev.id for ev in held)
+
+    groups: "OrderedDict[str, List[PspEvent]]" = OrderedDict()
+    for ev in events:
+        groups.setdefault(ev.group_key or ev.psp_event_id, []).append(ev)
+
+    now = datetime.now(timezone.utc)
+    emits: List[Dict[str, Any]] = []
+    processed = failed = 0
+    for key, group in groups.items():
+        group_emits: List[Dict[str, Any]] = []
+        try:
+            apply_group(db, [(ev.provider, ev.payload) for ev in group], group_emits)
+        except Exception as e:
+            failed += len(group)
+            logger.warning("webhook_group_failed", group_key=key, events=len(group), error=str(e))
+            for ev in group:
+                ev.attempts = (ev.attempts or 0) + 1
+                ev.error = str(e)[:500]
+                if ev.attempts >= max_attempts:
+                    ev.status = "failed"
+                    ev.processed_at = now
+                else:
+                    skip_ids.add(ev.id)
+            continue
+        processed += len(group)
+        emits.extend(group_emits)
+        for ev in group:
+            ev.attempts = (ev.attempts or 0) + 1
+            ev.status = "processed"
+            ev.processed_at = now
+            ev.error = None
+    db.commit()
+
+    if emits:
+        from app.analytics.sink import emit
+
+        for record in emits:
+            emit("payment_result", record)
+
+    created = [_utc(ev.created_at) for ev in events if ev.created_at is not None]
+    lag = max((now - c).total_seconds() for c in created) if created else 0.0
+    _stats.batch(processed, failed, time.perf_counter() - started, lag)
+    return {"claimed": len(claimed), "processed": processed, "failed": failed, "deferred": len(held),
+            "groups": len(groups)}
+
+
+def process_pending(
+    db: Session,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None,
+    max_attempts: Optional[int] = None,
+) -> Dict[str, int]:
+    """Drain pending events in batches until the queue is empty (or ``max_batches``)."""
+    batch_size = batch_size or int(os.getenv("WEBHOOK_BATCH_SIZE", "200"))
+    max_batches = max_batches or int(os.getenv("WEBHOOK_MAX_BATCHES", "50"))
+    max_attempts = max_attempts or int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+    totals = {"batches": 0, "claimed": 0, "processed": 0, "failed": 0, "deferred": 0}
+    retry_later: Set[int] = set()
+    for _ in range(max_batches):
+        result = process_batch(db, batch_size, max_attempts, retry_later)
+        if not result["claimed"]:
+            break
+        totals["batches"] += 1
+        for k in ("claimed", "processed", "failed", "deferred"):
+            totals[k] += result[k]
+    return totals
+
+
+def _utc(dt: datetime) -> datetime:
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+# ---------------------------------------------------------------------------
+# Dispatch
+# ---------------------------------------------------------------------------
+
+_last_kick = 0.0
+_kick_lock = threading.Lock()
+
+
+def drain_inline() -> Dict[str, int]:
+    """Fallback executor when no Celery broker is reachable."""
+    from app.db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return process_pending(db)
+    except Exception as e:
+        logger.warning("webhook_drain_failed", error=str(e))
+        return {}
+    finally:
+        db.close()
+
+
+def kick() -> str:
+    """Queue a drain on Celery (throttled per process), else drain here.
+
+    Meant to run as a route's background task, after the 200 went out.
+    Returns "celery", "throttled" or "inline".
+    """
+    global _last_kick
+    interval = float(os.getenv("WEBHOOK_KICK_INTERVAL_S", "1"))
+    with _kick_lock:
+        if time.monotonic() - _last_kick < interval:
+            return "throttled"
+        _last_kick = time.monotonic()
+    try:
+        from app.tasks.webhook_tasks import process_webhook_events
+        from app.worker import celery_app
+
+        with celery_app.connection_for_write() as conn:
+            # Fail fast instead of kombu's default reconnect loop
+            conn.ensure_connection(max_retries=1, interval_start=0, interval_step=0, timeout=1)
+            process_webhook_events.apply_async(connection=conn, retry=False)
+        return "celery"
+    except Exception as e:
+        logger.warning("webhook_dispatch_fallback", error=str(e))
+        with _kick_lock:
+            _last_kick = 0.0  # inline drains are not throttled
+        drain_inline()
+        return "inline"
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+class _PipelineStats:
+    """Per-process ingest/processing counters."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.received = 0
+            self.duplicates = 0
+            self.batches = 0
+            self.processed = 0
+            self.failed = 0
+            self.busy_s = 0.0
+            self.last_batch_lag_s: Optional[float] = None
+
+    def ingested(self, inserted: bool) -> None:
+        with self._lock:
+            self.received += 1
+            self.duplicates += 0 if inserted else 1
+
+    def batch(self, processed: int, failed: int, elapsed: float, lag: float) -> None:
+        with self._lock:
+            self.batches += 1
+            self.processed += processed
+            self.failed += failed
+            self.busy_s += elapsed
+            self.last_batch_lag_s = round(lag, 3)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "received": self.received,
+                "duplicates": self.duplicates,
+                "batches": self.batches,
+                "processed": self.processed,
+                "failed": self.failed,
+                "events_per_busy_s": round(self.processed / self.busy_s, 1) if self.busy_s else None,
+                "last_batch_lag_s": self.last_batch_lag_s,
+            }
+
+
+_stats = _PipelineStats()
+
+
+def pipeline_stats(db: Session, window_s: int = 60) -> Dict[str, Any]:
+    """Queue depth, lag and throughput from the event table, plus this process's counters."""
+    now = datetime.now(timezone.utc)
+    by_status = dict(db.query(PspEvent.status, func.count()).group_by(PspEvent.status).all())
+    oldest = db.query(func.min(PspEvent.created_at)).filter(PspEvent.status == "pending").scalar()
+    recent = db.query(func.count()).select_from(PspEvent).filter(
+        PspEvent.processed_at >= now - timedelta(seconds=window_s),
+        PspEvent.status == "processed",
+    ).scalar()
+    return {
+        "pending": by_status.get("pending", 0),
+        "failed": by_status.get("failed", 0),
+        "lag_s": round((now - _utc(oldest)).total_seconds(), 3) if oldest else 0.0,
+        "processed_per_s": round((recent or 0) / window_s, 2),
+        "process": _stats.snapshot(),
+    }
@@ -0,0 +1,405 @@
+"""
+Replay stored PSP webhook events through the webhook pipeline's handlers.
+
+Used after a handler fix to re-apply history. A WebhookReplayJob selects
+PspEvent rows by provider, event type and created_at range. Its status and
+counters live on the job row, as with recon jobs.
+
+- Rows stream from a server-side cursor (``yield_per``) in id order.
+- Rows are sharded by transaction (``group_key``). Each shard has at most one
+  batch in flight, so one transaction's events are still applied in order
+  when batches run across a process pool.
+- Each batch runs in one DB transaction, through
+  ``webhook_pipeline.apply_group`` (a savepoint per transaction). dry_run
+  rolls the batch back instead of committing.
+- ``rate_limit`` caps events per second.
+- ``checkpoint_id`` is advanced as batches finish. Every event at or below
+  it has been replayed or is recorded in ``failed_ids``. When a transaction's
+  events fail, its later events are held back into ``failed_ids`` as well, so
+  they are never applied out of order. Resuming retries ``failed_ids`` first,
+  then continues after the checkpoint.
+- A running job refreshes ``heartbeat_at`` at every checkpoint. Only failed
+  jobs, or running jobs whose heartbeat is older than
+  ``WEBHOOK_REPLAY_STALE_S``, can be resumed (``claim_resume``).
+
+Replays never emit analytics (the original processing already did) and never
+touch PspEvent.status.
+"""
+from __future__ import annotations
+
+import os
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models import PspEvent, WebhookReplayJob
+from app.services.webhook_pipeline import apply_group
+
+try:
+    import structlog  # type: ignore
+    logger = structlog.get_logger(__name__)
+except Exception:  # pragma: no cover
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+# A running job whose heartbeat is older than this is presumed dead and may be
+# resumed. Keep it well above batch size / rate limit, the longest gap between
+# checkpoints.
+REPLAY_STALE_S = int(os.getenv("WEBHOOK_REPLAY_STALE_S", "900"))
+
+Row = Tuple[int, str, Optional[str], Optional[Dict[str, Any]]]  # id, provider, group_key, payload
+
+
+def _group_of(row: Row) -> str:
+    return row[2] or str(row[0])
+
+
+def replay_rows(session_factory: Callable[[], Session], rows: Sequence[Row], dry_run: bool) -> List[int]:
+    """Apply ``rows`` in one transaction (rolled back when dry_run). Returns the ids that failed."""
+    groups: "OrderedDict[str, List[Row]]" = OrderedDict()
+    for row in rows:
+        groups.setdefault(_group_of(row), []).append(row)
+    db = session_factory()
+    try:
+        failed: List[int] = []
+        for key, events in groups.items():
+            try:
+                apply_group(db, [(provider, payload) for _, provider, _, payload in events], [])
+            except Exception as e:
+                failed.extend(event_id for event_id, _, _, _ in events)
+                logger.warning("webhook_replay_group_failed", group_key=key, events=len(events), error=str(e))
+        if dry_run:
+            db.rollback()
+        else:
+            db.commit()
+        return failed
+    finally:
+        db.close()
+
+
+def claim_resume(db: Session, job_id: int) -> bool:
+    """Queue ``job_id`` again if it failed or its runner stopped heartbeating.
+
+    Atomic, so two resumes of the same job cannot both start it. False when
+    the job is queued, succeeded or still running.
+    """
+    stale = datetime.now(timezone.utc) - timedelta(seconds=REPLAY_STALE_S)
+    running_but_dead = and_(
+        WebhookReplayJob.status == "running",
+        or_(WebhookReplayJob.heartbeat_at.is_(None), WebhookReplayJob.heartbeat_at < stale),
+    )
+    result = db.execute(
+        update(WebhookReplayJob)
+        .where(WebhookReplayJob.id == job_id, or_(WebhookReplayJob.status == "failed", running_but_dead))
+        .values(status="queued")
+        .execution_options(synchronize_session=False)  # the commit expires loaded jobs
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+# -- process pool workers ----------------------------------------------------
+
+_worker_factory: Optional[Callable[[], Session]] = None
+
+
+def _init_worker() -> None:
+    global _worker_factory
+    from app.db import SessionLocal, engine
+
+    # Connections inherited from the parent must not be shared across processes
+    engine.dispose(close=False)
+    _worker_factory = SessionLocal
+
+
+def _replay_in_worker(rows: Sequence[Row], dry_run: bool) -> List[int]:
+    return replay_rows(_worker_factory, rows, dry_run)
+
+
+class _Shard:
+    __slots__ = ("buffer", "future", "inflight", "failed_groups")
+
+    def __init__(self) -> None:
+        self.buffer: List[Row] = []
+        self.future: Optional[Future] = None
+        self.inflight: List[Row] = []
+        self.failed_groups: Set[str] = set()
+
+    def unfinished_min(self) -> Optional[int]:
+        ids = [rows[0][0] for rows in (self.inflight, self.buffer) if rows]
+        return min(ids) if ids else None
+
+
+class _Pacer:
+    """Sleep so that no more than ``rate`` events per second are submitted."""
+
+    def __init__(self, rate: Optional[float]) -> None:
+        self.rate = rate
+        self.start = time.monotonic()
+        self.sent = 0
+
+    def wait(self, n: int) -> None:
+        if not self.rate:
+            return
+        self.sent += n
+        delay = self.start + self.sent / self.rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ReplayEngine:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        workers: int = 0,
+        batch_size: int = 500,
+    ) -> None:
+        """``workers=0`` replays in this process (required inside Celery's daemonic workers)."""
+        self.session_factory = session_factory
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def _query(self, job: WebhookReplayJob):
+        q = select(PspEvent.id, PspEvent.provider, PspEvent.group_key, PspEvent.payload)
+        if job.provider:
+            q = q.where(PspEvent.provider == job.provider)
+        if job.event_types:
+            q = q.where(PspEvent.event_type.in_(job.event_types))
+        if job.since is not None:
+            q = q.where(PspEvent.created_at >= job.since)
+        if job.until is not None:
+            q = q.where(PspEvent.created_at < job.until)
+        return q
+
+    def run(self, job_id: int) -> Dict[str, Any]:
+        read = self.session_factory()
+        write = self.session_factory()
+        # Claim the job so a duplicate dispatch cannot run it twice at once
+        claimed = write.execute(
+            update(WebhookReplayJob)
+            .where(WebhookReplayJob.id == job_id, WebhookReplayJob.status == "queued")
+            .values(status="running", heartbeat_at=datetime.now(timezone.utc))
+        ).rowcount
+        write.commit()
+        job = write.get(WebhookReplayJob, job_id)
+        if job is None or not claimed:
+            read.close()
+            write.close()
+            if job is None:
+                raise LookupError(f"webhook replay job {job_id} not found")
+            logger.warning("webhook_replay_not_queued", job_id=job_id, status=job.status)
+            return job_summary(job)
+        pool = ProcessPoolExecutor(self.workers, initializer=_init_worker) if self.workers else None
+        shards = [_Shard() for _ in range(max(1, self.workers))]
+        started = time.monotonic()
+        # Kept off the ORM object between checkpoints so the write session
+        # does not hold a read snapshot while batches commit
+        dry_run, rate_limit, last_seen = bool(job.dry_run), job.rate_limit, job.checkpoint_id or 0
+        counts = {"replayed": job.replayed or 0, "failed": job.failed or 0, "processed": 0}
+        failed_ids: Set[int] = set(job.failed_ids or [])
+        retry = sorted(failed_ids)
+
+        def settle(shard: _Shard, rows: Sequence[Row], failed: Set[int]) -> None:
+            counts["processed"] += len(rows)
+            for row in rows:
+                event_id = row[0]
+                if event_id in failed:
+                    shard.failed_groups.add(_group_of(row))
+                    if event_id not in failed_ids:
+                        failed_ids.add(event_id)
+                        counts["failed"] += 1
+                else:
+                    counts["replayed"] += 1
+                    if event_id in failed_ids:  # a retry that went through
+                        failed_ids.discard(event_id)
+                        counts["failed"] -= 1
+
+        def collect(shard: _Shard) -> None:
+            if shard.future is None:
+                return
+            failed = shard.future.result()
+            settle(shard, shard.inflight, set(failed))
+            shard.future, shard.inflight = None, []
+
+        def submit(shard: _Shard, pacer: _Pacer) -> None:
+            collect(shard)  # one batch in flight per shard keeps transactions in order
+            rows, held = [], []
+            for row in shard.buffer:
+                (held if _group_of(row) in shard.failed_groups else rows).append(row)
+            shard.buffer = []
+            if held:
+                # An earlier event of these transactions failed; applying later
+                # ones would reorder them, so they wait for the retry as well
+                settle(shard, held, {row[0] for row in held})
+            if not rows:
+                return
+            pacer.wait(len(rows))
+            shard.inflight = rows
+            if pool is None:
+                shard.future = Future()
+                shard.future.set_result(replay_rows(self.session_factory, rows, dry_run))
+            else:
+                shard.future = pool.submit(_replay_in_worker, rows, dry_run)
+
+        def add(row: Row, pacer: _Pacer) -> None:
+            shard = shards[zlib.crc32(_group_of(row).encode()) % len(shards)]
+            shard.buffer.append(row)
+            if len(shard.buffer) >= self.batch_size:
+                submit(shard, pacer)
+
+        def drain(pacer: _Pacer) -> None:
+            for shard in shards:
+                if shard.buffer:
+                    submit(shard, pacer)
+            for shard in shards:
+                collect(shard)
+
+        def checkpoint(last_seen: int) -> None:
+            pending = [m for m in (s.unfinished_min() for s in shards) if m is not None]
+            job.checkpoint_id = (min(pending) - 1) if pending else last_seen
+            job.replayed, job.failed = counts["replayed"], counts["failed"]
+            job.failed_ids = sorted(failed_ids) or None
+            job.heartbeat_at = datetime.now(timezone.utc)
+            elapsed = time.monotonic() - started
+            if elapsed > 0:
+                job.events_per_s = int(counts["processed"] / elapsed)
+            write.commit()
+
+        try:
+            job.started_at = job.started_at or datetime.now(timezone.utc)
+            job.finished_at = None
+            job.error = None
+            query = self._query(job)
+            if job.total is None:
+                job.total = read.execute(select(func.count()).select_from(query.subquery())).scalar()
+            write.commit()
+
+            pacer = _Pacer(rate_limit)
+            # Events that failed or were held back last time go first, in id
+            # order, so each transaction's events still apply in order
+            columns = (PspEvent.id, PspEvent.provider, PspEvent.group_key, PspEvent.payload)
+            for start in range(0, len(retry), self.batch_size):
+                chunk = retry[start:start + self.batch_size]
+                for row in read.execute(select(*columns).where(PspEvent.id.in_(chunk)).order_by(PspEvent.id)):
+                    add(tuple(row), pacer)
+            drain(pacer)
+            if retry:
+                checkpoint(last_seen)
+                logger.info("webhook_replay_retried", job_id=job_id, retried=len(retry), still_failed=len(failed_ids))
+
+            stream = read.execute(
+                query.where(PspEvent.id > last_seen).order_by(PspEvent.id).execution_options(yield_per=self.batch_size)
+            )
+            for partition in stream.partitions():
+                for row in partition:
+                    add(tuple(row), pacer)
+                    last_seen = row.id
+                for shard in shards:
+                    if shard.future is not None and shard.future.done():
+                        collect(shard)
+                checkpoint(last_seen)
+
+            drain(pacer)
+            checkpoint(last_seen)
+
+            job.status = "succeeded"
+            job.finished_at = datetime.now(timezone.utc)
+            write.commit()
+            logger.info(
+                "webhook_replay_finished", job_id=job_id, dry_run=job.dry_run, replayed=job.replayed,
+                failed=job.failed, events_per_s=job.events_per_s,
+            )
+            return job_summary(job)
+        except Exception as e:
+            write.rollback()
+            job = write.get(WebhookReplayJob, job_id)
+            job.status = "failed"
+            job.error = str(e)[:500]
+            job.finished_at = datetime.now(timezone.utc)
+            write.commit()
+            logger.error("webhook_replay_failed", job_id=job_id, error=str(e))
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+            read.close()
+            write.close()
+
+
+def job_summary(job: WebhookReplayJob) -> Dict[str, Any]:
+    done = (job.replayed or 0) + (job.failed or 0)
+    progress = None
+    if job.total:
+        progress = round(done / job.total, 4)
+    elif job.status == "succeeded":
+        progress = 1.0
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "provider": job.provider,
+        "event_types": job.event_types,
+        "since": job.since.isoformat() if job.since else None,
+        "until": job.until.isoformat() if job.until else None,
+        "dry_run": bool(job.dry_run),
+        "rate_limit": job.rate_limit,
+        "total": job.total,
+        "replayed": job.replayed or 0,
+        "failed": job.failed or 0,
+        "checkpoint_id": job.checkpoint_id,
+        "failed_ids": (job.failed_ids or [])[:100],  # the first 100; resume retries all of them
+        "events_per_s": job.events_per_s,
+        "progress": progress,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "heartbeat_at": job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+    }
+
+
+def default_engine(workers: int = 0) -> ReplayEngine:
+    """In-process by default (Celery task, API background task); the CLI passes --workers."""
+    from app.db import SessionLocal
+
+    return ReplayEngine(
+        SessionLocal,
+        workers=workers,
+        batch_size=int(os.getenv("WEBHOOK_REPLAY_BATCH_SIZE", "500")),
+    )
+
+
+def run_replay_job_inline(job_id: int) -> None:
+    """Fallback executor when no Celery broker is reachable."""
+    try:
+        default_engine().run(job_id)
+    except Exception:
+        pass  # recorded on the job row
+
+
+def dispatch_replay_job(job_id: int, background_tasks=None) -> str:
+    """Queue ``job_id`` on Celery; without a reachable broker run it as a background task.
+
+    Returns "celery" or "background".
+    """
+    try:
+        from app.tasks.webhook_tasks import replay_webhook_events
+        from app.worker import celery_app
+
+        with celery_app.connection_for_write() as conn:
+            # Fail fast instead of kombu's default reconnect loop
+            conn.ensure_connection(max_retries=1, interval_start=0, interval_step=0, timeout=1)
+            replay_webhook_events.apply_async(args=[job_id], connection=conn, retry=False)
+        return "celery"
+    except Exception as e:
+        if background_tasks is None:
+            raise
+        logger.warning("webhook_replay_dispatch_fallback", job_id=job_id, error=str(e))
+        background_tasks.add_task(run_replay_job_inline, job_id)
+        return "background"
@@ -51,26 +51,24 @@ def create_monthly_partitions():
     db.close()
     return {"status": "completed", "tables": tables}
 
-@shared_task(name="reconcile_transactions_daily")
-def reconcile_transactions_daily():
+@shared_task(name="ensure_time_partitions")
+def ensure_time_partitions_task():
     """
-    Daily reconciliation task to verify transaction data integrity.
+    Pre-create daily/weekly partitions for the OTP, security-log and session tables.
     """
-    db = next(get_db())
-    
-    # Find transactions with recovery_attempts but no updates in 24h
-    result = db.execute("""
-        SELECT t.id, t.external_ref, t.status, COUNT(ra.id) as attempts
-        FROM transactions t
-        LEFT JOIN recovery_attempts ra ON ra.transaction_id = t.id
-        WHERE t.status = 'failed'
-        AND t.updated_at < NOW() - INTERVAL '24 hours'
-        GROUP BY t.id
-        HAVING COUNT(ra.id) > 0
-    """).fetchall()
-    
-    logger.info("reconciliation_complete", 
-               stale_transactions=len(result))
-    
-    db.close()
-    return {"stale_transactions": len(result)}
+    from app.services.partition_service import ensure_time_partitions
+
+    created = ensure_time_partitions()
+    logger.info("time_partitions_ensured", created=created)
+    return {"created": created}
+
+@shared_task(name="drop_expired_time_partitions")
+def drop_expired_time_partitions_task():
+    """
+    Apply retention to the time-partitioned auth tables by dropping whole partitions.
+    """
+    from app.services.partition_service import drop_expired_time_partitions
+
+    removed = drop_expired_time_partitions()
+    logger.info("time_partitions_retention", removed=removed)
+    return {"removed": removed}
@@ -0,0 +1,66 @@
+"""
+Reconciliation jobs (see app.services.recon_engine).
+"""
+import os
+from datetime import datetime, timedelta, timezone
+
+from app.worker import celery_app
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# A month of orders can take well over the global 5 minute task limit
+RECON_TIME_LIMIT_S = int(os.getenv("RECON_TIME_LIMIT_S", "7200"))
+
+
+@celery_app.task(
+    name='app.tasks.recon_tasks.run_recon_job',
+    time_limit=RECON_TIME_LIMIT_S,
+    soft_time_limit=RECON_TIME_LIMIT_S - 60,
+)
+def run_recon_job(job_id: int):
+    """Reconcile one ReconJob; progress is written to the job row."""
+    from app.services.recon_engine import default_engine
+
+    logger.info("recon_job_started", job_id=job_id)
+    return default_engine().run(job_id)
+
+
+@celery_app.task(name='reconcile_transactions_daily')
+def reconcile_transactions_daily():
+    """
+    Queue an incremental reconciliation job per org with Razorpay orders in
+    the last RECON_DAILY_DAYS days. Incremental runs only re-query open,
+    mismatched and recently changed orders. Orgs whose previous job is still
+    queued or running are skipped.
+    """
+    from sqlalchemy import or_
+
+    from app.db import SessionLocal
+    from app.models import ReconJob, Transaction
+    from app.services.recon_engine import active_job
+
+    days = int(os.getenv("RECON_DAILY_DAYS", "30"))
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    db = SessionLocal()
+    try:
+        org_ids = [
+            org_id for (org_id,) in db.query(Transaction.org_id).filter(
+                Transaction.org_id.isnot(None),
+                Transaction.created_at >= since,
+                or_(Transaction.razorpay_order_id.isnot(None), Transaction.razorpay_payment_id.isnot(None)),
+            ).distinct()
+        ]
+        busy = [org_id for org_id in org_ids if active_job(db, org_id) is not None]
+        jobs = [
+            ReconJob(org_id=org_id, status="queued", mode="incremental", since=since)
+            for org_id in org_ids if org_id not in busy
+        ]
+        db.add_all(jobs)
+        db.commit()
+        for job in jobs:
+            run_recon_job.delay(job.id)
+        logger.info("recon_daily_queued", orgs=len(jobs), skipped_busy=len(busy))
+        return {"queued": [job.id for job in jobs]}
+    finally:
+        db.close()
@@ -0,0 +1,43 @@
+"""
+PSP webhook event processing (see app.services.webhook_pipeline) and replays
+(see app.services.webhook_replay).
+"""
+import os
+
+from app.worker import celery_app
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Replaying months of events can take well over the global 5 minute task limit
+WEBHOOK_REPLAY_TIME_LIMIT_S = int(os.getenv("WEBHOOK_REPLAY_TIME_LIMIT_S", "7200"))
+
+
+@celery_app.task(name='app.tasks.webhook_tasks.process_webhook_events')
+def process_webhook_events():
+    """Drain pending PspEvents in batches grouped by transaction."""
+    from app.db import SessionLocal
+    from app.services.webhook_pipeline import process_pending
+
+    db = SessionLocal()
+    try:
+        totals = process_pending(db)
+        if totals["claimed"]:
+            logger.info("webhook_events_processed", **totals)
+        return totals
+    finally:
+        db.close()
+
+
+@celery_app.task(
+    name='app.tasks.webhook_tasks.replay_webhook_events',
+    time_limit=WEBHOOK_REPLAY_TIME_LIMIT_S,
+    soft_time_limit=WEBHOOK_REPLAY_TIME_LIMIT_S - 60,
+)
+def replay_webhook_events(job_id: int):
+    """Run (or resume) one WebhookReplayJob in this worker process."""
+    from app.services.webhook_replay import default_engine
+
+    logger.info("webhook_replay_started", job_id=job_id)
+    # In-process: Celery's prefork children are daemonic and cannot start a process pool
+    return default_engine().run(job_id)
@@ -15,7 +15,8 @@ celery_app = Celery(
     'stealth_recovery',
     broker=BROKER_URL,
     backend=RESULT_BACKEND,
-    include=['app.tasks.retry_tasks', 'app.tasks.notification_tasks', 'app.tasks.partition_tasks']
+    include=['app.tasks.retry_tasks', 'app.tasks.notification_tasks', 'app.tasks.partition_tasks', 'app.tasks.recon_tasks',
+             'app.tasks.webhook_tasks']
 )
 
 # Celery configuration
@@ -45,6 +46,18 @@ celery_app.conf.beat_schedule = {
         'task': 'create_monthly_partitions',
         'schedule': crontab(day_of_month='1', hour=0, minute=5),  # 00:05 on the 1st of each month
     },
+    'ensure-time-partitions-daily': {
+        'task': 'ensure_time_partitions',
+        'schedule': crontab(hour=0, minute=15),  # 00:15 daily; a week of premade partitions covers misses
+    },
+    'drop-expired-time-partitions-daily': {
+        'task': 'drop_expired_time_partitions',
+        'schedule': crontab(hour=2, minute=30),  # 2:30 AM daily
+    },
+    'process-webhook-events': {
+        'task': 'app.tasks.webhook_tasks.process_webhook_events',
+        'schedule': 5.0,  # Safety net; routes kick a drain after each new event
+    },
     'reconcile-transactions-daily': {
         'task': 'reconcile_transactions_daily',
         'schedule': crontab(hour=3, minute=0),  # 3 AM daily
@@ -0,0 +1,38 @@
+"""recovery latency sketches
+
+Revision ID: 006_recovery_latency_sketches
+Revises: 005_partitions
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '006_recovery_latency_sketches'
+down_revision: Union[str, Sequence[str], None] = '005_partitions'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'recovery_latency_sketches',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('org_id', sa.Integer(), sa.ForeignKey('organizations.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('channel', sa.String(length=16), nullable=False),
+        sa.Column('basis', sa.String(length=16), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('sketch', sa.JSON(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.UniqueConstraint('org_id', 'day', 'channel', 'basis', name='uq_recovery_latency_sketch'),
+    )
+    op.create_index('ix_recovery_latency_sketches_org_id', 'recovery_latency_sketches', ['org_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recovery_latency_sketches_org_id', table_name='recovery_latency_sketches')
+    op.drop_table('recovery_latency_sketches')
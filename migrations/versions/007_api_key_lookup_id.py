@@ -0,0 +1,35 @@
+"""api key lookup id
+
+Revision ID: 007_api_key_lookup_id
+Revises: 006_recovery_latency_sketches
+Create Date: 2026-10-19 00:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '007_api_key_lookup_id'
+down_revision: Union[str, Sequence[str], None] = '006_recovery_latency_sketches'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing bcrypt-hashed keys keep key_id NULL and are rehashed on first use
+    with op.batch_alter_table('api_keys') as batch_op:
+        batch_op.add_column(sa.Column('key_id', sa.String(length=32), nullable=True))
+        batch_op.create_index('ix_api_keys_key_id', ['key_id'], unique=True)
+    op.create_index(
+        'ix_api_keys_legacy_prefix', 'api_keys', ['key_prefix'],
+        postgresql_where=sa.text('key_id IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_api_keys_legacy_prefix', table_name='api_keys')
+    with op.batch_alter_table('api_keys') as batch_op:
+        batch_op.drop_index('ix_api_keys_key_id')
+        batch_op.drop_column('key_id')
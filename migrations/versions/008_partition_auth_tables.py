@@ -0,0 +1,171 @@
+"""partition auth tables by created_at
+
+email_otps and mobile_otps become daily RANGE partitions, otp_security_logs
+and user_sessions weekly ones, so retention is a DROP of whole partitions
+(app.services.partition_service.drop_expired_time_partitions) instead of
+row DELETEs. Every row is copied: rows older than the partitions created
+here land in the DEFAULT partition, and the retention job deletes them once
+they are past the table's retention. Foreign keys (user_sessions.user_id ...
+ON DELETE CASCADE) are re-created as they were. Postgres only, no-op
+elsewhere; tables that do not exist yet are skipped.
+
+Revision ID: 008_partition_auth_tables
+Revises: 007_api_key_lookup_id
+Create Date: 2026-10-19 00:20:00.000000
+
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '008_partition_auth_tables'
+down_revision: Union[str, Sequence[str], None] = '007_api_key_lookup_id'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# table -> (interval days, retention buckets, premake buckets, indexes)
+# Mirrors partition_service.TIME_PARTITIONED; kept inline so the migration
+# does not import the app.
+TABLES = {
+    'email_otps': (1, 3, 7, [
+        ('ix_email_otps_email', 'email'),
+    ]),
+    'mobile_otps': (1, 3, 7, [
+        ('ix_mobile_otps_mobile_number', 'mobile_number'),
+    ]),
+    'otp_security_logs': (7, 5, 4, [
+        ('ix_otp_security_logs_email', 'email'),
+    ]),
+    'user_sessions': (7, 8, 4, [
+        ('ix_user_sessions_user_id', 'user_id'),
+        # Unique constraints on a partitioned table must include created_at;
+        # tokens are random so a plain index is enough for lookups.
+        ('ix_user_sessions_session_token', 'session_token'),
+    ]),
+}
+
+
+def _bucket_start(now: datetime, days: int) -> datetime:
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if days == 7:
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def _exists(conn, table: str) -> bool:
+    return conn.execute(sa.text("SELECT to_regclass(:t) IS NOT NULL"), {"t": f"public.{table}"}).scalar()
+
+
+def _is_partitioned(conn, table: str) -> bool:
+    return conn.execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"
+    ), {"t": f"public.{table}"}).first() is not None
+
+
+def _foreign_keys(conn, table: str):
+    return conn.execute(sa.text("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = to_regclass(:t) AND contype = 'f'
+    """), {"t": f"public.{table}"}).all()
+
+
+def _drop_indexes(conn, table: str) -> None:
+    # Index names are global; free them so the new parent can reuse them.
+    # Foreign keys own no index and stay on the legacy table; upgrade()
+    # re-creates them on the new one.
+    names = conn.execute(sa.text("""
+        SELECT i.relname FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = to_regclass(:t) AND NOT x.indisprimary
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+    """), {"t": f"public.{table}"}).scalars().all()
+    for name in names:
+        op.execute(f'DROP INDEX IF EXISTS public."{name}"')
+    cons = conn.execute(sa.text("""
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = to_regclass(:t) AND contype IN ('p', 'u')
+    """), {"t": f"public.{table}"}).scalars().all()
+    for name in cons:
+        op.execute(f'ALTER TABLE public.{table} DROP CONSTRAINT IF EXISTS "{name}"')
+
+
+def _move_sequence(conn, table: str) -> None:
+    seq = conn.execute(sa.text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": f"public.{table}_legacy"}).scalar()
+    if seq:
+        op.execute(f"ALTER SEQUENCE {seq} OWNED BY public.{table}.id")
+        op.execute(
+            f"SELECT setval('{seq}', COALESCE((SELECT MAX(id) FROM public.{table}_legacy), 0) + 1, false)"
+        )
+
+
+def _create_indexes(table: str, indexes, foreign_keys) -> None:
+    op.execute(f"ALTER TABLE public.{table} ADD PRIMARY KEY (id, created_at)")
+    for name, column in indexes:
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON public.{table} ({column})")
+    for name, definition in foreign_keys:
+        op.execute(f'ALTER TABLE public.{table} ADD CONSTRAINT "{name}" {definition}')
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        return
+
+    now = datetime.now(timezone.utc)
+    for table, (days, retention, premake, indexes) in TABLES.items():
+        if not _exists(conn, table) or _is_partitioned(conn, table):
+            continue
+        kind = 'd' if days == 1 else 'w'
+        step = timedelta(days=days)
+        current = _bucket_start(now, days)
+
+        foreign_keys = _foreign_keys(conn, table)
+        _drop_indexes(conn, table)
+        op.execute(f"ALTER TABLE public.{table} RENAME TO {table}_legacy")
+        op.execute(
+            f"CREATE TABLE public.{table} (LIKE public.{table}_legacy INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE (created_at)"
+        )
+        _move_sequence(conn, table)
+        op.execute(f"CREATE TABLE public.{table}_default PARTITION OF public.{table} DEFAULT")
+        for i in range(-(retention - 1), premake + 1):
+            start = current + step * i
+            op.execute(
+                f"CREATE TABLE public.{table}_{kind}{start:%Y%m%d} PARTITION OF public.{table} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{(start + step).isoformat()}')"
+            )
+        op.execute(f"INSERT INTO public.{table} SELECT * FROM public.{table}_legacy")
+        op.execute(f"DROP TABLE public.{table}_legacy")
+        _create_indexes(table, indexes, foreign_keys)
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        return
+
+    for table, (_, _, _, indexes) in TABLES.items():
+        if not _is_partitioned(conn, table):
+            continue
+        foreign_keys = _foreign_keys(conn, table)
+        op.execute(f"ALTER TABLE public.{table} RENAME TO {table}_parted")
+        op.execute(f"CREATE TABLE public.{table} (LIKE public.{table}_parted INCLUDING DEFAULTS)")
+        seq = conn.execute(sa.text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": f"public.{table}_parted"}).scalar()
+        if seq:
+            op.execute(f"ALTER SEQUENCE {seq} OWNED BY public.{table}.id")
+        op.execute(f"INSERT INTO public.{table} SELECT * FROM public.{table}_parted")
+        # Drops the parent together with every partition and its indexes
+        op.execute(f"DROP TABLE public.{table}_parted")
+        op.execute(f"ALTER TABLE public.{table} ADD PRIMARY KEY (id)")
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_id ON public.{table} (id)")
+        for name, column in indexes:
+            unique = "UNIQUE " if name == 'ix_user_sessions_session_token' else ""
+            op.execute(f"CREATE {unique}INDEX IF NOT EXISTS {name} ON public.{table} ({column})")
+        for name, definition in foreign_keys:
+            op.execute(f'ALTER TABLE public.{table} ADD CONSTRAINT "{name}" {definition}')
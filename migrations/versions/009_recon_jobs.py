@@ -0,0 +1,42 @@
+"""recon jobs
+
+Revision ID: 009_recon_jobs
+Revises: 008_partition_auth_tables
+Create Date: 2026-10-19 00:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '009_recon_jobs'
+down_revision: Union[str, Sequence[str], None] = '008_partition_auth_tables'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'recon_jobs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('org_id', sa.Integer(), sa.ForeignKey('organizations.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False, server_default='queued'),
+        sa.Column('since', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=True),
+        sa.Column('checked', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('ok', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('mismatches', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('fetch_errors', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index('ix_recon_jobs_org_id', 'recon_jobs', ['org_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recon_jobs_org_id', table_name='recon_jobs')
+    op.drop_table('recon_jobs')
@@ -0,0 +1,48 @@
+"""incremental recon state
+
+Revision ID: 010_recon_state
+Revises: 009_recon_jobs
+Create Date: 2026-10-19 00:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '010_recon_state'
+down_revision: Union[str, Sequence[str], None] = '009_recon_jobs'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('recon_jobs') as batch_op:
+        batch_op.add_column(sa.Column('mode', sa.String(length=16), nullable=False, server_default='incremental'))
+        batch_op.add_column(sa.Column('watermark', sa.DateTime(timezone=True), nullable=True))
+        batch_op.add_column(sa.Column('skipped', sa.Integer(), nullable=False, server_default='0'))
+    op.create_table(
+        'recon_states',
+        sa.Column('transaction_id', sa.Integer(), sa.ForeignKey('transactions.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('org_id', sa.Integer(), sa.ForeignKey('organizations.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('state', sa.String(length=16), nullable=False),
+        sa.Column('internal_status', sa.String(length=32), nullable=False),
+        sa.Column('external_status', sa.String(length=32), nullable=True),
+        sa.Column('checks', sa.Integer(), nullable=False, server_default='1'),
+        sa.Column('first_checked_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('last_checked_at', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index('ix_recon_states_org_state', 'recon_states', ['org_id', 'state'])
+    # Finding last run's watermark per org
+    op.create_index('ix_recon_jobs_org_status', 'recon_jobs', ['org_id', 'status', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recon_jobs_org_status', table_name='recon_jobs')
+    op.drop_index('ix_recon_states_org_state', table_name='recon_states')
+    op.drop_table('recon_states')
+    with op.batch_alter_table('recon_jobs') as batch_op:
+        batch_op.drop_column('skipped')
+        batch_op.drop_column('watermark')
+        batch_op.drop_column('mode')
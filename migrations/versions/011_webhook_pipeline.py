@@ -0,0 +1,58 @@
+"""psp event processing state for the fast-ack webhook pipeline
+
+Revision ID: 011_webhook_pipeline
+Revises: 010_recon_state
+Create Date: 2026-10-19 00:50:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '011_webhook_pipeline'
+down_revision: Union[str, Sequence[str], None] = '010_recon_state'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if not sa.inspect(op.get_bind()).has_table('psp_events'):
+        # Until now the table was only created by the app's startup create_all
+        op.create_table(
+            'psp_events',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('provider', sa.String(length=32), nullable=False),
+            sa.Column('event_type', sa.String(length=64), nullable=False),
+            sa.Column('psp_event_id', sa.String(length=160), nullable=False),
+            sa.Column('payload', sa.JSON(), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        )
+        op.create_index('ix_psp_events_psp_event_id', 'psp_events', ['psp_event_id'], unique=True)
+
+    # Existing rows were applied inline by the old handlers
+    with op.batch_alter_table('psp_events') as batch_op:
+        batch_op.add_column(sa.Column('group_key', sa.String(length=160), nullable=True))
+        batch_op.add_column(sa.Column('status', sa.String(length=16), nullable=False, server_default='processed'))
+        batch_op.add_column(sa.Column('attempts', sa.Integer(), nullable=False, server_default='1'))
+        batch_op.add_column(sa.Column('error', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True))
+    op.execute("UPDATE psp_events SET processed_at = created_at")
+    with op.batch_alter_table('psp_events') as batch_op:
+        batch_op.alter_column('status', server_default='pending')
+        batch_op.alter_column('attempts', server_default='0')
+    op.create_index(
+        'ix_psp_events_pending', 'psp_events', ['id'],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_psp_events_pending', table_name='psp_events')
+    with op.batch_alter_table('psp_events') as batch_op:
+        batch_op.drop_column('processed_at')
+        batch_op.drop_column('error')
+        batch_op.drop_column('attempts')
+        batch_op.drop_column('status')
+        batch_op.drop_column('group_key')
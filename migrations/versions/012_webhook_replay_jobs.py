@@ -0,0 +1,47 @@
+"""webhook replay jobs
+
+Revision ID: 012_webhook_replay_jobs
+Revises: 011_webhook_pipeline
+Create Date: 2026-10-19 01:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '012_webhook_replay_jobs'
+down_revision: Union[str, Sequence[str], None] = '011_webhook_pipeline'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'webhook_replay_jobs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('status', sa.String(length=16), nullable=False, server_default='queued'),
+        sa.Column('provider', sa.String(length=32), nullable=True),
+        sa.Column('event_types', sa.JSON(), nullable=True),
+        sa.Column('since', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('until', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('dry_run', sa.Boolean(), nullable=False, server_default=sa.text('false')),
+        sa.Column('rate_limit', sa.Integer(), nullable=True),
+        sa.Column('total', sa.Integer(), nullable=True),
+        sa.Column('replayed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('failed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('checkpoint_id', sa.Integer(), nullable=True),
+        sa.Column('events_per_s', sa.Integer(), nullable=True),
+        sa.Column('error', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    # Replay filters on provider/type/time and streams in id order
+    op.create_index('ix_psp_events_provider_type_created', 'psp_events', ['provider', 'event_type', 'created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_psp_events_provider_type_created', table_name='psp_events')
+    op.drop_table('webhook_replay_jobs')
@@ -0,0 +1,25 @@
+"""organization allowed psps
+
+Revision ID: 013_org_allowed_psps
+Revises: 012_webhook_replay_jobs
+Create Date: 2026-10-19 01:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '013_org_allowed_psps'
+down_revision: Union[str, Sequence[str], None] = '012_webhook_replay_jobs'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('organizations', sa.Column('allowed_psps', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('organizations', 'allowed_psps')
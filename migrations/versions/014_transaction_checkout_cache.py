@@ -0,0 +1,25 @@
+"""transaction checkout cache
+
+Revision ID: 014_transaction_checkout_cache
+Revises: 013_org_allowed_psps
+Create Date: 2026-10-19 01:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '014_transaction_checkout_cache'
+down_revision: Union[str, Sequence[str], None] = '013_org_allowed_psps'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('transactions', sa.Column('checkout_cache', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('transactions', 'checkout_cache')
@@ -0,0 +1,27 @@
+"""transaction razorpay payment link id
+
+Revision ID: 015_transaction_razorpay_payment_link
+Revises: 014_transaction_checkout_cache
+Create Date: 2026-10-19 01:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '015_transaction_razorpay_payment_link'
+down_revision: Union[str, Sequence[str], None] = '014_transaction_checkout_cache'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('transactions', sa.Column('razorpay_payment_link_id', sa.String(length=128), nullable=True))
+    op.create_index('ix_transactions_razorpay_payment_link_id', 'transactions', ['razorpay_payment_link_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transactions_razorpay_payment_link_id', table_name='transactions')
+    op.drop_column('transactions', 'razorpay_payment_link_id')
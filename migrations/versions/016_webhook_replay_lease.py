@@ -0,0 +1,27 @@
+"""webhook replay heartbeat and failed event ids
+
+Revision ID: 016_webhook_replay_lease
+Revises: 015_transaction_razorpay_payment_link
+Create Date: 2026-10-19 02:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '016_webhook_replay_lease'
+down_revision: Union[str, Sequence[str], None] = '015_transaction_razorpay_payment_link'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('webhook_replay_jobs', sa.Column('failed_ids', sa.JSON(), nullable=True))
+    op.add_column('webhook_replay_jobs', sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('webhook_replay_jobs', 'heartbeat_at')
+    op.drop_column('webhook_replay_jobs', 'failed_ids')
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+analytics_scan.py
+
+Scan the partitioned analytics object store for a date range and print
+matching records as NDJSON (or a count). Only files listed in the per-day
+manifests that overlap the range are fetched.
+
+Usage:
+  python scripts/analytics_scan.py --store file:///tmp/analytics --from 2025-01-01 --to 2025-01-02
+  python scripts/analytics_scan.py --bucket tinko-analytics --endpoint http://localhost:9000 \\
+      --from 2025-01-01T00:00:00Z --to 2025-01-01T06:00:00Z --event-type payment_result --count
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.analytics.object_store import LocalObjectStore, S3ObjectStore, scan  # noqa: E402
+
+
+def _parse(value: str) -> datetime:
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--store", help="file:///path for a local store")
+    ap.add_argument("--bucket", help="S3/MinIO bucket name")
+    ap.add_argument("--endpoint", help="S3 endpoint URL (MinIO)")
+    ap.add_argument("--prefix", default="analytics")
+    ap.add_argument("--from", dest="start", required=True)
+    ap.add_argument("--to", dest="end", required=True)
+    ap.add_argument("--event-type")
+    ap.add_argument("--count", action="store_true", help="print only the number of matching records")
+    args = ap.parse_args()
+
+    if args.store and args.store.startswith("file://"):
+        store = LocalObjectStore(args.store[len("file://"):])
+    elif args.bucket:
+        store = S3ObjectStore(args.bucket, endpoint_url=args.endpoint)
+    else:
+        ap.error("either --store file://... or --bucket is required")
+
+    n = 0
+    for rec in scan(store, _parse(args.start), _parse(args.end), event_type=args.event_type, prefix=args.prefix):
+        n += 1
+        if not args.count:
+            sys.stdout.write(json.dumps(rec) + "\n")
+    if args.count:
+        print(n)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+analytics_columnar.py
+
+Benchmark the /v1/analytics endpoint functions on the SQL path against the
+columnar NumPy cache (FEATURE_ANALYTICS_COLUMNAR) for one synthetic org.
+
+Usage:
+  python scripts/bench/analytics_columnar.py --rows 200000
+  python scripts/bench/analytics_columnar.py --db-url postgresql+psycopg2://... --rows 1000000 --repeat 20
+
+Without --db-url an in-memory SQLite database is seeded; numbers against
+Postgres are the ones that matter for capacity planning.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+os.environ.setdefault("DATABASE_URL", "postgresql://bench@localhost/bench")
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.analytics import columnar  # noqa: E402
+from app.db import Base  # noqa: E402
+from app.models import FailureEvent, Organization, RecoveryAttempt, Transaction  # noqa: E402
+from app.routers import analytics  # noqa: E402
+
+STATUSES = ["created", "sent", "opened", "completed", "expired"]
+CHANNELS = ["email", "sms", "whatsapp", "link"]
+REASONS = ["insufficient_funds", "card_declined", "network_error", "expired_card"]
+
+
+def seed(db, rows: int, days: int) -> None:
+    now = datetime.now(timezone.utc)
+    db.add(Organization(id=1, name="Bench", slug="bench"))
+    db.commit()
+    rnd = random.Random(7)
+    chunk = 10000
+    for base in range(0, rows, chunk):
+        n = min(chunk, rows - base)
+        created = [now - timedelta(seconds=rnd.randint(0, days * 86400)) for _ in range(n)]
+        db.execute(insert(Transaction), [
+            {"id": base + i + 1, "transaction_ref": f"tx{base + i}", "amount": rnd.randint(100, 100000),
+             "currency": "INR", "org_id": 1, "created_at": created[i]} for i in range(n)
+        ])
+        db.execute(insert(RecoveryAttempt), [
+            {"transaction_id": base + i + 1, "token": f"t{base + i}", "status": rnd.choice(STATUSES),
+             "channel": rnd.choice(CHANNELS), "expires_at": now, "created_at": created[i]} for i in range(n)
+        ])
+        db.execute(insert(FailureEvent), [
+            {"transaction_id": base + i + 1, "reason": rnd.choice(REASONS), "created_at": created[i]} for i in range(n)
+        ])
+        db.commit()
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db-url", default="sqlite://")
+    ap.add_argument("--rows", type=int, default=200000)
+    ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--repeat", type=int, default=10)
+    args = ap.parse_args()
+
+    if not columnar.available():
+        print("numpy is not installed; pip install numpy")
+        return 1
+
+    engine = create_engine(args.db_url)
+    tables = [Base.metadata.tables[t] for t in ("organizations", "transactions", "failure_events", "recovery_attempts")]
+    Base.metadata.create_all(engine, tables=tables)
+    db = sessionmaker(bind=engine)()
+    t0 = time.perf_counter()
+    seed(db, args.rows, args.days)
+    print(f"seeded {args.rows} attempts in {time.perf_counter() - t0:.1f}s")
+
+    user = SimpleNamespace(org_id=1)
+    start = (datetime.now(timezone.utc) - timedelta(days=args.days - 1)).isoformat()
+    calls = {
+        "revenue_recovered": lambda: analytics.revenue_recovered(start, None, user, db),
+        "recovery_rate": lambda: analytics.recovery_rate(start, None, user, db),
+        "attempts_summary": lambda: analytics.attempts_summary(start, None, user, db),
+        "funnel": lambda: analytics.funnel(start, None, user, db),
+    }
+
+    os.environ["FEATURE_ANALYTICS_COLUMNAR"] = "off"
+    sql = {name: timed(fn, args.repeat) for name, fn in calls.items()}
+    sql_results = {name: fn() for name, fn in calls.items()}
+
+    os.environ["FEATURE_ANALYTICS_COLUMNAR"] = "on"
+    os.environ["ANALYTICS_COLUMNAR_REFRESH_S"] = "3600"
+    t0 = time.perf_counter()
+    columnar.snapshot_for(db, 1, datetime.now(timezone.utc))
+    print(f"initial snapshot load {(time.perf_counter() - t0) * 1000:.0f} ms, "
+          f"{columnar.cache_stats()['bytes'] / 1e6:.1f} MB")
+    col = {name: timed(fn, args.repeat) for name, fn in calls.items()}
+
+    print(f"{'endpoint':<20}{'sql ms':>10}{'columnar ms':>14}{'speedup':>10}  same result")
+    for name, fn in calls.items():
+        result = fn()
+        if name == "attempts_summary":  # by_channel is only computed on the columnar path
+            result = {**result, "by_channel": {}}
+        # "to" defaults to now, so it differs between calls
+        same = {k: v for k, v in result.items() if k != "to"} == {k: v for k, v in sql_results[name].items() if k != "to"}
+        print(f"{name:<20}{sql[name]:>10.2f}{col[name]:>14.3f}{sql[name] / max(col[name], 1e-6):>9.0f}x  {same}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
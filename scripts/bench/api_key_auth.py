@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+api_key_auth.py
+
+Show that API-key authentication cost stays flat as the key table grows.
+Seeds 1k/10k/100k keys and times resolve_api_key() for random valid keys,
+then times the old approach (bcrypt check per active key) on a small table
+and extrapolates it.
+
+Usage:
+  python scripts/bench/api_key_auth.py
+  python scripts/bench/api_key_auth.py --db-url postgresql+psycopg2://... --sizes 1000,100000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+os.environ.setdefault("DATABASE_URL", "postgresql://bench@localhost/bench")
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.api_auth import resolve_api_key  # noqa: E402
+from app.db import Base  # noqa: E402
+from app.models import ApiKey, Organization, User  # noqa: E402
+from app.security import api_key_lookup_id, hash_api_key, hash_password, verify_password  # noqa: E402
+
+
+def seed(db, start: int, end: int, keys: list) -> None:
+    rows = []
+    for i in range(start, end):
+        plain = ApiKey.generate_key()
+        keys.append(plain)
+        rows.append({"user_id": 1, "key_name": f"k{i}", "key_id": api_key_lookup_id(plain),
+                     "key_hash": hash_api_key(plain), "key_prefix": plain[:8], "scopes": ["read"],
+                     "is_active": True, "usage_count": 0})
+        if len(rows) == 5000:
+            db.execute(insert(ApiKey), rows)
+            rows = []
+    if rows:
+        db.execute(insert(ApiKey), rows)
+    db.commit()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db-url", default="sqlite://")
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--lookups", type=int, default=2000)
+    args = ap.parse_args()
+
+    engine = create_engine(args.db_url)
+    Base.metadata.create_all(engine, tables=[Base.metadata.tables[t] for t in ("organizations", "users", "api_keys")])
+    db = sessionmaker(bind=engine)()
+    db.add(Organization(id=1, name="Bench", slug="bench"))
+    db.add(User(id=1, email="bench@example.com", org_id=1))
+    db.commit()
+
+    keys: list = []
+    print(f"{'keys':>8}{'p50 us':>10}{'p99 us':>10}")
+    for size in sorted(int(s) for s in args.sizes.split(",")):
+        seed(db, len(keys), size, keys)
+        rnd = random.Random(size)
+        samples = []
+        for _ in range(args.lookups):
+            key = rnd.choice(keys)
+            t0 = time.perf_counter()
+            assert resolve_api_key(db, key) is not None
+            samples.append((time.perf_counter() - t0) * 1e6)
+            db.expunge_all()
+        samples.sort()
+        print(f"{size:>8}{statistics.median(samples):>10.0f}{samples[int(len(samples) * 0.99)]:>10.0f}")
+
+    # Previous scheme: bcrypt.checkpw against every active key until a match
+    hashed = hash_password(keys[0])
+    t0 = time.perf_counter()
+    for _ in range(5):
+        verify_password(keys[0], hashed)
+    per_check = (time.perf_counter() - t0) / 5
+    print(f"bcrypt scan (old path): {per_check * 1000:.0f} ms per key checked; "
+          f"~{per_check * len(keys) / 2:.0f} s average at {len(keys)} keys")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
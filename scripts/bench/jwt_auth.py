@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+jwt_auth.py
+
+Auth overhead per request, in microseconds:
+
+  decode        decode_jwt with the claims cache disabled vs warm
+  guardrail     events ingest org assignment: decode + users lookup vs claims only
+  roles         require_roles_or_token: DB user lookup vs claims (cold and warm cache)
+
+The database is SQLite (in memory by default), so the lookup columns are a
+lower bound on what a networked Postgres round trip costs.
+
+Usage:
+  python scripts/bench/jwt_auth.py
+  python scripts/bench/jwt_auth.py --db-url postgresql+psycopg2://... -n 20000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+os.environ.setdefault("DATABASE_URL", "postgresql://bench@localhost/bench")
+
+from fastapi.security import HTTPAuthorizationCredentials  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+import app.security as security  # noqa: E402
+from app import models  # noqa: E402
+from app.core.jwt_cache import ClaimsCache  # noqa: E402
+from app.db import Base  # noqa: E402
+from app.deps import get_current_user, require_roles_or_token  # noqa: E402
+from app.security import create_jwt, decode_jwt  # noqa: E402
+
+
+def per_call_us(fn, n: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db-url", default="sqlite://")
+    ap.add_argument("-n", type=int, default=10000)
+    args = ap.parse_args()
+
+    kw = {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}} if args.db_url == "sqlite://" else {}
+    engine = create_engine(args.db_url, **kw)
+    Base.metadata.create_all(engine, tables=[Base.metadata.tables["organizations"], Base.metadata.tables["users"]])
+    db = sessionmaker(bind=engine)()
+    org = models.Organization(name="Bench", slug=f"bench-{os.getpid()}")
+    db.add(org)
+    db.flush()
+    user = models.User(email=f"bench-{os.getpid()}@bench.dev", role="admin", org_id=org.id, is_active=True)
+    db.add(user)
+    db.commit()
+
+    token = create_jwt({"user_id": user.id, "org_id": user.org_id, "role": user.role})
+    creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    roles = require_roles_or_token(["admin"])
+
+    def guardrail_db():
+        claims = decode_jwt(token)
+        u = db.query(models.User).filter(models.User.id == claims["user_id"]).first()
+        return u.org_id
+
+    def guardrail_claims():
+        return decode_jwt(token)["org_id"]
+
+    rows = []
+    security.get_claims_cache = lambda: ClaimsCache(max_entries=0)
+    rows.append(("decode", "uncached", per_call_us(lambda: decode_jwt(token), args.n)))
+    rows.append(("guardrail", "decode+users", per_call_us(guardrail_db, args.n)))
+    rows.append(("roles", "db user", per_call_us(lambda: get_current_user(creds, db), args.n)))
+    rows.append(("roles", "claims cold", per_call_us(lambda: roles(creds, db), args.n)))
+
+    warm = ClaimsCache()
+    security.get_claims_cache = lambda: warm
+    rows.append(("decode", "cached", per_call_us(lambda: decode_jwt(token), args.n)))
+    rows.append(("guardrail", "claims", per_call_us(guardrail_claims, args.n)))
+    rows.append(("roles", "claims warm", per_call_us(lambda: roles(creds, db), args.n)))
+
+    print(f"{'path':<12}{'variant':<16}{'us/request':>12}   (n={args.n}, db={engine.url.get_backend_name()})")
+    for path, variant, us in rows:
+        print(f"{path:<12}{variant:<16}{us:>12.1f}")
+    db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
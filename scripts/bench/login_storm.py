@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+login_storm.py
+
+Show that a burst of password logins no longer stalls other requests.
+Serves a tiny app with uvicorn that has a cheap /ping endpoint and three
+login variants: bcrypt inline in an ``async def`` (the stall this fixes),
+an ``async def`` awaiting the bounded executor, and a sync ``def`` on
+FastAPI's threadpool using the executor's blocking path (how the auth
+router's login runs, DB lookup included). For each variant, fires a login
+storm while sampling /ping latency, then prints /ping p50/p99 and how many
+logins were answered or shed with 503.
+
+Usage:
+  python scripts/bench/login_storm.py
+  python scripts/bench/login_storm.py --rounds 12 --logins 200 --concurrency 50
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+os.environ.setdefault("DATABASE_URL", "postgresql://bench@localhost/bench")
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+from app.core.password_hasher import PasswordHasher  # noqa: E402
+from app.security import hash_password, verify_password  # noqa: E402
+
+
+def build_app(hasher: PasswordHasher, hashed: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.post("/login/inline")
+    async def login_inline():
+        return {"ok": verify_password("wrong", hashed)}
+
+    @app.post("/login/offload")
+    async def login_offload():
+        return {"ok": await hasher.verify("wrong", hashed)}
+
+    @app.post("/login/sync")
+    def login_sync():
+        return {"ok": hasher.verify_sync("wrong", hashed)}
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def storm(base: str, variant: str, logins: int, concurrency: int, ping_every: float) -> dict:
+    limits = httpx.Limits(max_connections=concurrency + 5)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=120) as client:
+        await client.get("/ping")
+        done = asyncio.Event()
+        codes: dict = {}
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one_login():
+            async with sem:
+                r = await client.post(f"/login/{variant}")
+                codes[r.status_code] = codes.get(r.status_code, 0) + 1
+
+        async def pinger():
+            samples = []
+            while not done.is_set():
+                t0 = time.perf_counter()
+                await client.get("/ping")
+                samples.append((time.perf_counter() - t0) * 1000)
+                await asyncio.sleep(ping_every)
+            return samples
+
+        ping_task = asyncio.create_task(pinger())
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one_login() for _ in range(logins)))
+        elapsed = time.perf_counter() - t0
+        done.set()
+        samples = await ping_task
+    samples.sort()
+    return {
+        "ping_p50": statistics.median(samples),
+        "ping_p99": samples[min(len(samples) - 1, int(0.99 * len(samples)))],
+        "ping_max": samples[-1],
+        "pings": len(samples),
+        "codes": codes,
+        "seconds": elapsed,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rounds", type=int, default=10, help="bcrypt cost for the stored hash")
+    ap.add_argument("--logins", type=int, default=120)
+    ap.add_argument("--concurrency", type=int, default=40)
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--max-queue", type=int, default=16)
+    ap.add_argument("--ping-every", type=float, default=0.01)
+    args = ap.parse_args()
+
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    hashed = hash_password("secret")
+    hasher = PasswordHasher(workers=args.workers, max_queue=args.max_queue)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(build_app(hasher, hashed), port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base = f"http://127.0.0.1:{port}"
+    print(f"bcrypt cost={args.rounds} logins={args.logins} concurrency={args.concurrency} "
+          f"executor={args.workers} workers/{args.max_queue} queue")
+    print(f"{'variant':<10}{'ping p50':>10}{'ping p99':>10}{'ping max':>10}{'pings':>8}  login status codes")
+    for variant in ("inline", "offload", "sync"):
+        r = asyncio.run(storm(base, variant, args.logins, args.concurrency, args.ping_every))
+        codes = ", ".join(f"{k}: {v}" for k, v in sorted(r["codes"].items()))
+        print(f"{variant:<10}{r['ping_p50']:>8.1f}ms{r['ping_p99']:>8.1f}ms{r['ping_max']:>8.1f}ms{r['pings']:>8}  {codes}")
+    print(f"executor stats: {hasher.stats()}")
+
+    server.should_exit = True
+    thread.join(5)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+otp_store.py
+
+OTP requests and verifications per second through app.core.otp_store, in
+Redis mode and in degraded (database) mode. Each operation commits, as the
+OTP endpoints do. Redis mode is skipped when no server answers at
+--redis-url.
+
+Usage:
+  python scripts/bench/otp_store.py
+  python scripts/bench/otp_store.py --db-url postgresql+psycopg2://... --redis-url redis://localhost:6379 -n 5000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+os.environ.setdefault("DATABASE_URL", "postgresql://bench@localhost/bench")
+
+from sqlalchemy import create_engine, func, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.core.otp_store import VERIFIED, OTPStore  # noqa: E402
+from app.db import Base  # noqa: E402
+from app.models import EmailOTP  # noqa: E402
+
+
+async def run_mode(store: OTPStore, Session, n: int) -> tuple:
+    db = Session()
+    subjects = [f"user{i}@bench.dev" for i in range(n)]
+    t0 = time.perf_counter()
+    for s in subjects:
+        await store.issue(db, "email", s, "123456", 600)
+        db.commit()
+    issue_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    ok = 0
+    for s in subjects:
+        ok += await store.verify(db, "email", s, "123456") == VERIFIED
+        db.commit()
+    verify_s = time.perf_counter() - t0
+    db.close()
+    assert ok == n, f"only {ok}/{n} verified"
+    return n / issue_s, n / verify_s
+
+
+async def redis_manager_for(url: str):
+    try:
+        import redis.asyncio as aioredis
+        client = aioredis.from_url(url, decode_responses=True, socket_connect_timeout=2)
+        await client.ping()
+    except Exception as e:
+        print(f"redis     skipped (no server at {url}: {e})")
+        return None
+    return SimpleNamespace(redis_client=client, is_available=True)
+
+
+async def main_async(args) -> int:
+    engine = create_engine(args.db_url)
+    Base.metadata.create_all(engine, tables=[Base.metadata.tables["email_otps"]])
+    Session = sessionmaker(bind=engine)
+
+    print(f"{'mode':<10}{'requests/s':>12}{'verifies/s':>12}   (n={args.n}, db={engine.url.get_backend_name()})")
+    issue, verify = await run_mode(OTPStore(SimpleNamespace(redis_client=None, is_available=False)), Session, args.n)
+    print(f"{'database':<10}{issue:>12.0f}{verify:>12.0f}")
+    with engine.begin() as conn:
+        conn.execute(EmailOTP.__table__.delete())
+
+    manager = await redis_manager_for(args.redis_url)
+    if manager is not None:
+        issue, verify = await run_mode(OTPStore(manager, prefix="otpbench"), Session, args.n)
+        print(f"{'redis':<10}{issue:>12.0f}{verify:>12.0f}")
+        with engine.connect() as conn:
+            rows = conn.execute(select(func.count()).select_from(EmailOTP.__table__)).scalar()
+        print(f"rows written to email_otps in redis mode: {rows}")
+        await manager.redis_client.aclose()
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db-url", default=f"sqlite:///{tempfile.gettempdir()}/otp_bench.db")
+    ap.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379"))
+    ap.add_argument("-n", type=int, default=2000)
+    args = ap.parse_args()
+    try:
+        return asyncio.run(main_async(args))
+    finally:
+        if args.db_url.startswith("sqlite:///") and "otp_bench.db" in args.db_url:
+            Path(args.db_url[len("sqlite:///"):]).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
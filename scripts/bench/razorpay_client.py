@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+razorpay_client.py
+
+Order-status calls per second against a local Razorpay stand-in server
+(uvicorn on 127.0.0.1, plain HTTP, optional --latency-ms per response):
+
+  sync   per-call client   anyio.run + new AsyncClient per call (previous adapter)
+  sync   background loop   RazorpayAdapter.get_order_status (shared client)
+  async  per-call client   new AsyncClient per call, --concurrency in flight
+  async  shared client     RazorpayAdapter.get_order_status_async, --concurrency in flight
+
+No TLS locally, so the per-call numbers understate the real handshake cost.
+
+Usage:
+  python scripts/bench/razorpay_client.py
+  python scripts/bench/razorpay_client.py -n 2000 --concurrency 50 --latency-ms 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+import anyio  # noqa: E402
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+
+def stand_in(latency_s: float) -> Starlette:
+    async def order(request):
+        if latency_s:
+            await asyncio.sleep(latency_s)
+        oid = request.path_params["order_id"]
+        return JSONResponse({"id": oid, "entity": "order", "status": "paid", "amount": 50000, "currency": "INR"})
+
+    return Starlette(routes=[Route("/v1/orders/{order_id}", order)])
+
+
+def serve(app: Starlette) -> str:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+
+async def legacy_get(base: str, auth: dict, order_id: str) -> dict:
+    async with httpx.AsyncClient(timeout=15) as client:
+        r = await client.get(f"{base}/v1/orders/{order_id}", headers=auth)
+        r.raise_for_status()
+        return r.json()
+
+
+async def bounded(n: int, concurrency: int, call) -> None:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            await call(f"order_{i}")
+
+    await asyncio.gather(*(one(i) for i in range(n)))
+
+
+def rate(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return n / (time.perf_counter() - t0)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-n", type=int, default=500)
+    ap.add_argument("--concurrency", type=int, default=20)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    args = ap.parse_args()
+
+    base = serve(stand_in(args.latency_ms / 1000))
+    os.environ.update(RAZORPAY_API_BASE=base, RAZORPAY_KEY_ID="rzp_bench", RAZORPAY_KEY_SECRET="bench")
+    from app.services.payments.razorpay_adapter import RazorpayAdapter
+
+    adapter = RazorpayAdapter()
+    auth = adapter._auth_header
+    n, c = args.n, args.concurrency
+
+    def sync_legacy():
+        for i in range(n):
+            anyio.run(legacy_get, base, auth, f"order_{i}")
+
+    def sync_background():
+        for i in range(n):
+            adapter.get_order_status(f"order_{i}")
+
+    def async_legacy():
+        asyncio.run(bounded(n, c, lambda oid: legacy_get(base, auth, oid)))
+
+    def async_shared():
+        asyncio.run(bounded(n, c, adapter.get_order_status_async))
+
+    adapter.get_order_status("warmup")
+    print(f"{'mode':<8}{'client':<20}{'calls/s':>10}   (n={n}, concurrency={c}, latency={args.latency_ms}ms)")
+    for mode, client, fn in (
+        ("sync", "per-call client", sync_legacy),
+        ("sync", "background loop", sync_background),
+        ("async", "per-call client", async_legacy),
+        ("async", "shared client", async_shared),
+    ):
+        print(f"{mode:<8}{client:<20}{rate(fn, n):>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+psp_simulator.py
+
+Run the local Razorpay/Stripe simulator (app/psp/simulator.py) for load tests
+and CI, or fire a storm of signed webhooks at the app.
+
+  serve  the simulator on --host/--port; point the app at it with
+         RAZORPAY_API_BASE=http://HOST:PORT/razorpay
+         STRIPE_API_BASE=http://HOST:PORT/stripe
+         Tune it while it runs with POST /_sim/config, read GET /_sim/stats.
+  storm  pay --count synthetic orders/sessions and POST their signed webhooks
+         to --target (the app), --concurrency at a time; prints ack latency.
+
+Webhooks are signed with RAZORPAY_WEBHOOK_SECRET / STRIPE_WEBHOOK_SECRET, so
+use the app's values. Fault settings default to PSP_SIM_* (see .env.example).
+
+Usage:
+  python scripts/psp_simulator.py serve --port 8099 --latency lognormal:80:0.5 --error-rate 0.02
+  python scripts/psp_simulator.py serve --rate-limit 100 --webhook-url http://localhost:8000
+  python scripts/psp_simulator.py storm --provider razorpay --count 5000 --concurrency 100 \\
+      --duplicate-rate 0.1 --target http://localhost:8000
+  python scripts/psp_simulator.py storm --provider stripe --refs R-1,R-2 --target http://localhost:8000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.psp.simulator import PROVIDERS, PSPSimulator, SimConfig, create_app  # noqa: E402
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="run the simulator")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8099)
+    serve.add_argument("--provider", choices=PROVIDERS, help="apply the fault options to one PSP only")
+    serve.add_argument("--latency", help="fixed:MS, uniform:LO:HI, lognormal:MEDIAN:SIGMA or exp:MEAN")
+    serve.add_argument("--error-rate", type=float, help="share of requests answered with a 500")
+    serve.add_argument("--rate-limit", type=float, help="requests per second per PSP before 429s")
+    serve.add_argument("--burst", type=int, help="rate limit bucket size")
+    serve.add_argument("--webhook-url", help="app base URL that /_sim/{provider}/pay/{id} delivers to")
+    serve.add_argument("--seed", type=int, help="seed latency/error sampling for repeatable runs")
+
+    storm = sub.add_parser("storm", help="send signed webhooks to the app")
+    storm.add_argument("--provider", choices=PROVIDERS, required=True)
+    storm.add_argument("--target", required=True, help="app base URL, e.g. http://localhost:8000")
+    storm.add_argument("--count", type=int, default=1000, help="payments (each sends two events)")
+    storm.add_argument("--concurrency", type=int, default=50)
+    storm.add_argument("--duplicate-rate", type=float, default=0.0, help="share of events delivered twice")
+    storm.add_argument("--refs", help="comma-separated transaction_refs to attach to the payments")
+    storm.add_argument("--seed", type=int)
+    args = ap.parse_args()
+
+    config = SimConfig.from_env()
+    if args.seed is not None:
+        config.seed = args.seed
+
+    if args.command == "storm":
+        sim = PSPSimulator(config)
+        refs = [r for r in (args.refs or "").split(",") if r]
+        summary = asyncio.run(sim.storm(args.provider, args.count, args.target, args.concurrency,
+                                        args.duplicate_rate, refs))
+        print(json.dumps(summary, indent=2))
+        return 0 if set(summary["statuses"]) <= {"200"} else 1
+
+    import uvicorn
+
+    changes = {k: v for k, v in {"latency": args.latency, "error_rate": args.error_rate,
+                                 "rate_limit": args.rate_limit, "burst": args.burst}.items() if v is not None}
+    for p in ([args.provider] if args.provider else PROVIDERS):
+        config.providers[p].update(changes)
+    if args.webhook_url:
+        config.webhook_url = args.webhook_url
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+replay_webhooks.py
+
+Replay stored PSP webhook events (psp_events) through the current webhook
+handlers across a process pool, e.g. after a handler fix. Creates a
+WebhookReplayJob, so progress is visible at
+GET /v1/maintenance/webhooks/replay/{job_id}; --resume retries a failed or
+stalled run's failed events, then continues from its checkpoint.
+
+Usage:
+  python scripts/replay_webhooks.py --provider razorpay --event-type payment.captured \\
+      --from 2026-09-01 --to 2026-10-01 --dry-run
+  python scripts/replay_webhooks.py --provider stripe --workers 8 --rate 2000
+  python scripts/replay_webhooks.py --resume 42
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.db import SessionLocal  # noqa: E402
+from app.models import WebhookReplayJob  # noqa: E402
+from app.services.webhook_replay import ReplayEngine, claim_resume  # noqa: E402
+
+
+def _parse(value: str) -> datetime:
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--provider", choices=["razorpay", "stripe"])
+    ap.add_argument("--event-type", action="append", help="repeat for several types")
+    ap.add_argument("--from", dest="start", help="created_at >= (ISO date/time, UTC)")
+    ap.add_argument("--to", dest="end", help="created_at < (ISO date/time, UTC)")
+    ap.add_argument("--dry-run", action="store_true", help="run the handlers but roll every batch back")
+    ap.add_argument("--rate", type=int, help="max events per second")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes (0: in this process)")
+    ap.add_argument("--batch-size", type=int, default=500, help="events per batch transaction")
+    ap.add_argument("--resume", type=int, metavar="JOB_ID", help="retry a failed/stalled job and continue it")
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.resume:
+            job = db.get(WebhookReplayJob, args.resume)
+            if job is None:
+                ap.error(f"replay job {args.resume} not found")
+            if not claim_resume(db, job.id):
+                db.refresh(job)
+                ap.error(f"replay job {args.resume} is {job.status}")
+        else:
+            job = WebhookReplayJob(
+                status="queued",
+                provider=args.provider,
+                event_types=args.event_type,
+                since=_parse(args.start) if args.start else None,
+                until=_parse(args.end) if args.end else None,
+                dry_run=args.dry_run,
+                rate_limit=args.rate,
+            )
+            db.add(job)
+            db.commit()
+        job_id = job.id
+    finally:
+        db.close()
+
+    summary = ReplayEngine(SessionLocal, workers=args.workers, batch_size=args.batch_size).run(job_id)
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
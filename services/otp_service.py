@@ -1,9 +1,10 @@
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime, timedelta
+from datetime import datetime
 from sqlalchemy.orm import Session
 from app.models import EmailOTP
+from app.core.otp_store import VERIFIED, otp_store
 import os
 import logging
 
@@ -22,29 +23,15 @@ class OTPService:
         
         logger.info(f"OTPService initialized with SMTP_HOST: {self.smtp_host}, SMTP_PORT: {self.smtp_port}")
     
-    def generate_and_send_otp(self, email: str) -> bool:
+    async def generate_and_send_otp(self, email: str) -> bool:
         """Generate OTP and send via email"""
         try:
-            # Invalidate any existing active OTPs for this email
-            self.db.query(EmailOTP).filter(
-                EmailOTP.email == email,
-                EmailOTP.is_used == False
-            ).update({"is_used": True})
-            
-            # Generate new OTP
+            # Store new OTP (replaces any active one), 10 minute expiry
             otp_code = EmailOTP.generate_otp()
-            expires_at = datetime.utcnow() + timedelta(minutes=10)  # 10 minute expiry
-            
-            # Save OTP to database
-            otp_record = EmailOTP(
-                email=email,
-                otp_code=otp_code,
-                expires_at=expires_at
-            )
-            self.db.add(otp_record)
+            backend = await otp_store.issue(self.db, "email", email, otp_code, 600)
             self.db.commit()
             
-            logger.info(f"Generated OTP for {email}: {otp_code}")
+            logger.info(f"Generated OTP for {email} ({backend})")
             
             # Send email
             self._send_otp_email(email, otp_code)
@@ -55,30 +42,16 @@ class OTPService:
             self.db.rollback()
             return False
     
-    def verify_otp(self, email: str, otp_code: str) -> bool:
+    async def verify_otp(self, email: str, otp_code: str) -> bool:
         """Verify the OTP code"""
         try:
-            otp_record = self.db.query(EmailOTP).filter(
-                EmailOTP.email == email,
-                EmailOTP.otp_code == otp_code,
-                EmailOTP.is_used == False
-            ).first()
-            
-            if not otp_record:
-                logger.warning(f"OTP verification failed: No valid OTP found for {email}")
-                return False
+            outcome = await otp_store.verify(self.db, "email", email, otp_code, max_attempts=3)
+            self.db.commit()
             
-            if not otp_record.is_valid():
-                # Increment attempts if record exists
-                otp_record.attempts += 1
-                self.db.commit()
-                logger.warning(f"OTP verification failed: Invalid OTP for {email} (expired/too many attempts)")
+            if outcome != VERIFIED:
+                logger.warning(f"OTP verification failed for {email}: {outcome}")
                 return False
             
-            # Mark OTP as used
-            otp_record.is_used = True
-            self.db.commit()
-            
             logger.info(f"OTP verification successful for {email}")
             return True
             
@@ -134,8 +107,14 @@ Tinko Recovery Team
             raise
     
     def cleanup_expired_otps(self):
-        """Clean up expired OTP records (optional maintenance)"""
+        """Clean up expired OTP rows written in degraded (no Redis) mode"""
+        from app.services.partition_service import drop_expired_time_partitions, is_time_partitioned
+
         try:
+            if is_time_partitioned("email_otps"):
+                dropped = drop_expired_time_partitions(tables=["email_otps"])
+                logger.info(f"Dropped {len(dropped)} expired OTP partitions")
+                return len(dropped)
             expired_count = self.db.query(EmailOTP).filter(
                 EmailOTP.expires_at < datetime.utcnow()
             ).delete()
@@ -18,6 +18,9 @@ import logging
 import os
 
 from app.models import EmailOTP, OTPSecurityLog, User
+from app.core.otp_store import LOCKED, VERIFIED, otp_store
+from app.core.rate_limit import Rule, rate_limiter
+from app.services.security_audit import record_security_event
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -34,7 +37,9 @@ class SecureOTPService:
         
         # Security settings
         self.max_requests_per_15min = 3
+        self.max_requests_per_ip_15min = 20
         self.max_failed_verifications_per_hour = 5
+        self.max_failed_verifications_per_ip_hour = 20
         self.temp_block_duration_minutes = 60
         self.otp_expiry_minutes = 10
         
@@ -62,6 +67,7 @@ class SecureOTPService:
                 action="request_otp",
                 success=False
             )
+            self.db.commit()
             # Return success to prevent email enumeration
             return {
                 "success": True,
@@ -70,34 +76,38 @@ class SecureOTPService:
             }
         
         # 2. Check if user/IP is currently blocked
-        if self._is_blocked(email, ip_address):
+        if await self._check_blocked(email, ip_address):
             raise HTTPException(
                 status_code=429,
                 detail="Too many failed attempts. Please try again later."
             )
         
-        # 3. Rate limiting - max requests per email per 15 minutes
-        recent_requests = self.db.query(OTPSecurityLog).filter(
-            OTPSecurityLog.email == email,
-            OTPSecurityLog.action == "request_otp",
-            OTPSecurityLog.created_at > datetime.utcnow() - timedelta(minutes=15)
-        ).count()
+        # 3. Rate limiting - max requests per email / per IP per 15 minutes
+        limited = await rate_limiter.hit([
+            Rule("otp_request:email", email, self.max_requests_per_15min, 900),
+            Rule("otp_request:ip", ip_address, self.max_requests_per_ip_15min, 900),
+        ])
+        if limited is None:
+            # Redis unavailable: count the audit log instead
+            recent_requests = self.db.query(OTPSecurityLog).filter(
+                OTPSecurityLog.email == email,
+                OTPSecurityLog.action == "request_otp",
+                OTPSecurityLog.created_at > datetime.utcnow() - timedelta(minutes=15)
+            ).count()
+            too_many = recent_requests >= self.max_requests_per_15min
+        else:
+            too_many = not limited.allowed
         
-        if recent_requests >= self.max_requests_per_15min:
-            self._block_temporarily(email, ip_address, minutes=15)
+        if too_many:
+            await self._block(email, ip_address, minutes=15)
+            self.db.commit()
             raise HTTPException(
                 status_code=429,
                 detail="Too many OTP requests. Please wait 15 minutes."
             )
         
         # 4. Check for active unused OTPs (prevent spam)
-        active_otp = self.db.query(EmailOTP).filter(
-            EmailOTP.email == email,
-            EmailOTP.is_used == False,
-            EmailOTP.expires_at > datetime.utcnow()
-        ).first()
-        
-        if active_otp:
+        if await otp_store.has_active(self.db, "email", email):
             # Don't generate new OTP if one is still valid
             self._log_security_event(
                 email=email,
@@ -114,25 +124,12 @@ class SecureOTPService:
         
         # 5. Generate and send OTP
         try:
-            # Invalidate any existing OTPs for this email
-            self.db.query(EmailOTP).filter(
-                EmailOTP.email == email,
-                EmailOTP.is_used == False
-            ).update({"is_used": True})
-            
+            # Store OTP (replaces any existing one); Redis with TTL, DB when degraded
             otp_code = EmailOTP.generate_otp()
-            expires_at = datetime.utcnow() + timedelta(minutes=self.otp_expiry_minutes)
-            
-            # Store OTP
-            otp_record = EmailOTP(
-                email=email,
-                otp_code=otp_code,
-                expires_at=expires_at
-            )
-            self.db.add(otp_record)
+            backend = await otp_store.issue(self.db, "email", email, otp_code, self.otp_expiry_minutes * 60)
             self.db.commit()
             
-            logger.info(f"Generated secure OTP for {email}: {otp_code}")
+            logger.info(f"Generated secure OTP for {email} ({backend})")
             
             # Send email
             self._send_otp_email(email, otp_code, user.full_name)
@@ -170,26 +167,16 @@ class SecureOTPService:
         user_agent = request.headers.get("user-agent", "")
         
         # Check if blocked
-        if self._is_blocked(email, ip_address):
+        if await self._check_blocked(email, ip_address):
             raise HTTPException(
                 status_code=429,
                 detail="Too many failed attempts. Please try again later."
             )
         
-        # Find valid OTP
-        otp_record = self.db.query(EmailOTP).filter(
-            EmailOTP.email == email,
-            EmailOTP.otp_code == otp_code,
-            EmailOTP.is_used == False
-        ).first()
+        # Check OTP; mismatches count against the OTP and lock it after 3
+        outcome = await otp_store.verify(self.db, "email", email, otp_code, max_attempts=3)
         
-        if not otp_record or not otp_record.is_valid():
-            # Increment attempts for all unused OTPs for this email
-            self.db.query(EmailOTP).filter(
-                EmailOTP.email == email,
-                EmailOTP.is_used == False
-            ).update({EmailOTP.attempts: EmailOTP.attempts + 1})
-            
+        if outcome != VERIFIED:
             self._log_security_event(
                 email=email,
                 ip_address=ip_address,
@@ -199,15 +186,24 @@ class SecureOTPService:
             )
             
             # Check if too many failed attempts
-            failed_attempts = self.db.query(OTPSecurityLog).filter(
-                OTPSecurityLog.email == email,
-                OTPSecurityLog.action == "verify_otp",
-                OTPSecurityLog.success == False,
-                OTPSecurityLog.created_at > datetime.utcnow() - timedelta(hours=1)
-            ).count()
+            failures = await rate_limiter.record([
+                Rule("otp_verify_fail:email", email, self.max_failed_verifications_per_hour, 3600),
+                Rule("otp_verify_fail:ip", ip_address, self.max_failed_verifications_per_ip_hour, 3600),
+            ])
+            if failures is None:
+                # Redis unavailable: count the audit log instead
+                failed_attempts = self.db.query(OTPSecurityLog).filter(
+                    OTPSecurityLog.email == email,
+                    OTPSecurityLog.action == "verify_otp",
+                    OTPSecurityLog.success == False,
+                    OTPSecurityLog.created_at > datetime.utcnow() - timedelta(hours=1)
+                ).count()
+                too_many = failed_attempts >= self.max_failed_verifications_per_hour
+            else:
+                too_many = failures.exhausted
             
-            if failed_attempts >= self.max_failed_verifications_per_hour:
-                self._block_temporarily(email, ip_address, minutes=self.temp_block_duration_minutes)
+            if too_many:
+                await self._block(email, ip_address, minutes=self.temp_block_duration_minutes)
                 self.db.commit()
                 raise HTTPException(
                     status_code=429,
@@ -217,13 +213,9 @@ class SecureOTPService:
             self.db.commit()
             raise HTTPException(
                 status_code=400,
-                detail="Invalid or expired OTP"
+                detail="Too many invalid attempts. Request a new OTP." if outcome == LOCKED else "Invalid or expired OTP"
             )
         
-        # Mark OTP as used
-        otp_record.is_used = True
-        self.db.commit()
-        
         # Log successful verification
         self._log_security_event(
             email=email,
@@ -232,6 +224,7 @@ class SecureOTPService:
             action="verify_otp",
             success=True
         )
+        self.db.commit()
         
         logger.info(f"OTP verification successful for {email}")
         return True
@@ -250,6 +243,20 @@ class SecureOTPService:
         # Fallback to direct client IP
         return request.client.host if request.client else "unknown"
     
+    async def _check_blocked(self, email: str, ip_address: str) -> bool:
+        """Redis block flag; the audit-log query only runs when Redis is unavailable"""
+        blocked = await rate_limiter.is_blocked("otp", f"{email}|{ip_address}")
+        if blocked is None:
+            return self._is_blocked(email, ip_address)
+        if blocked:
+            logger.warning(f"User {email} from IP {ip_address} is currently blocked")
+        return blocked
+    
+    async def _block(self, email: str, ip_address: str, minutes: int):
+        """Set the Redis block flag and write the audit record"""
+        await rate_limiter.block("otp", f"{email}|{ip_address}", minutes * 60)
+        self._block_temporarily(email, ip_address, minutes)
+    
     def _is_blocked(self, email: str, ip_address: str) -> bool:
         """Check if user/IP combination is currently blocked"""
         block_record = self.db.query(OTPSecurityLog).filter(
@@ -285,15 +292,15 @@ class SecureOTPService:
     
     def _log_security_event(self, email: str, ip_address: str, user_agent: str, 
                            action: str, success: bool):
-        """Log security events for monitoring"""
-        log_entry = OTPSecurityLog(
+        """Log security events for monitoring (batched; see app.services.security_audit)"""
+        record_security_event(
+            self.db,
             email=email,
             ip_address=ip_address,
-            user_agent=user_agent[:500] if user_agent else None,  # Truncate long user agents
+            user_agent=user_agent or None,
             action=action,
             success=success
         )
-        self.db.add(log_entry)
         # Don't commit here - let caller handle transaction
     
     def _send_otp_email(self, email: str, otp_code: str, user_name: Optional[str] = None):
@@ -388,19 +395,31 @@ Tinko Recovery Security Team
             raise
     
     def cleanup_expired_otps(self) -> int:
-        """Clean up expired OTP records and security logs (maintenance)"""
+        """Clean up OTP rows written in degraded (no Redis) mode and old security logs"""
+        from app.services.partition_service import drop_expired_time_partitions, is_time_partitioned
+
         try:
-            # Clean up expired OTPs
-            expired_otps = self.db.query(EmailOTP).filter(
-                EmailOTP.expires_at < datetime.utcnow()
-            ).delete()
+            # Partitioned tables (migration 008) are trimmed by dropping whole partitions
+            dropped = []
+            expired_otps = old_logs = 0
+            if is_time_partitioned("email_otps"):
+                dropped += drop_expired_time_partitions(tables=["email_otps"])
+            else:
+                expired_otps = self.db.query(EmailOTP).filter(
+                    EmailOTP.expires_at < datetime.utcnow()
+                ).delete()
             
             # Clean up old security logs (keep 30 days)
-            old_logs = self.db.query(OTPSecurityLog).filter(
-                OTPSecurityLog.created_at < datetime.utcnow() - timedelta(days=30)
-            ).delete()
+            if is_time_partitioned("otp_security_logs"):
+                dropped += drop_expired_time_partitions(tables=["otp_security_logs"])
+            else:
+                old_logs = self.db.query(OTPSecurityLog).filter(
+                    OTPSecurityLog.created_at < datetime.utcnow() - timedelta(days=30)
+                ).delete()
             
             self.db.commit()
+            if dropped:
+                logger.info(f"Dropped expired partitions: {', '.join(dropped)}")
             logger.info(f"Cleaned up {expired_otps} expired OTPs and {old_logs} old security logs")
             return expired_otps + old_logs
             
@@ -0,0 +1,96 @@
+import threading
+import time
+
+from app.analytics.batcher import BatchEmitter
+
+
+class RecordingSender:
+    def __init__(self, ok=True, delay=0.0):
+        self.batches = []
+        self.ok = ok
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self, records):
+        if self.delay:
+            time.sleep(self.delay)
+        with self.lock:
+            self.batches.append(list(records))
+        return self.ok
+
+
+def test_flush_by_size_and_counters():
+    sender = RecordingSender()
+    em = BatchEmitter(sender, max_queue=100, batch_size=5, flush_interval=10.0)
+    for i in range(10):
+        assert em.submit({"i": i}) is True
+    deadline = time.time() + 2
+    while em.stats()["flushed"] < 10 and time.time() < deadline:
+        time.sleep(0.01)
+    em.stop()
+    stats = em.stats()
+    assert stats["queued"] == 10
+    assert stats["flushed"] == 10
+    assert stats["dropped"] == 0
+    assert all(len(b) <= 5 for b in sender.batches)
+    assert [r["i"] for b in sender.batches for r in b] == list(range(10))
+
+
+def test_flush_by_time():
+    sender = RecordingSender()
+    em = BatchEmitter(sender, max_queue=100, batch_size=1000, flush_interval=0.05)
+    em.submit({"i": 1})
+    deadline = time.time() + 2
+    while not sender.batches and time.time() < deadline:
+        time.sleep(0.01)
+    em.stop()
+    assert sender.batches == [[{"i": 1}]]
+
+
+def test_drop_newest_when_full():
+    em = BatchEmitter(RecordingSender(), max_queue=3, batch_size=100, flush_interval=10.0)
+    em._ensure_started = lambda: None  # keep the queue full for the assertion
+    results = [em.submit({"i": i}) for i in range(5)]
+    assert results == [True, True, True, False, False]
+    assert em.stats()["dropped"] == 2
+    em.flush()
+    assert em.stats()["flushed"] == 3
+
+
+def test_drop_oldest_keeps_latest():
+    sender = RecordingSender()
+    em = BatchEmitter(sender, max_queue=3, batch_size=100, flush_interval=10.0, policy="drop_oldest")
+    em._ensure_started = lambda: None
+    for i in range(5):
+        assert em.submit({"i": i}) is True
+    em.flush()
+    assert [r["i"] for r in sender.batches[0]] == [2, 3, 4]
+    assert em.stats()["dropped"] == 2
+
+
+def test_block_policy_times_out_and_drops():
+    em = BatchEmitter(RecordingSender(), max_queue=1, batch_size=100, flush_interval=10.0, policy="block", block_timeout=0.02)
+    em._ensure_started = lambda: None
+    assert em.submit({"i": 0}) is True
+    start = time.monotonic()
+    assert em.submit({"i": 1}) is False
+    assert time.monotonic() - start >= 0.015
+    assert em.stats()["dropped"] == 1
+
+
+def test_failed_batches_are_counted():
+    em = BatchEmitter(RecordingSender(ok=False), max_queue=10, batch_size=10, flush_interval=10.0)
+    em._ensure_started = lambda: None
+    em.submit({"i": 1})
+    em.flush()
+    assert em.stats()["failed"] == 1
+    assert em.stats()["flushed"] == 0
+
+
+def test_submit_does_not_wait_on_sender():
+    sender = RecordingSender(delay=0.2)
+    em = BatchEmitter(sender, max_queue=100, batch_size=1, flush_interval=0.01)
+    start = time.monotonic()
+    for i in range(20):
+        em.submit({"i": i})
+    assert time.monotonic() - start < 0.1
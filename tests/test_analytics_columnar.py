@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.analytics import columnar  # noqa: E402
+from app.analytics.columnar import ColumnarCache, OrgSnapshot  # noqa: E402
+from app.core.principal import Principal  # noqa: E402
+from app.db import Base  # noqa: E402
+from app.models import FailureEvent, Organization, RecoveryAttempt, Transaction  # noqa: E402
+from app.routers.analytics import attempts_summary  # noqa: E402
+
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+@pytest.fixture()
+def session():
+    eng = create_engine("sqlite://")
+    tables = [Base.metadata.tables[t] for t in ("organizations", "transactions", "failure_events", "recovery_attempts")]
+    Base.metadata.create_all(eng, tables=tables)
+    db = sessionmaker(bind=eng)()
+    db.add_all([Organization(id=1, name="A", slug="a"), Organization(id=2, name="B", slug="b")])
+    db.commit()
+    yield db
+    db.close()
+
+
+def _attempt(db, org_id, n, status="created", channel="email", amount=100, age=timedelta(hours=1)):
+    tx = Transaction(transaction_ref=f"tx-{org_id}-{n}", amount=amount, currency="INR", org_id=org_id)
+    db.add(tx)
+    db.flush()
+    ra = RecoveryAttempt(transaction_id=tx.id, channel=channel, token=f"tok-{org_id}-{n}", status=status,
+                         expires_at=NOW + timedelta(days=1), created_at=NOW - age)
+    db.add(ra)
+    db.add(FailureEvent(transaction_id=tx.id, reason="insufficient_funds", created_at=NOW - age))
+    db.commit()
+    return ra
+
+
+def test_snapshot_queries_match_expected():
+    snap = OrgSnapshot(1)
+    snap.append_attempts([
+        (1, NOW - timedelta(hours=3), "completed", "email", 500),
+        (2, NOW - timedelta(hours=2), "sent", "sms", 200),
+        (3, NOW - timedelta(hours=1), "opened", "email", None),
+        (4, NOW - timedelta(days=5), "completed", "sms", 900),
+    ])
+    start, end = NOW - timedelta(days=1), NOW
+    assert snap.count_attempts(start, end) == 3
+    assert snap.sum_amount(start, end, ["completed"]) == 500
+    assert snap.attempts_by("channel", start, end) == {"email": 2, "sms": 1}
+    assert snap.funnel(start, end) == {"failed": 3, "notified": 3, "clicked": 2, "paid": 1}
+    assert snap.count_attempts(start, end, ["missing"]) == 0
+
+
+def test_incremental_refresh_picks_up_new_rows_and_status_changes(session):
+    cache = ColumnarCache(refresh_interval=0)
+    ra = _attempt(session, 1, 1)
+    _attempt(session, 2, 1)
+    snap = cache.get(session, 1)
+    start, end = NOW - timedelta(days=1), NOW + timedelta(minutes=1)
+    assert snap.count_attempts(start, end) == 1  # org 2 excluded
+
+    ra.status = "completed"
+    session.commit()
+    _attempt(session, 1, 2, status="sent")
+    snap = cache.get(session, 1)
+    assert snap.attempts_by("status", start, end) == {"completed": 1, "sent": 1}
+    assert snap.sum_amount(start, end, ["completed"]) == 100
+    assert snap.failures_by_reason(start, end) == {"insufficient_funds": 2}
+    assert cache.stats()["loads"] == 1 and cache.stats()["refreshes"] == 1
+
+
+def test_refresh_picks_up_rows_committed_below_the_watermark(session):
+    cache = ColumnarCache(refresh_interval=0)
+    tx = Transaction(transaction_ref="tx-late", amount=100, currency="INR", org_id=1)
+    session.add(tx)
+    session.flush()
+
+    def attempt(id_, channel):
+        session.add(RecoveryAttempt(id=id_, transaction_id=tx.id, channel=channel, token=f"tok-{id_}",
+                                    status="created", expires_at=NOW + timedelta(days=1), created_at=NOW))
+        session.commit()
+
+    attempt(2, "email")
+    snap = cache.get(session, 1)
+    assert snap.attempts.id.tolist() == [2]
+
+    attempt(1, "sms")  # allocated before id 2, committed after the snapshot read it
+    snap = cache.get(session, 1)
+    assert snap.attempts.id.tolist() == [1, 2]
+    assert snap.attempts_by("channel", NOW - timedelta(days=1), NOW + timedelta(minutes=1)) == {"email": 1, "sms": 1}
+
+
+def test_window_and_lru_eviction(session):
+    cache = ColumnarCache(window_days=30, refresh_interval=0)
+    _attempt(session, 1, 1, age=timedelta(days=60))
+    _attempt(session, 1, 2)
+    _attempt(session, 2, 1)
+    snap = cache.get(session, 1)
+    assert len(snap.attempts.id) == 1
+    assert not snap.covers(NOW - timedelta(days=45))
+
+    cache.max_bytes = snap.nbytes  # room for exactly one org
+    cache.get(session, 2)
+    assert cache.stats()["orgs"] == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_attempts_summary_has_the_same_shape_from_sql_and_snapshot(session, monkeypatch):
+    _attempt(session, 1, 1, status="completed", channel="email")
+    _attempt(session, 1, 2, status="sent", channel="sms")
+    _attempt(session, 1, 3, status="sent", channel=None)
+    _attempt(session, 2, 1, channel="whatsapp")
+    user = Principal(id=1, org_id=1, role="admin", is_active=True)
+    window = {"from_": (NOW - timedelta(days=1)).isoformat(), "to_": (NOW + timedelta(minutes=1)).isoformat()}
+
+    monkeypatch.setenv("FEATURE_ANALYTICS_COLUMNAR", "off")
+    from_sql = attempts_summary(current_user=user, db=session, **window)
+    monkeypatch.setenv("FEATURE_ANALYTICS_COLUMNAR", "on")
+    monkeypatch.setattr(columnar, "_cache", ColumnarCache(refresh_interval=0))
+    from_snapshot = attempts_summary(current_user=user, db=session, **window)
+    assert from_sql["by_channel"] == {"email": 1, "sms": 1, "unknown": 1}
+    assert from_sql == from_snapshot
@@ -0,0 +1,133 @@
+import gzip
+import json
+from datetime import datetime, timezone
+
+from app.analytics.object_store import LocalObjectStore, PartitionedWriter, list_files, scan
+
+
+def _ts(y, m, d, h, mi=0):
+    return int(datetime(y, m, d, h, mi, tzinfo=timezone.utc).timestamp())
+
+
+def _rec(ts, etype="payment_result", i=0):
+    return {"ts": ts, "event_type": etype, "payload": {"i": i}}
+
+
+def test_partitioned_layout_and_manifest(tmp_path):
+    store = LocalObjectStore(str(tmp_path))
+    w = PartitionedWriter(store, writer_id="w1")
+    w.write_many([_rec(_ts(2025, 1, 1, 10, 5), i=1), _rec(_ts(2025, 1, 1, 11, 0), i=2)])
+    w.close()
+
+    keys = store.list("analytics/")
+    assert "analytics/dt=2025-01-01/hour=10/part-00001-w1.ndjson.gz" in keys
+    assert "analytics/dt=2025-01-01/hour=11/part-00002-w1.ndjson.gz" in keys
+    assert "analytics/_manifests/dt=2025-01-01/w1.json" in keys
+
+    manifest = json.loads(store.get("analytics/_manifests/dt=2025-01-01/w1.json"))
+    assert sorted(f["hour"] for f in manifest["files"]) == [10, 11]
+    body = store.get(manifest["files"][0]["key"])
+    assert json.loads(gzip.decompress(body).splitlines()[0])["event_type"] == "payment_result"
+
+
+def test_size_rotation_creates_multiple_parts(tmp_path):
+    store = LocalObjectStore(str(tmp_path))
+    w = PartitionedWriter(store, max_bytes=200, writer_id="w1")
+    w.write_many([_rec(_ts(2025, 1, 1, 10), i=i) for i in range(20)])
+    w.close()
+    files = list_files(store, datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 1, 1, 23, tzinfo=timezone.utc))
+    assert len(files) > 1
+    assert sum(f["records"] for f in files) == 20
+
+
+def test_age_rotation(tmp_path):
+    store = LocalObjectStore(str(tmp_path))
+    w = PartitionedWriter(store, max_age=0.0, writer_id="w1")
+    w.write_many([_rec(_ts(2025, 1, 1, 10))])
+    assert w.files_written == 0
+    w.maybe_rotate()
+    assert w.files_written == 1
+
+
+def test_scan_filters_range_and_type(tmp_path):
+    store = LocalObjectStore(str(tmp_path))
+    w = PartitionedWriter(store, writer_id="w1")
+    w.write_many([
+        _rec(_ts(2025, 1, 1, 10), i=1),
+        _rec(_ts(2025, 1, 2, 12), etype="other", i=2),
+        _rec(_ts(2025, 1, 2, 13), i=3),
+        _rec(_ts(2025, 1, 4, 9), i=4),
+    ])
+    w.close()
+    # A second writer contributes to the same day
+    w2 = PartitionedWriter(store, writer_id="w2")
+    w2.write_many([_rec(_ts(2025, 1, 2, 14), i=5)])
+    w2.close()
+
+    start = datetime(2025, 1, 2, tzinfo=timezone.utc)
+    end = datetime(2025, 1, 3, tzinfo=timezone.utc)
+    got = [r["payload"]["i"] for r in scan(store, start, end)]
+    assert sorted(got) == [2, 3, 5]
+    got = [r["payload"]["i"] for r in scan(store, start, end, event_type="payment_result")]
+    assert sorted(got) == [3, 5]
+
+
+def test_failed_put_hands_records_to_on_failed(tmp_path):
+    class FailingStore(LocalObjectStore):
+        def put(self, key, body):
+            raise OSError("unreachable")
+
+    failed = []
+    w = PartitionedWriter(FailingStore(str(tmp_path)), writer_id="w1", on_failed=failed.extend)
+    w.write_many([_rec(_ts(2025, 1, 1, 10), i=i) for i in range(3)])
+    w.close()
+    assert len(failed) == 3
+    assert w.files_failed == 1 and w.files_written == 0
+    assert list_files(w.store, datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 1, 2, tzinfo=timezone.utc)) == []
+
+
+def test_wal_recovers_buffered_records_after_crash(tmp_path):
+    from app.analytics.spool import Spool
+
+    store = LocalObjectStore(str(tmp_path / "store"))
+    wal = Spool(str(tmp_path / "wal"), fsync_every=1)
+    w = PartitionedWriter(store, writer_id="w1", wal=wal)
+    w.write_many([_rec(_ts(2025, 1, 1, 10), i=i) for i in range(3)])
+    assert w.files_written == 0
+    wal.close()  # crash: the open part is never rolled
+
+    w2 = PartitionedWriter(store, writer_id="w2", wal=Spool(str(tmp_path / "wal"), fsync_every=1))
+    assert w2.recovered == 3
+    files = list_files(store, datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 1, 2, tzinfo=timezone.utc))
+    assert sum(f["records"] for f in files) == 3
+    assert w2.wal.pending_bytes() == 0
+
+
+def test_wal_checkpoint_stops_at_oldest_open_part(tmp_path):
+    from app.analytics.spool import Spool
+
+    store = LocalObjectStore(str(tmp_path / "store"))
+    wal = Spool(str(tmp_path / "wal"), fsync_every=1)
+    w = PartitionedWriter(store, max_bytes=200, writer_id="w1", wal=wal)
+    w.write_many([_rec(_ts(2025, 1, 1, 10), i=1)])
+    w.write_many([_rec(_ts(2025, 1, 1, 11), i=i) for i in range(20)])
+    # hour 11 rolled on size, but hour 10 is still only buffered
+    assert w.files_written > 0 and wal.pending_bytes() > 0
+    w.close()
+    assert wal.pending_bytes() == 0
+
+
+def test_past_manifests_are_evicted_and_reloaded(tmp_path):
+    store = LocalObjectStore(str(tmp_path))
+    w = PartitionedWriter(store, writer_id="w1")
+    w.write_many([_rec(_ts(2025, 1, 1, 10), i=1)])
+    w.close()
+    w.write_many([_rec(_ts(2025, 1, 2, 10), i=2)])
+    w.close()
+    assert list(w._manifests) == ["2025-01-02"]
+
+    # a late record for an evicted day extends its manifest
+    w.write_many([_rec(_ts(2025, 1, 1, 12), i=3)])
+    w.close()
+    manifest = json.loads(store.get("analytics/_manifests/dt=2025-01-01/w1.json"))
+    assert sorted(f["hour"] for f in manifest["files"]) == [10, 12]
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api_auth import resolve_api_key
+from app.db import Base
+from app.models import ApiKey, Organization, User
+from app.security import hash_password
+
+
+@pytest.fixture()
+def session():
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng, tables=[Base.metadata.tables[t] for t in ("organizations", "users", "api_keys")])
+    db = sessionmaker(bind=eng)()
+    db.add(Organization(id=1, name="A", slug="a"))
+    db.add(User(id=1, email="a@example.com", org_id=1))
+    db.commit()
+    yield db
+    db.close()
+
+
+def _issue(db, **fields):
+    plain, record = ApiKey.issue(user_id=1, key_name="k", scopes=["read"], is_active=True, **fields)
+    db.add(record)
+    db.commit()
+    return plain, record
+
+
+def test_new_key_format_and_lookup(session):
+    plain, record = _issue(session)
+    assert plain.startswith(f"sk_{record.key_id}_")
+    assert record.key_hash.startswith("hmac-sha256$")
+    assert resolve_api_key(session, plain).id == record.id
+    assert resolve_api_key(session, plain[:-1] + ("A" if plain[-1] != "A" else "B")) is None
+
+
+def test_inactive_and_expired_keys_rejected(session):
+    plain, record = _issue(session)
+    record.is_active = False
+    session.commit()
+    assert resolve_api_key(session, plain) is None
+
+    plain, record = _issue(session, expires_at=datetime.utcnow() - timedelta(minutes=1))
+    assert resolve_api_key(session, plain) is None
+
+
+def test_legacy_bcrypt_key_migrates_on_first_use(session):
+    legacy = "sk_" + "x" * 43
+    session.add(ApiKey(user_id=1, key_name="old", key_hash=hash_password(legacy), key_prefix=legacy[:8],
+                       scopes=["read"], is_active=True))
+    session.commit()
+
+    record = resolve_api_key(session, legacy)
+    assert record is not None
+    assert record.key_id and record.key_hash.startswith("hmac-sha256$")
+    # Second use goes through the indexed path
+    assert resolve_api_key(session, legacy).id == record.id
+    assert resolve_api_key(session, "sk_" + "x" * 42 + "y") is None
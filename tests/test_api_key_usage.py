@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models import ApiKey, Organization, User
+from app.services.api_key_usage import ApiKeyUsageBuffer
+
+
+@pytest.fixture()
+def factory():
+    eng = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(eng, tables=[Base.metadata.tables[t] for t in ("organizations", "users", "api_keys")])
+    Session = sessionmaker(bind=eng)
+    db = Session()
+    db.add(Organization(id=1, name="A", slug="a"))
+    db.add(User(id=1, email="a@example.com", org_id=1))
+    for i in (1, 2):
+        _, key = ApiKey.issue(user_id=1, key_name=f"k{i}", scopes=["read"], is_active=True)
+        key.id = i
+        db.add(key)
+    db.commit()
+    db.close()
+    return Session
+
+
+def test_usage_is_buffered_then_flushed_in_bulk(factory):
+    buf = ApiKeyUsageBuffer(factory, flush_interval=3600)
+    t0 = datetime(2025, 1, 1, 12)
+    for i in range(5):
+        buf.record(1, t0 + timedelta(seconds=i))
+    buf.record(2, t0)
+    assert buf.pending(1) == (5, t0 + timedelta(seconds=4))
+
+    db = factory()
+    assert db.get(ApiKey, 1).usage_count == 0  # nothing written yet
+    db.close()
+
+    assert buf.flush() == 2
+    assert buf.pending(1) == (0, None)
+    db = factory()
+    k1 = db.get(ApiKey, 1)
+    assert k1.usage_count == 5
+    assert k1.last_used_at.replace(tzinfo=None) == t0 + timedelta(seconds=4)
+    assert db.get(ApiKey, 2).usage_count == 1
+    db.close()
+
+    # An older timestamp never moves last_used_at backwards
+    buf.record(1, t0 - timedelta(days=1))
+    buf.flush()
+    db = factory()
+    k1 = db.get(ApiKey, 1)
+    assert k1.usage_count == 6
+    assert k1.last_used_at.replace(tzinfo=None) == t0 + timedelta(seconds=4)
+    db.close()
+    buf.stop()
+
+
+def test_failed_flush_keeps_deltas(factory):
+    class Broken:
+        def connection(self):
+            raise RuntimeError("db down")
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    buf = ApiKeyUsageBuffer(lambda: Broken(), flush_interval=3600)
+    buf.record(1)
+    buf.record(1)
+    assert buf.flush() == 0
+    assert buf.pending(1)[0] == 2
+    assert buf.stats()["failures"] == 1
+    buf.stop()
+
+
+def test_usage_stays_visible_while_a_flush_is_in_flight(factory):
+    seen = []
+
+    class Watched:
+        def __init__(self):
+            self.db = factory()
+
+        def connection(self):
+            seen.append(buf.pending(1))
+            return self.db.connection()
+
+        def __getattr__(self, name):
+            return getattr(self.db, name)
+
+    buf = ApiKeyUsageBuffer(lambda: Watched(), flush_interval=3600)
+    t0 = datetime(2025, 1, 1, 12)
+    buf.record(1, t0)
+    buf.record(1, t0)
+    assert buf.flush() == 1
+    assert seen == [(2, t0)]
+    assert buf.pending(1) == (0, None)
+    buf.stop()
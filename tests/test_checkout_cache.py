@@ -0,0 +1,143 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.deps import get_db
+from app.models import Transaction
+from app.services.checkout_cache import CheckoutCache, CheckoutEntry
+from app.services.webhook_pipeline import apply_group
+
+
+@pytest.fixture()
+def factory():
+    eng = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    tables = ["organizations", "transactions", "recovery_attempts", "recovery_latency_sketches"]
+    Base.metadata.create_all(eng, tables=[Base.metadata.tables[t] for t in tables])
+    factory = sessionmaker(bind=eng)
+    db = factory()
+    db.add(Transaction(transaction_ref="R-1", amount=500, currency="INR"))
+    db.commit()
+    db.close()
+    return factory
+
+
+def session_entry(n, amount, hours=24):
+    return CheckoutEntry("checkout", "stripe", f"cs_{n}", amount, "inr", url=f"https://checkout/cs_{n}",
+                         expires_at=datetime.now(timezone.utc) + timedelta(hours=hours))
+
+
+def test_sessions_are_reused_until_amount_change_expiry_or_completion(factory):
+    cache = CheckoutCache(min_remaining_s=600)
+    db = factory()
+    txn = db.query(Transaction).one()
+    created = []
+
+    async def get(amount=500, currency="INR"):
+        async def create():
+            created.append(1)
+            return session_entry(len(created), amount, hours=24 if len(created) != 3 else 0.1)
+
+        return await cache.get_or_create(db, txn, "checkout", amount, currency, create)
+
+    first, reused = asyncio.run(get())
+    assert (first.id, reused) == ("cs_1", False)
+    assert (txn.stripe_checkout_session_id, txn.payment_link_url) == ("cs_1", "https://checkout/cs_1")
+    assert asyncio.run(get()) == (first, True)
+    # another amount is another key; the new session replaces the stored one
+    assert asyncio.run(get(amount=400))[0].id == "cs_2"
+    assert asyncio.run(get(amount=400))[0].id == "cs_2"
+    assert asyncio.run(get())[0].id == "cs_3"
+    # cs_3 has under min_remaining_s left, so it is not handed to a payer
+    assert asyncio.run(get())[0].id == "cs_4"
+
+    # checkout.session.expired only drops the session it names
+    apply_group(db, [("stripe", {"type": "checkout.session.expired", "data": {"object": {"id": "cs_3"}}})], [])
+    assert cache.lookup(txn, "checkout", 500, "inr").id == "cs_4"
+    apply_group(db, [("stripe", {"type": "checkout.session.expired", "data": {"object": {"id": "cs_4"}}})], [])
+    assert cache.lookup(txn, "checkout", 500, "inr") is None
+    assert asyncio.run(get())[0].id == "cs_5"
+
+    # once checkout.session.completed lands, the paid session is kept and nothing new is created
+    apply_group(db, [("stripe", {"type": "checkout.session.completed", "data": {"object": {
+        "id": "cs_5", "payment_intent": "pi_5", "metadata": {"transaction_ref": "R-1"}}}})], [])
+    db.commit()
+    assert txn.checkout_cache == {"paid": {"provider": "stripe", "id": "cs_5"}}
+    assert (txn.stripe_checkout_session_id, txn.stripe_payment_intent_id) == ("cs_5", "pi_5")
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(get())
+    assert exc.value.status_code == 409
+    assert len(created) == 5 and txn.stripe_checkout_session_id == "cs_5"
+    assert cache.stats()["hits"] == 2
+    db.close()
+
+
+def test_concurrent_order_requests_create_one_razorpay_order(factory, monkeypatch):
+    from app.routers import payments_razorpay
+
+    monkeypatch.setenv("FEATURE_RAZORPAY_ALLOW_ORDER_CREATION", "on")
+    monkeypatch.setenv("RAZORPAY_KEY_ID", "rzp_test")
+    monkeypatch.setenv("RAZORPAY_KEY_SECRET", "shh")
+    monkeypatch.setattr(payments_razorpay, "get_checkout_cache", lambda cache=CheckoutCache(): cache)
+    calls = []
+
+    async def create_order_async(self, amount, currency, receipt):
+        calls.append(receipt)
+        await asyncio.sleep(0.05)
+        return {"order_id": f"order_{len(calls)}", "amount": amount, "currency": currency}
+
+    monkeypatch.setattr(payments_razorpay.RazorpayAdapter, "create_order_async", create_order_async)
+    api = FastAPI()
+    api.include_router(payments_razorpay.router)
+
+    def override():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    api.dependency_overrides[get_db] = override
+
+    async def run():
+        transport = httpx.ASGITransport(app=api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            post = lambda: client.post("/v1/payments/razorpay/orders-public", json={"ref": "R-1"})  # noqa: E731
+            first = await asyncio.gather(*(post() for _ in range(5)))
+            later = await post()
+        return first, later
+
+    first, later = asyncio.run(run())
+    assert {r.json()["order_id"] for r in first + [later]} == {"order_1"}
+    assert calls == ["R-1"]
+
+    db = factory()
+    txn = db.query(Transaction).one()
+    assert (txn.razorpay_order_id, txn.checkout_cache["order"]["amount"]) == ("order_1", 500)
+    # a changed amount gets a fresh order
+    txn.amount = 700
+    db.commit()
+    db.close()
+    assert asyncio.run(run())[1].json() == {"order_id": "order_2", "key_id": "rzp_test", "amount": 700,
+                                            "currency": "INR"}
+
+    # after payment.captured the paid order is returned, never replaced
+    db = factory()
+    apply_group(db, [("razorpay", {"event": "payment.captured", "payload": {"payment": {"entity": {
+        "id": "pay_1", "order_id": "order_2"}}}})], [])
+    db.commit()
+    db.close()
+    assert asyncio.run(run())[1].json()["order_id"] == "order_2"
+    db = factory()
+    txn = db.query(Transaction).one()
+    txn.amount = 900  # even for a changed amount
+    db.commit()
+    db.close()
+    assert asyncio.run(run())[1].json()["order_id"] == "order_2"
+    assert calls == ["R-1", "R-1"]
@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+from app.core.google_id_token import GoogleIdTokenVerifier, InvalidIdToken, cache_max_age
+
+AUD = "client-123.apps.googleusercontent.com"
+
+
+def make_key(kid):
+    pem = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public = jwk.construct(pem, "RS256").public_key().to_dict()
+    public.update(kid=kid, use="sig")
+    return pem, public
+
+
+def sign(pem, kid, **overrides):
+    now = int(time.time())
+    claims = {
+        "iss": "https://accounts.google.com", "aud": AUD, "sub": "1089", "email": "a@x.com",
+        "email_verified": True, "name": "A", "iat": now, "exp": now + 3600,
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, pem, algorithm="RS256", headers={"kid": kid})
+
+
+@pytest.fixture(scope="module")
+def keys():
+    return make_key("k1"), make_key("k2")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_fixed_key_set_checks_signature_issuer_audience_and_expiry(keys):
+    (pem1, pub1), (pem2, _) = keys
+    v = GoogleIdTokenVerifier(certs_url=None, jwks={"keys": [pub1]})
+    assert run(v.verify(sign(pem1, "k1"), [AUD]))["sub"] == "1089"
+
+    bad = [
+        sign(pem1, "k1", aud="someone-else"),
+        sign(pem1, "k1", iss="https://evil.example"),
+        sign(pem1, "k1", exp=int(time.time()) - 3600),
+        sign(pem2, "k1"),  # wrong signer
+        sign(pem2, "k2"),  # unknown kid
+        "not.a.jwt",
+    ]
+    for token in bad:
+        with pytest.raises(InvalidIdToken):
+            run(v.verify(token, [AUD]))
+    with pytest.raises(InvalidIdToken):
+        run(v.verify(sign(pem1, "k1"), []))
+    assert v.stats()["verified"] == 1 and v.stats()["rejected"] == len(bad) + 1
+
+
+def test_jwks_is_cached_per_cache_control_and_refetched_on_rotation(keys):
+    (pem1, pub1), (pem2, pub2) = keys
+    served = {"keys": [pub1]}
+    fetches = []
+
+    def handler(request):
+        fetches.append(request.url)
+        return httpx.Response(200, json=served, headers={"Cache-Control": "public, max-age=20000, must-revalidate"})
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        v = GoogleIdTokenVerifier(client=client, min_refresh_interval=0)
+        for _ in range(3):
+            await v.verify(sign(pem1, "k1"), [AUD])
+        assert len(fetches) == 1 and 19990 < v.stats()["expires_in_s"] <= 20000
+
+        served["keys"] = [pub1, pub2]
+        assert (await v.verify(sign(pem2, "k2"), [AUD]))["email"] == "a@x.com"
+        assert len(fetches) == 2
+
+        # Inside the refresh margin: served from cache, refreshed in the background
+        v._refresh_at = time.monotonic() - 1
+        await v.verify(sign(pem1, "k1"), [AUD])
+        assert len(fetches) == 2
+        await v._task
+        assert len(fetches) == 3 and v.refreshes == 3
+        await client.aclose()
+
+    run(scenario())
+
+
+def test_refresh_failure_keeps_cached_keys(keys):
+    (pem1, pub1), _ = keys
+    state = {"up": True}
+
+    def handler(request):
+        if state["up"]:
+            return httpx.Response(200, json={"keys": [pub1]})
+        return httpx.Response(503)
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        v = GoogleIdTokenVerifier(client=client)
+        await v.verify(sign(pem1, "k1"), [AUD])
+        state["up"] = False
+        await v.refresh()
+        await v.verify(sign(pem1, "k1"), [AUD])
+        assert v.refresh_failures == 1 and v.stats()["keys"] == 1
+        await client.aclose()
+
+    run(scenario())
+    assert cache_max_age("no-cache") is None
@@ -0,0 +1,104 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.security as security
+from app.core.jwt_cache import ClaimsCache
+from app.core.principal import get_principal_cache, invalidate_principal
+from app.db import Base
+from app.deps import require_roles_or_token
+from app.models import Organization, User
+from app.security import create_jwt, decode_jwt
+
+
+def test_decode_is_cached_and_returns_copies(monkeypatch):
+    cache = ClaimsCache()
+    monkeypatch.setattr(security, "get_claims_cache", lambda: cache)
+    token = create_jwt({"user_id": 1, "org_id": 2, "role": "admin"})
+    first = decode_jwt(token)
+    first["role"] = "tampered"
+    assert decode_jwt(token)["role"] == "admin"
+    assert (cache.hits, cache.misses) == (1, 1)
+    # Same token under another secret is a separate (failing) verification
+    assert decode_jwt(token, secret="other") is None
+    assert decode_jwt("not-a-jwt") is None
+    assert cache.stats()["size"] == 1
+
+
+def test_entries_expire_at_exp_and_lru_evicts():
+    cache = ClaimsCache(max_entries=2)
+    cache.put(b"a", {"exp": time.time() - 1})
+    assert cache.get(b"a") is None and cache.expired == 1
+    cache.put(b"a", {"exp": time.time() + 60})
+    cache.put(b"b", {})
+    cache.get(b"a")
+    cache.put(b"c", {})
+    assert cache.get(b"b") is None and cache.get(b"a") is not None
+    assert cache.evictions == 1
+
+
+class NoDB:
+    def __getattr__(self, name):
+        raise AssertionError("db touched")
+
+
+@pytest.fixture()
+def db():
+    eng = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(eng, tables=[Base.metadata.tables[t] for t in ("organizations", "users")])
+    session = sessionmaker(bind=eng)()
+    org = Organization(name="A", slug="a")
+    session.add(org)
+    session.flush()
+    session.add(User(id=1, email="admin@a", role="admin", org_id=org.id))
+    session.commit()
+    get_principal_cache().clear()
+    yield session
+    get_principal_cache().clear()
+    session.close()
+
+
+def check(roles, token, db):
+    return require_roles_or_token(roles)(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token), db)
+
+
+def test_require_roles_or_token_authorizes_from_claims_without_db(db):
+    # a token whose user does not exist is authorized from its claims
+    token = create_jwt({"user_id": 999, "org_id": 7, "role": "admin"})
+    assert check(["admin"], token, db) == {"user_id": 999, "role": "admin", "org_id": 7}
+    with pytest.raises(HTTPException) as exc:
+        check(["operator"], token, db)
+    assert exc.value.status_code == 403
+
+    # a real user is looked up once, then served from the principal cache
+    token = create_jwt({"user_id": 1, "org_id": 1, "role": "admin"})
+    assert check(["admin"], token, db) == {"user_id": 1, "role": "admin", "org_id": 1}
+    assert check(["admin"], token, NoDB()) == {"user_id": 1, "role": "admin", "org_id": 1}
+
+
+def test_demotion_and_deactivation_apply_before_the_token_expires(db):
+    token = create_jwt({"user_id": 1, "org_id": 1, "role": "admin"})
+    assert check(["admin"], token, db)["role"] == "admin"
+
+    user = db.get(User, 1)
+    user.role = "operator"
+    db.commit()
+    invalidate_principal(1)  # what POST /v1/auth/roles/assign does
+    with pytest.raises(HTTPException) as exc:
+        check(["admin"], token, db)
+    assert exc.value.status_code == 403
+    assert check(["operator"], token, NoDB())["role"] == "operator"
+
+    user.is_active = False
+    db.commit()
+    invalidate_principal(1)  # what POST /v1/auth/users/{id}/deactivate does
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc:
+            check(["operator"], token, db)
+        assert exc.value.status_code == 401
+    assert get_principal_cache().get(1) is None
@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.otp_store import EXPIRED, INVALID, LOCKED, VERIFIED, OTPStore
+from app.db import Base
+from app.models import EmailOTP
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.ops = []
+
+    def __getattr__(self, name):
+        return lambda *a, **k: self.ops.append((name, a, k))
+
+    async def execute(self):
+        self.client.executed.extend(self.ops)
+
+
+class FakeClient:
+    def __init__(self, verify_reply="missing"):
+        self.verify_reply = verify_reply
+        self.executed = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def script_load(self, script):
+        return "sha1"
+
+    async def evalsha(self, sha, numkeys, *args):
+        return self.verify_reply
+
+
+class FakeManager:
+    def __init__(self, client=None):
+        self.redis_client = client
+        self.is_available = client is not None
+
+
+@pytest.fixture()
+def db():
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng, tables=[Base.metadata.tables["email_otps"]])
+    session = sessionmaker(bind=eng)()
+    yield session
+    session.close()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_degraded_mode_uses_rows_and_locks_after_max_attempts(db):
+    store = OTPStore(FakeManager())
+    assert run(store.issue(db, "email", "a@x.com", "111111", 600)) == "db"
+    assert run(store.issue(db, "email", "a@x.com", "222222", 600)) == "db"
+    assert run(store.has_active(db, "email", "a@x.com"))
+    # Re-issuing invalidated the first code
+    assert run(store.verify(db, "email", "a@x.com", "111111")) == INVALID
+    assert run(store.verify(db, "email", "a@x.com", "000000")) == INVALID
+    assert run(store.verify(db, "email", "a@x.com", "000000")) == LOCKED
+    assert run(store.verify(db, "email", "a@x.com", "222222")) == INVALID
+
+    run(store.issue(db, "email", "a@x.com", "333333", 600))
+    assert run(store.verify(db, "email", "a@x.com", "333333")) == VERIFIED
+    assert not run(store.has_active(db, "email", "a@x.com"))
+
+
+def test_degraded_mode_expiry(db):
+    store = OTPStore(FakeManager())
+    run(store.issue(db, "email", "b@x.com", "444444", 600))
+    db.query(EmailOTP).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    assert run(store.verify(db, "email", "b@x.com", "444444")) == EXPIRED
+
+
+def test_redis_mode_stores_digest_with_ttl_and_skips_db(db):
+    client = FakeClient(verify_reply="verified")
+    store = OTPStore(FakeManager(client))
+    assert run(store.issue(db, "email", "C@x.com", "555555", 300)) == "redis"
+    ops = {name: (a, k) for name, a, k in client.executed}
+    assert ops["hset"][0][0] == "otp:email:c@x.com"
+    assert "555555" not in str(ops["hset"])
+    assert ops["expire"][0] == ("otp:email:c@x.com", 300)
+    assert db.query(EmailOTP).count() == 0
+    assert run(store.verify(db, "email", "c@x.com", "555555")) == VERIFIED
+
+
+def test_redis_miss_falls_back_to_rows_issued_during_outage(db):
+    manager = FakeManager()
+    store = OTPStore(manager)
+    run(store.issue(db, "email", "d@x.com", "666666", 600))
+    manager.redis_client, manager.is_available = FakeClient(verify_reply="missing"), True
+    assert run(store.verify(db, "email", "d@x.com", "666666")) == VERIFIED
+
+
+def test_redis_issue_invalidates_rows_issued_during_outage(db):
+    manager = FakeManager()
+    store = OTPStore(manager)
+    run(store.issue(db, "email", "e@x.com", "777777", 600))
+    manager.redis_client, manager.is_available = FakeClient(verify_reply="missing"), True
+    assert run(store.issue(db, "email", "e@x.com", "888888", 600)) == "redis"
+    assert run(store.verify(db, "email", "e@x.com", "777777")) == INVALID
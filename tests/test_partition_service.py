@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import app.services.partition_service as ps
+from sqlalchemy import create_engine
+
+NOW = datetime(2026, 10, 21, 13, 30, tzinfo=timezone.utc)  # a Wednesday
+
+
+def test_day_and_week_buckets_and_names():
+    day, week = ps.TIME_PARTITIONED["email_otps"], ps.TIME_PARTITIONED["otp_security_logs"]
+    assert ps.bucket_bounds(day, NOW) == (
+        datetime(2026, 10, 21, tzinfo=timezone.utc), datetime(2026, 10, 22, tzinfo=timezone.utc)
+    )
+    start, end = ps.bucket_bounds(week, NOW)
+    assert (start.weekday(), start.day, (end - start).days) == (0, 19, 7)
+    assert ps.partition_name(week, start) == "otp_security_logs_w20261019"
+
+    planned = ps.planned_partitions(day, NOW)
+    assert len(planned) == day.retention + day.premake
+    assert planned[0][0] == "email_otps_d20261019" and planned[-1][0] == "email_otps_d20261028"
+    assert all(a[2] == b[1] for a, b in zip(planned, planned[1:]))
+
+
+def test_expired_partitions_respect_retention_and_env_override(monkeypatch):
+    spec = ps.TIME_PARTITIONED["email_otps"]
+    names = [
+        "email_otps_default", "email_otps_d20261017", "email_otps_d20261018",
+        "email_otps_d20261019", "email_otps_d20261021", "mobile_otps_d20261001",
+    ]
+    assert ps.expired_partitions(spec, names, NOW) == ["email_otps_d20261017", "email_otps_d20261018"]
+    monkeypatch.setenv("PARTITION_RETENTION_EMAIL_OTPS", "1")
+    assert ps.expired_partitions(spec, names, NOW)[-1] == "email_otps_d20261019"
+
+
+def test_sqlite_is_a_no_op(monkeypatch):
+    monkeypatch.setattr(ps, "engine", create_engine("sqlite://"))
+    assert ps.ensure_time_partitions(NOW) == []
+    assert ps.drop_expired_time_partitions(NOW) == []
+    assert ps.list_partitions() == []
+    assert not ps.is_time_partitioned("email_otps")
+
+
+def test_only_partitions_that_exist_afterwards_are_reported(monkeypatch):
+    spec = ps.TIME_PARTITIONED["email_otps"]
+    planned = [name for name, _, _ in ps.planned_partitions(spec, NOW)]
+    # The DO block swallowed the CREATE of the first missing partition
+    children = iter([planned[:2], planned[:2] + planned[3:]])
+
+    @contextmanager
+    def begin():
+        yield SimpleNamespace(execute=lambda *a, **kw: None)
+
+    monkeypatch.setattr(ps, "engine", SimpleNamespace(dialect=SimpleNamespace(name="postgresql"), begin=begin))
+    monkeypatch.setattr(ps, "_is_partitioned", lambda conn, table: True)
+    monkeypatch.setattr(ps, "_children", lambda conn, table: next(children))
+    assert ps.ensure_time_partitions(NOW, tables=["email_otps"]) == planned[3:]
+
+
+def test_retention_also_deletes_expired_rows_from_the_default_partition(monkeypatch):
+    executed = []
+
+    @contextmanager
+    def begin():
+        yield SimpleNamespace(execute=lambda stmt, params=None: executed.append((str(stmt), params)))
+
+    monkeypatch.setattr(ps, "engine", SimpleNamespace(dialect=SimpleNamespace(name="postgresql"), begin=begin))
+    monkeypatch.setattr(ps, "_is_partitioned", lambda conn, table: True)
+    monkeypatch.setattr(ps, "_children", lambda conn, table: ["email_otps_default", "email_otps_d20261017"])
+    assert ps.drop_expired_time_partitions(NOW, tables=["email_otps"]) == ["email_otps_d20261017"]
+    assert executed[-1] == (
+        "DELETE FROM public.email_otps_default WHERE created_at < :cutoff",
+        {"cutoff": datetime(2026, 10, 19, tzinfo=timezone.utc)},
+    )
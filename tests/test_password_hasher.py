@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.password_hasher import PasswordHasher
+
+
+def test_hash_and_verify_use_configured_cost(monkeypatch):
+    monkeypatch.setenv("BCRYPT_ROUNDS", "4")
+    hasher = PasswordHasher(workers=1, max_queue=4)
+
+    async def run():
+        hashed = await hasher.hash("s3cret")
+        return hashed, await hasher.verify("s3cret", hashed), await hasher.verify("wrong", hashed)
+
+    hashed, ok, bad = asyncio.run(run())
+    assert hashed.startswith("$2b$04$")
+    assert ok is True and bad is False
+    assert hasher.stats()["completed"] == 3
+    hasher.shutdown()
+
+
+def test_saturated_executor_sheds_with_503():
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def run():
+        first = asyncio.ensure_future(hasher._submit(release.wait, 5))
+        second = asyncio.ensure_future(hasher._submit(release.wait, 5))
+        await asyncio.sleep(0.05)
+        assert hasher.queue_depth == 1
+        with pytest.raises(HTTPException) as exc:
+            await hasher._submit(release.wait, 5)
+        release.set()
+        await asyncio.gather(first, second)
+        return exc.value
+
+    err = asyncio.run(run())
+    assert err.status_code == 503
+    assert err.headers["Retry-After"] == "1"
+    stats = hasher.stats()
+    assert (stats["completed"], stats["rejected"], stats["queue_depth"], stats["max_queue_depth"]) == (2, 1, 0, 1)
+    hasher.shutdown()
+
+
+def test_sync_path_shares_the_pool_and_admission():
+    hasher = PasswordHasher(workers=1, max_queue=0)
+    release = threading.Event()
+    holder = threading.Thread(target=hasher._call, args=(release.wait, 5))
+    holder.start()
+    while hasher.stats()["running"] == 0:
+        time.sleep(0.01)
+    with pytest.raises(HTTPException) as exc:
+        hasher.verify_sync("s3cret", "$2b$04$" + "x" * 53)
+    release.set()
+    holder.join()
+    assert exc.value.status_code == 503
+    assert hasher.verify_sync("s3cret", None) is False
+    hashed = hasher.hash_sync("s3cret")
+    assert hasher.verify_sync("s3cret", hashed) is True
+    assert (hasher.stats()["completed"], hasher.stats()["rejected"]) == (3, 1)
+    hasher.shutdown()
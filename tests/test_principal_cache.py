@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import app.core.principal as principal_mod
+from app.core.principal import PrincipalCache
+from app.db import Base
+from app.deps import get_current_principal, require_principal_roles
+from app.models import Organization, ReconJob, User
+from app.routers.recon import recon_job_status
+from app.security import create_jwt
+
+
+@pytest.fixture()
+def env(monkeypatch):
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng, tables=[Base.metadata.tables[t] for t in ("organizations", "users", "recon_jobs")])
+    Session = sessionmaker(bind=eng)
+    db = Session()
+    db.add(Organization(id=1, name="Acme", slug="acme"))
+    db.add(User(id=7, email="a@example.com", org_id=1, role="analyst", is_active=True))
+    db.commit()
+
+    queries = []
+    event.listen(eng, "before_cursor_execute", lambda *a, **k: queries.append(a[2]))
+    monkeypatch.setattr(principal_mod, "_cache", PrincipalCache(ttl=60))
+    monkeypatch.setattr(principal_mod, "_cache_pid", principal_mod.os.getpid())
+    creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials=create_jwt({"user_id": 7, "org_id": 1}))
+    yield db, creds, queries
+    db.close()
+
+
+def test_warm_cache_costs_no_queries(env):
+    db, creds, queries = env
+    p = get_current_principal(creds, db)
+    assert (p.id, p.org_id, p.role, p.org_slug) == (7, 1, "analyst", "acme")
+    assert len(queries) == 1  # users joined to organizations
+
+    queries.clear()
+    for _ in range(3):
+        assert get_current_principal(creds, db) is p
+    assert queries == []
+    assert principal_mod.get_principal_cache().stats()["hits"] == 3
+
+
+def test_committed_role_change_and_deactivation_invalidate(env):
+    db, creds, _ = env
+    get_current_principal(creds, db)
+    user = db.get(User, 7)
+    user.role = "admin"
+    db.flush()
+    # Stale until the change commits
+    with pytest.raises(HTTPException):
+        require_principal_roles(["admin"])(get_current_principal(creds, db))
+
+    db.commit()
+    assert require_principal_roles(["admin"])(get_current_principal(creds, db)).role == "admin"
+
+    user.full_name = "Ada"  # not a Principal field: the entry stays cached
+    db.commit()
+    assert principal_mod.get_principal_cache().get(7) is not None
+
+    user.is_active = False
+    db.commit()
+    with pytest.raises(HTTPException) as exc:
+        get_current_principal(creds, db)
+    assert exc.value.status_code == 401
+
+
+def test_expired_entries_are_reloaded():
+    cache = PrincipalCache(ttl=0)
+    cache.put(principal_mod.Principal(id=1, org_id=1, role="admin", is_active=True))
+    assert cache.get(1) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_recon_job_polls_use_the_cached_principal(env):
+    db, creds, queries = env
+    db.get(User, 7).role = "admin"
+    db.add(ReconJob(id=3, org_id=1, status="running", since=datetime.now(timezone.utc)))
+    db.commit()
+    check = require_principal_roles(["admin"])
+    assert recon_job_status(3, check(get_current_principal(creds, db)), db)["status"] == "running"
+
+    queries.clear()
+    assert recon_job_status(3, check(get_current_principal(creds, db)), db)["job_id"] == 3
+    assert len(queries) == 1  # the job only
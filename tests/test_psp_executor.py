@@ -0,0 +1,118 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.psp import executor, health
+from app.psp.dispatcher import PSPDispatcher
+from app.psp.executor import PSPExecutor
+from app.psp.health import HealthTable
+
+
+class SlowAdapter:
+    """Blocks like the Stripe SDK does for one round trip."""
+
+    def __init__(self, name, delay=0.2):
+        self.name, self.delay = name, delay
+
+    def create_checkout_session(self, amount, currency, success_url, cancel_url, metadata=None, **kwargs):
+        time.sleep(self.delay)
+        return {"session_id": f"{self.name}_cs", "url": f"https://{self.name}/cs", "status": "open"}
+
+
+@pytest.fixture()
+def executors(monkeypatch):
+    pool = {"stripe": PSPExecutor("stripe", workers=8, max_queue=0), "razorpay": PSPExecutor("razorpay", workers=2)}
+    monkeypatch.setattr(executor, "_executors", pool)
+    monkeypatch.setattr(executor, "_executors_pid", os.getpid())
+    monkeypatch.setattr(health, "_table", HealthTable())
+    monkeypatch.setattr(health, "_table_pid", os.getpid())
+    PSPDispatcher._adapters = {"stripe": SlowAdapter("stripe"), "razorpay": SlowAdapter("razorpay", delay=0)}
+    yield pool
+    PSPDispatcher.clear_cache()
+    for ex in pool.values():
+        ex.shutdown()
+
+
+async def max_loop_lag(make_work, tick=0.005):
+    """Await ``make_work()`` while measuring the longest the event loop went without running a 5 ms ticker."""
+    lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(tick)
+            lag = max(lag, time.perf_counter() - start - tick)
+
+    t = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0)
+    result = await make_work()
+    done = True
+    await t
+    return result, lag
+
+
+def create(n, fn):
+    kwargs = dict(amount=500, currency="usd", success_url="https://s", cancel_url="https://c")
+    return asyncio.gather(*(fn(["stripe"], "create_checkout_session", **kwargs) for _ in range(n)))
+
+
+def test_concurrent_checkout_creation_does_not_block_the_loop(executors):
+    async def inline(providers, op, **kwargs):
+        return PSPDispatcher.route(providers, op, **kwargs)  # the old, blocking path
+
+    async def run():
+        _, blocked = await max_loop_lag(lambda: create(4, inline))
+        start = time.perf_counter()
+        results, lag = await max_loop_lag(lambda: create(8, PSPDispatcher.aroute))
+        return blocked, results, lag, time.perf_counter() - start
+
+    blocked, results, lag, elapsed = asyncio.run(run())
+    assert blocked >= 0.19  # the measurement sees a blocking call
+    assert lag < 0.1
+    assert elapsed < 0.8  # 8 x 200 ms overlapped on the pool, not serialized
+    assert [p for p, _ in results] == ["stripe"] * 8
+    stats = PSPDispatcher.health()
+    assert stats["executors"]["stripe"]["completed"] == 8
+    assert stats["providers"]["stripe"]["ops"]["create_checkout_session"]["calls"] == 12
+
+
+def test_saturated_psp_sheds_with_503_or_fails_over(executors):
+    release = threading.Event()
+
+    async def run():
+        stripe = executors["stripe"]
+        held = [asyncio.ensure_future(stripe.run(release.wait, 5)) for _ in range(8)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as exc:
+            await PSPDispatcher.acall("stripe", "create_checkout_session", None, 500, "usd", "https://s", "https://c")
+        provider, _ = await PSPDispatcher.aroute(
+            ["stripe", "razorpay"], "create_checkout_session", 500, "usd", "https://s", "https://c"
+        )
+        release.set()
+        await asyncio.gather(*held)
+        return exc.value, provider
+
+    err, provider = asyncio.run(run())
+    assert (err.status_code, err.headers["Retry-After"]) == (503, "1")
+    assert provider == "razorpay"
+    assert executors["stripe"].stats()["rejected"] == 2
+    assert PSPDispatcher.health()["failovers"] == 1
+
+
+def test_failed_stripe_retrieve_is_recorded_as_an_error(executors, monkeypatch):
+    stripe = pytest.importorskip("stripe")
+    from app.services.stripe_service import StripeService
+
+    def fail(session_id):
+        raise stripe.error.APIConnectionError("unreachable")
+
+    monkeypatch.setattr(stripe.checkout.Session, "retrieve", fail)
+    assert asyncio.run(StripeService.retrieve_checkout_session_async("cs_1", hedge=False)) is None
+    op = health.get_health_table().stats()["providers"]["stripe"]["ops"]["retrieve_checkout_session"]
+    assert op["calls"] == 1 and op["errors"] == 1
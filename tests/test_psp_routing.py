@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models import RecoveryAttempt, Transaction
+from app.psp import health
+from app.psp.dispatcher import PSPDispatcher
+from app.psp.health import HealthTable
+from app.psp.razorpay_adapter import RazorpayAdapter
+from app.services.payments.razorpay_adapter import RazorpayAdapter as RazorpayClient
+from app.services.webhook_pipeline import apply_group, razorpay_event_key
+
+
+@pytest.fixture()
+def table(monkeypatch):
+    t = HealthTable(window_s=60, min_samples=3)
+    monkeypatch.setattr(health, "_table", t)
+    monkeypatch.setattr(health, "_table_pid", os.getpid())
+    yield t
+    PSPDispatcher.clear_cache()
+
+
+class FakeAdapter:
+    def __init__(self, name, fail=None):
+        self.name, self.fail, self.calls = name, fail, 0
+
+    def create_payment_link(self, amount, currency, metadata=None, **kwargs):
+        self.calls += 1
+        if self.fail is not None:
+            raise self.fail(f"{self.name} down")
+        return {"payment_link_id": f"{self.name}_link", "url": f"https://{self.name}/pay"}
+
+
+def test_rank_prefers_merchant_order_until_health_says_otherwise(table):
+    assert table.rank(["razorpay", "stripe"]) == ["razorpay", "stripe"]
+    for _ in range(3):
+        table.record("razorpay", "create_payment_link", 0.9, True)
+        table.record("stripe", "create_payment_link", 0.2, True)
+    assert table.rank(["razorpay", "stripe"]) == ["stripe", "razorpay"]
+    for _ in range(6):
+        table.record("stripe", "create_payment_link", 0.1, False)
+    assert not table.provider_health("stripe")["healthy"]
+    assert table.rank(["stripe", "razorpay"]) == ["razorpay", "stripe"]
+    # samples age out of the window, so the PSP comes back
+    assert table.rank(["stripe", "razorpay"], now=time.monotonic() + 120) == ["stripe", "razorpay"]
+
+
+def test_route_fails_over_and_records_health(table):
+    stripe, razorpay = FakeAdapter("stripe", fail=httpx.ConnectError), FakeAdapter("razorpay")
+    PSPDispatcher._adapters = {"stripe": stripe, "razorpay": razorpay}
+
+    provider, result = PSPDispatcher.route(["stripe", "razorpay", "paypal"], "create_payment_link", 100, "inr")
+    assert (provider, result["url"]) == ("razorpay", "https://razorpay/pay")
+    stats = PSPDispatcher.health()
+    assert stats["failovers"] == 1
+    assert stats["providers"]["stripe"]["ops"]["create_payment_link"]["errors"] == 1
+    assert stats["providers"]["razorpay"]["error_rate"] == 0.0
+
+    for _ in range(2):
+        PSPDispatcher.route(["stripe", "razorpay"], "create_payment_link", 100, "inr")
+    # stripe is now out of rotation and no longer tried first
+    PSPDispatcher.route(["stripe", "razorpay"], "create_payment_link", 100, "inr")
+    assert stripe.calls == 3 and razorpay.calls == 4
+
+    with pytest.raises(ValueError):
+        PSPDispatcher.route(["paypal"], "create_payment_link", 100, "inr")
+
+
+def test_route_does_not_fail_over_when_the_psp_may_have_created_the_link(table):
+    # a read timeout (or a 5xx) may come after the link was created: a second PSP would make another payable link
+    stripe, razorpay = FakeAdapter("stripe", fail=httpx.ReadTimeout), FakeAdapter("razorpay")
+    PSPDispatcher._adapters = {"stripe": stripe, "razorpay": razorpay}
+    with pytest.raises(httpx.ReadTimeout):
+        PSPDispatcher.route(["stripe", "razorpay"], "create_payment_link", 100, "inr")
+    assert (stripe.calls, razorpay.calls, PSPDispatcher.health()["failovers"]) == (1, 0, 0)
+
+
+def test_slow_retrieve_is_hedged(table, monkeypatch):
+    monkeypatch.setenv("PSP_HEDGE_AFTER_MS", "50")
+    calls = []
+    lock = threading.Lock()
+
+    def retrieve(session_id):
+        with lock:
+            calls.append(session_id)
+            first = len(calls) == 1
+        time.sleep(1.0 if first else 0.01)
+        return {"id": session_id, "fast": not first}
+
+    start = time.monotonic()
+    assert PSPDispatcher.call("stripe", "retrieve", retrieve, "cs_1", hedge=True) == {"id": "cs_1", "fast": True}
+    assert time.monotonic() - start < 0.5
+    assert (table.hedges, table.hedge_wins, len(calls)) == (1, 1, 2)
+
+    # fast calls are not duplicated
+    assert PSPDispatcher.call("stripe", "retrieve", lambda s: s, "cs_2", hedge=True) == "cs_2"
+    assert table.hedges == 1
+
+
+def test_razorpay_adapter_creates_and_reads_payment_links():
+    def handler(request):
+        if request.method == "POST":
+            assert request.url.path == "/v1/payment_links"
+            # the transaction_ref rides on the link's payments as notes.receipt
+            assert json.loads(request.content)["notes"] == {"transaction_ref": "R-1", "receipt": "R-1"}
+            return httpx.Response(200, json={"id": "plink_1", "short_url": "https://rzp.io/i/x", "status": "created"})
+        return httpx.Response(200, json={"id": "plink_1", "status": "paid", "amount": 500, "currency": "INR"})
+
+    client = RazorpayClient("k", "s", client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    adapter = RazorpayAdapter("k", "s", client=client)
+    link = adapter.create_payment_link(500, "inr", metadata={"transaction_ref": "R-1"})
+    assert (link["payment_link_id"], link["url"]) == ("plink_1", "https://rzp.io/i/x")
+    status = adapter.get_session_status("plink_1")
+    assert (status["status"], status["payment_status"], status["amount_total"]) == ("complete", "paid", 500)
+
+
+def test_razorpay_link_payment_completes_the_recovery_attempt():
+    eng = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    tables = ["organizations", "transactions", "recovery_attempts", "recovery_latency_sketches"]
+    Base.metadata.create_all(eng, tables=[Base.metadata.tables[t] for t in tables])
+    db = sessionmaker(bind=eng)()
+    expires = datetime.now(timezone.utc) + timedelta(days=1)
+    for ref, link_id in (("R-1", "plink_1"), ("R-2", None)):
+        txn = Transaction(transaction_ref=ref, amount=500, currency="INR", razorpay_payment_link_id=link_id)
+        db.add(txn)
+        db.flush()
+        db.add(RecoveryAttempt(transaction_id=txn.id, transaction_ref=ref, token=f"tok-{ref}",
+                               status="sent", expires_at=expires))
+    db.commit()
+
+    def link_paid(link_id, payment_id, notes):
+        return {"event": "payment_link.paid", "payload": {
+            "payment_link": {"entity": {"id": link_id, "status": "paid", "notes": notes}},
+            "payment": {"entity": {"id": payment_id, "order_id": f"order_{link_id}", "notes": notes}},
+            "order": {"entity": {"id": f"order_{link_id}"}}}}
+
+    emits = []
+    # matched by the stored link id, then (link not stored) by notes.receipt
+    apply_group(db, [("razorpay", link_paid("plink_1", "pay_1", {}))], emits)
+    apply_group(db, [("razorpay", link_paid("plink_2", "pay_2", {"transaction_ref": "R-2", "receipt": "R-2"}))], emits)
+    db.commit()
+    assert {a.status for a in db.query(RecoveryAttempt)} == {"completed"}
+    assert [t.razorpay_payment_id for t in db.query(Transaction).order_by(Transaction.id)] == ["pay_1", "pay_2"]
+    assert [e["transaction_ref"] for e in emits] == ["R-1", "R-2"]
+    assert razorpay_event_key(link_paid("plink_1", "pay_1", {}))[1] == "razorpay:payment_link.paid:pay_1"
+    db.close()
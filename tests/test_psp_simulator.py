@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.deps import get_db
+from app.models import PspEvent, RecoveryAttempt, Transaction
+from app.psp.simulator import Latency, PSPSimulator, SimConfig, unflatten
+from app.services.payments.razorpay_adapter import RazorpayAdapter
+from app.services.webhook_pipeline import process_pending
+
+
+def sim_client(sim):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=sim.app), base_url="http://sim")
+
+
+def test_razorpay_adapter_against_simulator_with_faults(monkeypatch):
+    monkeypatch.setenv("RAZORPAY_API_BASE", "http://sim/razorpay")
+    sim = PSPSimulator(SimConfig(seed=7))
+    sim.config.providers["razorpay"].latency = Latency.parse("uniform:1:3")
+
+    async def run():
+        async with sim_client(sim) as client:
+            rzp = RazorpayAdapter("rzp_test", "shh", client=client)
+            orders = [await rzp.create_order_async(100 * (i + 1), "inr", f"R-{i}") for i in range(5)]
+            listed = [o["id"] async for o in rzp.list_orders_async(0, 2 ** 40, page_size=2)]
+            link = await rzp.create_payment_link_async(700, "inr", notes={"transaction_ref": "R-9"})
+            paid = await client.post(f"/_sim/razorpay/pay/{orders[0]['order_id']}")
+            status = await rzp.get_order_status_async(orders[0]["order_id"])
+
+            await client.post("/_sim/config", json={"provider": "razorpay", "error_rate": 1})
+            with pytest.raises(httpx.HTTPStatusError) as failed:
+                await rzp.get_order_status_async(orders[1]["order_id"])
+            await client.post("/_sim/config", json={"error_rate": 0, "rate_limit": 1, "burst": 2})
+            limited = [(await client.get(f"/razorpay/v1/orders/{orders[1]['order_id']}",
+                                         headers=rzp._auth_header)).status_code for _ in range(3)]
+            unauthenticated = await client.get("/razorpay/v1/orders")
+            stats = (await client.get("/_sim/stats")).json()
+        return orders, listed, link, paid.json(), status, failed.value, limited, unauthenticated, stats
+
+    orders, listed, link, paid, status, failed, limited, unauthenticated, stats = asyncio.run(run())
+    assert [o["amount"] for o in orders] == [100, 200, 300, 400, 500]
+    assert sorted(listed) == sorted(o["order_id"] for o in orders)
+    assert link["url"].endswith(link["payment_link_id"]) and link["status"] == "created"
+    assert [e["event"] for e in paid["events"]] == ["payment.captured", "order.paid"]
+    assert paid["delivery"] is None  # no webhook_url configured
+    assert status["status"] == "paid"
+    assert failed.response.status_code == 500
+    assert failed.response.json()["error"]["code"] == "SERVER_ERROR"
+    assert limited == [200, 200, 429]
+    assert unauthenticated.status_code == 401
+    assert stats["config"]["providers"]["razorpay"]["rate_limit"] == 1
+    assert {"provider": "razorpay", "route": "/v1/orders/{id}", "status": 429, "count": 1} in stats["requests"]
+
+
+def test_stripe_form_api_and_webhook_signatures():
+    sim = PSPSimulator(SimConfig(stripe_webhook_secret="whsec_test"))
+    auth = {"Authorization": "Bearer sk_test_sim"}
+    form = {
+        "mode": "payment",
+        "line_items[0][price_data][currency]": "usd",
+        "line_items[0][price_data][unit_amount]": "1250",
+        "line_items[0][price_data][product_data][name]": "Payment R-1",
+        "line_items[0][quantity]": "2",
+        "metadata[transaction_ref]": "R-1",
+        "success_url": "https://s",
+        "cancel_url": "https://c",
+    }
+
+    async def run():
+        async with sim_client(sim) as client:
+            created = (await client.post("/stripe/v1/checkout/sessions", data=form, headers=auth)).json()
+            fetched = (await client.get(f"/stripe/v1/checkout/sessions/{created['id']}", headers=auth)).json()
+            for amount in (100, 200):
+                await client.post("/stripe/v1/payment_intents", data={"amount": amount, "currency": "usd"},
+                                  headers=auth)
+            page = (await client.get("/stripe/v1/payment_intents", params={"limit": 2, "created[gte]": 0},
+                                     headers=auth)).json()
+            rest = (await client.get("/stripe/v1/payment_intents",
+                                     params={"limit": 2, "starting_after": page["data"][-1]["id"]},
+                                     headers=auth)).json()
+            missing = await client.get("/stripe/v1/checkout/sessions/cs_nope", headers=auth)
+        return created, fetched, page, rest, missing
+
+    created, fetched, page, rest, missing = asyncio.run(run())
+    assert created == fetched
+    assert (created["amount_total"], created["currency"], created["metadata"]) == (2500, "usd", {"transaction_ref": "R-1"})
+    assert created["payment_intent"].startswith("pi_") and created["status"] == "open"
+    assert (len(page["data"]), page["has_more"], len(rest["data"]), rest["has_more"]) == (2, True, 1, False)
+    assert missing.status_code == 404 and missing.json()["error"]["type"] == "invalid_request_error"
+    assert unflatten([("a[0][b]", "1"), ("a[1][b]", "2"), ("c", "3")]) == {"a": [{"b": "1"}, {"b": "2"}], "c": "3"}
+
+    events = sim.stripe_completed_events(sim.sessions[created["id"]])
+    assert [e["type"] for e in events] == ["checkout.session.completed", "payment_intent.succeeded"]
+    body, headers = sim.signed("stripe", events[0])
+    # what stripe.Webhook.construct_event checks
+    parts = dict(p.split("=", 1) for p in headers["Stripe-Signature"].split(","))
+    expected = hmac.new(b"whsec_test", f"{parts['t']}.".encode() + body, hashlib.sha256).hexdigest()
+    assert parts["v1"] == expected
+    assert json.loads(body)["data"]["object"]["payment_status"] == "paid"
+
+
+def test_webhook_storm_is_accepted_and_applied_by_the_app(monkeypatch):
+    from app.routers import payments_razorpay
+
+    monkeypatch.setenv("RAZORPAY_API_BASE", "http://sim/razorpay")
+    monkeypatch.setenv("RAZORPAY_WEBHOOK_SECRET", "shh")
+    monkeypatch.setattr(payments_razorpay, "kick", lambda: None)
+    eng = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    tables = ["organizations", "transactions", "recovery_attempts", "psp_events", "recovery_latency_sketches"]
+    Base.metadata.create_all(eng, tables=[Base.metadata.tables[t] for t in tables])
+    factory = sessionmaker(bind=eng)
+    api = FastAPI()
+    api.include_router(payments_razorpay.router)
+
+    def override():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    api.dependency_overrides[get_db] = override
+    sim = PSPSimulator(SimConfig(razorpay_webhook_secret="shh", seed=3))
+
+    async def run():
+        db = factory()
+        async with sim_client(sim) as client:
+            rzp = RazorpayAdapter("rzp_test", "shh", client=client)
+            expires = datetime.now(timezone.utc) + timedelta(days=1)
+            for i in range(20):
+                order = await rzp.create_order_async(1000, "INR", f"R-{i}")
+                txn = Transaction(transaction_ref=f"R-{i}", amount=1000, currency="INR",
+                                  razorpay_order_id=order["order_id"])
+                db.add(txn)
+                db.flush()
+                db.add(RecoveryAttempt(transaction_id=txn.id, transaction_ref=txn.transaction_ref,
+                                       token=f"tok-{i}", status="sent", expires_at=expires))
+            db.commit()
+        app_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api), base_url="http://app")
+        async with app_client:
+            summary = await sim.storm("razorpay", 20, "http://app", concurrency=8, duplicate_rate=0.5,
+                                      client=app_client)
+        return db, summary
+
+    db, summary = asyncio.run(run())
+    assert summary["events"] == 40 and summary["duplicates"] > 0
+    assert summary["statuses"] == {"200": summary["sent"]}
+    assert summary["ack_p95_ms"] is not None
+    assert db.query(PspEvent).count() == 40  # retried deliveries are stored once
+    process_pending(db)
+    db.expire_all()
+    assert {a.status for a in db.query(RecoveryAttempt)} == {"completed"}
+    db.close()
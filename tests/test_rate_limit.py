@@ -0,0 +1,92 @@
+import asyncio
+
+from app.core.rate_limit import Rule, SlidingWindowLimiter
+
+
+class FakeClient:
+    def __init__(self, reply=None, error=None):
+        self.reply = reply
+        self.error = error
+        self.calls = []
+
+    async def script_load(self, script):
+        return "sha1"
+
+    async def evalsha(self, sha, numkeys, *args):
+        self.calls.append(("evalsha", numkeys, args))
+        if self.error:
+            raise self.error
+        return self.reply
+
+    async def eval(self, script, numkeys, *args):
+        self.calls.append(("eval", numkeys, args))
+        return self.reply
+
+
+class FakeManager:
+    def __init__(self, client=None):
+        self.redis_client = client
+        self.is_available = client is not None
+        self.connects = 0
+
+    async def connect(self):
+        self.connects += 1
+
+
+RULES = [Rule("otp_request:email", "A@x.com", 3, 900), Rule("otp_request:ip", "1.2.3.4", 20, 900)]
+
+
+def test_keys_and_weights_cover_both_buckets():
+    client = FakeClient(reply=[1, "1.5", "1"])
+    limiter = SlidingWindowLimiter(FakeManager(client))
+    now = 900 * 1000 + 225  # a quarter into the bucket
+    result = asyncio.run(limiter._run(RULES, 1, False, now=now))
+    assert result[0] is True
+    _, numkeys, args = client.calls[0]
+    assert numkeys == 4
+    assert args[:4] == ("rl:otp_request:email:a@x.com:1000", "rl:otp_request:email:a@x.com:999",
+                        "rl:otp_request:ip:1.2.3.4:1000", "rl:otp_request:ip:1.2.3.4:999")
+    assert args[4:] == ("1", "0", "3", "900000", "0.750000", "20", "900000", "0.750000")
+
+
+def test_hit_reports_which_rule_denied():
+    limiter = SlidingWindowLimiter(FakeManager(FakeClient(reply=[0, "3", "4"])))
+    res = asyncio.run(limiter.hit(RULES))
+    assert not res.allowed
+    assert res.denied_by == "otp_request:email"
+    assert 1 <= res.retry_after <= 900
+
+    limiter = SlidingWindowLimiter(FakeManager(FakeClient(reply=[1, "2", "4"])))
+    res = asyncio.run(limiter.hit(RULES))
+    assert res.allowed and res.denied_by is None
+
+
+def test_record_is_exhausted_once_limit_reached():
+    limiter = SlidingWindowLimiter(FakeManager(FakeClient(reply=[1, "3", "3"])))
+    res = asyncio.run(limiter.record(RULES))
+    assert res.exhausted and res.denied_by == "otp_request:email"
+
+
+def test_unavailable_or_failing_redis_falls_back_to_db():
+    manager = FakeManager()
+    limiter = SlidingWindowLimiter(manager)
+
+    async def run():
+        out = await limiter.hit(RULES)
+        await asyncio.sleep(0)
+        return out
+
+    assert asyncio.run(run()) is None
+    assert manager.connects == 1  # one background reconnect attempt
+
+    manager = FakeManager(FakeClient(error=ConnectionError("down")))
+    limiter = SlidingWindowLimiter(manager)
+    assert asyncio.run(limiter.hit(RULES)) is None
+    assert manager.is_available is False
+
+
+def test_noscript_falls_back_to_eval():
+    client = FakeClient(reply=[1, "1", "1"], error=Exception("NOSCRIPT No matching script"))
+    limiter = SlidingWindowLimiter(FakeManager(client))
+    assert asyncio.run(limiter.hit(RULES)).allowed
+    assert [c[0] for c in client.calls] == ["evalsha", "eval"]
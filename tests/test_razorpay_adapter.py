@@ -0,0 +1,76 @@
+import asyncio
+import base64
+import json
+
+import httpx
+
+from app.services.payments.razorpay_adapter import RazorpayAdapter, shared_client
+
+
+def mock_client(seen):
+    def handler(request):
+        seen.append(request)
+        if request.method == "POST":
+            body = json.loads(request.content)
+            return httpx.Response(200, json={"id": "order_1", "amount": body["amount"], "currency": body["currency"]})
+        return httpx.Response(200, json={"id": "order_1", "status": "paid", "amount": 500, "currency": "INR"})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_async_api_sends_auth_and_normalizes():
+    seen = []
+
+    async def scenario():
+        adapter = RazorpayAdapter("rzp_test", "secret", client=mock_client(seen))
+        order = await adapter.create_order_async(500, "inr", "R-1")
+        status = await adapter.get_order_status_async("order_1")
+        return order, status
+
+    order, status = asyncio.run(scenario())
+    assert order == {"order_id": "order_1", "amount": 500, "currency": "INR"}
+    assert status["status"] == "paid"
+    assert seen[0].headers["Authorization"] == "Basic " + base64.b64encode(b"rzp_test:secret").decode()
+    assert json.loads(seen[0].content)["payment_capture"] == 1
+
+
+def test_sync_wrappers_work_inside_a_running_loop():
+    seen = []
+    adapter = RazorpayAdapter("rzp_test", "secret", client=mock_client(seen))
+
+    async def handler_calling_sync_api():
+        # anyio.run here used to raise "already running"
+        return adapter.create_order(100, "INR", "R-2"), adapter.get_order_status("order_1")
+
+    order, status = asyncio.run(handler_calling_sync_api())
+    assert order["order_id"] == "order_1" and status["status"] == "paid"
+    assert len(seen) == 2
+
+
+def test_shared_client_is_reused_per_loop():
+    async def pair():
+        return shared_client(), shared_client()
+
+    a, b = asyncio.run(pair())
+    assert a is b
+    c, _ = asyncio.run(pair())
+    assert c is not a
+
+
+def test_list_orders_pages_until_a_short_page():
+    seen = []
+
+    def handler(request):
+        seen.append(dict(request.url.params))
+        skip, count = int(request.url.params["skip"]), int(request.url.params["count"])
+        items = [{"id": f"order_{i}", "status": "paid"} for i in range(skip, min(skip + count, 250))]
+        return httpx.Response(200, json={"entity": "collection", "count": len(items), "items": items})
+
+    async def scenario():
+        adapter = RazorpayAdapter("rzp_test", "secret", client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        return [o["id"] async for o in adapter.list_orders_async(1000, 2000)]
+
+    ids = asyncio.run(scenario())
+    assert len(ids) == 250 and ids[-1] == "order_249"
+    assert [p["skip"] for p in seen] == ["0", "100", "200"]
+    assert seen[0]["from"] == "1000" and seen[0]["to"] == "2000" and seen[0]["count"] == "100"
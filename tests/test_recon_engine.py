@@ -0,0 +1,210 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.models import Organization, ReconJob, ReconLog, ReconState, Transaction
+from app.services.recon_engine import ReconEngine, active_job, dispatch_recon_job, job_summary
+
+
+class FakeAdapter:
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def get_order_status_async(self, order_id):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if order_id == "order_err":
+            raise RuntimeError("psp timeout")
+        return {"status": "paid" if order_id.endswith("paid") else "created"}
+
+
+@pytest.fixture()
+def factory():
+    eng = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    tables = ["organizations", "transactions", "recon_logs", "recon_jobs", "recon_states"]
+    Base.metadata.create_all(eng, tables=[Base.metadata.tables[t] for t in tables])
+    return sessionmaker(bind=eng)
+
+
+def seed(factory):
+    db = factory()
+    org = Organization(name="R", slug="r")
+    db.add(org)
+    db.flush()
+    specs = [
+        ("order_1_paid", "pay_1"),  # ok
+        ("order_2_paid", None),     # mismatch: PSP paid, we are not
+        ("order_3", "pay_3"),       # mismatch: we think paid
+        ("order_4", None),          # ok
+        ("order_err", None),        # ok (unknown counts as open), fetch error
+        (None, "pay_6"),            # mismatch: no order to check
+        ("order_7", None),          # ok
+    ]
+    for i, (order_id, payment_id) in enumerate(specs):
+        db.add(Transaction(transaction_ref=f"T-{i}", amount=100, currency="INR", org_id=org.id,
+                           razorpay_order_id=order_id, razorpay_payment_id=payment_id))
+    db.add(Transaction(transaction_ref="T-none", amount=100, currency="INR", org_id=org.id))
+    job = ReconJob(org_id=org.id, since=datetime.now(timezone.utc) - timedelta(days=30))
+    db.add(job)
+    db.commit()
+    job_id = job.id
+    db.close()
+    return job_id
+
+
+def test_engine_streams_chunks_concurrently_and_records_progress(factory):
+    job_id = seed(factory)
+    adapter = FakeAdapter()
+    summary = ReconEngine(factory, adapter, concurrency=2, chunk_size=3).run(job_id)
+
+    assert (summary["status"], summary["total"], summary["checked"]) == ("succeeded", 7, 7)
+    assert (summary["ok"], summary["mismatches"], summary["fetch_errors"]) == (4, 3, 1)
+    assert summary["progress"] == 1.0
+    assert adapter.calls == 6 and adapter.peak == 2
+    db = factory()
+    assert db.query(ReconLog).count() == 7
+    assert db.query(ReconLog).filter(ReconLog.result == "mismatch").count() == 3
+    db.close()
+
+
+def new_job(factory, mode="incremental"):
+    db = factory()
+    job = ReconJob(org_id=db.query(Organization.id).scalar(), mode=mode,
+                   since=datetime.now(timezone.utc) - timedelta(days=30))
+    db.add(job)
+    db.commit()
+    job_id = job.id
+    db.close()
+    return job_id
+
+
+def test_incremental_runs_only_recheck_open_mismatched_and_changed(factory):
+    seed(factory)
+    adapter = FakeAdapter()
+    first = ReconEngine(factory, adapter, chunk_size=3).run(1)
+    assert (first["checked"], first["skipped"], adapter.calls) == (7, 0, 6)
+    db = factory()
+    states = dict(db.query(Transaction.transaction_ref, ReconState.state).join(
+        ReconState, ReconState.transaction_id == Transaction.id))
+    assert states == {"T-0": "settled", "T-1": "mismatch", "T-2": "mismatch", "T-3": "open",
+                      "T-4": "unknown", "T-5": "mismatch", "T-6": "open"}
+    db.close()
+
+    # Settled order ages out; open ones past the TTL expire
+    adapter.calls = 0
+    second = ReconEngine(factory, adapter, open_ttl=timedelta(0)).run(new_job(factory))
+    assert (second["checked"], second["skipped"], adapter.calls) == (6, 1, 5)
+
+    # A change after the watermark brings a settled order back
+    db = factory()
+    db.query(Transaction).filter(Transaction.transaction_ref == "T-0").update(
+        {"updated_at": datetime.now(timezone.utc) + timedelta(days=1)})
+    db.commit()
+    db.close()
+    adapter.calls = 0
+    third = ReconEngine(factory, adapter).run(new_job(factory))
+    assert (third["checked"], third["skipped"], adapter.calls) == (5, 2, 4)
+    assert ReconEngine(factory, adapter).run(new_job(factory, mode="full"))["checked"] == 7
+    db = factory()
+    assert db.query(ReconState).filter(ReconState.transaction_id == 1).one().checks == 3
+    db.close()
+
+
+class ListingAdapter(FakeAdapter):
+    """Serves the list API for every seeded order except order_7 (created outside the window)."""
+
+    def __init__(self, page_size=2):
+        super().__init__()
+        self.page_size = page_size
+        self.pages = 0
+
+    async def list_orders_async(self, created_from, created_to, page_size=100):
+        orders = [{"id": o, "status": "paid" if o.endswith("paid") else "attempted"}
+                  for o in ("order_1_paid", "order_2_paid", "order_3", "order_4", "order_err")]
+        for i in range(0, len(orders) + 1, self.page_size):
+            self.pages += 1
+            for order in orders[i:i + self.page_size]:
+                yield order
+
+
+def test_bulk_mode_uses_the_list_index_and_fetches_only_misses(factory):
+    seed(factory)
+    adapter = ListingAdapter()
+    summary = ReconEngine(factory, adapter, chunk_size=3).run(new_job(factory, mode="bulk"))
+
+    assert (summary["checked"], summary["ok"], summary["mismatches"]) == (7, 4, 3)
+    # order_err came back from the list, so it is no longer a fetch error
+    assert summary["fetch_errors"] == 0
+    assert adapter.pages == 3 and adapter.calls == 1  # only order_7 fetched individually
+
+
+def test_failed_run_is_recorded_on_the_job(factory):
+    job_id = seed(factory)
+
+    class Broken(FakeAdapter):
+        async def get_order_status_async(self, order_id):
+            return None  # .get on None inside the engine -> TypeError escapes gather
+
+    with pytest.raises(Exception):
+        ReconEngine(factory, Broken(), chunk_size=100).run(job_id)
+    db = factory()
+    job = db.get(ReconJob, job_id)
+    assert job.status == "failed" and job.error and job_summary(job)["finished_at"]
+    assert db.query(ReconLog).count() == 0
+    db.close()
+
+
+def test_overlapping_runs_upsert_recon_state(factory):
+    seed(factory)
+    engine = ReconEngine(factory, FakeAdapter(), chunk_size=3)
+    engine.run(1)
+    db = factory()
+    txn_id = db.query(Transaction.id).filter(Transaction.transaction_ref == "T-3").scalar()
+    now = datetime.now(timezone.utc)
+    # A second run read no state for T-3 before the first run saved it
+    engine._save_states(db, 1, [{
+        "transaction_id": txn_id, "org_id": None, "state": "mismatch", "internal_status": "paid",
+        "external_status": "open", "checks": 1, "first_checked_at": now, "last_checked_at": now,
+    }], [])
+    db.commit()
+    state = db.get(ReconState, txn_id)
+    assert (state.state, state.checks) == ("mismatch", 2)
+    db.close()
+
+
+def test_active_job_blocks_a_second_job_per_org(factory):
+    job_id = seed(factory)
+    db = factory()
+    assert active_job(db, 1).id == job_id
+    db.close()
+    ReconEngine(factory, FakeAdapter()).run(job_id)
+    db = factory()
+    assert active_job(db, 1) is None
+    db.close()
+
+
+def test_dispatch_falls_back_to_background_task_without_broker(monkeypatch):
+    monkeypatch.setenv("CELERY_BROKER_URL", "redis://127.0.0.1:1/0")
+    from app.worker import celery_app
+    monkeypatch.setattr(celery_app.conf, "broker_url", "redis://127.0.0.1:1/0")
+
+    class Tasks:
+        def __init__(self):
+            self.added = []
+
+        def add_task(self, fn, *args):
+            self.added.append((fn.__name__, args))
+
+    tasks = Tasks()
+    assert dispatch_recon_job(42, tasks) == "background"
+    assert tasks.added == [("run_recon_job_inline", (42,))]
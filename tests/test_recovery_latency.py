@@ -0,0 +1,87 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.analytics.sketch import DDSketch
+from app.db import Base
+from app.models import FailureEvent, NotificationLog, Organization, RecoveryAttempt, Transaction
+from app.services.recovery_latency import latency_percentiles, parse_quantiles, record_completion
+
+
+def test_ddsketch_relative_accuracy_and_merge():
+    rnd = random.Random(1)
+    values = [rnd.lognormvariate(8, 1.5) for _ in range(20000)]
+    a, b = DDSketch(), DDSketch()
+    for i, v in enumerate(values):
+        (a if i % 2 else b).add(v)
+    merged = DDSketch.from_dict(a.to_dict())
+    merged.merge(DDSketch.from_dict(b.to_dict()))
+    values.sort()
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(merged.quantile(q) - exact) / exact <= 0.011
+    assert merged.count == 20000
+    assert merged.quantile(0) == values[0] and merged.quantile(1) == values[-1]
+
+
+def test_parse_quantiles():
+    assert parse_quantiles("50, 90") == [0.5, 0.9]
+    assert parse_quantiles(None) == [0.5, 0.9, 0.99]
+    with pytest.raises(ValueError):
+        parse_quantiles("150")
+
+
+@pytest.fixture()
+def session():
+    eng = create_engine("sqlite://")
+    names = ("organizations", "transactions", "failure_events", "recovery_attempts",
+             "notification_logs", "recovery_latency_sketches")
+    Base.metadata.create_all(eng, tables=[Base.metadata.tables[t] for t in names])
+    db = sessionmaker(bind=eng)()
+    db.add(Organization(id=1, name="A", slug="a"))
+    db.commit()
+    yield db
+    db.close()
+
+
+def _complete(db, n, channel, failure_age, notify_age=None):
+    now = datetime(2025, 6, 1, 12, tzinfo=timezone.utc)
+    tx = Transaction(transaction_ref=f"tx{n}", amount=100, org_id=1)
+    db.add(tx)
+    db.flush()
+    db.add(FailureEvent(transaction_id=tx.id, reason="declined", created_at=now - failure_age))
+    ra = RecoveryAttempt(transaction_id=tx.id, channel=channel, token=f"t{n}", status="sent",
+                         expires_at=now + timedelta(days=1))
+    db.add(ra)
+    db.flush()
+    if notify_age is not None:
+        db.add(NotificationLog(recovery_attempt_id=ra.id, channel=channel, recipient="x", status="sent",
+                               sent_at=now - notify_age))
+        db.flush()
+    ra.status = "completed"
+    ra.used_at = now
+    record_completion(db, ra)
+    db.commit()
+
+
+def test_record_completion_and_percentiles(session):
+    for i in range(1, 11):
+        _complete(session, i, "email", timedelta(minutes=10 * i), notify_age=timedelta(minutes=i))
+    _complete(session, 99, "sms", timedelta(hours=5))
+
+    day = datetime(2025, 6, 1).date()
+    res = latency_percentiles(session, 1, day, day, basis="failure", quantiles=[0.5])
+    assert res["count"] == 11
+    assert set(res["by_channel"]) == {"email", "sms"}
+    assert res["by_channel"]["sms"]["percentiles"]["p50"] == pytest.approx(5 * 3600, rel=0.01)
+
+    res = latency_percentiles(session, 1, day, day, basis="notification", channel="email", quantiles=[0.5, 0.9])
+    assert res["count"] == 10  # sms attempt had no notification
+    assert res["percentiles"]["p50"] == pytest.approx(5 * 60, rel=0.25)
+    assert res["percentiles"]["p90"] == pytest.approx(9 * 60, rel=0.02)
+
+    other_day = datetime(2025, 6, 3).date()
+    assert latency_percentiles(session, 1, other_day, other_day)["count"] == 0
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.core.redis as redis_mod
+import app.services.security_audit as audit_mod
+from app.db import Base
+from app.models import OTPSecurityLog
+from app.services.security_audit import SecurityAuditPipeline, record_security_event
+
+
+@pytest.fixture()
+def factory():
+    eng = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(eng, tables=[Base.metadata.tables["otp_security_logs"]])
+    return sessionmaker(bind=eng)
+
+
+def test_events_are_bulk_inserted_in_batches(factory):
+    pipe = SecurityAuditPipeline(None, batch_size=3)  # no writer thread; flush by hand
+    for i in range(7):
+        pipe.enqueue(email=f"u{i}@x.com", ip_address="1.1.1.1", action="request_otp", success=False)
+    db = factory()
+    assert db.query(OTPSecurityLog).count() == 0
+    assert pipe.lag_seconds() > 0
+
+    assert [pipe.flush(db) for _ in range(4)] == [3, 3, 1, 0]
+    assert db.query(OTPSecurityLog).count() == 7
+    assert db.query(OTPSecurityLog.created_at).filter(OTPSecurityLog.created_at.is_(None)).count() == 0
+    stats = pipe.stats()
+    assert (stats["pending"], stats["batches"], stats["lag_seconds"]) == (0, 3, 0.0)
+    db.close()
+
+
+def test_failed_flush_keeps_events_and_queue_is_bounded(factory):
+    pipe = SecurityAuditPipeline(None, batch_size=10, max_pending=3)
+    for i in range(5):
+        pipe.enqueue(email=f"u{i}@x.com", action="verify_otp", success=False)
+    assert pipe.stats()["dropped"] == 2
+
+    class Broken:
+        def execute(self, *a, **k):
+            raise RuntimeError("db down")
+
+        def rollback(self):
+            pass
+
+    assert pipe.flush(Broken()) == 0
+    assert pipe.stats()["pending"] == 3 and pipe.stats()["failures"] == 1
+    db = factory()
+    assert pipe.flush(db) == 3
+    assert db.query(OTPSecurityLog).count() == 3
+    db.close()
+
+
+def test_events_are_written_inline_without_redis(factory, monkeypatch):
+    queued = SecurityAuditPipeline(None)
+    monkeypatch.setattr(audit_mod, "get_audit_pipeline", lambda: queued)
+    db = factory()
+
+    monkeypatch.setattr(redis_mod, "redis_manager", SimpleNamespace(is_available=False))
+    record_security_event(db, email="a@x.com", action="verify_otp", success=False, user_agent="x" * 900)
+    db.commit()
+    row = db.query(OTPSecurityLog).one()
+    assert len(row.user_agent) == 500
+
+    monkeypatch.setattr(redis_mod, "redis_manager", SimpleNamespace(is_available=True))
+    record_security_event(db, email="a@x.com", action="verify_otp", success=False)
+    db.commit()
+    assert db.query(OTPSecurityLog).count() == 1
+    assert queued.stats()["pending"] == 1
+    db.close()
@@ -0,0 +1,172 @@
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.deps import get_db
+from app.models import Organization, PspEvent, RecoveryAttempt, Transaction
+from app.services import webhook_pipeline
+from app.services.webhook_pipeline import ingest, pipeline_stats, process_batch, process_pending
+
+
+@pytest.fixture()
+def factory():
+    eng = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    tables = ["organizations", "transactions", "recovery_attempts", "psp_events", "recovery_latency_sketches"]
+    Base.metadata.create_all(eng, tables=[Base.metadata.tables[t] for t in tables])
+    return sessionmaker(bind=eng)
+
+
+def razorpay_event(etype, order_id, payment_id=None):
+    entity = {"order_id": order_id}
+    if payment_id:
+        entity["id"] = payment_id
+    return {"event": etype, "payload": {"payment": {"entity": entity}}}
+
+
+def seed(db):
+    org = Organization(name="W", slug="w")
+    db.add(org)
+    db.flush()
+    expires = datetime.now(timezone.utc) + timedelta(days=1)
+    for ref, order_id in (("R-1", "order_1"), ("R-2", "order_2"), ("S-1", None)):
+        txn = Transaction(transaction_ref=ref, amount=100, currency="INR", org_id=org.id, razorpay_order_id=order_id)
+        db.add(txn)
+        db.flush()
+        db.add(RecoveryAttempt(transaction_id=txn.id, transaction_ref=ref, token=f"tok-{ref}",
+                               status="sent", expires_at=expires))
+    db.commit()
+
+
+def test_ingest_is_idempotent_and_skips_unkeyed_events(factory):
+    db = factory()
+    event = razorpay_event("payment.captured", "order_1", "pay_1")
+    assert ingest(db, "razorpay", event) is True
+    assert ingest(db, "razorpay", event) is False
+    assert ingest(db, "razorpay", {"event": "payment.captured", "payload": {}}) is None
+    row = db.query(PspEvent).one()
+    assert (row.status, row.attempts, row.group_key) == ("pending", 0, "razorpay:order_1")
+    db.close()
+
+
+def test_batches_apply_grouped_events_in_order(factory):
+    db = factory()
+    seed(db)
+    ingest(db, "razorpay", razorpay_event("payment.captured", "order_1", "pay_1"))
+    ingest(db, "razorpay", razorpay_event("order.paid", "order_1", "pay_1"))
+    ingest(db, "razorpay", razorpay_event("payment.failed", "order_2", "pay_2"))
+    ingest(db, "stripe", {"id": "evt_1", "type": "checkout.session.completed", "data": {"object": {
+        "id": "cs_1", "payment_intent": "pi_1", "metadata": {"transaction_ref": "S-1"}}}})
+    assert pipeline_stats(db)["pending"] == 4
+
+    totals = process_pending(db, batch_size=3)
+    assert totals == {"batches": 2, "claimed": 4, "processed": 4, "failed": 0, "deferred": 0}
+    status = dict(db.query(RecoveryAttempt.transaction_ref, RecoveryAttempt.status))
+    assert status == {"R-1": "completed", "R-2": "sent", "S-1": "completed"}
+    assert db.query(Transaction).filter_by(transaction_ref="R-1").one().razorpay_payment_id == "pay_1"
+    assert db.query(Transaction).filter_by(transaction_ref="S-1").one().stripe_payment_intent_id == "pi_1"
+    stats = pipeline_stats(db)
+    assert (stats["pending"], stats["lag_s"]) == (0, 0.0) and stats["processed_per_s"] > 0
+    db.close()
+
+
+def test_failing_group_is_retried_later_without_blocking_others(factory, monkeypatch):
+    db = factory()
+    seed(db)
+    ingest(db, "razorpay", razorpay_event("payment.captured", "order_1", "pay_1"))
+    ingest(db, "razorpay", razorpay_event("payment.captured", "order_2", "pay_2"))
+    apply = webhook_pipeline._HANDLERS["razorpay"]
+
+    def flaky(db, event, emits):
+        if event["payload"]["payment"]["entity"]["order_id"] == "order_2":
+            raise RuntimeError("boom")
+        apply(db, event, emits)
+
+    monkeypatch.setitem(webhook_pipeline._HANDLERS, "razorpay", flaky)
+    assert process_pending(db, batch_size=1, max_attempts=2)["failed"] == 1  # not retried within one drain
+    pending = db.query(PspEvent).filter_by(status="pending").one()
+    assert (pending.attempts, pending.error) == (1, "boom")
+    assert db.query(Transaction).filter_by(transaction_ref="R-2").one().razorpay_payment_id is None
+
+    process_pending(db, max_attempts=2)
+    assert db.query(PspEvent).filter_by(status="failed").count() == 1
+    assert pipeline_stats(db)["failed"] == 1
+    db.close()
+
+
+def test_later_events_wait_for_earlier_events_of_their_group(factory, monkeypatch):
+    db = factory()
+    seed(db)
+    ingest(db, "razorpay", razorpay_event("payment.captured", "order_1", "pay_1"))
+    ingest(db, "razorpay", razorpay_event("payment.captured", "order_2", "pay_2"))
+    ingest(db, "razorpay", razorpay_event("order.paid", "order_1", "pay_1"))
+    first, _, later = db.query(PspEvent).order_by(PspEvent.id).all()
+
+    # another worker holds order_1's first event (SKIP LOCKED passes over it)
+    result = process_batch(db, skip_ids={first.id})
+    assert (result["processed"], result["deferred"]) == (1, 1)
+    db.expire_all()
+    assert db.get(PspEvent, later.id).status == "pending"
+    assert db.query(Transaction).filter_by(transaction_ref="R-1").one().razorpay_payment_id is None
+
+    # a failed event holds back the rest of its group until it is retried
+    apply = webhook_pipeline._HANDLERS["razorpay"]
+    applied = []
+
+    def flaky(db, event, emits):
+        if event["event"] == "payment.captured":
+            raise RuntimeError("boom")
+        applied.append(event["event"])
+        apply(db, event, emits)
+
+    monkeypatch.setitem(webhook_pipeline._HANDLERS, "razorpay", flaky)
+    totals = process_pending(db, batch_size=1)
+    assert (totals["failed"], totals["deferred"], applied) == (1, 1, [])
+    monkeypatch.setitem(webhook_pipeline._HANDLERS, "razorpay", apply)
+    totals = process_pending(db, batch_size=1)
+    assert (totals["processed"], totals["deferred"]) == (2, 0)
+    assert [e.psp_event_id for e in db.query(PspEvent).order_by(PspEvent.processed_at, PspEvent.id)][-2:] == [
+        "razorpay:payment.captured:pay_1", "razorpay:order.paid:pay_1"]
+    assert db.query(RecoveryAttempt).filter_by(transaction_ref="R-1").one().status == "completed"
+    db.close()
+
+
+def test_routes_ack_without_processing(factory, monkeypatch):
+    from app.routers import payments_razorpay
+
+    monkeypatch.setenv("RAZORPAY_WEBHOOK_SECRET", "shh")
+    kicks = []
+    monkeypatch.setattr(payments_razorpay, "kick", lambda: kicks.append(1))
+    api = FastAPI()
+    api.include_router(payments_razorpay.router)
+
+    def override():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    api.dependency_overrides[get_db] = override
+    db = factory()
+    seed(db)
+    client = TestClient(api)
+    body = json.dumps(razorpay_event("payment.captured", "order_1", "pay_1")).encode()
+    headers = {"X-Razorpay-Signature": hmac.new(b"shh", body, hashlib.sha256).hexdigest()}
+
+    assert client.post("/v1/payments/razorpay/webhooks", content=body, headers=headers).json() == {"status": "ok"}
+    assert client.post("/v1/payments/razorpay/webhooks", content=body, headers=headers).json()["idempotent"] is True
+    assert len(kicks) == 1
+    assert db.query(RecoveryAttempt).filter_by(transaction_ref="R-1").one().status == "sent"
+    process_pending(db)
+    db.expire_all()
+    assert db.query(RecoveryAttempt).filter_by(transaction_ref="R-1").one().status == "completed"
+    db.close()